@@ -0,0 +1,229 @@
+# it032_analysis.py - análisis de una práctica: escalones, régimen y convección
+# -------------------------------------------------------
+# - Divide la sesión en escalones según los cambios de consigna (FAN/HEAT)
+#   registrados como eventos; las salidas del PID no abren escalón
+# - Medias por escalón sobre la parte final (régimen) con sumas acumuladas:
+#   todo vectorizado con searchsorted, sin recorrer muestra a muestra
+# - Resultados derivados: coeficiente de convección h, Reynolds, Nusselt y
+#   balance de energía del aire, con propiedades del aire a la temperatura
+#   de película
+# - Indicadores de calidad por escalón (transitorio, pocas muestras...)
+# - Geometría del equipo en equipo.json
+# - Comparación de varias prácticas en una rejilla común (it032_resample)
+
+import json
+import warnings
+
+import numpy as np
+
+import it032_resample as resample
+
+EQUIPO_PATH = "equipo.json"
+CANALES = ("te", "ts", "tc", "vel", "pot")
+ACTUADORES = ("HEAT", "FAN")
+
+DEFAULT_EQUIPO = {
+    "area_calefactor_m2": 0.01,  # superficie del calefactor en contacto con el aire
+    "seccion_conducto_m2": 0.0144,  # sección de paso del aire en la torre
+    "longitud_m": 0.1,  # longitud característica para Re y Nu
+}
+
+ESCALON_MIN_S = 5.0  # cambios de consigna más juntos se funden en un escalón
+FRACCION_REGIMEN = 0.5  # parte final del escalón que se promedia
+PENDIENTE_REGIMEN = 0.2  # °C/min en TC por debajo de la cual hay régimen
+MIN_MUESTRAS = 10
+DT_MIN = 2.0  # °C entre superficie y aire para calcular h con sentido
+POT_MIN = 1.0  # W
+
+P_ATM = 101325.0
+R_AIRE = 287.05
+CP_AIRE = 1007.0
+
+
+def cargar_equipo(path=EQUIPO_PATH):
+    equipo = dict(DEFAULT_EQUIPO)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            equipo.update(json.load(f))
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"⚠️ No se pudo cargar {path} ({e}); se usa la geometría por defecto.")
+    return equipo
+
+
+def propiedades_aire(temp_c):
+    """Densidad, conductividad y viscosidad cinemática del aire seco a 1 atm."""
+    tk = np.asarray(temp_c, dtype=float) + 273.15
+    rho = P_ATM / (R_AIRE * tk)
+    # Sutherland para la viscosidad dinámica; k casi lineal en el rango 0-150 °C
+    mu = 1.716e-5 * (tk / 273.15) ** 1.5 * (273.15 + 110.4) / (tk + 110.4)
+    k = 0.0241 + 7.7e-5 * (tk - 273.15)
+    return rho, k, mu / rho
+
+
+# ---------------------------------------------------------
+# ESCALONES
+# ---------------------------------------------------------
+def escalones(t, eventos):
+    """Límites de cada escalón: lista de (t0, t1, {HEAT, FAN}).
+
+    `eventos` son dicts {"t", "kind", "value", "source"} como en el pie de los
+    ficheros .it32s. Las ráfagas al mover un mando se funden en un cambio.
+    """
+    if not len(t):
+        return []
+    consignas = {a: 0 for a in ACTUADORES}
+    limites = [(float(t[0]), dict(consignas))]
+    for ev in sorted(eventos, key=lambda e: e["t"]):
+        if ev["kind"] not in ACTUADORES or ev.get("source") == "control":
+            continue
+        if ev["t"] >= t[-1]:
+            break
+        consignas[ev["kind"]] = ev["value"]
+        if ev["t"] - limites[-1][0] >= ESCALON_MIN_S:
+            limites.append((ev["t"], dict(consignas)))
+        elif len(limites) > 1:
+            limites[-1] = (ev["t"], dict(consignas))
+        else:
+            limites[0] = (limites[0][0], dict(consignas))
+    fines = [l[0] for l in limites[1:]] + [float(t[-1])]
+    return [(t0, t1, c) for (t0, c), t1 in zip(limites, fines)]
+
+
+def _sumas(x):
+    return np.concatenate(([0.0], np.cumsum(x)))
+
+
+def _sumas_finitas(x):
+    """Sumas acumuladas ignorando NaN y número acumulado de valores finitos.
+
+    Con un cumsum normal un solo hueco (celda vacía importada, intervalo
+    compactado sin dato) dejaría en NaN todos los escalones posteriores.
+    """
+    finito = np.isfinite(x)
+    return _sumas(np.where(finito, x, 0.0)), _sumas(finito)
+
+
+def medias_escalones(t, columnas, tramos, fraccion=FRACCION_REGIMEN):
+    """Medias de régimen y pendiente de TC por escalón (arrays por canal)."""
+    t = np.asarray(t, dtype=float)
+    t0 = np.array([e[0] for e in tramos])
+    t1 = np.array([e[1] for e in tramos])
+    i0 = np.searchsorted(t, t1 - fraccion * (t1 - t0), side="left")
+    i1 = np.searchsorted(t, t1, side="right")
+    n = i1 - i0
+    with np.errstate(all="ignore"):
+        medias = {}
+        for canal in CANALES:
+            s, c = _sumas_finitas(np.asarray(columnas[canal], dtype=float))
+            medias[canal] = (s[i1] - s[i0]) / (c[i1] - c[i0])
+        # Pendiente de TC por mínimos cuadrados: solo hacen falta cuatro sumas,
+        # todas sobre las muestras con TC válida
+        tr = t - t[0] if len(t) else t
+        y = np.asarray(columnas["tc"], dtype=float)
+        valido = np.isfinite(y)
+        tr, y = np.where(valido, tr, 0.0), np.where(valido, y, 0.0)
+        st, sy, stt, sty, sn = (_sumas(v) for v in (tr, y, tr * tr, tr * y, valido))
+        m = sn[i1] - sn[i0]
+        St, Sy = st[i1] - st[i0], sy[i1] - sy[i0]
+        Stt, Sty = stt[i1] - stt[i0], sty[i1] - sty[i0]
+        pendiente = (m * Sty - St * Sy) / (m * Stt - St * St) * 60.0
+    return medias, n, pendiente
+
+
+def derivar(medias, equipo=None):
+    """Resultados de convección a partir de las medias (arrays o escalares)."""
+    equipo = equipo or DEFAULT_EQUIPO
+    te, ts, tc = (np.asarray(medias[c], dtype=float) for c in ("te", "ts", "tc"))
+    vel, pot = np.asarray(medias["vel"], dtype=float), np.asarray(medias["pot"], dtype=float)
+    t_aire = 0.5 * (te + ts)
+    dt = tc - t_aire
+    with np.errstate(all="ignore"):
+        h = np.where((dt > DT_MIN) & (pot > POT_MIN),
+                     pot / (equipo["area_calefactor_m2"] * dt), np.nan)
+        _, k, nu = propiedades_aire(0.5 * (tc + t_aire))
+        rho_in, _, _ = propiedades_aire(te)
+        L = equipo["longitud_m"]
+        q_aire = rho_in * vel * equipo["seccion_conducto_m2"] * CP_AIRE * (ts - te)
+        return {
+            "dt_superficie": dt,
+            "h": h,
+            "re": vel * L / nu,
+            "nu": h * L / k,
+            "q_aire": q_aire,
+            "balance": np.where(pot > POT_MIN, q_aire / pot, np.nan),
+        }
+
+
+def indicadores(n, pendiente, medias):
+    """Lista de avisos de calidad por escalón."""
+    avisos = []
+    for i in range(len(n)):
+        a = []
+        if n[i] < MIN_MUESTRAS:
+            a.append("pocas_muestras")
+        if not abs(pendiente[i]) <= PENDIENTE_REGIMEN:
+            a.append("transitorio")
+        if not medias["pot"][i] > POT_MIN:
+            a.append("sin_potencia")
+        elif not medias["tc"][i] - 0.5 * (medias["te"][i] + medias["ts"][i]) > DT_MIN:
+            a.append("dt_pequeno")
+        avisos.append(a)
+    return avisos
+
+
+def resumen(t, columnas, eventos, equipo=None):
+    """Escalones con medias de régimen, resultados derivados e indicadores."""
+    tramos = escalones(t, eventos)
+    if not tramos:
+        return []
+    medias, n, pendiente = medias_escalones(t, columnas, tramos)
+    derivados = derivar(medias, equipo)
+    avisos = indicadores(n, pendiente, medias)
+    filas = []
+    for i, (t0, t1, consignas) in enumerate(tramos):
+        fila = {
+            "escalon": i + 1,
+            "t0": t0,
+            "duracion_s": t1 - t0,
+            "HEAT": consignas["HEAT"],
+            "FAN": consignas["FAN"],
+            "n": int(n[i]),
+            "pendiente_tc": float(pendiente[i]),
+            **{c: float(medias[c][i]) for c in CANALES},
+            **{k: float(v[i]) for k, v in derivados.items()},
+            "avisos": avisos[i],
+        }
+        filas.append(fila)
+    return filas
+
+
+def cargar_sesion(path):
+    """(t, columnas, metadatos) de un fichero .it32s."""
+    from it032_session_file import SessionFile
+
+    with SessionFile(path) as f:
+        datos = f.rango()
+        meta = dict(f.metadata)
+    t = np.asarray(datos.pop("t"), dtype=float)
+    return t, {c: np.asarray(datos[c], dtype=float) for c in CANALES}, meta
+
+
+def comparar(paths, canal, paso=1.0, referencia="event", tipo_evento="HEAT", modo="mean"):
+    """Un canal de varias prácticas alineado en una rejilla común.
+
+    Devuelve (rejilla, matriz sesiones × instantes, media, desviación típica,
+    número de sesiones con dato en cada instante).
+    """
+    sesiones = []
+    for path in paths:
+        t, columnas, meta = cargar_sesion(path)
+        sesiones.append((t, {canal: columnas[canal]}, meta.get("events", [])))
+    g, series = resample.alinear(sesiones, paso, modo, referencia, tipo_evento)
+    matriz = np.vstack([s[canal] for s in series]) if series else np.empty((0, len(g)))
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)  # instantes sin ninguna sesión
+        media = np.nanmean(matriz, axis=0)
+        desviacion = np.nanstd(matriz, axis=0)
+    return g, matriz, media, desviacion, np.isfinite(matriz).sum(axis=0)
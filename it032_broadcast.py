@@ -0,0 +1,344 @@
+# it032_broadcast.py - difusión en directo de las medidas a varios visores
+# -------------------------------------------------------
+# - Hub publicación/suscripción en proceso: cada muestra se serializa una vez
+#   y se reparte a N suscriptores
+# - Cola acotada por cliente: un cliente lento pierde tramas antiguas, nunca
+#   frena la adquisición (publicar no bloquea)
+# - Endpoint Server-Sent Events (/stream) + panel web mínimo (/) + estadísticas (/stats)
+# - python it032_broadcast.py --bench N  mide cuántos visores aguanta el PC
+
+import argparse
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BROADCAST_PORT = int(os.environ.get("IT032_BROADCAST_PORT", "0"))  # 0 = desactivado
+CLIENT_QUEUE = 64  # tramas pendientes por cliente antes de descartar las antiguas
+KEEPALIVE = 15.0  # segundos entre comentarios SSE si no hay datos
+
+
+# ---------------------------------------------------------
+# HUB
+# ---------------------------------------------------------
+class Subscriber:
+    """Buzón acotado de un cliente; al llenarse se descartan las tramas más antiguas."""
+
+    def __init__(self, maxlen=CLIENT_QUEUE):
+        self.cola = deque(maxlen=maxlen)
+        self.aviso = threading.Event()
+        self.entregadas = 0
+        self.descartadas = 0
+
+    def poner(self, trama):
+        if len(self.cola) == self.cola.maxlen:
+            self.descartadas += 1
+        self.cola.append(trama)  # deque.append es atómico: no hace falta lock
+        self.aviso.set()
+
+    def sacar_todo(self, timeout):
+        """Espera hasta `timeout` y devuelve todas las tramas pendientes."""
+        if not self.aviso.wait(timeout):
+            return []
+        self.aviso.clear()
+        tramas = []
+        while True:
+            try:
+                tramas.append(self.cola.popleft())
+            except IndexError:
+                break
+        self.entregadas += len(tramas)
+        return tramas
+
+
+class BroadcastHub:
+    """Reparte cada muestra a todos los suscriptores sin bloquear al publicador.
+
+    publicar() solo serializa y deja la trama en una cola; un hilo repartidor
+    hace el reparto O(N), de modo que el coste en el hilo de adquisición no
+    depende del número de visores.
+    """
+
+    def __init__(self):
+        self._subs = ()  # tupla inmutable: el repartidor itera sin tomar el lock
+        self._lock = threading.Lock()
+        self._entrada = deque(maxlen=CLIENT_QUEUE)
+        self._aviso = threading.Event()
+        self.publicadas = 0
+        self.descartadas_cerradas = 0
+        self.ultima = None
+        threading.Thread(target=self._repartir, daemon=True).start()
+
+    def suscribir(self, maxlen=CLIENT_QUEUE):
+        sub = Subscriber(maxlen)
+        with self._lock:
+            self._subs = self._subs + (sub,)
+        if self.ultima is not None:
+            sub.poner(self.ultima)  # el visor nuevo ve el último valor al instante
+        return sub
+
+    def desuscribir(self, sub):
+        with self._lock:
+            self._subs = tuple(s for s in self._subs if s is not sub)
+            self.descartadas_cerradas += sub.descartadas
+
+    def publicar(self, timestamp, te, ts, tc, vel, pot):
+        """Serializa la muestra una sola vez como trama SSE y la encola en cada cliente."""
+        payload = json.dumps(
+            {"t": timestamp, "te": te, "ts": ts, "tc": tc, "vel": vel, "pot": pot},
+            separators=(",", ":"),
+        )
+        trama = f"data: {payload}\n\n".encode("utf-8")
+        self.ultima = trama
+        self.publicadas += 1
+        self._entrada.append(trama)
+        self._aviso.set()
+
+    def publicar_evento(self, evento, datos):
+        """Trama SSE con nombre (`event: ...`); no sustituye al último valor."""
+        payload = json.dumps(datos, separators=(",", ":"))
+        self._entrada.append(f"event: {evento}\ndata: {payload}\n\n".encode("utf-8"))
+        self._aviso.set()
+
+    def _repartir(self):
+        while True:
+            self._aviso.wait()
+            self._aviso.clear()
+            while True:
+                try:
+                    trama = self._entrada.popleft()
+                except IndexError:
+                    break
+                for sub in self._subs:
+                    sub.poner(trama)
+
+    def estadisticas(self):
+        subs = self._subs
+        return {
+            "clientes": len(subs),
+            "publicadas": self.publicadas,
+            "entregadas": sum(s.entregadas for s in subs),
+            "descartadas": self.descartadas_cerradas + sum(s.descartadas for s in subs),
+        }
+
+
+# ---------------------------------------------------------
+# SERVIDOR HTTP (SSE + panel)
+# ---------------------------------------------------------
+DASHBOARD_HTML = """<!DOCTYPE html>
+<html lang="es"><head><meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>IT 03.2 - DIKOIN</title>
+<style>
+body{font-family:"Segoe UI",sans-serif;background:#ecf1fd;margin:0;padding:16px}
+.card{background:#fff;border-radius:16px;padding:16px;margin-bottom:12px}
+.vals{display:grid;grid-template-columns:repeat(auto-fit,minmax(140px,1fr));gap:8px}
+.v{font-size:1.6em;font-weight:600}.n{color:#666;font-size:.9em}
+canvas{width:100%;height:300px}
+</style></head><body>
+<div class="card"><h2>IT 03.2 &mdash; Convecci&oacute;n Natural y Forzada</h2>
+<div class="vals" id="vals"></div><div class="n" id="estado">Conectando...</div></div>
+<div class="card"><canvas id="plot" width="1000" height="300"></canvas></div>
+<script>
+const canales=[["te","TE (°C)","#E74C3C"],["ts","TS (°C)","#3498DB"],["tc","TC (°C)","#27AE60"],
+["vel","Vel (m/s)","#F39C12"],["pot","Pot (W)","#8E44AD"]];
+const N=600, hist=[];
+const vals=document.getElementById("vals");
+for(const [k,nom] of canales){vals.insertAdjacentHTML("beforeend",
+`<div><div class="n">${nom}</div><div class="v" id="v_${k}">-</div></div>`);}
+const cv=document.getElementById("plot"), cx=cv.getContext("2d");
+function dibujar(){
+  cx.clearRect(0,0,cv.width,cv.height); if(hist.length<2)return;
+  let lo=Infinity,hi=-Infinity;
+  for(const m of hist)for(const [k] of canales){lo=Math.min(lo,m[k]);hi=Math.max(hi,m[k]);}
+  if(hi==lo){hi+=1;lo-=1;}
+  const t0=hist[0].t,t1=hist[hist.length-1].t||t0+1;
+  for(const [k,,col] of canales){cx.strokeStyle=col;cx.lineWidth=2;cx.beginPath();
+    hist.forEach((m,i)=>{const x=(m.t-t0)/(t1-t0||1)*cv.width,y=cv.height-(m[k]-lo)/(hi-lo)*cv.height;
+      i?cx.lineTo(x,y):cx.moveTo(x,y);});cx.stroke();}
+}
+const es=new EventSource("stream");
+es.onopen=()=>document.getElementById("estado").textContent="En directo";
+es.onerror=()=>document.getElementById("estado").textContent="Reconectando...";
+es.onmessage=(e)=>{const m=JSON.parse(e.data);hist.push(m);if(hist.length>N)hist.shift();
+  for(const [k] of canales)document.getElementById("v_"+k).textContent=m[k].toFixed(2);
+  requestAnimationFrame(dibujar);};
+</script></body></html>
+"""
+
+
+def crear_servidor(hub, port=BROADCAST_PORT, host="0.0.0.0"):
+    """Crea el servidor HTTP del hub (un hilo por cliente conectado)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            ruta = self.path.split("?", 1)[0]
+            if ruta == "/stream":
+                self._stream()
+            elif ruta == "/stats":
+                self._enviar(200, "application/json",
+                             json.dumps(hub.estadisticas()).encode("utf-8"))
+            elif ruta in ("/", "/index.html"):
+                self._enviar(200, "text/html; charset=utf-8", DASHBOARD_HTML.encode("utf-8"))
+            else:
+                self._enviar(404, "text/plain", b"not found")
+
+        def _enviar(self, status, tipo, data):
+            self.send_response(status)
+            self.send_header("Content-Type", tipo)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _stream(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            self.close_connection = True
+            sub = hub.suscribir()
+            try:
+                self.wfile.write(b"retry: 2000\n\n")
+                self.wfile.flush()
+                while not self.server.parando:
+                    tramas = sub.sacar_todo(KEEPALIVE)
+                    # Todas las tramas pendientes en una sola escritura
+                    self.wfile.write(b"".join(tramas) if tramas else b": ping\n\n")
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError, OSError):
+                pass
+            finally:
+                hub.desuscribir(sub)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+        request_queue_size = 128  # muchos visores pueden conectarse a la vez
+
+    server = Server((host, port), Handler)
+    server.parando = False
+    return server
+
+
+def iniciar_servidor(hub, port=BROADCAST_PORT, host="0.0.0.0"):
+    server = crear_servidor(hub, port, host)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"📡 Difusión en directo en http://{host}:{server.server_address[1]}/")
+    return server
+
+
+def detener_servidor(server):
+    server.parando = True
+    server.shutdown()
+    server.server_close()
+
+
+# ---------------------------------------------------------
+# BANCO DE PRUEBAS
+# ---------------------------------------------------------
+def _cliente_sse(port, contador, parar):
+    """Cliente mínimo que lee el stream y cuenta tramas recibidas."""
+    with socket.create_connection(("127.0.0.1", port)) as s:
+        s.sendall(b"GET /stream HTTP/1.1\r\nHost: localhost\r\n\r\n")
+        s.settimeout(1.0)
+        while not parar.is_set():
+            try:
+                data = s.recv(65536)
+            except socket.timeout:
+                continue
+            if not data:
+                break
+            contador[0] += data.count(b"data: ")
+
+
+def benchmark(clientes, rate, duracion):
+    """Publica a `rate` muestras/s durante `duracion` s con N clientes conectados."""
+    hub = BroadcastHub()
+    server = iniciar_servidor(hub, 0, "127.0.0.1")
+    port = server.server_address[1]
+    parar = threading.Event()
+    contadores = [[0] for _ in range(clientes)]
+    hilos = [
+        threading.Thread(target=_cliente_sse, args=(port, c, parar), daemon=True)
+        for c in contadores
+    ]
+    for h in hilos:
+        h.start()
+    while hub.estadisticas()["clientes"] < clientes:
+        time.sleep(0.01)
+
+    costes = []
+    periodo = 1.0 / rate
+    siguiente = time.perf_counter()
+    fin = siguiente + duracion
+    i = 0
+    while time.perf_counter() < fin:
+        t0 = time.perf_counter()
+        hub.publicar(time.time(), 20.0 + i % 10, 21.0, 35.0, 1.5, 40.0)
+        costes.append(time.perf_counter() - t0)
+        i += 1
+        siguiente += periodo
+        time.sleep(max(0.0, siguiente - time.perf_counter()))
+    time.sleep(0.5)
+    parar.set()
+    detener_servidor(server)
+
+    costes.sort()
+    recibidas = sum(c[0] for c in contadores)
+    esperadas = clientes * i
+    st = hub.estadisticas()
+    return {
+        "clientes": clientes,
+        "muestras": i,
+        "entregado_%": 100.0 * recibidas / max(1, esperadas),
+        "descartadas": st["descartadas"],
+        "publicar_p50_us": costes[len(costes) // 2] * 1e6,
+        "publicar_p99_us": costes[int(len(costes) * 0.99)] * 1e6,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hub de difusión IT 03.2")
+    parser.add_argument("--bench", type=int, nargs="*", metavar="N",
+                        help="número(s) de visores simultáneos a simular")
+    parser.add_argument("--rate", type=float, default=20.0, help="muestras/s publicadas")
+    parser.add_argument("--duracion", type=float, default=5.0)
+    parser.add_argument("--port", type=int, default=8080)
+    args = parser.parse_args()
+
+    if args.bench is not None:
+        for n in args.bench or [1, 10, 50, 100, 200]:
+            r = benchmark(n, args.rate, args.duracion)
+            print(
+                f"{r['clientes']:4d} visores | {r['muestras']} muestras | "
+                f"entregado {r['entregado_%']:5.1f}% | descartadas {r['descartadas']} | "
+                f"publicar p50 {r['publicar_p50_us']:.0f} µs p99 {r['publicar_p99_us']:.0f} µs"
+            )
+        return
+
+    # Demo: publica datos sintéticos para probar el panel en el navegador
+    import math
+
+    hub = BroadcastHub()
+    server = iniciar_servidor(hub, args.port)
+    try:
+        t0 = time.time()
+        while True:
+            t = time.time() - t0
+            hub.publicar(time.time(), 20 + math.sin(t / 10), 25 + math.sin(t / 7),
+                         40 + 5 * math.sin(t / 20), 1.5, 40.0)
+            time.sleep(1.0 / args.rate)
+    except KeyboardInterrupt:
+        detener_servidor(server)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,358 @@
+# it032_calibration.py - curvas de calibración por canal y por equipo
+# -------------------------------------------------------
+# - calibration.json: constantes del firmware ("firmware"), recalibración
+#   lineal común ("channels", ver it032_reprocess) y curvas de cada equipo
+#   ("devices" -> número de serie -> canal -> modelo)
+# - Modelos: "linear" y "poly" (ajuste por mínimos cuadrados de varios
+#   puntos [lectura, referencia] o coeficientes dados) y "table"
+#   (linealización por tramos: puntos medidos o tabla incorporada, p. ej.
+#   "max6675_k" para el termopar K del MAX6675, que supone 41.276 µV/°C)
+# - Cada modelo se precalcula en una tabla uniforme (LUT): aplicarla es una
+#   interpolación vectorizada sin búsqueda, igual de barata para un polinomio
+#   que para una recta, en el lector (etapa Calibrar) y al reprocesar sesiones
+# - La entrada de las curvas es siempre la lectura tal como la envía el
+#   firmware, sin offsets: la curva da el valor absoluto
+#
+# Uso:  python it032_calibration.py --channel te --fit linear --point 20.4:20.0 --point 61.2:60.0
+#       python it032_calibration.py --channel tc --table max6675_k
+#       python it032_calibration.py --show          |   --bench
+
+import argparse
+import hashlib
+import json
+import time
+
+import numpy as np
+
+CALIBRATION_PATH = "calibration.json"
+CANALES = ("te", "ts", "tc", "vel", "pot")
+LUT_PUNTOS = 2048
+# Rango de lecturas del firmware que cubre la LUT si el modelo no dice otro
+RANGOS = {"te": (-10.0, 110.0), "ts": (-10.0, 110.0), "tc": (-10.0, 500.0),
+          "vel": (0.0, 5.0), "pot": (-10.0, 150.0)}
+
+DEFAULT_CALIBRACION = {
+    "firmware": {"tc": {"scale": 1.0, "offset": -1.3}, "vel": {"scale": 0.00489, "offset": 0.0}},
+    "channels": {"tc": {"scale": 1.0, "offset": -1.3}, "vel": {"scale": 0.00489, "offset": 0.0}},
+    "devices": {},
+}
+
+
+def cargar_calibracion(path=CALIBRATION_PATH):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            cfg = json.load(f)
+    except FileNotFoundError:
+        return json.loads(json.dumps(DEFAULT_CALIBRACION))
+    except Exception as e:
+        print(f"⚠️ No se pudo cargar {path} ({e}); se usa la calibración por defecto.")
+        return json.loads(json.dumps(DEFAULT_CALIBRACION))
+    return {k: cfg.get(k, DEFAULT_CALIBRACION[k]) for k in DEFAULT_CALIBRACION}
+
+
+def guardar_calibracion(calibracion, path=CALIBRATION_PATH):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(calibracion, f, indent=2, ensure_ascii=False)
+        f.write("\n")
+
+
+# ---------------------------------------------------------
+# TABLA PRECALCULADA
+# ---------------------------------------------------------
+class Tabla:
+    """y(x) muestreada en una rejilla uniforme x0, x0 + dx, ...
+
+    Fuera del rango se prolonga el primer o el último tramo. Un NaN de entrada
+    (canal sin lectura nueva en modo mixto) sale como NaN.
+    """
+
+    def __init__(self, x0, dx, y):
+        self.x0 = float(x0)
+        self.dx = float(dx)
+        self.y = np.asarray(y, dtype=float)
+        # Por tramo i: y = ordenada[i] + u · pendiente[i], con u en unidades de rejilla
+        self._pendiente = np.diff(self.y)
+        self._ordenada = self.y[:-1] - np.arange(len(self.y) - 1) * self._pendiente
+        self._ultimo = len(self.y) - 2
+
+    @classmethod
+    def desde_funcion(cls, f, lo, hi, n=LUT_PUNTOS):
+        x = np.linspace(lo, hi, n)
+        return cls(lo, x[1] - x[0], f(x))
+
+    @property
+    def x1(self):
+        return self.x0 + self.dx * (len(self.y) - 1)
+
+    def __call__(self, x):
+        u = (np.asarray(x, dtype=float) - self.x0) / self.dx
+        # fmin/fmax ignoran NaN: el índice queda válido y el NaN sigue en u
+        i = np.fmax(np.fmin(u, self._ultimo), 0).astype(np.intp)
+        return np.take(self._ordenada, i) + u * np.take(self._pendiente, i)
+
+    def monotona(self):
+        d = self._pendiente
+        return bool((d > 0).all() or (d < 0).all())
+
+    def inversa(self, n=LUT_PUNTOS):
+        """Tabla de x(y); solo para curvas estrictamente monótonas."""
+        if not self.monotona():
+            raise ValueError("la curva no es monótona en su rango: no se puede invertir")
+        x = self.x0 + self.dx * np.arange(len(self.y))
+        orden = np.argsort(self.y)
+        ys, xs = self.y[orden], x[orden]
+        return Tabla.desde_funcion(lambda v: np.interp(v, ys, xs), ys[0], ys[-1], n)
+
+
+# ---------------------------------------------------------
+# TABLAS DE LINEALIZACIÓN INCORPORADAS
+# ---------------------------------------------------------
+# Termopar tipo K, NIST ITS-90 (0 a 1372 °C): E(T) en mV
+_NIST_K_C = (-1.7600413686e-02, 3.8921204975e-02, 1.8558770032e-05, -9.9457592874e-08,
+             3.1840945719e-10, -5.6072844889e-13, 5.6075059059e-16, -3.2020720003e-19,
+             9.7151147152e-23, -1.2104721275e-26)
+_NIST_K_A = (1.185976e-01, -1.183432e-04, 1.269686e02)
+
+
+def fem_tipo_k(t):
+    """Tensión del termopar K (mV) con la unión fría a 0 °C."""
+    t = np.asarray(t, dtype=float)
+    a0, a1, a2 = _NIST_K_A
+    return np.polyval(_NIST_K_C[::-1], t) + a0 * np.exp(a1 * (t - a2) ** 2)
+
+
+def tabla_max6675_k(modelo, firmware):
+    """Lectura del firmware -> temperatura real del termopar K.
+
+    El MAX6675 convierte con una sensibilidad fija (41.276 µV/°C) a partir de
+    la temperatura de su unión fría; el firmware resta además su corrección
+    fija (offset de "firmware" para tc).
+    """
+    tcj = float(modelo.get("cold_junction", 25.0))
+    sensibilidad = float(modelo.get("sensitivity_uv", 41.276)) / 1000.0
+    fw = firmware.get("tc", {})
+    t = np.linspace(0.0, float(modelo.get("max", 500.0)), LUT_PUNTOS)
+    lectura = tcj + (fem_tipo_k(t) - fem_tipo_k(tcj)) / sensibilidad
+    lectura = lectura * float(fw.get("scale", 1.0)) + float(fw.get("offset", 0.0))
+    return lectura, t
+
+
+TABLAS = {"max6675_k": tabla_max6675_k}
+
+
+# ---------------------------------------------------------
+# MODELOS -> TABLAS
+# ---------------------------------------------------------
+def _puntos(modelo, minimo):
+    p = np.asarray(modelo.get("points", []), dtype=float).reshape(-1, 2)
+    if len(p) < minimo:
+        raise ValueError(f"hacen falta al menos {minimo} puntos [lectura, referencia]")
+    return p[np.argsort(p[:, 0])]
+
+
+def coeficientes_modelo(modelo):
+    """Coeficientes (potencia mayor primero) de un modelo "linear" o "poly"."""
+    if "coefficients" in modelo:
+        return np.asarray(modelo["coefficients"], dtype=float)
+    grado = 1 if modelo["type"] == "linear" else int(modelo.get("degree", 2))
+    p = _puntos(modelo, grado + 1)
+    return np.polyfit(p[:, 0], p[:, 1], grado)
+
+
+def crear_tabla(canal, modelo, firmware=None):
+    """Precalcula la LUT de un modelo de calibration.json."""
+    tipo = modelo.get("type")
+    lo, hi = modelo.get("range", RANGOS[canal])
+    if tipo in ("linear", "poly"):
+        c = coeficientes_modelo(modelo)
+        tabla = Tabla.desde_funcion(lambda x: np.polyval(c, x), lo, hi)
+    elif tipo == "table":
+        if "table" in modelo:
+            if modelo["table"] not in TABLAS:
+                raise ValueError(f"tabla desconocida: {modelo['table']} (use {', '.join(TABLAS)})")
+            xs, ys = TABLAS[modelo["table"]](modelo, firmware or DEFAULT_CALIBRACION["firmware"])
+        else:
+            p = _puntos(modelo, 2)
+            xs, ys = p[:, 0], p[:, 1]
+        if "range" not in modelo:
+            lo, hi = xs[0], xs[-1]
+        tabla = Tabla.desde_funcion(lambda x: np.interp(x, xs, ys), lo, hi)
+    else:
+        raise ValueError(f"{canal}: tipo de modelo no válido: {tipo} (use linear, poly o table)")
+    if not tabla.monotona():
+        raise ValueError(f"{canal}: la curva no es monótona entre {lo:g} y {hi:g}")
+    return tabla
+
+
+class Curvas:
+    """Curvas de un equipo, una LUT por canal calibrado."""
+
+    def __init__(self, modelos=None, firmware=None):
+        self.modelos = dict(modelos or {})
+        self.tablas = {}
+        for canal, modelo in self.modelos.items():
+            self.tablas[canal] = crear_tabla(canal, modelo, firmware)
+        self._inversas = {}
+        self.columnas = [i for i, c in enumerate(CANALES) if c in self.tablas]
+
+    def __bool__(self):
+        return bool(self.tablas)
+
+    def __contains__(self, canal):
+        return canal in self.tablas
+
+    def aplicar(self, valores):
+        """(n, 5) lecturas del firmware -> (n, 5) calibradas; los canales sin curva no cambian."""
+        if not self.tablas:
+            return valores
+        out = np.array(valores, dtype=float)
+        for i in self.columnas:
+            out[:, i] = self.tablas[CANALES[i]](out[:, i])
+        return out
+
+    def canal(self, canal, x):
+        return self.tablas[canal](x)
+
+    def invertir(self, canal, y):
+        """Valor calibrado -> lectura del firmware (para reprocesar con otra curva)."""
+        if canal not in self._inversas:
+            self._inversas[canal] = self.tablas[canal].inversa()
+        return self._inversas[canal](y)
+
+    def sin_offsets(self, offsets):
+        """Un canal con curva es absoluto: no se le resta el cero de reposo."""
+        offsets = np.array(offsets, dtype=float)
+        offsets[self.columnas] = 0.0
+        return offsets
+
+    def huella(self):
+        return hashlib.sha256(json.dumps(self.modelos, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def curvas_equipo(calibracion, serial_number):
+    return Curvas(calibracion.get("devices", {}).get(serial_number, {}), calibracion["firmware"])
+
+
+def cargar_curvas(serial_number, path=CALIBRATION_PATH):
+    """Curvas del equipo; si alguna no es válida se avisa y se trabaja sin curvas."""
+    try:
+        return curvas_equipo(cargar_calibracion(path), serial_number)
+    except ValueError as e:
+        print(f"⚠️ Curvas de calibración de {serial_number} no válidas ({e}); se ignoran.")
+        return Curvas()
+
+
+# ---------------------------------------------------------
+# LÍNEA DE COMANDOS
+# ---------------------------------------------------------
+def _punto(texto):
+    try:
+        lectura, referencia = (float(v) for v in texto.split(":"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"punto no válido: {texto} (use lectura:referencia)")
+    return [lectura, referencia]
+
+
+def mostrar(calibracion, serial_number):
+    modelos = calibracion.get("devices", {}).get(serial_number, {})
+    if not modelos:
+        print(f"{serial_number}: sin curvas (lecturas del firmware tal cual)")
+        return
+    curvas = curvas_equipo(calibracion, serial_number)
+    for canal, modelo in modelos.items():
+        tabla = curvas.tablas[canal]
+        linea = f"{serial_number} {canal}: {modelo['type']}"
+        if modelo["type"] in ("linear", "poly"):
+            c = coeficientes_modelo(modelo)
+            linea += " [" + ", ".join(f"{v:.6g}" for v in c) + "]"
+            if "points" in modelo:
+                p = np.asarray(modelo["points"], dtype=float)
+                residuo = np.polyval(c, p[:, 0]) - p[:, 1]
+                linea += f", residuo máx {np.abs(residuo).max():.3g}"
+        elif "table" in modelo:
+            linea += f" {modelo['table']}"
+        else:
+            linea += f" ({len(modelo['points'])} puntos)"
+        linea += f", LUT {tabla.x0:g}..{tabla.x1:g}"
+        print(linea)
+        muestras = np.linspace(tabla.x0, tabla.x1, 5)
+        print("   " + "  ".join(f"{x:.4g}→{y:.4g}" for x, y in zip(muestras, tabla(muestras))))
+
+
+def bench(n=1_000_000):
+    """Coste por muestra de la LUT frente a evaluar el modelo directamente."""
+    x = np.random.default_rng(0).uniform(0, 200, n)
+    c = np.array([2e-13, -3e-10, 1e-7, -2e-5, 1.01, -0.4])
+    poly = Tabla.desde_funcion(lambda v: np.polyval(c, v), -10, 500)
+    lecturas, reales = tabla_max6675_k({}, DEFAULT_CALIBRACION["firmware"])
+    termopar = crear_tabla("tc", {"type": "table", "table": "max6675_k"})
+    pruebas = {
+        "polinomio grado 5 (np.polyval)": lambda: np.polyval(c, x),
+        "polinomio grado 5 (LUT)": lambda: poly(x),
+        f"termopar K, tabla de {len(lecturas)} puntos (np.interp)":
+            lambda: np.interp(x, lecturas, reales),
+        "termopar K (LUT)": lambda: termopar(x),
+    }
+    for nombre, f in pruebas.items():
+        f()
+        t = time.perf_counter()
+        for _ in range(5):
+            f()
+        dt = (time.perf_counter() - t) / 5
+        print(f"   {nombre}: {dt / n * 1e9:.1f} ns/muestra")
+    print(f"   error máx de la LUT: polinomio {np.abs(poly(x) - np.polyval(c, x)).max():.1e}, "
+          f"termopar {np.abs(termopar(x) - np.interp(x, lecturas, reales)).max():.1e} °C")
+
+
+def main():
+    import it032_store as store
+
+    p = argparse.ArgumentParser(description="Curvas de calibración por equipo (calibration.json)")
+    p.add_argument("--calibration", default=CALIBRATION_PATH)
+    p.add_argument("--machine", default=store.MACHINE_SERIAL, help="número de serie del equipo")
+    p.add_argument("--channel", choices=CANALES)
+    p.add_argument("--fit", choices=("linear", "poly"), help="ajuste por varios puntos")
+    p.add_argument("--degree", type=int, default=2)
+    p.add_argument("--point", type=_punto, action="append", metavar="LECTURA:REF")
+    p.add_argument("--table", help=f"tabla incorporada ({', '.join(TABLAS)}) o 'points'")
+    p.add_argument("--cold-junction", type=float, default=25.0, help="°C (max6675_k)")
+    p.add_argument("--remove", action="store_true", help="quitar la curva del canal")
+    p.add_argument("--show", action="store_true")
+    p.add_argument("--bench", action="store_true")
+    args = p.parse_args()
+
+    if args.bench:
+        bench()
+        return
+    calibracion = cargar_calibracion(args.calibration)
+    if args.channel:
+        equipo = calibracion.setdefault("devices", {}).setdefault(args.machine, {})
+        if args.remove:
+            equipo.pop(args.channel, None)
+        else:
+            if args.fit:
+                modelo = {"type": args.fit, "points": args.point or []}
+                if args.fit == "poly":
+                    modelo["degree"] = args.degree
+            elif args.table == "points":
+                modelo = {"type": "table", "points": args.point or []}
+            elif args.table:
+                modelo = {"type": "table", "table": args.table}
+                if args.table == "max6675_k":
+                    modelo["cold_junction"] = args.cold_junction
+            else:
+                p.error("indique --fit, --table o --remove")
+            try:
+                crear_tabla(args.channel, modelo, calibracion["firmware"])
+            except ValueError as e:
+                p.error(str(e))
+            equipo[args.channel] = modelo
+        if not equipo:
+            calibracion["devices"].pop(args.machine)
+        guardar_calibracion(calibracion, args.calibration)
+        print(f"✅ {args.calibration} actualizado")
+    mostrar(calibracion, args.machine)
+
+
+if __name__ == "__main__":
+    main()
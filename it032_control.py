@@ -0,0 +1,268 @@
+# it032_control.py - control automático de temperatura (TC) y velocidad del aire
+# -------------------------------------------------------
+# - PID con derivada sobre la medida y anti-windup por integración
+#   condicional; salida limitada a 0-255 como en enviar_comando
+# - Se evalúa en el hilo de lectura, muestra a muestra (no depende de la GUI),
+#   y envía las salidas por el CommandLane como consignas con origen "control"
+#   (los enclavamientos de seguridad siguen limitándolas)
+# - Autoajuste por relé (Åström-Hägglund): oscila alrededor del objetivo,
+#   mide ganancia y periodo últimos y calcula las ganancias
+# - Ganancias por lazo guardadas en control.json
+
+import json
+import math
+import threading
+
+CONTROL_PATH = "control.json"
+SALIDA_MIN, SALIDA_MAX = 0, 255
+
+# Lazo -> canal medido (índice en [te, ts, tc, vel, pot]) y actuador
+LAZOS = {
+    "tc": {"canal": 2, "actuador": "HEAT", "unidad": "°C"},
+    "vel": {"canal": 3, "actuador": "FAN", "unidad": "m/s"},
+}
+
+DEFAULT_GAINS = {
+    "tc": {"kp": 2.5, "ki": 0.02, "kd": 0.0},
+    "vel": {"kp": 85.0, "ki": 17.0, "kd": 0.0},
+}
+
+# Autoajuste: amplitud del relé, histéresis (en unidades del canal) y límites
+AUTOTUNE = {
+    "tc": {"amplitud": 80, "histeresis": 0.3, "timeout_s": 3600.0},
+    "vel": {"amplitud": 60, "histeresis": 0.05, "timeout_s": 300.0},
+}
+AUTOTUNE_CICLOS = 4  # ciclos medidos (se descarta el primero)
+
+
+def _limitar(valor, lo=SALIDA_MIN, hi=SALIDA_MAX):
+    return max(lo, min(hi, valor))
+
+
+# ---------------------------------------------------------
+# PID
+# ---------------------------------------------------------
+class PID:
+    """PID de posición; el término integral se guarda ya en unidades de salida."""
+
+    def __init__(self, kp, ki, kd=0.0, salida_min=SALIDA_MIN, salida_max=SALIDA_MAX):
+        self.kp, self.ki, self.kd = kp, ki, kd
+        self.salida_min, self.salida_max = salida_min, salida_max
+        self.reiniciar()
+
+    def reiniciar(self, salida_actual=0.0):
+        """Arranque sin salto: el integral parte de la salida que ya tiene el equipo."""
+        self.integral = _limitar(salida_actual, self.salida_min, self.salida_max)
+        self._t = None
+        self._medida = None
+
+    def calcular(self, t, consigna, medida):
+        dt = t - self._t if self._t is not None else 0.0
+        error = consigna - medida
+        p = self.kp * error
+        # Derivada sobre la medida: un cambio de consigna no produce un pico
+        d = 0.0
+        if self.kd and dt > 0 and self._medida is not None:
+            d = -self.kd * (medida - self._medida) / dt
+        self._t, self._medida = t, medida
+
+        integral = self.integral + self.ki * error * dt
+        salida = p + integral + d
+        # Anti-windup: no se integra si la salida satura y el error empuja a saturar más
+        saturada_arriba = salida > self.salida_max and error > 0
+        saturada_abajo = salida < self.salida_min and error < 0
+        if not (saturada_arriba or saturada_abajo):
+            self.integral = _limitar(integral, self.salida_min, self.salida_max)
+        return _limitar(p + self.integral + d, self.salida_min, self.salida_max)
+
+
+# ---------------------------------------------------------
+# AUTOAJUSTE POR RELÉ
+# ---------------------------------------------------------
+def reglas_sintonia(ku, pu, regla="tyreus-luyben"):
+    """Ganancias a partir de la ganancia y el periodo últimos."""
+    if regla == "ziegler-nichols":
+        kp, ti, td = 0.6 * ku, pu / 2.0, pu / 8.0
+    else:
+        # Tyreus-Luyben (PI): más conservadora, con menos sobreoscilación en
+        # procesos térmicos lentos
+        kp, ti, td = ku / 3.2, 2.2 * pu, 0.0
+    return {"kp": kp, "ki": kp / ti, "kd": kp * td}
+
+
+class RelayAutotune:
+    """Conmuta la salida entre base ± amplitud según la medida cruce el objetivo."""
+
+    def __init__(self, consigna, salida_base, amplitud, histeresis,
+                 ciclos=AUTOTUNE_CICLOS, timeout_s=3600.0, regla="tyreus-luyben"):
+        self.consigna = consigna
+        self.alta = _limitar(salida_base + amplitud)
+        self.baja = _limitar(salida_base - amplitud)
+        self.d = (self.alta - self.baja) / 2.0
+        self.histeresis = histeresis
+        self.ciclos = ciclos
+        self.timeout_s = timeout_s
+        self.regla = regla
+        self.salida = self.alta
+        self.subidas = []  # instantes de conmutación a salida alta
+        self.amplitudes = []  # pico a pico de la medida en cada ciclo
+        self._max = -math.inf
+        self._min = math.inf
+        self._t0 = None
+        self.terminado = False
+        self.resultado = None  # dict con ku, pu y ganancias, o None si falla
+        self.error = None
+
+    def calcular(self, t, medida):
+        if self._t0 is None:
+            self._t0 = t
+        self._max = max(self._max, medida)
+        self._min = min(self._min, medida)
+        if self.salida == self.alta and medida > self.consigna + self.histeresis:
+            self.salida = self.baja
+        elif self.salida == self.baja and medida < self.consigna - self.histeresis:
+            self.salida = self.alta
+            self.subidas.append(t)
+            if len(self.subidas) > 1:
+                self.amplitudes.append(self._max - self._min)
+            self._max, self._min = -math.inf, math.inf
+            if len(self.subidas) > self.ciclos + 1:
+                self._terminar()
+        if not self.terminado and t - self._t0 > self.timeout_s:
+            self.terminado = True
+            self.error = "timeout"
+        return self.salida
+
+    def _terminar(self):
+        # El primer ciclo arranca desde fuera del régimen oscilatorio: se descarta
+        periodos = [b - a for a, b in zip(self.subidas[1:], self.subidas[2:])]
+        a = sum(self.amplitudes[1:]) / len(self.amplitudes[1:]) / 2.0
+        pu = sum(periodos) / len(periodos)
+        self.terminado = True
+        if a <= 0 or pu <= 0:
+            self.error = "sin oscilación"
+            return
+        ku = 4.0 * self.d / (math.pi * a)
+        self.resultado = {"ku": ku, "pu": pu, **reglas_sintonia(ku, pu, self.regla)}
+
+
+# ---------------------------------------------------------
+# LAZOS
+# ---------------------------------------------------------
+def cargar_ganancias(path=CONTROL_PATH):
+    ganancias = {k: dict(v) for k, v in DEFAULT_GAINS.items()}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for lazo, g in json.load(f).items():
+                ganancias.setdefault(lazo, {}).update(g)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"⚠️ No se pudo cargar {path} ({e}); se usan las ganancias por defecto.")
+    return ganancias
+
+
+def guardar_ganancias(ganancias, path=CONTROL_PATH):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(ganancias, f, ensure_ascii=False, indent=2)
+
+
+class ControlLoop:
+    """Un lazo (medida -> actuador) que se evalúa en cada muestra."""
+
+    def __init__(self, lane, lazo, ganancias):
+        cfg = LAZOS[lazo]
+        self.lane = lane
+        self.lazo = lazo
+        self.idx = cfg["canal"]
+        self.actuador = cfg["actuador"]
+        self.pid = PID(**ganancias)
+        self.consigna = None
+        self.activo = False
+        self.autotune = None
+        self._ultima = None
+        self._lock = threading.Lock()
+
+    def activar(self, consigna):
+        with self._lock:
+            if not self.activo:
+                self.pid.reiniciar(self.lane.valores.get(self.actuador, 0))
+            self.consigna = float(consigna)
+            self.activo = True
+
+    def desactivar(self):
+        with self._lock:
+            self.activo = False
+            self.autotune = None
+            self._ultima = None
+
+    def iniciar_autotune(self, consigna, **opciones):
+        cfg = {**AUTOTUNE[self.lazo], **opciones}
+        with self._lock:
+            self.consigna = float(consigna)
+            self.autotune = RelayAutotune(
+                self.consigna, self.lane.valores.get(self.actuador, 0) or SALIDA_MAX / 2,
+                cfg["amplitud"], cfg["histeresis"], timeout_s=cfg["timeout_s"],
+            )
+            self.activo = True
+
+    def evaluar(self, t, valores):
+        """Devuelve el autoajuste si acaba de terminar en esta muestra."""
+        with self._lock:
+            if not self.activo:
+                return None
+            medida = valores[self.idx]
+            if medida != medida:  # canal sin lectura todavía
+                return None
+            terminado = None
+            if self.autotune:
+                salida = self.autotune.calcular(t, medida)
+                if self.autotune.terminado:
+                    terminado, self.autotune = self.autotune, None
+                    if terminado.resultado:
+                        r = terminado.resultado
+                        self.pid.kp, self.pid.ki, self.pid.kd = r["kp"], r["ki"], r["kd"]
+                    self.pid.reiniciar(salida)
+                    salida = self.pid.calcular(t, self.consigna, medida)
+            else:
+                salida = self.pid.calcular(t, self.consigna, medida)
+            salida = int(round(salida))
+            # Solo se escribe en el puerto cuando cambia el valor entero
+            if salida != self._ultima:
+                self._ultima = salida
+                self.lane.consigna(self.actuador, salida, origen="control")
+            return terminado
+
+    def ganancias(self):
+        return {"kp": self.pid.kp, "ki": self.pid.ki, "kd": self.pid.kd}
+
+
+class Controller:
+    """Lazos de TC y velocidad; se llama desde el hilo de adquisición."""
+
+    def __init__(self, lane, al_terminar_autotune=None, path=CONTROL_PATH):
+        self.path = path
+        ganancias = cargar_ganancias(path)
+        self.lazos = {lazo: ControlLoop(lane, lazo, ganancias[lazo]) for lazo in LAZOS}
+        self.al_terminar_autotune = al_terminar_autotune
+
+    def evaluar(self, t, valores):
+        for lazo in self.lazos.values():
+            terminado = lazo.evaluar(t, valores)
+            if terminado is not None:
+                if terminado.resultado:
+                    self.guardar()
+                if self.al_terminar_autotune:
+                    self.al_terminar_autotune(lazo.lazo, terminado.resultado or {"error": terminado.error})
+
+    def desactivar_actuador(self, actuador):
+        """Apaga los lazos que mueven un actuador (p. ej. tras un enclavamiento)."""
+        for lazo in self.lazos.values():
+            if lazo.actuador == actuador:
+                lazo.desactivar()
+
+    def guardar(self):
+        try:
+            guardar_ganancias({k: l.ganancias() for k, l in self.lazos.items()}, self.path)
+        except Exception as e:
+            print(f"⚠️ No se pudieron guardar las ganancias: {e}")
@@ -1,13 +1,32 @@
+import math
 import serial
 import serial.tools.list_ports
 import time
+import threading
 import numpy as np
-import sys
 
 BAUD = 9600
 COM_TIMEOUT = 1.0
+LIBERAR_PUERTO_S = 1.0  # tras cerrar el puerto, antes de volver a abrirlo
 READ_DELAY = 0.5
 CALIBRATION_SAMPLES = 10
+# Canales con un cero físico en reposo (ventilador y calefactor parados). Las
+# temperaturas son absolutas (DS18B20 y termopar): no se les resta nada; su
+# corrección son las curvas de it032_calibration.
+CANALES_CERO = (3, 4)
+SAMPLE_RATE_HZ = 10  # canales rápidos (vel, pot) si el firmware admite RATE###
+RATE_ACK_TIMEOUT = 6.0  # segundos esperando la confirmación "# RATE n"
+RATE_ACK_LINES = 20  # líneas leídas como máximo mientras se espera
+
+# Reloj común para muestras y comandos: monótono, pero expresado en segundos
+# epoch para poder guardarlo y convertirlo a fecha/hora.
+_T0_WALL = time.time()
+_T0_MONO = time.monotonic()
+
+
+def reloj():
+    """Marca de tiempo monótona (no salta si se cambia la hora del sistema)."""
+    return _T0_WALL + (time.monotonic() - _T0_MONO)
 
 def detectar_puerto():
     """Detecta automáticamente el puerto COM donde está conectado el equipo."""
@@ -27,10 +46,10 @@ def detectar_puerto():
                     if not line:
                         continue
                     parts = line.split("\t")
-                    # Se espera 5 valores numéricos separados por tab
-                    if len(parts) == 5:
+                    # Se espera 5 valores numéricos separados por tab (6 en modo mixto)
+                    if len(parts) in (5, 6):
                         try:
-                            floats = list(map(float, parts))
+                            floats = [float(p) for p in parts if p]
                             print(f"✅ Equipo detectado en {p.device}: {floats}")
                             return p.device
                         except ValueError:
@@ -43,13 +62,29 @@ def detectar_puerto():
 
 def leer_linea(ser):
     try:
-        line = ser.readline().decode(errors="ignore").strip()
-        if not line:
+        return parsear_linea(ser.readline())
+    except Exception as e:
+        print(f"⚠️ Error leyendo línea: {e}")
+        return None
+
+
+def parsear_linea(raw):
+    """Convierte una línea del equipo en [te, ts, tc, vel, pot] (None si no es válida).
+
+    Admite la línea clásica de 5 campos y la mixta del firmware con RATE###:
+    millis + 5 campos, con las temperaturas vacías si no hay lectura nueva;
+    esos canales se devuelven como NaN.
+    """
+    try:
+        line = raw.decode(errors="ignore").strip()
+        if not line or line.startswith("#"):
             return None
         parts = line.split("\t")
-        if len(parts) != 5:
+        if len(parts) == 6:
+            parts = parts[1:]
+        elif len(parts) != 5:
             return None
-        vals = list(map(float, parts))
+        vals = [float(p) if p else math.nan for p in parts]
         vals[0], vals[1] = vals[1], vals[0]
         return vals
     except Exception as e:
@@ -58,22 +93,28 @@ def leer_linea(ser):
 
 
 def calibrar_sensores(ser):
-    """Lee varias muestras iniciales y calcula los promedios como offsets."""
+    """Lee varias muestras en reposo y devuelve los offsets (solo vel y pot)."""
     print("🧭 Calibrando sensores... espere unos segundos.")
     muestras = []
-    for i in range(10):  # número de muestras
+    # En modo mixto las temperaturas llegan en menos líneas que vel/pot:
+    # se sigue leyendo hasta tener CALIBRATION_SAMPLES de cada canal
+    for _ in range(CALIBRATION_SAMPLES * 40):
         valores = leer_linea(ser)
         if valores:
             muestras.append(valores)
-            print(f"  Muestra {i+1}/10: {valores}")
-        time.sleep(READ_DELAY)
+            print(f"  Muestra {len(muestras)}: {valores}")
+            if np.isfinite(np.array(muestras)).sum(axis=0).min() >= CALIBRATION_SAMPLES:
+                break
 
     if not muestras:
         print("❌ No se recibieron datos durante la calibración.")
         return [0, 0, 0, 0, 0]
 
     arr = np.array(muestras)
-    offsets = np.mean(arr, axis=0)
+    offsets = np.zeros(arr.shape[1])
+    with np.errstate(all="ignore"):
+        ceros = np.nan_to_num(np.nanmean(arr[:, CANALES_CERO], axis=0))
+    offsets[list(CANALES_CERO)] = ceros
     print("\n✅ Calibración completada.")
     print(f"Offsets calculados: {offsets}\n")
     return offsets
@@ -92,6 +133,119 @@ def enviar_comando(ser, tipo, valor):
         print(f"⚠️ Error enviando comando {tipo}: {e}")
 
 
+def negociar_frecuencia(ser, hz=SAMPLE_RATE_HZ):
+    """Pide al firmware el modo mixto (RATE###). Devuelve True si lo confirma.
+
+    El comando se envía al llegar la primera línea (el Arduino se reinicia al
+    abrir el puerto y lo perdería); un firmware antiguo lo ignora y sigue con
+    la línea clásica.
+    """
+    limite = time.monotonic() + RATE_ACK_TIMEOUT
+    enviado = False
+    for _ in range(RATE_ACK_LINES):
+        if time.monotonic() > limite:
+            break
+        try:
+            raw = ser.readline()
+        except Exception as e:
+            print(f"⚠️ Error leyendo línea: {e}")
+            break
+        linea = raw.decode(errors="ignore").strip()
+        if not enviado:
+            if linea:
+                enviar_comando(ser, "RATE", hz)
+                enviado = True
+            continue
+        if linea.startswith("# RATE"):
+            # El firmware contesta con la frecuencia que ha aplicado
+            try:
+                aplicada = int(linea[6:])
+            except ValueError:
+                continue
+            if aplicada <= 0:
+                break
+            print(f"✅ Firmware en modo mixto: canales rápidos a {aplicada} Hz")
+            return True
+    print("ℹ️ El firmware no admite RATE: se mantiene la línea clásica.")
+    return False
+
+
+class CommandLane:
+    """Canal de comandos FAN/HEAT hacia el equipo.
+
+    Las consignas normales se encolan y se fusionan (solo cuenta la última de
+    cada tipo) y las escribe un hilo propio. La vía prioritaria escribe en el
+    acto desde el hilo que la llama, descarta la consigna pendiente del mismo
+    tipo y puede enclavar un valor hasta que se rearme.
+    """
+
+    def __init__(self, ser):
+        self.ser = ser
+        self.valores = {"FAN": 0, "HEAT": 0}  # último valor escrito en el equipo
+        self.bloqueos = {}  # tipo -> valor máximo permitido mientras esté enclavado
+        self.oyentes = []  # callbacks (t, tipo, valor, origen) tras cada escritura
+        self._pendientes = {}
+        self._cond = threading.Condition()
+        self._lock_serie = threading.Lock()
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def consigna(self, tipo, valor, origen="consigna"):
+        """Encola una consigna; sustituye a la anterior del mismo tipo si no se envió aún."""
+        tipo = tipo.upper()
+        with self._cond:
+            if tipo in self.bloqueos:
+                valor = min(valor, self.bloqueos[tipo])
+            self._pendientes[tipo] = (valor, origen)
+            self._cond.notify()
+
+    def prioritario(self, tipo, valor, enclavar=False):
+        """Escribe el comando inmediatamente, saltándose la cola de consignas."""
+        tipo = tipo.upper()
+        with self._lock_serie:
+            with self._cond:
+                self._pendientes.pop(tipo, None)
+                if enclavar:
+                    self.bloqueos[tipo] = valor
+            self._escribir(tipo, valor, "prioritario")
+
+    def rearmar(self, tipo):
+        with self._cond:
+            self.bloqueos.pop(tipo.upper(), None)
+
+    def _escribir(self, tipo, valor, origen="consigna"):
+        # Llamar siempre con _lock_serie tomado
+        enviar_comando(self.ser, tipo, valor)
+        t = reloj()
+        valor = int(max(0, min(255, valor)))
+        self.valores[tipo] = valor
+        for oyente in self.oyentes:
+            oyente(t, tipo, valor, origen)
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while self._running and not self._pendientes:
+                    self._cond.wait()
+                if not self._running:
+                    return
+            # La consigna se extrae con el puerto ya reservado: si entretanto
+            # llegó un comando prioritario, la pendiente ya no existe.
+            with self._lock_serie:
+                with self._cond:
+                    if not self._pendientes:
+                        continue
+                    tipo, (valor, origen) = self._pendientes.popitem()
+                self._escribir(tipo, valor, origen)
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join(timeout=2.0)
+
+
 def main():
     port = detectar_puerto()
     if not port:
@@ -0,0 +1,349 @@
+# it032_diagnostics.py - diagnóstico de ruido y espectro de los sensores
+# -------------------------------------------------------
+# - Espectro de potencia (Welch), desviación de Allan y suelo de ruido por
+#   canal, calculados sobre las últimas muestras sin filtrar
+# - Cada canal guarda solo sus lecturas reales con su propio instante: en
+#   modo mixto las temperaturas van más lentas y su frecuencia de muestreo
+#   es la suya, no la de la velocidad y la potencia
+# - El cálculo corre en un hilo aparte con NumPy; las ventanas y los ejes de
+#   frecuencia se precalculan una vez por tamaño de segmento y se reutilizan
+# - Panel independiente con exportación a Excel para calificar un equipo
+#
+# Sirve para distinguir vibración del ventilador (pico en el espectro),
+# ruido del ADC (ruido blanco con cuantización visible) o un termopar flojo
+# (deriva: la desviación de Allan crece con tau).
+
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pyqtgraph as pg
+from PyQt6.QtCore import QThread, QTimer, pyqtSignal
+from PyQt6.QtWidgets import (
+    QWidget,
+    QVBoxLayout,
+    QHBoxLayout,
+    QPushButton,
+    QComboBox,
+    QLabel,
+    QTableWidget,
+    QTableWidgetItem,
+    QFileDialog,
+    QMessageBox,
+)
+
+CANALES = ("te", "ts", "tc", "vel", "pot")
+BUFFER_SAMPLES = 8192  # muestras crudas que se conservan para el diagnóstico
+MIN_SAMPLES = 64  # mínimo para empezar a analizar
+NPERSEG = 256  # muestras por segmento de Welch
+ALLAN_PUNTOS = 24  # valores de tau (escala logarítmica)
+PERIODO_MS = 2000  # cada cuánto se recalcula con el panel abierto
+
+
+# ---------------------------------------------------------
+# BÚFER DE MUESTRAS CRUDAS
+# ---------------------------------------------------------
+class SampleRing:
+    """Últimas n lecturas de cada canal (instante y valor) en arrays preasignados."""
+
+    def __init__(self, n=BUFFER_SAMPLES):
+        self.t = np.zeros((n, len(CANALES)))
+        self.x = np.zeros((n, len(CANALES)))
+        self.n = n
+        self.totales = np.zeros(len(CANALES), dtype=np.int64)
+        self._lock = threading.Lock()
+
+    def agregar(self, t, valores, nuevos=None):
+        """Una fila o un bloque: t (m,), valores (m, 5) y `nuevos` (m, 5), que
+        marca las lecturas reales (sin él, todas lo son)."""
+        t = np.atleast_1d(np.asarray(t, dtype=float))
+        valores = np.asarray(valores, dtype=float).reshape(len(t), len(CANALES))
+        with self._lock:
+            for k in range(len(CANALES)):
+                filas = np.arange(len(t)) if nuevos is None else np.flatnonzero(nuevos[:, k])
+                filas = filas[-self.n:]
+                pos = (self.totales[k] + np.arange(len(filas))) % self.n
+                self.t[pos, k] = t[filas]
+                self.x[pos, k] = valores[filas, k]
+                self.totales[k] += len(filas)
+
+    def __len__(self):
+        """Lecturas del canal que menos tiene."""
+        return int(min(self.totales.min(), self.n))
+
+    def ultimas(self):
+        """Copia ordenada por tiempo: dict canal -> (t, x)."""
+        series = {}
+        with self._lock:
+            for k, canal in enumerate(CANALES):
+                total = int(self.totales[k])
+                if total <= self.n:
+                    orden = np.arange(total)
+                else:
+                    orden = (total + np.arange(self.n)) % self.n
+                series[canal] = (self.t[orden, k], self.x[orden, k])
+        return series
+
+
+# ---------------------------------------------------------
+# ANÁLISIS
+# ---------------------------------------------------------
+class Analizador:
+    """Welch, Allan y suelo de ruido; reutiliza ventanas y ejes entre llamadas."""
+
+    def __init__(self, nperseg=NPERSEG):
+        self.nperseg = nperseg
+        self._planes = {}  # n -> (ventana, escala, frecuencias normalizadas)
+
+    def _plan(self, n):
+        plan = self._planes.get(n)
+        if plan is None:
+            ventana = np.hanning(n)
+            plan = (ventana, 1.0 / np.sum(ventana ** 2), np.fft.rfftfreq(n))
+            self._planes[n] = plan
+        return plan
+
+    def welch(self, x, fs):
+        """Densidad espectral de potencia (unidades²/Hz) con solape del 50 %."""
+        n = min(self.nperseg, len(x))
+        ventana, escala, f_norm = self._plan(n)
+        segmentos = np.lib.stride_tricks.sliding_window_view(x, n)[:: n // 2]
+        segmentos = segmentos - segmentos.mean(axis=1, keepdims=True)
+        espectro = np.abs(np.fft.rfft(segmentos * ventana, axis=1)) ** 2
+        psd = espectro.mean(axis=0) * escala / fs
+        psd[1: -1 if n % 2 == 0 else None] *= 2.0  # espectro de una cara
+        return f_norm * fs, psd
+
+    @staticmethod
+    def allan(x, fs, puntos=ALLAN_PUNTOS):
+        """Desviación de Allan solapada, con sumas acumuladas (sin bucles por muestra)."""
+        n = len(x)
+        m = np.unique(np.logspace(0, np.log10(max(1, n // 3)), puntos).astype(int))
+        c = np.concatenate(([0.0], np.cumsum(x - x.mean())))
+        adev = np.empty(len(m))
+        for i, mi in enumerate(m):
+            d = c[2 * mi:] - 2.0 * c[mi:n + 1 - mi] + c[: n + 1 - 2 * mi]
+            adev[i] = np.sqrt(0.5 * np.mean(d ** 2)) / mi
+        return m / fs, adev
+
+    def analizar(self, series):
+        """`series`: dict canal -> (t, x) con las lecturas reales de cada canal."""
+        t0 = time.perf_counter()
+        res = {"canales": {}}
+        for canal in CANALES:
+            t, x = (np.asarray(a, dtype=float) for a in series[canal])
+            fs = 1.0 / float(np.median(np.diff(t)))
+            f, psd = self.welch(x, fs)
+            tau, adev = self.allan(x, fs)
+            # Se ignoran las frecuencias más bajas (deriva/consigna) al buscar picos
+            desde = max(2, len(f) // 32)
+            pico = desde + int(np.argmax(psd[desde:])) if len(psd) > desde else 0
+            pasos = np.diff(np.unique(x))
+            res["canales"][canal] = {
+                "n": len(x),
+                "fs": fs,
+                "f": f,
+                "psd": psd,
+                "tau": tau,
+                "adev": adev,
+                # Ruido blanco a partir de diferencias: insensible a la deriva lenta
+                "ruido_rms": float(np.std(np.diff(x)) / np.sqrt(2.0)),
+                "suelo": float(np.sqrt(np.median(psd[len(psd) // 2:]))),
+                "pico_hz": float(f[pico]),
+                "cuanto": float(pasos.min()) if len(pasos) else 0.0,
+            }
+        res["duracion_ms"] = (time.perf_counter() - t0) * 1e3
+        return res
+
+
+def exportar(resultados, path):
+    """Guarda resumen, espectros y desviación de Allan en hojas de un Excel."""
+    resumen = pd.DataFrame([
+        {
+            "canal": canal,
+            "fs_hz": r["fs"],
+            "muestras": r["n"],
+            "ruido_rms": r["ruido_rms"],
+            "suelo_por_raiz_hz": r["suelo"],
+            "pico_hz": r["pico_hz"],
+            "cuanto": r["cuanto"],
+        }
+        for canal, r in resultados["canales"].items()
+    ])
+    # Cada canal con su propio eje: la frecuencia de muestreo no es la misma
+    psd = pd.concat([
+        pd.Series(v, name=f"{canal}{sufijo}")
+        for canal, r in resultados["canales"].items()
+        for sufijo, v in (("_f_hz", r["f"]), ("", r["psd"]))
+    ], axis=1)
+    allan = pd.concat([
+        pd.Series(v, name=f"{canal}{sufijo}")
+        for canal, r in resultados["canales"].items()
+        for sufijo, v in (("_tau_s", r["tau"]), ("", r["adev"]))
+    ], axis=1)
+    with pd.ExcelWriter(path) as writer:
+        resumen.to_excel(writer, sheet_name="Resumen", index=False)
+        psd.to_excel(writer, sheet_name="PSD", index=False)
+        allan.to_excel(writer, sheet_name="Allan", index=False)
+
+
+# ---------------------------------------------------------
+# HILO DE CÁLCULO
+# ---------------------------------------------------------
+class DiagnosticsWorker(QThread):
+    """Calcula en segundo plano; si llegan peticiones seguidas solo atiende la última."""
+
+    resultados = pyqtSignal(object)
+
+    def __init__(self):
+        super().__init__()
+        self.analizador = Analizador()
+        self._pendiente = None
+        self._cond = threading.Condition()
+        self._running = True
+
+    def solicitar(self, series):
+        with self._cond:
+            self._pendiente = series
+            self._cond.notify()
+
+    def run(self):
+        while True:
+            with self._cond:
+                while self._running and self._pendiente is None:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                series = self._pendiente
+                self._pendiente = None
+            try:
+                self.resultados.emit(self.analizador.analizar(series))
+            except Exception as e:
+                print(f"⚠️ Error en el diagnóstico: {e}")
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+
+# ---------------------------------------------------------
+# PANEL
+# ---------------------------------------------------------
+class DiagnosticsPanel(QWidget):
+    """Ventana de diagnóstico de ruido alimentada por un SampleRing."""
+
+    def __init__(self, translations, current_lang, fuente):
+        super().__init__()
+        t = translations[current_lang]
+        td = t["diagnostics"]
+        self.td = td
+        self.fuente = fuente
+        self.ultimos = None
+        self.setWindowTitle(td["title"])
+        self.resize(1100, 750)
+
+        self.cmb_canal = QComboBox()
+        for clave, etiqueta in zip(CANALES, t["legend_labels"]):
+            self.cmb_canal.addItem(etiqueta, clave)
+        self.cmb_canal.currentIndexChanged.connect(self.dibujar)
+
+        self.btn_exportar = QPushButton(td["export"])
+        self.btn_exportar.clicked.connect(self.exportar)
+        self.lbl_estado = QLabel("")
+
+        self.plot_psd = pg.PlotWidget(title=td["psd_title"])
+        self.plot_allan = pg.PlotWidget(title=td["allan_title"])
+        for plot in (self.plot_psd, self.plot_allan):
+            plot.setBackground("#FFFFFF")
+            plot.showGrid(x=True, y=True, alpha=0.3)
+            plot.setLogMode(x=True, y=True)
+        self.plot_psd.setLabel("bottom", "f (Hz)")
+        self.plot_allan.setLabel("bottom", "τ (s)")
+        self.curva_psd = self.plot_psd.plot(pen=pg.mkPen("#E74C3C", width=1.5))
+        self.curva_allan = self.plot_allan.plot(
+            pen=pg.mkPen("#3498DB", width=1.5), symbol="o", symbolSize=4
+        )
+
+        self.tabla = QTableWidget(len(CANALES), len(td["headers"]))
+        self.tabla.setHorizontalHeaderLabels(td["headers"])
+        self.tabla.setVerticalHeaderLabels(t["legend_labels"])
+        self.tabla.setFixedHeight(190)
+
+        h_ctrl = QHBoxLayout()
+        h_ctrl.addWidget(QLabel(td["channel"]))
+        h_ctrl.addWidget(self.cmb_canal)
+        h_ctrl.addWidget(self.btn_exportar)
+        h_ctrl.addStretch()
+        h_ctrl.addWidget(self.lbl_estado)
+
+        h_plots = QHBoxLayout()
+        h_plots.addWidget(self.plot_psd)
+        h_plots.addWidget(self.plot_allan)
+
+        layout = QVBoxLayout(self)
+        layout.addLayout(h_ctrl)
+        layout.addLayout(h_plots, stretch=1)
+        layout.addWidget(self.tabla)
+
+        self.worker = DiagnosticsWorker()
+        self.worker.resultados.connect(self.mostrar)
+        self.worker.start()
+
+        self._timer = QTimer(self)
+        self._timer.setInterval(PERIODO_MS)
+        self._timer.timeout.connect(self.solicitar)
+        self._timer.start()
+        self.solicitar()
+
+    def solicitar(self):
+        n = len(self.fuente)
+        if n < MIN_SAMPLES:
+            self.lbl_estado.setText(self.td["waiting"].format(n=n, min=MIN_SAMPLES))
+            return
+        self.worker.solicitar(self.fuente.ultimas())
+
+    def mostrar(self, res):
+        self.ultimos = res
+        for fila, canal in enumerate(CANALES):
+            r = res["canales"][canal]
+            for col, valor in enumerate(
+                (r["ruido_rms"], r["suelo"], r["pico_hz"], r["cuanto"])
+            ):
+                self.tabla.setItem(fila, col, QTableWidgetItem(f"{valor:.4g}"))
+        self.dibujar()
+
+    def dibujar(self):
+        if not self.ultimos:
+            return
+        r = self.ultimos["canales"][self.cmb_canal.currentData()]
+        self.lbl_estado.setText(
+            self.td["status"].format(n=r["n"], fs=r["fs"], ms=self.ultimos["duracion_ms"])
+        )
+        # En escala logarítmica se omiten la componente continua y los ceros
+        validos = (r["f"] > 0) & (r["psd"] > 0)
+        self.curva_psd.setData(r["f"][validos], r["psd"][validos])
+        validos = r["adev"] > 0
+        self.curva_allan.setData(r["tau"][validos], r["adev"][validos])
+
+    def exportar(self):
+        if not self.ultimos:
+            QMessageBox.warning(self, "Error", self.td["no_data"])
+            return
+        path, _ = QFileDialog.getSaveFileName(
+            self, self.td["export"], "diagnostico.xlsx", "Excel (*.xlsx)"
+        )
+        if not path:
+            return
+        try:
+            exportar(self.ultimos, path)
+            QMessageBox.information(self, self.td["export"], path)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", str(e))
+
+    def closeEvent(self, event):
+        self._timer.stop()
+        self.worker.stop()
+        self.worker.wait()
+        event.accept()
@@ -0,0 +1,370 @@
+# it032_filters.py - filtrado de señal por canal, en streaming y sobre sesiones
+# -------------------------------------------------------
+# - Filtros disponibles: mediana móvil, EMA, rechazo de picos de Hampel y
+#   Kalman 1-D (nivel constante con ruido de proceso)
+# - Versión en streaming: estado preasignado al construir, coste acotado por
+#   muestra (constante para EMA/Kalman, O(ventana) fija para mediana/Hampel)
+# - Versión vectorizada con NumPy para filtrar sesiones grabadas completas;
+#   da exactamente el mismo resultado que la versión en streaming
+# - Un NaN (hueco, o canal lento sin lectura nueva en modo mixto) no avanza
+#   los filtros en ninguna de las dos versiones
+# - Configuración por canal en filters.json
+#
+# Uso:  python it032_filters.py sesion.it32s [salida.it32s]
+#       python it032_filters.py --prueba      (streaming y vectorizada, con huecos)
+
+import json
+from bisect import bisect_left, insort
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+FILTERS_PATH = "filters.json"
+CANALES = ("te", "ts", "tc", "vel", "pot")
+MAD_K = 1.4826  # MAD -> desviación típica para ruido gaussiano
+_BLOQUE_EMA = 32  # muestras por bloque en la recursión vectorizada
+
+
+# ---------------------------------------------------------
+# FILTROS EN STREAMING
+# ---------------------------------------------------------
+class _Ventana:
+    """Ventana circular con una copia ordenada para sacar la mediana sin reordenar."""
+
+    def __init__(self, n):
+        self.n = n
+        self.buf = [0.0] * n
+        self.orden = []
+        self.pos = 0
+
+    def meter(self, x):
+        if len(self.orden) == self.n:
+            del self.orden[bisect_left(self.orden, self.buf[self.pos])]
+        self.buf[self.pos] = x
+        self.pos = (self.pos + 1) % self.n
+        insort(self.orden, x)
+
+    def mediana(self):
+        o = self.orden
+        m = len(o) // 2
+        return o[m] if len(o) % 2 else 0.5 * (o[m - 1] + o[m])
+
+
+class MovingMedian:
+    def __init__(self, window=5):
+        self.window = int(window)
+        self._v = _Ventana(self.window)
+
+    def __call__(self, x):
+        self._v.meter(x)
+        return self._v.mediana()
+
+
+class EMA:
+    def __init__(self, alpha=0.3):
+        self.alpha = float(alpha)
+        self._y = None
+
+    def __call__(self, x):
+        self._y = x if self._y is None else self._y + self.alpha * (x - self._y)
+        return self._y
+
+
+class Hampel:
+    """Sustituye por la mediana las muestras a más de n_sigmas·MAD de ella."""
+
+    def __init__(self, window=7, n_sigmas=3.0):
+        self.window = int(window)
+        self.n_sigmas = float(n_sigmas)
+        self._v = _Ventana(self.window)
+
+    def __call__(self, x):
+        self._v.meter(x)
+        med = self._v.mediana()
+        mad = _mediana_lista(sorted(abs(v - med) for v in self._v.orden))
+        if abs(x - med) > self.n_sigmas * MAD_K * mad:
+            return med
+        return x
+
+
+class Kalman1D:
+    """Kalman escalar para un nivel casi constante: q = ruido de proceso, r = de medida."""
+
+    def __init__(self, q=0.01, r=0.1):
+        self.q = float(q)
+        self.r = float(r)
+        self._x = None
+        self._p = 1.0
+
+    def __call__(self, z):
+        if self._x is None:
+            self._x = z
+            self._p = self.r
+            return z
+        p = self._p + self.q
+        k = p / (p + self.r)
+        self._x += k * (z - self._x)
+        self._p = (1.0 - k) * p
+        return self._x
+
+
+def _mediana_lista(o):
+    m = len(o) // 2
+    return o[m] if len(o) % 2 else 0.5 * (o[m - 1] + o[m])
+
+
+TIPOS = {
+    "median": MovingMedian,
+    "ema": EMA,
+    "hampel": Hampel,
+    "kalman": Kalman1D,
+}
+
+
+def crear_filtro(cfg):
+    params = {k: v for k, v in cfg.items() if k != "type"}
+    return TIPOS[cfg["type"]](**params)
+
+
+# ---------------------------------------------------------
+# VERSIÓN VECTORIZADA (sesiones completas)
+# ---------------------------------------------------------
+def _arranque(cfg, x, n):
+    """Primeras n salidas con la versión en streaming (ventana aún incompleta)."""
+    f = crear_filtro(cfg)
+    return np.array([f(v) for v in x[:n]], dtype=float)
+
+
+def _median_array(x, cfg):
+    w = int(cfg.get("window", 5))
+    if len(x) < w:
+        return _arranque(cfg, x, len(x))
+    out = np.empty(len(x))
+    out[: w - 1] = _arranque(cfg, x, w - 1)
+    out[w - 1:] = np.median(sliding_window_view(x, w), axis=1)
+    return out
+
+
+def _hampel_array(x, cfg):
+    w = int(cfg.get("window", 7))
+    n_sigmas = float(cfg.get("n_sigmas", 3.0))
+    if len(x) < w:
+        return _arranque(cfg, x, len(x))
+    out = x.astype(float).copy()
+    out[: w - 1] = _arranque(cfg, x, w - 1)
+    ventanas = sliding_window_view(x, w)
+    med = np.median(ventanas, axis=1)
+    mad = np.median(np.abs(ventanas - med[:, None]), axis=1)
+    cola = x[w - 1:]
+    picos = np.abs(cola - med) > n_sigmas * MAD_K * mad
+    out[w - 1:][picos] = med[picos]
+    return out
+
+
+def _recursion(x, alpha, y0):
+    """y[n] = y[n-1] + alpha[n]·(x[n] - y[n-1]) resuelta por bloques con cumprod/cumsum."""
+    out = np.empty(len(x))
+    alpha = np.minimum(alpha, 1.0 - 1e-9)
+    y = y0
+    for i in range(0, len(x), _BLOQUE_EMA):
+        a = alpha[i:i + _BLOQUE_EMA]
+        c = np.cumprod(1.0 - a)
+        bloque = c * (y + np.cumsum(a * x[i:i + _BLOQUE_EMA] / c))
+        out[i:i + _BLOQUE_EMA] = bloque
+        y = bloque[-1]
+    return out
+
+
+def _ema_array(x, cfg):
+    if not len(x):
+        return x.astype(float)
+    alpha = float(cfg.get("alpha", 0.3))
+    out = np.empty(len(x))
+    out[0] = x[0]
+    out[1:] = _recursion(x[1:], np.full(len(x) - 1, alpha), float(x[0]))
+    return out
+
+
+def _kalman_array(x, cfg):
+    if not len(x):
+        return x.astype(float)
+    q, r = float(cfg.get("q", 0.01)), float(cfg.get("r", 0.1))
+    # La ganancia no depende de los datos: se calcula aparte hasta que converge
+    n = len(x) - 1
+    k = np.empty(n)
+    p = r
+    for i in range(n):
+        pp = p + q
+        k[i] = pp / (pp + r)
+        p_nueva = (1.0 - k[i]) * pp
+        if abs(p_nueva - p) < 1e-15:
+            k[i:] = k[i]
+            break
+        p = p_nueva
+    out = np.empty(len(x))
+    out[0] = x[0]
+    out[1:] = _recursion(x[1:], k, float(x[0]))
+    return out
+
+
+VECTORIZADOS = {
+    "median": _median_array,
+    "ema": _ema_array,
+    "hampel": _hampel_array,
+    "kalman": _kalman_array,
+}
+
+
+def filtrar_array(cadena, x):
+    """Aplica una cadena de filtros (lista de dicts de config) a un array completo.
+
+    Como en ChannelFilters.filtrar, los NaN no entran en los filtros: se
+    filtran solo las lecturas reales, en orden, y los huecos siguen en NaN
+    (en directo se repite la última salida; en una sesión queda el hueco).
+    """
+    y = np.asarray(x, dtype=float)
+    validos = ~np.isnan(y)
+    todos = validos.all()
+    z = y if todos else y[validos]
+    for cfg in cadena:
+        z = VECTORIZADOS[cfg["type"]](z, cfg)
+    if todos:
+        return z
+    out = np.full(len(y), np.nan)
+    out[validos] = z
+    return out
+
+
+# ---------------------------------------------------------
+# FILTROS POR CANAL
+# ---------------------------------------------------------
+DEFAULT_CONFIG = {
+    "te": [{"type": "hampel", "window": 7, "n_sigmas": 3.0}],
+    "ts": [{"type": "hampel", "window": 7, "n_sigmas": 3.0}],
+    "tc": [{"type": "hampel", "window": 7, "n_sigmas": 3.0}, {"type": "ema", "alpha": 0.4}],
+    "vel": [{"type": "hampel", "window": 7, "n_sigmas": 3.0}, {"type": "kalman", "q": 0.002, "r": 0.02}],
+    "pot": [{"type": "hampel", "window": 7, "n_sigmas": 3.0}],
+}
+
+
+def cargar_config(path=FILTERS_PATH):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            cfg = json.load(f)
+    except FileNotFoundError:
+        return DEFAULT_CONFIG
+    except Exception as e:
+        print(f"⚠️ No se pudo cargar {path} ({e}); se usan los filtros por defecto.")
+        return DEFAULT_CONFIG
+    if not cfg.get("enabled", True):
+        return {c: [] for c in CANALES}
+    return {c: cfg.get("channels", {}).get(c, []) for c in CANALES}
+
+
+class ChannelFilters:
+    """Un filtro en cadena por canal, en el orden [te, ts, tc, vel, pot]."""
+
+    def __init__(self, config=None):
+        self.config = config if config is not None else cargar_config()
+        self.reiniciar()
+
+    def reiniciar(self):
+        self._cadenas = [
+            [crear_filtro(cfg) for cfg in self.config.get(canal, [])] for canal in CANALES
+        ]
+        self._salidas = [float("nan")] * len(CANALES)
+
+    def filtrar(self, valores):
+        """Filtra una muestra; devuelve una lista nueva (la cruda no se modifica).
+
+        Un canal en NaN (sin lectura nueva en modo mixto) no avanza su filtro:
+        se repite la última salida.
+        """
+        out = self._salidas
+        for i, (v, cadena) in enumerate(zip(valores, self._cadenas)):
+            if v != v:
+                continue
+            for f in cadena:
+                v = f(v)
+            out[i] = v
+        return list(out)
+
+    def filtrar_sesion(self, columnas):
+        """Filtra columnas completas (dict canal -> array) con la versión vectorizada."""
+        return {
+            canal: filtrar_array(self.config.get(canal, []), columnas[canal])
+            if canal in CANALES else columnas[canal]
+            for canal in columnas
+        }
+
+
+# ---------------------------------------------------------
+# FILTRADO DE SESIONES GRABADAS
+# ---------------------------------------------------------
+def filtrar_fichero(origen, destino=None, config=None):
+    """Crea una copia filtrada de un fichero .it32s (la original queda intacta)."""
+    from it032_session_file import SessionFile, SessionWriter
+
+    filtros = ChannelFilters(config)
+    destino = destino or origen.replace(".it32s", "_filtrada.it32s")
+    with SessionFile(origen) as f:
+        columnas = filtros.filtrar_sesion(f.rango())
+        meta = dict(f.metadata)
+        meta["filters"] = filtros.config
+        tipos = [(c["name"], c["dtype"], c["unit"]) for c in f.metadata["columns"]]
+    with SessionWriter(destino, meta, tipos) as w:
+        w.agregar_bloque(columnas)
+    return destino
+
+
+# ---------------------------------------------------------
+# PRUEBA
+# ---------------------------------------------------------
+def prueba(n=5000):
+    """Streaming frente a vectorizada sobre una señal con picos y huecos."""
+    rng = np.random.default_rng(0)
+    t = np.arange(n) * 0.1
+    x = 20 + np.sin(t / 20) + rng.normal(0, 0.05, n)
+    x[rng.integers(0, n, n // 100)] += 5  # picos
+    x[200:260] = np.nan  # hueco del registro
+    huecos = x.copy()
+    huecos[np.arange(n) % 10 != 0] = np.nan  # canal lento en modo mixto
+    columnas = {"te": x, "ts": huecos, "tc": huecos, "vel": x, "pot": x}
+    cadenas = {
+        "te": [{"type": "median", "window": 5}],
+        "ts": [{"type": "hampel", "window": 7, "n_sigmas": 3.0}],
+        "tc": DEFAULT_CONFIG["tc"],
+        "vel": DEFAULT_CONFIG["vel"],
+        "pot": [{"type": "kalman", "q": 0.01, "r": 0.1}, {"type": "ema", "alpha": 0.3}],
+    }
+    vectorizada = ChannelFilters(cadenas).filtrar_sesion(columnas)
+    directo = ChannelFilters(cadenas)
+    streaming = np.array([directo.filtrar(fila) for fila in np.column_stack(
+        [columnas[c] for c in CANALES]).tolist()])
+    fallos = 0
+    for i, canal in enumerate(CANALES):
+        validos = ~np.isnan(columnas[canal])
+        iguales = np.allclose(vectorizada[canal][validos], streaming[validos, i], rtol=1e-9)
+        huecos_ok = np.isnan(vectorizada[canal][~validos]).all()
+        fallos += not (iguales and huecos_ok)
+        print(f"{'✅' if iguales and huecos_ok else '❌'} {canal}: "
+              f"{[c['type'] for c in cadenas[canal]]}, {int((~validos).sum())} huecos")
+    return fallos == 0
+
+
+def main():
+    import sys
+    import time
+
+    if len(sys.argv) < 2:
+        print("Uso: python it032_filters.py sesion.it32s [salida.it32s]")
+        return
+    if sys.argv[1] == "--prueba":
+        raise SystemExit(0 if prueba() else 1)
+    t = time.perf_counter()
+    destino = filtrar_fichero(sys.argv[1], sys.argv[2] if len(sys.argv) > 2 else None)
+    print(f"✅ Sesión filtrada en {destino} ({time.perf_counter() - t:.2f} s)")
+
+
+if __name__ == "__main__":
+    main()
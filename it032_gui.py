@@ -22,16 +22,35 @@ from PyQt6.QtWidgets import (
     QSizePolicy,
     QToolButton,
     QMenu,
+    QDoubleSpinBox,
+    QGridLayout,
 )
 from PyQt6.QtCore import Qt, QThread, pyqtSignal, QTimer
-from PyQt6.QtGui import QFont, QIcon
+from PyQt6.QtGui import QFont, QIcon, QKeySequence, QShortcut
+import os
 import sys
+import tempfile
 import time
 import pyqtgraph as pg
 import it032_core as core
+import it032_store as store
+import it032_upload as upload
+import it032_broadcast as broadcast
+import it032_safety as safety
+import it032_session_file as session_file
+import it032_viewer as viewer
+import it032_filters as filters
+import it032_diagnostics as diagnostics
+import it032_metrics as metrics
+import it032_control as control
+import it032_update as update
+import it032_report as report
+import it032_pipeline as pipeline
+import it032_remote as remote
+import it032_calibration as calibration
+import it032_retention as retention
 import pandas as pd
 from PyQt6.QtGui import QIcon
-from datetime import datetime
 import json
 from PyQt6.QtSvgWidgets import QSvgWidget
 
@@ -40,23 +59,49 @@ from PyQt6.QtSvgWidgets import QSvgWidget
 # Lectura de datos del equipo
 # =======================================================
 class ReaderThread(QThread):
-    new_data = pyqtSignal(float, float, float, float, float)
+    """Solo lee y parsea: agrupa las muestras en bloques y las deja en la
+    tubería sin esperar a ningún consumidor (it032_pipeline)."""
 
-    def __init__(self, ser, offsets):
+    def __init__(self, ser, tuberia, periodo=None):
         super().__init__()
         self.ser = ser
-        self.offsets = offsets
+        self.tuberia = tuberia
+        # En modo mixto el firmware marca el ritmo: readline ya bloquea lo justo
+        self.periodo = core.READ_DELAY if periodo is None else periodo
+        self.acumulador = pipeline.Acumulador()
         self._running = True
 
     def run(self):
         while self._running:
-            valores = core.leer_linea(self.ser)
-            if not valores:
-                continue
-            corregidos = [v - o for v, o in zip(valores, self.offsets)]
-            te, ts, tc, vel, pot = corregidos
-            self.new_data.emit(te, ts, tc, vel, pot)
-            time.sleep(core.READ_DELAY)
+            if metrics.ACTIVO:
+                valores = self._leer_medido()
+            else:
+                valores = core.leer_linea(self.ser)
+            if valores:
+                # Solo se agrupa lo que ya está en el buffer del puerto
+                hay_mas = getattr(self.ser, "in_waiting", 0) > 0
+                bloque = self.acumulador.agregar(core.reloj(), valores, hay_mas)
+                if bloque is not None:
+                    self.tuberia.meter(bloque)
+                if self.periodo:
+                    time.sleep(self.periodo)
+        bloque = self.acumulador.vaciar()
+        if bloque is not None:
+            self.tuberia.meter(bloque)
+
+    def _leer_medido(self):
+        """Como core.leer_linea, pero midiendo por separado la espera y el parseo."""
+        t0 = time.perf_counter()
+        try:
+            raw = self.ser.readline()
+        except Exception as e:
+            print(f"⚠️ Error leyendo línea: {e}")
+            return None
+        t1 = time.perf_counter()
+        valores = core.parsear_linea(raw)
+        metrics.registrar("serial.readline", t1 - t0)
+        metrics.registrar("leer_linea", time.perf_counter() - t1)
+        return valores
 
     def stop(self):
         self._running = False
@@ -70,6 +115,17 @@ class ReaderThread(QThread):
 # Ventana principal
 # =======================================================
 class MainWindow(QMainWindow):
+    # Disparo de un enclavamiento (llega desde el hilo de lectura o el watchdog)
+    safety_trip = pyqtSignal(dict)
+    # Comando escrito en el equipo (t, tipo, valor, origen), desde el hilo de comandos
+    command_event = pyqtSignal(float, str, int, str)
+    # Fin de un autoajuste (lazo, resultado), desde el hilo de lectura
+    autotune_done = pyqtSignal(str, dict)
+    # Informe terminado en el proceso de trabajo (lista de resultados)
+    report_done = pyqtSignal(list)
+    # Mando remoto perdido (motivo), desde el vigilante de it032_remote
+    remote_lost = pyqtSignal(str)
+
     def __init__(self):
         super().__init__()
         # --- Cargar traducciones ---
@@ -86,9 +142,60 @@ class MainWindow(QMainWindow):
         self.resize(1500, 750)
 
         self.ser = None
+        self._puerto_libre = 0.0  # monotonic a partir del cual se puede reabrir el puerto
+        self.comandos = None
+        self.safety = None
+        self.control = None
+        self.remoto = None
+        self.remote_server = None
         self.offsets = [0, 0, 0, 0, 0]
+        # Curvas de calibración de este equipo (calibration.json), aplicadas por LUT
+        self.curvas_calibracion = calibration.cargar_curvas(store.MACHINE_SERIAL)
+        self.modo_mixto = False
         self.reader_thread = None
-        self.data_records = []
+        self.pipeline = None
+
+        # --- Almacén local de prácticas (SQLite) ---
+        self.store = store.PracticeStore()
+        self.machine_id = self.store.maquina()
+        self.session_id = None
+        self.n_guardados = 0
+        self.ultima_muestra = None
+        # Últimas muestras sin filtrar para el panel de diagnóstico de ruido
+        self.muestras_crudas = diagnostics.SampleRing()
+
+        # --- Subida al servidor en segundo plano (solo si hay URL configurada) ---
+        self.uploader = None
+        if upload.SERVER_URL:
+            self.uploader = upload.Uploader(self.store)
+            self.uploader.start()
+
+        # --- Compactación de sesiones antiguas en segundo plano (retention.json) ---
+        self.retencion = retention.RetentionWorker(self.store, respetar_subida=bool(upload.SERVER_URL))
+        self.retencion.start()
+
+        # --- Actualizaciones en segundo plano (se aplican al próximo arranque) ---
+        self.updater = None
+        if update.UPDATE_URL:
+            self.updater = update.Updater()
+            self.updater.start()
+
+        # --- Difusión en directo a otros ordenadores / móviles (opcional) ---
+        self.hub = None
+        self.broadcast_server = None
+        if broadcast.BROADCAST_PORT:
+            self.hub = broadcast.BroadcastHub()
+            self.broadcast_server = broadcast.iniciar_servidor(
+                self.hub, broadcast.BROADCAST_PORT
+            )
+
+        # --- Métricas de rendimiento (F12 activa/desactiva, Mayús+F12 perfilador) ---
+        self.perfilador = metrics.PerfilMuestreo()
+        metrics.registrar_cola("escritura_db", self.store._cola.qsize)
+        for cola in ("entrada", "grafica", "registro", "difusion", "remoto"):
+            metrics.registrar_cola(cola, lambda cola=cola: self.filas_pendientes(cola))
+        if self.hub:
+            metrics.registrar_cola("hub", lambda: len(self.hub._entrada))
 
         # =======================================================
         # 📊 MEDIDAS EN TIEMPO REAL
@@ -129,7 +236,7 @@ class MainWindow(QMainWindow):
             lambda v: self.lbl_fan.setText(t["fan"].format(val=int(v / 2.55)))
         )
         self.dial_fan.valueChanged.connect(
-            lambda v: core.enviar_comando(self.ser, "FAN", v) if self.ser else None
+            lambda v: self.comandos.consigna("FAN", v) if self.comandos else None
         )
 
         fan_col = QWidget()
@@ -161,7 +268,7 @@ class MainWindow(QMainWindow):
             lambda v: self.lbl_heat.setText(t["heater"].format(val=int(v / 2.55)))
         )
         self.slider_heat.valueChanged.connect(
-            lambda v: core.enviar_comando(self.ser, "HEAT", v) if self.ser else None
+            lambda v: self.comandos.consigna("HEAT", v) if self.comandos else None
         )
 
         heat_col = QWidget()
@@ -176,7 +283,36 @@ class MainWindow(QMainWindow):
         h_control.addWidget(fan_col)
         h_control.addWidget(heat_col)
         h_control.addStretch(1)
-        self.group_control.setLayout(h_control)
+
+        # Control automático: un lazo PID por magnitud (TC -> calefactor, vel -> ventilador)
+        tcl = t["closed_loop"]
+        self.lbl_closed_loop = QLabel(tcl["title"])
+        self.lbl_closed_loop.setStyleSheet("font-weight: 600;")
+        self.controles_lazo = {}
+        g_lazos = QGridLayout()
+        g_lazos.addWidget(self.lbl_closed_loop, 0, 0, 1, 3)
+        for fila, (lazo, rango, paso) in enumerate(
+            (("tc", (20.0, 140.0), 0.5), ("vel", (0.0, 3.5), 0.05)), start=1
+        ):
+            chk = QCheckBox(tcl[lazo])
+            spin = QDoubleSpinBox()
+            spin.setRange(*rango)
+            spin.setSingleStep(paso)
+            spin.setDecimals(2 if lazo == "vel" else 1)
+            spin.setValue(60.0 if lazo == "tc" else 1.5)
+            btn = QPushButton(tcl["autotune"])
+            chk.toggled.connect(lambda on, l=lazo: self.alternar_lazo(l, on))
+            spin.valueChanged.connect(lambda v, l=lazo: self.cambiar_objetivo(l, v))
+            btn.clicked.connect(lambda _, l=lazo: self.autoajustar(l))
+            g_lazos.addWidget(chk, fila, 0)
+            g_lazos.addWidget(spin, fila, 1)
+            g_lazos.addWidget(btn, fila, 2)
+            self.controles_lazo[lazo] = (chk, spin, btn)
+
+        v_control = QVBoxLayout()
+        v_control.addLayout(h_control)
+        v_control.addLayout(g_lazos)
+        self.group_control.setLayout(v_control)
 
         # =======================================================
         # 📈 GRÁFICA
@@ -185,10 +321,34 @@ class MainWindow(QMainWindow):
         self.group_grafica.setObjectName("group_grafica")
 
         self.plot_widget = pg.PlotWidget()
+        metrics.medir_pintado(self.plot_widget)
+
+        # Superposición de métricas sobre la gráfica (solo visible con F12)
+        self.lbl_metricas = QLabel(self.plot_widget)
+        self.lbl_metricas.setStyleSheet(
+            "background: rgba(0, 0, 0, 160); color: #FFFFFF; padding: 6px;"
+            "font-family: Consolas, monospace; font-size: 9pt;"
+        )
+        self.lbl_metricas.move(70, 10)
+        self.lbl_metricas.setVisible(metrics.ACTIVO)
+        self.timer_metricas = QTimer(self)
+        self.timer_metricas.setInterval(1000)
+        self.timer_metricas.timeout.connect(self.actualizar_metricas)
+        if metrics.ACTIVO:
+            self.timer_metricas.start()
+        # La gráfica vacía su cola de la tubería a este ritmo, en bloque
+        self.timer_grafica = QTimer(self)
+        self.timer_grafica.setInterval(pipeline.REFRESCO_GUI_MS)
+        self.timer_grafica.timeout.connect(self.vaciar_grafica)
+        QShortcut(QKeySequence("F12"), self, activated=self.alternar_metricas)
+        QShortcut(QKeySequence("Shift+F12"), self, activated=self.alternar_perfilador)
 
         # === Apariencia clara para la gráfica ===
         self.plot_widget.setBackground("#FFFFFF")
         self.plot_widget.showGrid(x=True, y=True, alpha=0.3)
+        # Solo se pinta el tramo visible (las series ya están acotadas a
+        # PUNTOS_GRAFICA; el diezmado "peak" costaba más de lo que ahorraba)
+        self.plot_widget.setClipToView(True)
 
         # --- Etiquetas de los ejes desde el JSON ---
         graph_labels = t["graph_labels"]
@@ -330,6 +490,10 @@ class MainWindow(QMainWindow):
         self.btn_export.setFixedWidth(160)
         self.btn_export.clicked.connect(self.export_excel)
 
+        self.btn_report = QPushButton(t["report"]["button"])
+        self.btn_report.clicked.connect(self.generar_informe)
+        self.generador_informes = report.GeneradorInformes(procesos=1)
+
         # =======================================================
         # CREACIÓN DE BOTONES
         # =======================================================
@@ -351,6 +515,20 @@ class MainWindow(QMainWindow):
         self.btn_language.setMenu(menu_language)
         self.btn_language.setFixedHeight(32)
 
+        # Botón del visor de sesiones archivadas
+        self.btn_history = QToolButton()
+        self.btn_history.setObjectName("btn_history")
+        self.btn_history.setText(t["history"]["button"])
+        self.btn_history.setFixedHeight(32)
+        self.btn_history.clicked.connect(self.mostrar_historial)
+
+        # Botón del panel de diagnóstico de ruido
+        self.btn_diagnostics = QToolButton()
+        self.btn_diagnostics.setObjectName("btn_diagnostics")
+        self.btn_diagnostics.setText(t["diagnostics"]["button"])
+        self.btn_diagnostics.setFixedHeight(32)
+        self.btn_diagnostics.clicked.connect(self.mostrar_diagnostico)
+
         # =======================================================
         # BOTONES GENERALES
         # =======================================================
@@ -362,6 +540,7 @@ class MainWindow(QMainWindow):
             self.btn_detener,
             self.btn_guardar,
             self.btn_export,
+            self.btn_report,
         ]:
             b.setFixedHeight(32)
             b.setFixedWidth(180)
@@ -376,6 +555,8 @@ class MainWindow(QMainWindow):
         # === Barra superior con el botón de idioma ===
         h_topbar = QHBoxLayout()
         h_topbar.addWidget(self.btn_language, alignment=Qt.AlignmentFlag.AlignLeft)
+        h_topbar.addWidget(self.btn_history, alignment=Qt.AlignmentFlag.AlignLeft)
+        h_topbar.addWidget(self.btn_diagnostics, alignment=Qt.AlignmentFlag.AlignLeft)
         h_topbar.addStretch()
 
         # --- Parte superior: lecturas (izq) y control (der)
@@ -419,6 +600,7 @@ class MainWindow(QMainWindow):
             self.btn_detener,
             self.btn_guardar,
             self.btn_export,
+            self.btn_report,
         ]:
             botones_layout.addWidget(b)
         botones_layout.addStretch()
@@ -478,17 +660,23 @@ class MainWindow(QMainWindow):
         self.btn_iniciar.clicked.connect(self.iniciar_lectura)
         self.btn_detener.clicked.connect(self.detener_lectura)
         self.btn_guardar.clicked.connect(self.guardar_dato)
-
-        # Variables de datos
-        (
-            self.data_x,
-            self.data_te,
-            self.data_ts,
-            self.data_tc,
-            self.data_vel,
-            self.data_pot,
-        ) = ([], [], [], [], [], [])
-        self.t0 = time.time()
+        self.safety_trip.connect(self.on_safety_trip)
+        self.autotune_done.connect(self.on_autotune_done)
+        self.report_done.connect(self.on_report_done)
+        self.command_event.connect(self.marcar_evento)
+        self.remote_lost.connect(self.on_remote_lost)
+
+        # Variables de datos: cada canal tiene su propia serie (x, y), porque en
+        # modo mixto las temperaturas llegan a menos ritmo que la velocidad y
+        # la potencia. Solo se guardan los últimos puntos: el histórico
+        # completo está en el almacén y en el visor
+        self.n_muestras = 0
+        self.series = {canal: pipeline.SerieCircular() for canal in filters.CANALES}
+        self.curvas = dict(zip(filters.CANALES, (
+            self.curve_te, self.curve_ts, self.curve_tc, self.curve_vel, self.curve_pot,
+        )))
+        self.event_markers = []
+        self.t0 = core.reloj()
         self.set_language(self.current_lang)
 
     def load_translations(self):
@@ -506,21 +694,29 @@ class MainWindow(QMainWindow):
     # =======================================================
     # FUNCIONES DE GUARDADO Y EXPORTACIÓN
     # =======================================================
+    def sesion_actual(self):
+        """Devuelve la sesión de la práctica en curso, creándola al primer dato."""
+        if self.session_id is None:
+            self.session_id = self.store.iniciar_sesion(self.machine_id)
+        return self.session_id
+
     def guardar_dato(self):
         try:
-            now = datetime.now()
-            fecha = now.strftime("%d/%m/%Y")
-            hora = now.strftime("%H:%M:%S")
-
-            te = float(self.lbl_te.text().split(":")[1].replace("°C", "").strip())
-            ts = float(self.lbl_ts.text().split(":")[1].replace("°C", "").strip())
-            tc = float(self.lbl_tc.text().split(":")[1].replace("°C", "").strip())
-            vel = float(self.lbl_vel.text().split(":")[1].replace("m/s", "").strip())
-            pot = float(self.lbl_pot.text().split(":")[1].replace("W", "").strip())
-
-            self.data_records.append([fecha, hora, te, ts, tc, vel, pot])
-            self.table.setRowCount(len(self.data_records))
-            i = len(self.data_records) - 1
+            now = core.reloj()
+            fecha, hora = store.fecha_hora(now)
+
+            if self.ultima_muestra:
+                te, ts, tc, vel, pot = self.ultima_muestra[1:]
+            else:
+                te = ts = tc = vel = pot = 0.0
+
+            self.store.agregar_muestra(
+                self.machine_id, self.sesion_actual(), now,
+                [te, ts, tc, vel, pot], guardada=True,
+            )
+            self.n_guardados += 1
+            self.table.setRowCount(self.n_guardados)
+            i = self.n_guardados - 1
             self.table.setItem(i, 0, QTableWidgetItem(str(i + 1)))
             self.table.setItem(i, 1, QTableWidgetItem(fecha))
             self.table.setItem(i, 2, QTableWidgetItem(hora))
@@ -529,6 +725,61 @@ class MainWindow(QMainWindow):
         except Exception as e:
             QMessageBox.warning(self, "Error", f"No se pudo guardar el dato: {e}")
 
+    def guardar_fichero_sesion(self, carpeta=session_file.SESSIONS_DIR):
+        """Archiva el registro continuo de la sesión en formato nativo (.it32s)."""
+        if not self.store.contar(self.machine_id, self.session_id, guardadas=False):
+            return None
+        try:
+            path = session_file.ruta_sesion(
+                store.MACHINE_SERIAL, self.session_id, self.t0, carpeta=carpeta
+            )
+            return session_file.exportar_sesion(
+                self.store,
+                self.machine_id,
+                self.session_id,
+                path,
+                metadata={
+                    "device": {"serial_number": store.MACHINE_SERIAL, "model": store.MACHINE_MODEL},
+                    "offsets": [float(o) for o in self.offsets],
+                    "curves": self.curvas_calibracion.modelos,
+                    "setpoints": {"FAN": self.dial_fan.value(), "HEAT": self.slider_heat.value()},
+                    "language": self.current_lang,
+                },
+            )
+        except Exception as e:
+            print(f"⚠️ No se pudo archivar la sesión: {e}")
+            return None
+
+    def generar_informe(self):
+        """Informe HTML/PDF de la sesión en curso, generado en otro proceso."""
+        t = self.translations[self.current_lang]["report"]
+        path = None
+        if self.session_id is not None:
+            self.store.flush()
+            # Copia de la sesión hasta ahora; el archivo definitivo se hace al cerrar
+            path = self.guardar_fichero_sesion(carpeta=tempfile.gettempdir())
+        if not path:
+            QMessageBox.warning(self, "Error", t["no_data"])
+            return
+        self.btn_report.setEnabled(False)
+        self.generador_informes.generar(
+            [path], lang=self.current_lang, al_terminar=self.report_done.emit
+        )
+
+    def on_report_done(self, resultados):
+        self.btn_report.setEnabled(True)
+        t = self.translations[self.current_lang]["report"]
+        for r in resultados:
+            try:
+                os.remove(r["sesion"])
+            except OSError:
+                pass
+        ok, texto = report.mensaje(resultados, t)
+        if ok:
+            QMessageBox.information(self, t["button"], texto)
+        else:
+            QMessageBox.warning(self, "Error", texto)
+
     def export_excel(self):
         path, _ = QFileDialog.getSaveFileName(
             self,
@@ -563,7 +814,13 @@ class MainWindow(QMainWindow):
                 mensaje = "Excel file saved successfully."
                 titulo = "Export"
 
-            df = pd.DataFrame(self.data_records, columns=columnas)
+            self.store.flush()
+            registros = (
+                self.store.registros_guardados(self.machine_id, self.session_id)
+                if self.session_id is not None
+                else []
+            )
+            df = pd.DataFrame(registros, columns=columnas)
             df.index = df.index + 1
             df.index.name = "#"
             df.to_excel(path)
@@ -604,12 +861,20 @@ class MainWindow(QMainWindow):
         self.btn_detener.setText(t["stop"])
         self.btn_guardar.setText(t["save"])
         self.btn_export.setText(t["export"])
+        self.btn_report.setText(t["report"]["button"])
+        self.btn_history.setText(t["history"]["button"])
+        self.btn_diagnostics.setText(t["diagnostics"]["button"])
 
         # --- Controles (ventilador y calefactor) ---
         fan_value = int(self.dial_fan.value() / 2.55)
         heat_value = int(self.slider_heat.value() / 2.55)
         self.lbl_fan.setText(t["fan"].format(val=fan_value))
         self.lbl_heat.setText(t["heater"].format(val=heat_value))
+        self.lbl_closed_loop.setText(t["closed_loop"]["title"])
+        for lazo, (chk, _spin, btn) in self.controles_lazo.items():
+            chk.setText(t["closed_loop"][lazo])
+            if btn.isEnabled():
+                btn.setText(t["closed_loop"]["autotune"])
 
         # --- Tabla ---
         header_labels = t["table_headers"]
@@ -650,14 +915,69 @@ class MainWindow(QMainWindow):
                 self, "Conexión fallida", "No se detectó el equipo por USB."
             )
             return
+        if self.comandos or self.safety:
+            # Reconexión: nada del equipo anterior puede seguir actuando
+            self.liberar_equipo()
+        espera = self._puerto_libre - time.monotonic()
+        if espera > 0:
+            # El sistema tarda en soltar el puerto recién cerrado: se reabre
+            # con un temporizador para no congelar la ventana
+            self.btn_conectar.setEnabled(False)
+            QTimer.singleShot(int(espera * 1000), lambda: self.abrir_equipo(port))
+            return
+        self.abrir_equipo(port)
+
+    def abrir_equipo(self, port):
+        self.btn_conectar.setEnabled(True)
         self.ser = core.serial.Serial(port, core.BAUD, timeout=core.COM_TIMEOUT)
+        # Antes de arrancar el CommandLane: la negociación lee del puerto
+        self.modo_mixto = core.negociar_frecuencia(self.ser)
+        self.sesion_actual()  # antes del primer comando: el oyente corre en otro hilo
+        self.comandos = core.CommandLane(self.ser)
+        self.comandos.oyentes.append(self.registrar_comando)
+        self.safety = safety.SafetyEngine(self.comandos, al_disparar=self.safety_trip.emit)
+        self.control = control.Controller(
+            self.comandos, al_terminar_autotune=self.autotune_done.emit
+        )
+        # --- Práctica manejada a distancia (opcional) ---
+        if remote.REMOTE_PORT:
+            self.remoto = remote.RemoteSession(self.comandos, al_perder=self.remote_lost.emit)
+            self.remote_server = remote.iniciar_servidor(self.remoto, remote.REMOTE_PORT)
         QMessageBox.information(self, "Conectado", f"Equipo detectado en {port}")
 
+    def liberar_equipo(self):
+        """Para la lectura y suelta todo lo ligado al puerto: enclavamientos,
+        mando remoto, vía de comandos y el propio puerto serie."""
+        if self.reader_thread:
+            self.reader_thread.stop()
+            self.reader_thread.wait()
+            self.reader_thread = None
+            self.pipeline.detener()
+            self.timer_grafica.stop()
+            self.vaciar_grafica()
+        if self.safety:
+            self.safety.detener()
+            self.safety = None
+        if self.remote_server:
+            remote.detener_servidor(self.remote_server, self.remoto)
+            self.remote_server = self.remoto = None
+        if self.comandos:
+            self.comandos.stop()
+            self.comandos = None
+        # Los lazos del equipo anterior mueren con él; el nuevo empieza en manual
+        for chk, *_ in self.controles_lazo.values():
+            chk.setChecked(False)
+        self.control = None
+        if self.ser and self.ser.is_open:
+            self.ser.close()
+            self._puerto_libre = time.monotonic() + core.LIBERAR_PUERTO_S
+        self.ser = None
+
     def calibrar(self):
         if not self.ser:
             QMessageBox.warning(self, "Error", "Debe conectar el equipo primero.")
             return
-        self.offsets = core.calibrar_sensores(self.ser)
+        self.offsets = self.curvas_calibracion.sin_offsets(core.calibrar_sensores(self.ser))
         QMessageBox.information(
             self, "Calibración", "Calibración completada correctamente."
         )
@@ -666,9 +986,35 @@ class MainWindow(QMainWindow):
         if not self.ser:
             QMessageBox.warning(self, "Error", "Debe conectar el equipo primero.")
             return
-        self.reader_thread = ReaderThread(self.ser, self.offsets)
-        self.reader_thread.new_data.connect(self.actualizar_datos)
+        self.pipeline = pipeline.Pipeline(
+            [
+                pipeline.Calibrar(self.offsets, self.curvas_calibracion),
+                # Los picos sueltos se rechazan antes de los enclavamientos
+                pipeline.Filtrar(filters.ChannelFilters()),
+                pipeline.Derivar(),
+            ],
+            # Enclavamientos y lazos PID al ritmo de adquisición, sin pasar por la GUI
+            criticos=[self.safety.evaluar, self.control.evaluar],
+        )
+        # El registro continuo no puede perder muestras; la gráfica y la
+        # difusión prefieren ir al día
+        self.pipeline.agregar_sink("registro", self.registrar_bloque, "bloquear")
+        self.pipeline.agregar_sink("grafica", politica="descartar_antiguo")
+        if self.hub:
+            self.pipeline.agregar_sink(
+                "difusion", self.difundir_bloque, "muestrear",
+                intervalo=pipeline.INTERVALO_DIFUSION,
+            )
+        if self.remoto:
+            # Difusión a los alumnos remotos y detección del efecto de sus comandos
+            self.pipeline.agregar_sink("remoto", self.remoto.observar)
+        self.pipeline.iniciar()
+        self.reader_thread = ReaderThread(
+            self.ser, self.pipeline, periodo=0 if self.modo_mixto else None
+        )
+        self.safety.armar()
         self.reader_thread.start()
+        self.timer_grafica.start()
         QMessageBox.information(
             self, "Lectura iniciada", "El equipo está transmitiendo datos."
         )
@@ -677,36 +1023,227 @@ class MainWindow(QMainWindow):
         if self.reader_thread:
             self.reader_thread.stop()
             self.reader_thread.wait()
+            self.pipeline.detener()
+            self.timer_grafica.stop()
+            self.vaciar_grafica()
+            self.safety.desarmar()
             QMessageBox.information(
                 self, "Lectura detenida", "La lectura de datos ha sido detenida."
             )
 
-    def actualizar_datos(self, te, ts, tc, vel, pot):
-        self.lbl_te.setText(f"Entrada (TE): {te:.2f} °C")
-        self.lbl_ts.setText(f"Salida (TS): {ts:.2f} °C")
-        self.lbl_tc.setText(f"Termopar (TC): {tc:.2f} °C")
-        self.lbl_vel.setText(f"Velocidad del aire: {vel:.2f} m/s")
-        self.lbl_pot.setText(f"Potencia: {pot:.2f} W")
-
-        t = time.time() - self.t0
-        self.data_x.append(t)
-        self.data_te.append(te)
-        self.data_ts.append(ts)
-        self.data_tc.append(tc)
-        self.data_vel.append(vel)
-        self.data_pot.append(pot)
-
-        # Evita que la memoria se sature (limitado a 200 puntos)
-        # if len(self.data_x) > 200:
-        #     self.data_x, self.data_te, self.data_ts, self.data_tc, self.data_vel, self.data_pot = [
-        #         lst[-200:] for lst in [self.data_x, self.data_te, self.data_ts, self.data_tc, self.data_vel, self.data_pot]
-        #     ]
-
-        self.curve_te.setData(self.data_x, self.data_te)
-        self.curve_ts.setData(self.data_x, self.data_ts)
-        self.curve_tc.setData(self.data_x, self.data_tc)
-        self.curve_vel.setData(self.data_x, self.data_vel)
-        self.curve_pot.setData(self.data_x, self.data_pot)
+    def filas_pendientes(self, cola):
+        if not self.pipeline:
+            return 0
+        if cola == "entrada":
+            return self.pipeline.entrada.filas
+        sink = self.pipeline.sinks.get(cola)
+        return sink.cola.filas if sink else 0
+
+    def vaciar_grafica(self):
+        bloques = self.pipeline.sinks["grafica"].cola.sacar_todo() if self.pipeline else []
+        if bloques:
+            self.actualizar_datos(pipeline.Bloque.unir(bloques))
+
+    def actualizar_datos(self, bloque):
+        """Etiquetas, historial y curvas con todas las muestras llegadas desde el último refresco."""
+        medir = metrics.ACTIVO
+        if medir:
+            t_inicio = time.perf_counter()
+            metrics.registrar("cruce new_data", core.reloj() - bloque.t[-1])
+            metrics.contar("procesadas", len(bloque))
+        # Solo los canales con lectura nueva en el bloque
+        nuevos = bloque.nuevos.any(axis=0)
+        self.actualizar_etiquetas(bloque, nuevos)
+        self.ultima_muestra = (float(bloque.t[-1]), *bloque.valores[-1].tolist())
+        self.acumular_historial(bloque)
+        if medir:
+            t_datos = time.perf_counter()
+        # Solo se redibujan las curvas con datos nuevos
+        for canal, nuevo in zip(filters.CANALES, nuevos):
+            if nuevo:
+                self.curvas[canal].setData(*self.series[canal].datos())
+        self.recortar_marcas()
+        if medir:
+            t_fin = time.perf_counter()
+            metrics.registrar("actualizar_datos", t_datos - t_inicio)
+            metrics.registrar("plot.setData", t_fin - t_datos)
+
+    def recortar_marcas(self):
+        """Quita las líneas de eventos que ya han salido de la ventana de la gráfica."""
+        inicios = [s.datos()[0][0] for s in self.series.values() if len(s)]
+        if not inicios:
+            return
+        inicio = min(inicios)
+        while self.event_markers and self.event_markers[0].value() < inicio:
+            self.plot_widget.removeItem(self.event_markers.pop(0))
+
+    def actualizar_etiquetas(self, bloque, nuevos):
+        te, ts, tc, vel, pot = bloque.valores[-1].tolist()
+        if nuevos[0]:
+            self.lbl_te.setText(f"Entrada (TE): {te:.2f} °C")
+        if nuevos[1]:
+            self.lbl_ts.setText(f"Salida (TS): {ts:.2f} °C")
+        if nuevos[2]:
+            self.lbl_tc.setText(f"Termopar (TC): {tc:.2f} °C")
+        if nuevos[3]:
+            self.lbl_vel.setText(f"Velocidad del aire: {vel:.2f} m/s")
+        if nuevos[4]:
+            self.lbl_pot.setText(f"Potencia: {pot:.2f} W")
+
+    def acumular_historial(self, bloque):
+        t = bloque.t - self.t0
+        self.n_muestras += len(t)
+        for i, canal in enumerate(filters.CANALES):
+            # En modo mixto cada canal solo guarda sus lecturas reales
+            filas = bloque.nuevos[:, i]
+            self.series[canal].extender(t[filas], bloque.valores[filas, i])
+
+    def alternar_metricas(self):
+        metrics.activar(not metrics.ACTIVO)
+        if metrics.ACTIVO:
+            metrics.reiniciar()
+            self.timer_metricas.start()
+            self.actualizar_metricas()
+        else:
+            self.timer_metricas.stop()
+        self.lbl_metricas.setVisible(metrics.ACTIVO)
+
+    def alternar_perfilador(self):
+        if self.perfilador.activo:
+            self.perfilador.detener()
+        else:
+            self.perfilador.iniciar()
+
+    def actualizar_metricas(self):
+        texto = metrics.texto_resumen(metrics.instantanea())
+        if self.perfilador.activo:
+            texto += f"\nperfilador: {self.perfilador.muestras} muestras"
+        self.lbl_metricas.setText(texto)
+        self.lbl_metricas.adjustSize()
+        self.lbl_metricas.raise_()
+
+    def registrar_bloque(self, bloque):
+        """Consumidor "registro" (hilo propio): guarda la señal sin filtrar; se puede refiltrar después."""
+        session_id = self.sesion_actual()
+        for t, valores in zip(bloque.t.tolist(), bloque.crudos.tolist()):
+            self.store.agregar_muestra(self.machine_id, session_id, t, valores)
+        # Al diagnóstico, solo las lecturas reales de cada canal
+        self.muestras_crudas.agregar(bloque.t, bloque.crudos, bloque.nuevos)
+
+    def difundir_bloque(self, bloque):
+        """Consumidor "difusion": muestras ya filtradas para los visores web."""
+        for t, valores in zip(bloque.t.tolist(), bloque.valores.tolist()):
+            self.hub.publicar(t, *valores)
+
+    def registrar_comando(self, t, tipo, valor, origen):
+        """Oyente del CommandLane: guarda el comando como evento de la sesión."""
+        self.store.agregar_evento(
+            self.machine_id, self.sesion_actual(), t, tipo, valor, origen
+        )
+        self.command_event.emit(t, tipo, valor, origen)
+
+    def marcar_evento(self, t, tipo, valor, origen):
+        """Dibuja una línea vertical en la gráfica en el instante del comando."""
+        if origen in ("control", remote.ORIGEN):
+            # Las salidas del PID y los comandos remotos se reflejan en el mando
+            # correspondiente sin volver a enviarlos
+            mando = self.slider_heat if tipo == "HEAT" else self.dial_fan
+            mando.blockSignals(True)
+            mando.setValue(valor)
+            mando.blockSignals(False)
+            t_lang = self.translations[self.current_lang]
+            if tipo == "HEAT":
+                self.lbl_heat.setText(t_lang["heater"].format(val=int(valor / 2.55)))
+            else:
+                self.lbl_fan.setText(t_lang["fan"].format(val=int(valor / 2.55)))
+            if origen == "control":
+                return  # no se marcan: serían una línea por muestra
+        color = "#E67E22" if tipo == "HEAT" else "#2980B9"
+        linea = pg.InfiniteLine(
+            pos=t - self.t0,
+            angle=90,
+            movable=False,
+            pen=pg.mkPen(color, style=Qt.PenStyle.DashLine, width=1),
+            label=f"{tipo} {int(valor / 2.55)}%",
+            labelOpts={"position": 0.95, "color": color, "rotateAxis": (1, 0)},
+        )
+        self.plot_widget.addItem(linea)
+        self.event_markers.append(linea)
+
+    def on_safety_trip(self, disparo):
+        """El calefactor ya está apagado; se refleja en la GUI y se pide reconocimiento."""
+        t = self.translations[self.current_lang]["messages"]
+        if self.control:
+            # El lazo de temperatura no puede seguir pidiendo calor tras un disparo
+            self.control.desactivar_actuador("HEAT")
+            self.controles_lazo["tc"][0].setChecked(False)
+        self.slider_heat.setValue(0)
+        QMessageBox.warning(
+            self,
+            t["safety_trip_title"],
+            t["safety_trip"].format(regla=disparo["regla"], medida=disparo["medida"]),
+        )
+        # Reconocido por el operador: se libera el enclavamiento (si el equipo
+        # sigue conectado; tras una reconexión el motor ya es otro)
+        if self.safety:
+            self.safety.rearmar()
+
+    def on_remote_lost(self, motivo):
+        """El calefactor ya está apagado; ningún lazo debe volver a encenderlo."""
+        if self.control:
+            self.control.desactivar_actuador("HEAT")
+            self.controles_lazo["tc"][0].setChecked(False)
+        self.slider_heat.setValue(0)
+
+    # =======================================================
+    # CONTROL AUTOMÁTICO (PID)
+    # =======================================================
+    def alternar_lazo(self, lazo, activo):
+        chk, spin, btn = self.controles_lazo[lazo]
+        if activo and not self.control:
+            QMessageBox.warning(self, "Error", "Debe conectar el equipo primero.")
+            chk.blockSignals(True)
+            chk.setChecked(False)
+            chk.blockSignals(False)
+            return
+        mando = self.slider_heat if lazo == "tc" else self.dial_fan
+        if activo:
+            self.control.lazos[lazo].activar(spin.value())
+        elif self.control:
+            self.control.lazos[lazo].desactivar()
+            btn.setEnabled(True)
+            btn.setText(self.translations[self.current_lang]["closed_loop"]["autotune"])
+        # Con el lazo activo el mando solo muestra la salida del PID
+        mando.setEnabled(not activo)
+
+    def cambiar_objetivo(self, lazo, valor):
+        if self.control and self.control.lazos[lazo].activo:
+            self.control.lazos[lazo].activar(valor)
+
+    def autoajustar(self, lazo):
+        if not self.control:
+            QMessageBox.warning(self, "Error", "Debe conectar el equipo primero.")
+            return
+        chk, spin, btn = self.controles_lazo[lazo]
+        chk.setChecked(True)
+        self.control.lazos[lazo].iniciar_autotune(spin.value())
+        btn.setEnabled(False)
+        btn.setText(self.translations[self.current_lang]["closed_loop"]["autotune_running"])
+
+    def on_autotune_done(self, lazo, resultado):
+        tcl = self.translations[self.current_lang]["closed_loop"]
+        _, _, btn = self.controles_lazo[lazo]
+        btn.setEnabled(True)
+        btn.setText(tcl["autotune"])
+        if "error" in resultado:
+            QMessageBox.warning(
+                self, tcl["autotune_title"],
+                tcl["autotune_failed"].format(lazo=tcl[lazo], error=resultado["error"]),
+            )
+            return
+        QMessageBox.information(
+            self, tcl["autotune_title"], tcl["autotune_done"].format(lazo=tcl[lazo], **resultado)
+        )
 
     def toggle_curve_visibility(self):
         self.curve_te.setVisible(self.chk_te.isChecked())
@@ -716,24 +1253,33 @@ class MainWindow(QMainWindow):
         self.curve_pot.setVisible(self.chk_pot.isChecked())
 
     def mostrar_resultados(self):
-        if not self.data_records:
+        if not self.n_guardados:
             QMessageBox.warning(
                 self, "Sin datos", "No hay datos guardados para mostrar."
             )
             return
         self.results_window = ResultsWindow(
-            self.data_records, self.translations, self.current_lang
+            self.store,
+            self.machine_id,
+            self.session_id,
+            self.translations,
+            self.current_lang,
         )
 
         self.results_window.show()
 
+    def mostrar_historial(self):
+        self.history_window = viewer.HistoryViewer(self.translations, self.current_lang)
+        self.history_window.show()
+
+    def mostrar_diagnostico(self):
+        self.diagnostics_window = diagnostics.DiagnosticsPanel(
+            self.translations, self.current_lang, self.muestras_crudas
+        )
+        self.diagnostics_window.show()
+
     def cerrar_programa(self):
-        if self.reader_thread:
-            self.reader_thread.stop()
-            self.reader_thread.wait()
-        if self.ser and self.ser.is_open:
-            self.ser.close()
-            time.sleep(1)
+        # closeEvent hace las comprobaciones y libera el equipo
         self.close()
 
     # =======================================================
@@ -751,7 +1297,7 @@ class MainWindow(QMainWindow):
             return
 
         # --- 2️⃣ Verificar si hay registros sin exportar ---
-        if len(self.data_records) > 0:
+        if self.n_guardados > 0:
             msg = QMessageBox(self)
             msg.setWindowTitle(t["confirm_title"])
             msg.setText(t["confirm_message"])
@@ -769,12 +1315,21 @@ class MainWindow(QMainWindow):
                 return
 
         # --- 3️⃣ Cerrar correctamente si pasa todas las verificaciones ---
-        if self.reader_thread:
-            self.reader_thread.stop()
-            self.reader_thread.wait()
-        if self.ser and self.ser.is_open:
-            self.ser.close()
-            time.sleep(1)
+        self.liberar_equipo()
+        if self.session_id is not None:
+            self.store.cerrar_sesion(self.session_id)
+            self.guardar_fichero_sesion()
+        if self.uploader:
+            self.uploader.stop()
+        self.retencion.stop()
+        if self.updater:
+            self.updater.stop()
+        self.generador_informes.cerrar()
+        if self.broadcast_server:
+            broadcast.detener_servidor(self.broadcast_server)
+        self.perfilador.detener()
+        metrics.volcar()
+        self.store.cerrar()
         event.accept()
 
 
@@ -785,7 +1340,7 @@ class MainWindow(QMainWindow):
 # Ventana de resultados
 # =======================================================
 class ResultsWindow(QWidget):
-    def __init__(self, data_records, translations, current_lang):
+    def __init__(self, store, machine_id, session_id, translations, current_lang):
         super().__init__()
         self.setObjectName("ResultsTable")
         self.translations = translations
@@ -797,7 +1352,9 @@ class ResultsWindow(QWidget):
         # Usar el texto traducido para el título
         self.setWindowTitle(t["results"])
         self.resize(900, 600)
-        self.data_records = data_records
+        self.store = store
+        self.machine_id = machine_id
+        self.session_id = session_id
 
         # --- Tabla de datos ---
         self.table = QTableWidget()
@@ -843,10 +1400,15 @@ class ResultsWindow(QWidget):
         layout.addLayout(h_btns)
         self.setLayout(layout)
 
+    def registros(self):
+        """Puntos guardados de la sesión, leídos por rangos desde el almacén"""
+        return self.store.registros_guardados(self.machine_id, self.session_id)
+
     def update_table(self):
         """Actualiza la tabla con numeración y valores"""
-        self.table.setRowCount(len(self.data_records))
-        for i, record in enumerate(self.data_records):
+        self.table.setRowCount(0)
+        for i, record in enumerate(self.registros()):
+            self.table.setRowCount(i + 1)
             num_item = QTableWidgetItem(str(i + 1))
             num_item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
             self.table.setItem(i, 0, num_item)
@@ -866,7 +1428,7 @@ class ResultsWindow(QWidget):
         )
         if path:
             t = self.translations[self.current_lang]
-            df = pd.DataFrame(self.data_records, columns=t["table_headers"][1:])
+            df = pd.DataFrame(self.registros(), columns=t["table_headers"][1:])
             df.index = df.index + 1
             df.index.name = "#"
             df.to_excel(path)
@@ -885,6 +1447,18 @@ def load_stylesheet(app, path="style.qss"):
 
 
 if __name__ == "__main__":
+    # Los informes usan procesos hijos: necesario en el exe de PyInstaller
+    import multiprocessing
+
+    multiprocessing.freeze_support()
+
+    # Actualización descargada en la sesión anterior: se instala y se relanza
+    try:
+        if update.aplicar_pendiente():
+            update.relanzar()
+    except Exception as e:
+        print(f"⚠️ No se pudo aplicar la actualización: {e}")
+
     app = QApplication(sys.argv)
 
     # Estilo base “WindowsVista” (permite que QSS controle títulos y botones)
@@ -0,0 +1,446 @@
+# it032_import.py - importación de prácticas antiguas (registros LabVIEW y Excel)
+# -------------------------------------------------------
+# - Lee registros de texto de LabVIEW (.txt/.lvm/.csv, tabulador o ';', coma
+#   decimal) y los .xlsx que escribe export_excel, en trozos de CHUNK_ROWS
+#   filas: la memoria no depende del tamaño del fichero
+# - Columnas Fecha/Hora (%d/%m/%Y, %H:%M:%S) convertidas a epoch de una vez
+#   por trozo con pandas; las filas que comparten segundo se reparten dentro
+#   de él para conservar el orden
+# - Las cabeceras se reconocen con las de translations.json en cualquier
+#   idioma, más unos pocos alias (Velocity, Power, Termopar...)
+# - Sin duplicados: un fichero ya importado (mismo SHA-256) se salta, y las
+#   muestras de segundos que ya existen en el almacén para ese equipo no se
+#   vuelven a meter (re-importar un Excel de una sesión grabada no duplica)
+# - Cada fichero se analiza en un proceso aparte y se corta en sesiones por
+#   huecos de más de 30 min; el proceso principal las mete en el almacén, las
+#   resume (it032_query) y las archiva en sesiones/ (it032_viewer)
+#
+# Uso:  python it032_import.py antiguos/ "excel/*.xlsx" --machine DKT032 --jobs 4
+
+import argparse
+import glob
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+import it032_session_file as session_file
+import it032_store as store
+from it032_reprocess import sha256_fichero
+
+TRANSLATIONS_PATH = "translations.json"
+CHUNK_ROWS = 50_000
+HUECO_SESION_S = 1800.0  # más de media hora sin datos = otra práctica
+FORMATO_FECHA = "%d/%m/%Y"
+FORMATO_HORA = "%H:%M:%S"
+EXT_TEXTO = (".txt", ".lvm", ".csv", ".tsv", ".log", ".dat")
+EXT_EXCEL = (".xlsx", ".xlsm")
+LINEAS_CABECERA = 200  # líneas en las que se busca la fila de cabeceras
+
+CLAVES = ("fecha", "hora", "te", "ts", "tc", "vel", "pot")
+CANALES = CLAVES[2:]
+# Nombres que no salen de translations.json: export_excel en inglés y LabVIEW
+ALIAS = {
+    "date": "fecha", "time": "hora",
+    "velocity": "vel", "velocidad": "vel", "air velocity": "vel",
+    "power": "pot", "potencia": "pot",
+    "tp": "tc", "termopar": "tc", "thermocouple": "tc",
+    "entrada": "te", "t entrada": "te", "temp entrada": "te", "temperatura entrada": "te",
+    "inlet": "te", "salida": "ts", "t salida": "ts", "temp salida": "ts",
+    "temperatura salida": "ts", "outlet": "ts",
+}
+
+
+# ---------------------------------------------------------
+# CABECERAS
+# ---------------------------------------------------------
+def _normalizar(texto):
+    """'Vel (m/s)' -> 'vel', 'Velocidad [m/s]' -> 'velocidad'."""
+    texto = re.sub(r"[\(\[].*?[\)\]]", "", str(texto))
+    texto = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode()
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", texto.lower()).split())
+
+
+def cargar_alias(path=TRANSLATIONS_PATH):
+    """Cabecera normalizada -> clave, con las tablas de todos los idiomas."""
+    alias = {_normalizar(k): v for k, v in ALIAS.items()}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            traducciones = json.load(f)
+    except Exception as e:
+        print(f"⚠️ No se pudo cargar {path} ({e}); solo se usan los alias fijos.")
+        return alias
+    for t in traducciones.values():
+        cabeceras = t.get("table_headers", [])[1:]  # la primera es '#'
+        if len(cabeceras) == len(CLAVES):
+            for clave, cabecera in zip(CLAVES, cabeceras):
+                alias[_normalizar(cabecera)] = clave
+    return alias
+
+
+def inferir_columnas(cabeceras, alias):
+    """Clave -> posición de la columna; None si no parece una tabla de prácticas."""
+    columnas = {}
+    for i, cabecera in enumerate(cabeceras):
+        clave = alias.get(_normalizar(cabecera)) if cabecera is not None else None
+        if clave and clave not in columnas:
+            columnas[clave] = i
+    if "fecha" in columnas and "hora" in columnas and any(c in columnas for c in CANALES):
+        return columnas
+    return None
+
+
+# ---------------------------------------------------------
+# LECTURA EN TROZOS
+# ---------------------------------------------------------
+def _detectar_texto(path, alias):
+    """Codificación, separador, fila de cabeceras y separador decimal de un registro."""
+    with open(path, "rb") as f:
+        muestra = f.read(1 << 16)
+    try:
+        texto, encoding = muestra.decode("utf-8-sig"), "utf-8-sig"
+    except UnicodeDecodeError:
+        # LabVIEW en Windows escribe en la página de códigos del sistema
+        texto, encoding = muestra.decode("cp1252", errors="replace"), "cp1252"
+    lineas = texto.splitlines()[:LINEAS_CABECERA]
+    for i, linea in enumerate(lineas):
+        for sep in ("\t", ";", ","):
+            columnas = inferir_columnas(linea.split(sep), alias)
+            if columnas:
+                siguiente = lineas[i + 1].split(sep) if i + 1 < len(lineas) else []
+                coma = sep != "," and any(re.fullmatch(r"-?\d+,\d+", c.strip()) for c in siguiente)
+                return {"encoding": encoding, "sep": sep, "fila": i,
+                        "decimal": "," if coma else ".", "columnas": columnas}
+    raise ValueError("no se encontró la fila de cabeceras (Fecha/Hora y canales)")
+
+
+def _trozos_texto(path, alias):
+    d = _detectar_texto(path, alias)
+    posiciones = sorted(d["columnas"].items(), key=lambda kv: kv[1])
+    lector = pd.read_csv(
+        path, sep=d["sep"], skiprows=d["fila"] + 1, header=None, usecols=[p for _, p in posiciones],
+        dtype=str, encoding=d["encoding"], chunksize=CHUNK_ROWS, on_bad_lines="skip",
+        skip_blank_lines=True,
+    )
+    for trozo in lector:
+        trozo = trozo.rename(columns={p: clave for clave, p in posiciones})
+        if d["decimal"] == ",":
+            for c in CANALES:
+                if c in trozo:
+                    trozo[c] = trozo[c].str.replace(",", ".", regex=False)
+        yield trozo
+
+
+def _trozos_excel(path, alias):
+    from openpyxl import load_workbook
+
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        filas = wb.active.iter_rows(values_only=True)
+        columnas = None
+        for _, fila in zip(range(LINEAS_CABECERA), filas):
+            columnas = inferir_columnas(fila, alias)
+            if columnas:
+                break
+        if not columnas:
+            raise ValueError("no se encontró la fila de cabeceras (Fecha/Hora y canales)")
+        claves = list(columnas)
+        posiciones = [columnas[c] for c in claves]
+        lote = []
+        for fila in filas:
+            lote.append([fila[p] if p < len(fila) else None for p in posiciones])
+            if len(lote) >= CHUNK_ROWS:
+                yield pd.DataFrame(lote, columns=claves)
+                lote = []
+        if lote:
+            yield pd.DataFrame(lote, columns=claves)
+    finally:
+        wb.close()
+
+
+def leer_trozos(path, alias):
+    """DataFrames de hasta CHUNK_ROWS filas con columnas fecha, hora y canales."""
+    ext = os.path.splitext(path)[1].lower()
+    trozos = _trozos_excel(path, alias) if ext in EXT_EXCEL else _trozos_texto(path, alias)
+    for trozo in trozos:
+        for c in CANALES:
+            trozo[c] = pd.to_numeric(trozo[c], errors="coerce") if c in trozo else np.nan
+        yield trozo
+
+
+# ---------------------------------------------------------
+# MARCAS DE TIEMPO (vectorizado)
+# ---------------------------------------------------------
+def _es_fecha(serie):
+    return pd.api.types.is_datetime64_any_dtype(serie) or (
+        serie.dtype == object and len(serie) and isinstance(serie.iloc[0], datetime)
+    )
+
+
+def marcas_tiempo(fecha, hora):
+    """Epoch (hora local, como store.fecha_hora) de las columnas Fecha y Hora.
+
+    Acepta las cadenas que escribe export_excel y también celdas que Excel ya
+    convirtió en fecha u hora. Las filas ilegibles quedan en NaN.
+    """
+    fecha, hora = pd.Series(fecha), pd.Series(hora)
+    if _es_fecha(fecha):
+        dia = pd.to_datetime(fecha, errors="coerce").dt.normalize()
+    else:
+        dia = pd.to_datetime(fecha.astype(str).str.strip(), format=FORMATO_FECHA, errors="coerce")
+    if _es_fecha(hora):
+        h = pd.to_datetime(hora, errors="coerce")
+        delta = h - h.dt.normalize()
+    else:
+        texto = hora.astype(str).str.strip()
+        delta = pd.to_datetime(texto, format=FORMATO_HORA, errors="coerce") - pd.Timestamp("1900-01-01")
+        # Algunos registros llevan décimas: segundo intento solo con esas filas
+        fallidas = delta.isna() & texto.str.contains(".", regex=False)
+        if fallidas.any():
+            delta[fallidas] = pd.to_timedelta(texto[fallidas], errors="coerce")
+    ingenua = ((dia + delta) - pd.Timestamp("1970-01-01")) / pd.Timedelta(seconds=1)
+    ingenua = np.array(ingenua.to_numpy(dtype=float, na_value=np.nan))
+    # Paso a hora local: un desfase por día distinto (pocos), no por fila
+    validas = ~np.isnan(ingenua)
+    if not validas.any():
+        return ingenua
+    dias, inversa = np.unique(np.floor(ingenua[validas] / 86400), return_inverse=True)
+    desfases = np.array([
+        time.mktime((datetime(1970, 1, 1) + timedelta(days=d, hours=12)).timetuple())
+        - (d * 86400 + 43200)
+        for d in dias
+    ])
+    ingenua[validas] += desfases[inversa]
+    return ingenua
+
+
+def repartir_segundos(t):
+    """Filas del mismo segundo -> s, s+1/n, s+2/n... (t ordenado, resolución de 1 s)."""
+    segundos = np.floor(t)
+    if not len(t) or np.any(t != segundos):
+        return t
+    _, inicio, inversa, cuenta = np.unique(segundos, return_index=True, return_inverse=True,
+                                           return_counts=True)
+    rango = np.arange(len(t)) - inicio[inversa]
+    return segundos + rango / cuenta[inversa]
+
+
+# ---------------------------------------------------------
+# UN FICHERO (proceso de trabajo)
+# ---------------------------------------------------------
+def analizar_fichero(path, tmpdir, alias, conocidos=()):
+    """Convierte un registro en uno o más .it32s temporales, uno por práctica."""
+    t_inicio = time.perf_counter()
+    sha = sha256_fichero(path)
+    res = {"origen": path, "sha256": sha, "filas": 0, "invalidas": 0, "segmentos": [],
+           "saltado": sha in conocidos}
+    if res["saltado"]:
+        return res
+    formato = "xlsx" if os.path.splitext(path)[1].lower() in EXT_EXCEL else "labview"
+    base = os.path.splitext(os.path.basename(path))[0]
+    writer, ultimo = None, None
+    pendiente = None  # filas del último segundo de un trozo: se reparten con el siguiente
+
+    def escribir(t, valores):
+        """Añade filas ordenadas; un hueco grande (o la primera fila) abre otra sesión."""
+        nonlocal writer, ultimo
+        previo = np.concatenate(([-np.inf if ultimo is None else ultimo], t[:-1]))
+        inicios = np.flatnonzero(t - previo > HUECO_SESION_S)
+        limites = np.unique(np.concatenate(([0], inicios, [len(t)])))
+        for a, b in zip(limites[:-1], limites[1:]):
+            if a in inicios:
+                if writer is not None:
+                    writer.cerrar()
+                destino = os.path.join(
+                    tmpdir, f"{base}_{sha[:8]}_{len(res['segmentos'])}{session_file.EXTENSION}"
+                )
+                writer = session_file.SessionWriter(destino, {"imported": {
+                    "source": os.path.abspath(path), "format": formato, "sha256": sha,
+                }})
+                res["segmentos"].append(destino)
+            writer.agregar_bloque(
+                {"t": t[a:b], **{c: valores[a:b, i] for i, c in enumerate(CANALES)}}
+            )
+            ultimo = t[b - 1]
+
+    try:
+        for trozo in leer_trozos(path, alias):
+            t = marcas_tiempo(trozo["fecha"], trozo["hora"])
+            valores = trozo[list(CANALES)].to_numpy(dtype=float)
+            validas = ~np.isnan(t) & ~np.isnan(valores).all(axis=1)
+            res["invalidas"] += int((~validas).sum())
+            t, valores = t[validas], valores[validas]
+            if pendiente is not None:
+                t = np.concatenate((pendiente[0], t))
+                valores = np.concatenate((pendiente[1], valores))
+            if not len(t):
+                continue
+            orden = np.argsort(t, kind="stable")
+            t, valores = t[orden], valores[orden]
+            # El último segundo puede seguir en el trozo siguiente
+            corte = np.searchsorted(t, np.floor(t[-1]), "left")
+            pendiente = (t[corte:], valores[corte:])
+            if corte:
+                escribir(repartir_segundos(t[:corte]), valores[:corte])
+                res["filas"] += corte
+        if pendiente is not None and len(pendiente[0]):
+            escribir(repartir_segundos(pendiente[0]), pendiente[1])
+            res["filas"] += len(pendiente[0])
+    finally:
+        if writer is not None:
+            writer.cerrar()
+    res["formato"] = formato
+    res["segundos"] = time.perf_counter() - t_inicio
+    return res
+
+
+# ---------------------------------------------------------
+# ALMACÉN (proceso principal)
+# ---------------------------------------------------------
+def guardar_segmento(st, machine_id, serial_number, model, path, carpeta):
+    """Mete un segmento en el almacén sin duplicar segundos ya presentes.
+
+    El archivo .it32s se escribe a la vez con las mismas filas, sin volver a
+    leerlas del almacén. Devuelve (filas nuevas, filas repetidas, ruta o None).
+    """
+    with session_file.SessionFile(path) as f:
+        importado = f.metadata.get("imported", {})
+        existentes = st.segundos_con_datos(machine_id, f.t_inicio, f.t_fin)
+        session_id, archivo, nuevas, repetidas, t_fin = None, None, 0, 0, None
+        try:
+            for bloque in f.iter_bloques():
+                quedan = ~np.isin(np.floor(bloque["t"]).astype(np.int64), existentes)
+                repetidas += int((~quedan).sum())
+                if not quedan.any():
+                    continue
+                columnas = {c: v[quedan] for c, v in bloque.items()}
+                t = columnas["t"]
+                if session_id is None:
+                    session_id = st.iniciar_sesion(machine_id, float(t[0]))
+                    archivo = session_file.SessionWriter(
+                        session_file.ruta_sesion(serial_number, session_id, float(t[0]),
+                                                 carpeta=carpeta),
+                        {"device": {"serial_number": serial_number, "model": model},
+                         "machine_id": machine_id, "session_id": session_id,
+                         "events": [], "saved": [], "imported": importado},
+                    )
+                st.agregar_bloque(machine_id, session_id, t,
+                                  np.column_stack([columnas[c] for c in CANALES]))
+                archivo.agregar_bloque(columnas)
+                nuevas += len(t)
+                t_fin = float(t[-1])
+        except BaseException:
+            if archivo is not None:
+                archivo.__exit__(Exception)
+            raise
+    if session_id is None:
+        return 0, repetidas, None
+    archivo.cerrar()
+    st.cerrar_sesion(session_id, t_fin)
+    return nuevas, repetidas, archivo.path
+
+
+def buscar_ficheros(entradas):
+    paths = []
+    for e in entradas:
+        candidatos = glob.glob(os.path.join(e, "**", "*"), recursive=True) if os.path.isdir(e) \
+            else glob.glob(e)
+        paths += [p for p in candidatos
+                  if os.path.isfile(p) and os.path.splitext(p)[1].lower() in EXT_TEXTO + EXT_EXCEL
+                  and not os.path.basename(p).startswith("~$")]  # bloqueos de Excel abierto
+    return sorted(set(paths))
+
+
+def importar(paths, st, serial_number=store.MACHINE_SERIAL, model=store.MACHINE_MODEL,
+             procesos=None, carpeta=session_file.SESSIONS_DIR, al_terminar=None):
+    """Importa los ficheros en paralelo; devuelve estadísticas del lote."""
+    t0 = time.perf_counter()
+    machine_id = st.maquina(serial_number, model)
+    alias = cargar_alias()
+    conocidos = st.hashes_importados()
+    total = {"ficheros": len(paths), "importados": 0, "saltados": 0, "errores": [],
+             "leidas": 0, "nuevas": 0, "repetidas": 0, "invalidas": 0, "sesiones": 0}
+    tmpdir = tempfile.mkdtemp(prefix="it032_import_")
+    try:
+        procesos = max(1, min(procesos or os.cpu_count() or 1, len(paths) or 1))
+        with ProcessPoolExecutor(procesos) as pool:
+            futuros = {pool.submit(analizar_fichero, p, tmpdir, alias, conocidos): p for p in paths}
+            # Se guarda en el almacén según van terminando; el resto sigue analizándose
+            for fut in as_completed(futuros):
+                path = futuros[fut]
+                try:
+                    r = fut.result()
+                    if r["saltado"] or r["sha256"] in conocidos:
+                        total["saltados"] += 1
+                        continue
+                    nuevas = repetidas = sesiones = 0
+                    for seg in r["segmentos"]:
+                        n, rep, destino = guardar_segmento(st, machine_id, serial_number, model,
+                                                           seg, carpeta)
+                        nuevas, repetidas = nuevas + n, repetidas + rep
+                        sesiones += destino is not None
+                        os.remove(seg)
+                    st.registrar_importacion(r["sha256"], os.path.abspath(path), machine_id,
+                                             nuevas, sesiones)
+                    conocidos.add(r["sha256"])
+                except Exception as e:
+                    total["errores"].append((path, str(e)))
+                    print(f"❌ {os.path.basename(path)}: {e}")
+                    continue
+                total["importados"] += 1
+                total["leidas"] += r["filas"]
+                total["invalidas"] += r["invalidas"]
+                total["nuevas"] += nuevas
+                total["repetidas"] += repetidas
+                total["sesiones"] += sesiones
+                if al_terminar:
+                    al_terminar({**r, "nuevas": nuevas, "repetidas": repetidas,
+                                 "sesiones": sesiones})
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    total["segundos"] = time.perf_counter() - t0
+    return total
+
+
+def main():
+    p = argparse.ArgumentParser(description="Importa registros LabVIEW y Excel antiguos")
+    p.add_argument("entradas", nargs="+", help="carpetas, ficheros o patrones")
+    p.add_argument("--db", default=store.DB_PATH)
+    p.add_argument("--machine", default=store.MACHINE_SERIAL, help="número de serie del equipo")
+    p.add_argument("--model", default=store.MACHINE_MODEL)
+    p.add_argument("--sessions", default=session_file.SESSIONS_DIR,
+                   help="carpeta donde archivar las sesiones importadas")
+    p.add_argument("--jobs", type=int, default=None)
+    args = p.parse_args()
+
+    paths = buscar_ficheros(args.entradas)
+    if not paths:
+        print("No se encontraron ficheros .txt/.lvm/.csv/.xlsx.")
+        return
+
+    def progreso(r):
+        print(f"  ✅ {os.path.basename(r['origen'])} ({r['formato']}): {r['nuevas']} nuevas, "
+              f"{r['repetidas']} repetidas, {r['invalidas']} ilegibles, "
+              f"{r['sesiones']} sesiones")
+
+    st = store.PracticeStore(args.db)
+    try:
+        res = importar(paths, st, args.machine, args.model, args.jobs, args.sessions, progreso)
+    finally:
+        st.cerrar()
+    print(f"📥 {res['importados']} importados, {res['saltados']} ya importados, "
+          f"{len(res['errores'])} con error, {res['sesiones']} sesiones nuevas")
+    print(f"⚡ {res['leidas']:,} filas en {res['segundos']:.2f} s "
+          f"({res['leidas'] / max(res['segundos'], 1e-9):,.0f} filas/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+# it032_metrics.py - métricas de rendimiento del camino caliente
+# -------------------------------------------------------
+# - Contadores e histogramas de tiempo por etapa (lectura serie, parseo,
+#   cruce de la señal entre hilos, actualización de la GUI, repintado)
+# - Se activan en caliente (F12 en la ventana principal o IT032_METRICS=1);
+#   desactivadas, cada punto de medida cuesta solo comprobar ACTIVO
+# - Instantánea con muestras/s, p50/p99 por etapa, profundidad de colas y
+#   memoria RSS; volcado a JSON al salir
+# - Perfilador por muestreo opcional (pilas de todos los hilos cada pocos ms)
+#   guardado en formato "collapsed" compatible con flamegraph / speedscope
+
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+try:
+    import psutil
+except ImportError:  # opcional: sin psutil se usa /proc en Linux
+    psutil = None
+
+ACTIVO = os.environ.get("IT032_METRICS", "") == "1"
+METRICS_FILE = "metricas.json"
+PROFILE_FILE = "perfil.txt"
+PROFILE_INTERVAL = 0.005  # segundos entre muestras del perfilador
+
+# Histograma logarítmico: 4 cubetas por octava desde 1 µs (hasta ~1 min)
+_BASE_S = 1e-6
+_POR_OCTAVA = 4
+_CUBETAS = 26 * _POR_OCTAVA
+
+
+class Histograma:
+    """Histograma de duraciones con cubetas fijas; registrar() no reserva memoria."""
+
+    __slots__ = ("cuentas", "n", "suma", "maximo")
+
+    def __init__(self):
+        self.cuentas = [0] * _CUBETAS
+        self.n = 0
+        self.suma = 0.0
+        self.maximo = 0.0
+
+    def registrar(self, dt):
+        i = int(_POR_OCTAVA * math.log2(dt / _BASE_S)) if dt > _BASE_S else 0
+        self.cuentas[min(i, _CUBETAS - 1)] += 1
+        self.n += 1
+        self.suma += dt
+        if dt > self.maximo:
+            self.maximo = dt
+
+    def percentil(self, p):
+        """Límite superior de la cubeta que contiene el percentil p (0-100)."""
+        if not self.n:
+            return 0.0
+        objetivo = self.n * p / 100.0
+        acumulado = 0
+        for i, c in enumerate(self.cuentas):
+            acumulado += c
+            if acumulado >= objetivo:
+                return min(_BASE_S * 2 ** ((i + 1) / _POR_OCTAVA), self.maximo)
+        return self.maximo
+
+
+# ---------------------------------------------------------
+# REGISTRO GLOBAL
+# ---------------------------------------------------------
+# Sin cerrojos: cada etapa la actualiza un único hilo y, como mucho, se pierde
+# alguna cuenta si dos hilos coinciden en la misma etapa.
+etapas = {}
+contadores = Counter()
+colas = {}  # nombre -> función que devuelve la profundidad actual
+_t_inicio = time.monotonic()
+_ultima = (time.monotonic(), 0)  # para calcular muestras/s entre instantáneas
+
+
+def activar(valor=True):
+    global ACTIVO
+    ACTIVO = valor
+
+
+def reiniciar():
+    global _t_inicio, _ultima
+    etapas.clear()
+    contadores.clear()
+    _t_inicio = time.monotonic()
+    _ultima = (_t_inicio, 0)
+
+
+def registrar(etapa, dt):
+    h = etapas.get(etapa)
+    if h is None:
+        h = etapas[etapa] = Histograma()
+    h.registrar(dt)
+
+
+def contar(nombre, n=1):
+    contadores[nombre] += n
+
+
+def registrar_cola(nombre, profundidad):
+    colas[nombre] = profundidad
+
+
+def memoria_rss():
+    """Memoria residente del proceso en bytes (None si no se puede saber)."""
+    if psutil:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def instantanea():
+    global _ultima
+    ahora = time.monotonic()
+    muestras = contadores["muestras"]
+    t_prev, n_prev = _ultima
+    _ultima = (ahora, muestras)
+    profundidades = {}
+    for nombre, funcion in list(colas.items()):
+        try:
+            profundidades[nombre] = funcion()
+        except Exception:
+            profundidades[nombre] = None
+    rss = memoria_rss()
+    return {
+        "activo": ACTIVO,
+        "duracion_s": ahora - _t_inicio,
+        "muestras_s": (muestras - n_prev) / (ahora - t_prev) if ahora > t_prev else 0.0,
+        "contadores": dict(contadores),
+        "colas": profundidades,
+        "rss_mb": rss / 2 ** 20 if rss else None,
+        "etapas": {
+            nombre: {
+                "n": h.n,
+                "media_ms": h.suma / h.n * 1e3 if h.n else 0.0,
+                "p50_ms": h.percentil(50) * 1e3,
+                "p99_ms": h.percentil(99) * 1e3,
+                "max_ms": h.maximo * 1e3,
+            }
+            for nombre, h in list(etapas.items())
+        },
+    }
+
+
+def texto_resumen(inst):
+    """Texto compacto para la superposición sobre la gráfica."""
+    lineas = [f"{inst['muestras_s']:.1f} muestras/s"]
+    if inst["rss_mb"] is not None:
+        lineas[0] += f" · RSS {inst['rss_mb']:.0f} MB"
+    for nombre, e in inst["etapas"].items():
+        lineas.append(f"{nombre}: p50 {e['p50_ms']:.2f} · p99 {e['p99_ms']:.2f} ms")
+    if inst["colas"]:
+        lineas.append("colas: " + ", ".join(f"{k}={v}" for k, v in inst["colas"].items()))
+    avisos = [f"{k}={v}" for k, v in inst["contadores"].items()
+              if k.startswith(("descartadas:", "derramadas:"))]
+    if avisos:
+        lineas.append("⚠️ " + ", ".join(avisos))
+    return "\n".join(lineas)
+
+
+def volcar(path=None):
+    """Guarda la instantánea en JSON (solo si se ha medido algo)."""
+    if not etapas and not contadores:
+        return None
+    path = path or METRICS_FILE
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(instantanea(), f, ensure_ascii=False, indent=2)
+    print(f"📊 Métricas guardadas en {path}")
+    return path
+
+
+def medir_pintado(widget, etapa="repintado"):
+    """Envuelve paintEvent del widget para medir cuánto tarda cada repintado."""
+    original = widget.paintEvent
+
+    def paint_event(event):
+        if not ACTIVO:
+            return original(event)
+        t0 = time.perf_counter()
+        original(event)
+        registrar(etapa, time.perf_counter() - t0)
+
+    widget.paintEvent = paint_event
+
+
+# ---------------------------------------------------------
+# PERFILADOR POR MUESTREO
+# ---------------------------------------------------------
+class PerfilMuestreo:
+    """Toma la pila de cada hilo cada `intervalo` segundos y cuenta pilas repetidas."""
+
+    def __init__(self, intervalo=PROFILE_INTERVAL):
+        self.intervalo = intervalo
+        self.pilas = Counter()
+        self.muestras = 0
+        self._parar = threading.Event()
+        self._hilo = None
+
+    @property
+    def activo(self):
+        return self._hilo is not None and self._hilo.is_alive()
+
+    def iniciar(self):
+        if self.activo:
+            return
+        self._parar.clear()
+        self._hilo = threading.Thread(target=self._loop, daemon=True)
+        self._hilo.start()
+
+    def _loop(self):
+        propio = threading.get_ident()
+        nombres = {}
+        while not self._parar.wait(self.intervalo):
+            for hilo in threading.enumerate():
+                nombres[hilo.ident] = hilo.name
+            for ident, frame in sys._current_frames().items():
+                if ident == propio:
+                    continue
+                pila = []
+                while frame is not None:
+                    codigo = frame.f_code
+                    pila.append(
+                        f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{frame.f_lineno})"
+                    )
+                    frame = frame.f_back
+                pila.append(nombres.get(ident, str(ident)))
+                self.pilas[";".join(reversed(pila))] += 1
+            self.muestras += 1
+
+    def detener(self, path=PROFILE_FILE):
+        """Para el muestreo y guarda las pilas en formato collapsed."""
+        if not self.activo:
+            return None
+        self._parar.set()
+        self._hilo.join()
+        with open(path, "w", encoding="utf-8") as f:
+            for pila, n in self.pilas.most_common():
+                f.write(f"{pila} {n}\n")
+        print(f"🔬 Perfil ({self.muestras} muestras) guardado en {path}")
+        return path
@@ -0,0 +1,509 @@
+# it032_pipeline.py - tubería de procesado entre la adquisición y sus consumidores
+# -------------------------------------------------------
+# - Etapas componibles: parseo (en el lector) → calibración → filtrado →
+#   derivados → reparto a los consumidores (GUI, registro, difusión...)
+# - Las muestras viajan en bloques NumPy (t + 5 canales); el lector agrupa las
+#   líneas ya recibidas y las entrega sin esperar a nadie
+# - Colas acotadas entre etapas; cada consumidor elige qué hacer cuando su cola
+#   se llena:
+#     "bloquear"           no se pierde nada (registro): quien encola espera
+#                          hueco, salvo el hilo de procesado, que nunca espera
+#                          (no frena enclavamientos y PID): lo que no cabe se
+#                          derrama a un fichero temporal y vuelve en orden; si
+#                          el derrame llega a su límite, se descarta y se cuenta
+#     "descartar_antiguo"  tira los bloques más viejos (GUI)
+#     "muestrear"          se queda con una fila por intervalo (difusión web)
+# - La entrada desde el lector es siempre "descartar_antiguo": ningún
+#   consumidor, por lento que sea, puede frenar la lectura del puerto serie
+# - Enclavamientos y lazos PID son consumidores "críticos": se ejecutan en el
+#   hilo de procesado, muestra a muestra, antes del reparto
+# - Las filas descartadas y las derramadas de cada cola se avisan por consola
+#   y se cuentan en las métricas (F12)
+
+import tempfile
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+import it032_metrics as metrics
+
+N_CANALES = 5
+POLITICAS = ("bloquear", "descartar_antiguo", "muestrear")
+BLOQUE_MAX_FILAS = 64  # filas por bloque como mucho
+BLOQUE_MAX_S = 0.1  # antigüedad máxima de la primera fila de un bloque
+ENTRADA_BLOQUES = 600  # ~1 min a 10 Hz antes de empezar a descartar
+SINK_BLOQUES = 256
+REFRESCO_GUI_MS = 50  # la GUI vacía su cola con un QTimer a este intervalo
+PUNTOS_GRAFICA = 7200  # puntos por curva en la gráfica en directo (1 h a 2 Hz)
+INTERVALO_DIFUSION = 0.1  # s entre muestras enviadas a los visores web
+AVISO_PERDIDAS_S = 5.0  # s mínimos entre avisos por consola de una misma cola
+DERRAME_MAX_FILAS = 2_000_000  # ~55 h a 10 Hz, ~190 MB en disco; después se descarta
+
+
+class Bloque:
+    """Lote de muestras: t (n,), crudos y valores (n, 5), nuevos (n, 5) bool.
+
+    `crudos` es la señal calibrada sin filtrar y `valores` la filtrada. Hasta
+    la etapa Derivar, un NaN significa "sin lectura nueva en esta fila" (canal
+    lento en modo mixto); después ambos llevan el último valor y `nuevos`
+    indica qué canales se leyeron en cada fila.
+    """
+
+    __slots__ = ("t", "crudos", "valores", "nuevos")
+
+    def __init__(self, t, crudos, valores=None, nuevos=None):
+        self.t = np.asarray(t, dtype=float)
+        self.crudos = np.asarray(crudos, dtype=float).reshape(len(self.t), N_CANALES)
+        self.valores = self.crudos.copy() if valores is None else valores
+        self.nuevos = ~np.isnan(self.crudos) if nuevos is None else nuevos
+
+    def __len__(self):
+        return len(self.t)
+
+    def filas(self, indices):
+        return Bloque(self.t[indices], self.crudos[indices], self.valores[indices],
+                      self.nuevos[indices])
+
+    @staticmethod
+    def unir(bloques):
+        if len(bloques) == 1:
+            return bloques[0]
+        return Bloque(
+            np.concatenate([b.t for b in bloques]),
+            np.concatenate([b.crudos for b in bloques]),
+            np.concatenate([b.valores for b in bloques]),
+            np.concatenate([b.nuevos for b in bloques]),
+        )
+
+
+class Acumulador:
+    """Agrupa las muestras del lector en bloques.
+
+    Se entrega en cuanto el puerto no tiene más líneas esperando (a ritmo
+    normal, una fila por bloque y sin retraso); si el lector va con retraso,
+    lo ya recibido sale junto, hasta `max_filas` filas o `max_s` segundos.
+    """
+
+    def __init__(self, max_filas=BLOQUE_MAX_FILAS, max_s=BLOQUE_MAX_S):
+        self.max_filas = max_filas
+        self.max_s = max_s
+        self._t = []
+        self._filas = []
+        self._desde = 0.0
+
+    def agregar(self, t, valores, hay_mas=False):
+        """Añade una muestra; devuelve un Bloque cuando toca entregarlo."""
+        if not self._t:
+            self._desde = time.monotonic()
+        self._t.append(t)
+        self._filas.append(valores)
+        if (not hay_mas or len(self._t) >= self.max_filas
+                or time.monotonic() - self._desde >= self.max_s):
+            return self.vaciar()
+        return None
+
+    def vaciar(self):
+        if not self._t:
+            return None
+        bloque = Bloque(self._t, self._filas)
+        self._t, self._filas = [], []
+        return bloque
+
+
+# ---------------------------------------------------------
+# COLAS ACOTADAS
+# ---------------------------------------------------------
+class Cola:
+    """Cola de bloques con capacidad fija y política de desbordamiento."""
+
+    def __init__(self, capacidad=SINK_BLOQUES, politica="bloquear", intervalo=0.0,
+                 derrame_max=DERRAME_MAX_FILAS):
+        if politica not in POLITICAS:
+            raise ValueError(f"política no válida: {politica} (use {', '.join(POLITICAS)})")
+        if politica == "muestrear" and intervalo <= 0:
+            raise ValueError("la política 'muestrear' necesita un intervalo > 0")
+        self.capacidad = capacidad
+        self.politica = politica
+        self.intervalo = intervalo
+        self._cola = deque()
+        self._cond = threading.Condition()
+        self._ultimo_tramo = None
+        self.cerrada = False
+        self.filas = 0  # filas pendientes (en memoria y en disco)
+        self.entregadas = 0
+        self.descartadas = 0
+        self.derramadas = 0  # filas que han pasado por el fichero de derrame
+        # Derrame a disco (solo "bloquear" sin esperar): bloques en orden,
+        # se escriben al final y se leen desde `_pos_derrame`
+        self.derrame_max = derrame_max
+        self._derrame = None
+        self._pos_derrame = 0
+        self._en_disco = 0  # bloques
+        self._filas_disco = 0
+
+    def __len__(self):
+        return len(self._cola) + self._en_disco
+
+    def poner(self, bloque, esperar=True):
+        """Encola un bloque. Solo la política "bloquear" puede esperar.
+
+        Con `esperar=False` una cola "bloquear" llena tampoco espera: el bloque
+        va al fichero de derrame (`derramadas`) o, si este ya tiene
+        `derrame_max` filas, se descarta (`descartadas`).
+        """
+        if self.politica == "muestrear":
+            bloque = self._muestrear(bloque)
+            if bloque is None:
+                return
+        with self._cond:
+            if self.politica == "bloquear":
+                if not esperar:
+                    if self._en_disco or len(self._cola) >= self.capacidad:
+                        # Detrás de lo ya derramado, para no alterar el orden
+                        if self._filas_disco + len(bloque) > self.derrame_max:
+                            self.descartadas += len(bloque)
+                        else:
+                            self._derramar(bloque)
+                        return
+                else:
+                    while ((len(self._cola) >= self.capacidad or self._en_disco)
+                           and not self.cerrada):
+                        self._cond.wait()
+            else:
+                while len(self._cola) >= self.capacidad:
+                    viejo = self._cola.popleft()
+                    self.filas -= len(viejo)
+                    self.descartadas += len(viejo)
+            self._cola.append(bloque)
+            self.filas += len(bloque)
+            self._cond.notify_all()
+
+    def _muestrear(self, bloque):
+        # Primera fila de cada tramo de `intervalo` segundos (t es creciente)
+        tramo = np.floor(bloque.t / self.intervalo)
+        previo = np.empty_like(tramo)
+        previo[0] = -np.inf if self._ultimo_tramo is None else self._ultimo_tramo
+        previo[1:] = tramo[:-1]
+        quedan = np.flatnonzero(tramo != previo)
+        self.descartadas += len(bloque) - len(quedan)
+        if not len(quedan):
+            return None
+        self._ultimo_tramo = tramo[-1]
+        return bloque if len(quedan) == len(bloque) else bloque.filas(quedan)
+
+    def _derramar(self, bloque):
+        if self._derrame is None:
+            self._derrame = tempfile.TemporaryFile(prefix="it032_cola_")
+        self._derrame.seek(0, 2)
+        for x in (bloque.t, bloque.crudos, bloque.valores, bloque.nuevos):
+            np.save(self._derrame, x, allow_pickle=False)
+        self._en_disco += 1
+        self._filas_disco += len(bloque)
+        self.derramadas += len(bloque)
+        self.filas += len(bloque)
+        self._cond.notify_all()
+
+    def _recuperar(self):
+        # Devuelve a memoria lo derramado a medida que hay hueco
+        while self._en_disco and len(self._cola) < self.capacidad:
+            self._derrame.seek(self._pos_derrame)
+            bloque = Bloque(*(np.load(self._derrame) for _ in range(4)))
+            self._pos_derrame = self._derrame.tell()
+            self._en_disco -= 1
+            self._filas_disco -= len(bloque)
+            self._cola.append(bloque)
+        if not self._en_disco and self._pos_derrame:
+            self._derrame.seek(0)
+            self._derrame.truncate()
+            self._pos_derrame = 0
+
+    def sacar(self, timeout=None):
+        """Siguiente bloque, o None si no llega ninguno en `timeout` o está cerrada y vacía."""
+        with self._cond:
+            if not self._cola and not self._en_disco and not self.cerrada:
+                self._cond.wait(timeout)
+            self._recuperar()
+            if not self._cola:
+                return None
+            bloque = self._cola.popleft()
+            self.filas -= len(bloque)
+            self.entregadas += len(bloque)
+            self._recuperar()
+            self._cond.notify_all()
+            return bloque
+
+    def sacar_todo(self):
+        """Los bloques pendientes en memoria sin esperar (para consumidores con temporizador)."""
+        with self._cond:
+            bloques = list(self._cola)
+            self._cola.clear()
+            n = sum(len(b) for b in bloques)
+            self.filas -= n
+            self.entregadas += n
+            self._recuperar()
+            self._cond.notify_all()
+            return bloques
+
+    def cerrar(self):
+        with self._cond:
+            self.cerrada = True
+            self._cond.notify_all()
+
+    def liberar(self):
+        """Cierra el fichero de derrame (lo que quede en él se pierde)."""
+        with self._cond:
+            if self._derrame is not None:
+                self._derrame.close()
+                self._derrame = None
+            self.filas -= self._filas_disco
+            self._en_disco = self._filas_disco = self._pos_derrame = 0
+
+
+class SerieCircular:
+    """Últimos `n` puntos (x, y) de una curva, contiguos para pintarlos sin copiar.
+
+    Los arrays tienen sitio para 2n: se escribe al final y, al llegar al
+    tope, los puntos que siguen visibles vuelven al principio (una copia cada
+    ~n puntos en lugar de una por muestra).
+    """
+
+    def __init__(self, n=PUNTOS_GRAFICA):
+        self.n = n
+        self._x = np.empty(2 * n)
+        self._y = np.empty(2 * n)
+        self._ini = 0
+        self._fin = 0
+
+    def __len__(self):
+        return self._fin - self._ini
+
+    def extender(self, x, y):
+        m = len(x)
+        if not m:
+            return
+        if m > self.n:
+            x, y, m = x[-self.n:], y[-self.n:], self.n
+        if self._fin + m > 2 * self.n:
+            quedan = min(len(self), self.n - m)
+            self._x[:quedan] = self._x[self._fin - quedan:self._fin]
+            self._y[:quedan] = self._y[self._fin - quedan:self._fin]
+            self._ini, self._fin = 0, quedan
+        self._x[self._fin:self._fin + m] = x
+        self._y[self._fin:self._fin + m] = y
+        self._fin += m
+        self._ini = max(self._ini, self._fin - self.n)
+
+    def datos(self):
+        return self._x[self._ini:self._fin], self._y[self._ini:self._fin]
+
+
+# ---------------------------------------------------------
+# ETAPAS
+# ---------------------------------------------------------
+# Cada etapa recibe un Bloque y devuelve un Bloque (el mismo o uno nuevo), o
+# None si no queda nada que pasar a la siguiente.
+class Calibrar:
+    """Curvas del equipo (it032_calibration.Curvas, por LUT) y después los ceros de reposo."""
+
+    def __init__(self, offsets, curvas=None):
+        self.offsets = np.asarray(offsets, dtype=float)
+        self.curvas = curvas
+
+    def __call__(self, bloque):
+        crudos = self.curvas.aplicar(bloque.crudos) if self.curvas else bloque.crudos
+        bloque.crudos = crudos - self.offsets
+        bloque.valores = bloque.crudos.copy()
+        return bloque
+
+
+class Filtrar:
+    """Filtros en directo por canal (it032_filters.ChannelFilters), fila a fila."""
+
+    def __init__(self, filtros):
+        self.filtros = filtros
+
+    def __call__(self, bloque):
+        filtrar = self.filtros.filtrar
+        bloque.valores = np.array([filtrar(fila) for fila in bloque.crudos.tolist()])
+        return bloque
+
+
+class Derivar:
+    """Retiene el último valor de los canales lentos y espera a tener todos.
+
+    Tras esta etapa no quedan NaN: el registro y la difusión reciben siempre
+    los cinco canales, y `nuevos` sigue diciendo cuáles son lecturas frescas.
+    """
+
+    def __init__(self):
+        self._ultimos = np.full((2, N_CANALES), np.nan)  # crudos, valores
+
+    def __call__(self, bloque):
+        n = len(bloque)
+        for k, nombre in enumerate(("crudos", "valores")):
+            x = np.vstack((self._ultimos[k], getattr(bloque, nombre)))
+            # Índice de la última fila con dato, acumulado hacia abajo
+            idx = np.where(np.isnan(x), 0, np.arange(n + 1)[:, None])
+            np.maximum.accumulate(idx, axis=0, out=idx)
+            x = x[idx, np.arange(N_CANALES)]
+            self._ultimos[k] = x[-1]
+            setattr(bloque, nombre, x[1:])
+        completas = ~np.isnan(bloque.crudos).any(axis=1)
+        if completas.all():
+            return bloque
+        # Aún falta la primera lectura de algún canal lento
+        quedan = np.flatnonzero(completas)
+        return bloque.filas(quedan) if len(quedan) else None
+
+
+# ---------------------------------------------------------
+# CONSUMIDORES Y TUBERÍA
+# ---------------------------------------------------------
+class Sink:
+    """Consumidor con su propia cola. Con `funcion` tiene hilo propio; sin ella,
+    alguien la vacía desde fuera (la GUI con un QTimer).
+
+    El mismo bloque llega a todos los consumidores: ninguno debe modificarlo.
+    """
+
+    def __init__(self, nombre, funcion, cola):
+        self.nombre = nombre
+        self.funcion = funcion
+        self.cola = cola
+        self.errores = 0
+        self._hilo = None
+
+    def iniciar(self):
+        if self.funcion:
+            self._hilo = threading.Thread(target=self._loop, daemon=True,
+                                          name=f"sink-{self.nombre}")
+            self._hilo.start()
+
+    def _loop(self):
+        while True:
+            bloque = self.cola.sacar(timeout=0.5)
+            if bloque is None:
+                if self.cola.cerrada:
+                    return
+                continue
+            try:
+                self.funcion(bloque)
+            except Exception as e:
+                self.errores += 1
+                print(f"⚠️ Error en el consumidor '{self.nombre}': {e}")
+
+    def esperar(self, timeout):
+        if self._hilo:
+            self._hilo.join(timeout)
+
+
+class Pipeline:
+    """Lector → [entrada] → etapas + críticos → [cola por consumidor] → consumidores."""
+
+    def __init__(self, etapas, criticos=(), capacidad=ENTRADA_BLOQUES):
+        self.etapas = list(etapas)
+        self.criticos = list(criticos)
+        self.entrada = Cola(capacidad, "descartar_antiguo")
+        self.sinks = {}
+        self._hilo = None
+        self._avisadas = {}  # (tipo, cola) -> (filas ya avisadas, instante del aviso)
+
+    def agregar_sink(self, nombre, funcion=None, politica="descartar_antiguo",
+                     capacidad=SINK_BLOQUES, intervalo=0.0):
+        sink = Sink(nombre, funcion, Cola(capacidad, politica, intervalo))
+        self.sinks[nombre] = sink
+        if self._hilo:
+            sink.iniciar()
+        return sink
+
+    def iniciar(self):
+        for sink in self.sinks.values():
+            sink.iniciar()
+        self._hilo = threading.Thread(target=self._procesar, daemon=True, name="pipeline")
+        self._hilo.start()
+
+    def meter(self, bloque):
+        """Desde el lector: nunca espera."""
+        self.entrada.poner(bloque)
+
+    def detener(self, timeout=5.0):
+        """Procesa lo que quede en la entrada y vacía las colas de los consumidores."""
+        self.entrada.cerrar()
+        if self._hilo:
+            self._hilo.join(timeout)
+        for sink in self.sinks.values():
+            sink.cola.cerrar()
+        for sink in self.sinks.values():
+            sink.esperar(timeout)
+            sink.cola.liberar()
+
+    def _procesar(self):
+        while True:
+            bloque = self.entrada.sacar(timeout=0.5)
+            if bloque is None:
+                if self.entrada.cerrada:
+                    return
+                continue
+            medir = metrics.ACTIVO
+            if medir:
+                t_proceso = time.perf_counter()
+            for etapa in self.etapas:
+                bloque = etapa(bloque)
+                if bloque is None:
+                    break
+            if bloque is None:
+                continue
+            if self.criticos:
+                # Enclavamientos y PID muestra a muestra, antes que cualquier consumidor
+                for t, fila in zip(bloque.t.tolist(), bloque.valores.tolist()):
+                    for critico in self.criticos:
+                        critico(t, fila)
+            if medir:
+                metrics.registrar("filtros+seguridad", time.perf_counter() - t_proceso)
+                metrics.contar("muestras", len(bloque))
+            # Un consumidor lento no puede parar este hilo: los críticos del
+            # siguiente bloque no esperan a nadie
+            for sink in self.sinks.values():
+                sink.cola.poner(bloque, esperar=False)
+            self._vigilar_colas()
+
+    def _vigilar_colas(self):
+        # Descartadas en la entrada y en los "bloquear" (perdidas) y derramadas
+        # a disco (guardadas, pero el consumidor no da abasto)
+        cuentas = {("descartadas", "entrada"): self.entrada.descartadas}
+        for nombre, sink in self.sinks.items():
+            if sink.cola.politica == "bloquear":
+                cuentas[("derramadas", nombre)] = sink.cola.derramadas
+                cuentas[("descartadas", nombre)] = sink.cola.descartadas
+        ahora = time.monotonic()
+        for (tipo, nombre), total in cuentas.items():
+            previas, t_aviso = self._avisadas.get((tipo, nombre), (0, -AVISO_PERDIDAS_S))
+            if total <= previas:
+                continue
+            metrics.contar(f"{tipo}:{nombre}", total - previas)
+            if ahora - t_aviso < AVISO_PERDIDAS_S:
+                self._avisadas[(tipo, nombre)] = (total, t_aviso)
+                continue
+            if nombre == "entrada":
+                print(f"⚠️ Tubería saturada: {total} filas descartadas en la entrada")
+            elif tipo == "derramadas":
+                print(f"⚠️ Consumidor '{nombre}' lento: {total} filas derramadas a disco")
+            else:
+                print(f"⚠️ Consumidor '{nombre}' lento: {total} filas descartadas "
+                      f"(derrame lleno, {self.sinks[nombre].cola.derrame_max} filas)")
+            self._avisadas[(tipo, nombre)] = (total, ahora)
+
+    def estadisticas(self):
+        colas = {"entrada": self.entrada, **{n: s.cola for n, s in self.sinks.items()}}
+        return {
+            nombre: {
+                "politica": c.politica,
+                "pendientes": c.filas,
+                "entregadas": c.entregadas,
+                "descartadas": c.descartadas,
+                "derramadas": c.derramadas,
+            }
+            for nombre, c in colas.items()
+        }
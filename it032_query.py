@@ -0,0 +1,173 @@
+# it032_query.py - consultas del profesor sobre todas las prácticas guardadas
+# -------------------------------------------------------
+# - Filtra y ordena prácticas por equipo, fecha o resultado (h, Re, Nu...)
+#   leyendo solo los resúmenes por práctica de it032_store (no las muestras)
+# - --refresh resume antes las sesiones que aún no tenían resumen
+# - --steps N muestra el detalle por escalón de una práctica
+# - --bench N crea una base temporal con N prácticas sintéticas y mide
+#   cuánto tardan las consultas
+#
+# Ejemplos:
+#   python it032_query.py --machine DKT032 --since 01/09/2026 --order h_mean
+#   python it032_query.py --h-min 20 --clean --order valid_steps --asc
+
+import argparse
+import os
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+import it032_store as store
+
+COLUMNAS_TABLA = (
+    ("session_id", "Sesión", "{}"),
+    ("serial_number", "Equipo", "{}"),
+    ("started_at", "Inicio", None),
+    ("samples", "Muestras", "{}"),
+    ("valid_steps", "Escal. OK", "{}"),
+    ("steps", "Escal.", "{}"),
+    ("h_mean", "h medio", "{:.1f}"),
+    ("h_max", "h máx", "{:.1f}"),
+    ("re_max", "Re máx", "{:.0f}"),
+    ("nu_mean", "Nu medio", "{:.1f}"),
+    ("tp_max", "TC máx", "{:.1f}"),
+    ("flags", "Avisos", "{}"),
+)
+
+
+def _fecha(texto):
+    """dd/mm/aaaa (como la tabla de la GUI) o aaaa-mm-dd -> epoch."""
+    for formato in ("%d/%m/%Y", "%Y-%m-%d", "%d/%m/%Y %H:%M"):
+        try:
+            return datetime.strptime(texto, formato).timestamp()
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError(f"fecha no válida: {texto}")
+
+
+def formatear(filas, columnas=COLUMNAS_TABLA):
+    cabecera = [titulo for _, titulo, _ in columnas]
+    cuerpo = []
+    for f in filas:
+        linea = []
+        for clave, _, fmt in columnas:
+            v = f.get(clave)
+            if v is None:
+                linea.append("—")
+            elif fmt is None:
+                linea.append(datetime.fromtimestamp(v).strftime("%d/%m/%Y %H:%M"))
+            else:
+                linea.append(fmt.format(v))
+        cuerpo.append(linea)
+    anchos = [max(len(str(c)) for c in col) for col in zip(cabecera, *cuerpo)]
+    return "\n".join(
+        "  ".join(str(c).ljust(a) for c, a in zip(linea, anchos))
+        for linea in [cabecera, *cuerpo]
+    )
+
+
+# ---------------------------------------------------------
+# PRUEBA DE RENDIMIENTO
+# ---------------------------------------------------------
+def poblar(st, n_practicas, muestras=600, equipos=20, seed=0):
+    """Inserta prácticas sintéticas (escalones de HEAT/FAN) y las resume al cerrar."""
+    rng = np.random.default_rng(seed)
+    maquinas = [st.maquina(f"DKT{100 + i:03d}") for i in range(equipos)]
+    ahora = time.time()
+    separacion = 365 * 86400 / max(n_practicas, 1)  # un año de clases
+    for i in range(n_practicas):
+        machine_id = maquinas[i % equipos]
+        t0 = ahora - 365 * 86400 + i * separacion
+        sid = st.iniciar_sesion(machine_id, t0)
+        # Calefactor a 40 W desde t=10 s y escalón de ventilador a mitad de práctica
+        t_fan = muestras * 0.25
+        fan = int(rng.integers(50, 255))
+        t = t0 + np.arange(muestras) * 0.5
+        r = t - t0
+        vel = np.where(r >= t_fan, fan / 255 * 3, 0.3) + rng.normal(0, 0.02, muestras)
+        pot = np.where(r >= 10, 40.0, 0.0)
+        h = 8 + 15 * np.abs(vel) ** 0.8
+        te = 21 + rng.normal(0, 0.05, muestras)
+        ts = te + 1.5
+        tc = 22 + pot / (0.01 * h) * (1 - np.exp(-np.maximum(r - 10, 0) / 15))
+        for j in range(muestras):
+            st.agregar_muestra(machine_id, sid, t[j], [te[j], ts[j], tc[j], vel[j], pot[j]])
+        st.agregar_evento(machine_id, sid, t0 + 10, "HEAT", 170, "consigna")
+        st.agregar_evento(machine_id, sid, t0 + t_fan, "FAN", fan, "consigna")
+        st.cerrar_sesion(sid, t[-1])
+
+
+def bench(n_practicas):
+    with tempfile.TemporaryDirectory() as tmp:
+        st = store.PracticeStore(os.path.join(tmp, "practicas.db"))
+        t = time.perf_counter()
+        poblar(st, n_practicas)
+        dt = time.perf_counter() - t
+        print(f"📦 {n_practicas} prácticas guardadas y resumidas en {dt:.1f} s "
+              f"({dt / n_practicas * 1e3:.1f} ms por práctica)")
+        consultas = {
+            "todas por h medio": {"orden": "h_mean", "limite": 100000},
+            "un equipo, último mes": {
+                "serial_number": "DKT105", "desde": time.time() - 30 * 86400, "limite": 100000,
+            },
+            "h ≥ 30 por Re": {"h_min": 30, "orden": "re_max", "limite": 100000},
+            "sin avisos por h medio": {"sin_avisos": True, "orden": "h_mean", "limite": 100000},
+            "top 10 por h máx": {"orden": "h_max", "limite": 10},
+        }
+        for nombre, filtros in consultas.items():
+            t = time.perf_counter()
+            filas = st.buscar_practicas(**filtros)
+            print(f"   {nombre}: {len(filas)} filas en {(time.perf_counter() - t) * 1e3:.1f} ms")
+        st.cerrar()
+
+
+def main():
+    p = argparse.ArgumentParser(description="Consulta de prácticas IT 03.2 resumidas")
+    p.add_argument("--db", default=store.DB_PATH)
+    p.add_argument("--machine", help="número de serie del equipo")
+    p.add_argument("--since", type=_fecha, help="desde la fecha (dd/mm/aaaa)")
+    p.add_argument("--until", type=_fecha, help="hasta la fecha, sin incluirla")
+    p.add_argument("--h-min", type=float)
+    p.add_argument("--h-max", type=float)
+    p.add_argument("--clean", action="store_true", help="solo prácticas sin avisos")
+    p.add_argument("--order", default="started_at", choices=store.PracticeStore.ORDENES)
+    p.add_argument("--asc", action="store_true")
+    p.add_argument("--limit", type=int, default=50)
+    p.add_argument("--refresh", action="store_true", help="resumir sesiones pendientes")
+    p.add_argument("--steps", type=int, metavar="SESION", help="detalle por escalón")
+    p.add_argument("--bench", type=int, metavar="N", help="prueba con N prácticas sintéticas")
+    args = p.parse_args()
+
+    if args.bench:
+        bench(args.bench)
+        return
+    st = store.PracticeStore(args.db)
+    try:
+        if args.refresh:
+            t = time.perf_counter()
+            n = st.actualizar_resumenes()
+            print(f"🔄 {n} sesiones resumidas en {time.perf_counter() - t:.2f} s")
+        t = time.perf_counter()
+        if args.steps is not None:
+            filas = st.escalones_sesion(args.steps)
+            columnas = [(c, c, "{:.4g}" if c not in ("step", "samples", "flags") else "{}")
+                        for c in ("step", "duration", "heat", "fan", "samples", "te", "ts",
+                                  "tp", "vel", "pot", "h", "re", "nu", "balance", "flags")]
+            texto = formatear(filas, columnas)
+        else:
+            filas = st.buscar_practicas(
+                args.machine, args.since, args.until, args.h_min, args.h_max,
+                args.clean, args.order, not args.asc, args.limit,
+            )
+            texto = formatear(filas)
+        dt = time.perf_counter() - t
+        print(texto)
+        print(f"\n{len(filas)} filas en {dt * 1e3:.1f} ms")
+    finally:
+        st.cerrar()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,637 @@
+# it032_remote.py - práctica manejada a distancia (un mando, muchos visores)
+# -------------------------------------------------------
+# - Servidor HTTP propio (IT032_REMOTE_PORT): panel web con mandos de FAN y
+#   HEAT, medidas en directo (SSE) y estado de la sesión
+# - Un único mando remoto: quien lo pide recibe un token con caducidad
+#   (LEASE_S) que renueva con latidos; el resto de conectados solo mira.
+#   El operador del PC sigue pudiendo mover los mandos locales
+# - Los comandos remotos se limitan (cubo de fichas, COMANDOS_S por segundo)
+#   y entran al CommandLane como consignas de origen "remoto": se fusionan
+#   con las demás y quedan registradas como eventos de la sesión
+# - Latencia de cada comando: llegada → escrito en el equipo → primera
+#   muestra en la que se ve el efecto (pot para HEAT, vel para FAN); se
+#   envía al navegador, que añade el tramo de vuelta hasta pantalla
+# - Si el mando se pierde (sin latidos o stream caído más de RECONEXION_S)
+#   el calefactor se apaga por la vía prioritaria y el mando queda libre
+#
+# Uso:  python it032_remote.py --demo          (equipo simulado, abrir el navegador)
+#       python it032_remote.py --prueba        (cliente automático de comprobación)
+
+import argparse
+import json
+import os
+import secrets
+import socket
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+import it032_broadcast as broadcast
+import it032_core as core
+import it032_pipeline as pipeline
+
+REMOTE_PORT = int(os.environ.get("IT032_REMOTE_PORT", "0"))  # 0 = desactivado
+LEASE_S = 10.0  # el mando caduca si no se renueva en este tiempo
+RECONEXION_S = 3.0  # margen para que el stream del mando se reconecte
+COMANDOS_S = 4.0  # comandos por segundo sostenidos
+RAFAGA = 4  # comandos seguidos permitidos antes de limitar
+ESPERA_EFECTO = 15.0  # sin efecto visible en este tiempo, el comando se da por perdido
+LATENCIAS = 200  # latencias recientes para las estadísticas
+ORIGEN = "remoto"
+# tipo -> (columna de la muestra, cambio mínimo que cuenta como efecto)
+EFECTO = {"HEAT": (4, 1.0), "FAN": (3, 0.1)}
+ERRORES_HTTP = {"no_valido": 400, "sin_mando": 403, "ocupado": 409, "limite": 429}
+
+
+# ---------------------------------------------------------
+# SESIÓN REMOTA
+# ---------------------------------------------------------
+class Cubo:
+    """Limitador de cubo de fichas: `tasa` por segundo con ráfagas de `rafaga`."""
+
+    def __init__(self, tasa, rafaga):
+        self.tasa = tasa
+        self.rafaga = rafaga
+        self.fichas = float(rafaga)
+        self.t = time.monotonic()
+
+    def tomar(self):
+        ahora = time.monotonic()
+        self.fichas = min(self.rafaga, self.fichas + (ahora - self.t) * self.tasa)
+        self.t = ahora
+        if self.fichas < 1.0:
+            return False
+        self.fichas -= 1.0
+        return True
+
+
+class Mando:
+    def __init__(self, nombre, lease_s, tasa, rafaga):
+        self.token = secrets.token_urlsafe(16)
+        self.nombre = nombre
+        self.desde = core.reloj()
+        self.expira = time.monotonic() + lease_s
+        self.cubo = Cubo(tasa, rafaga)
+        self.streams = 0
+        self.con_stream = False  # tuvo stream alguna vez: sin él no se renueva
+
+
+class RemoteSession:
+    """Estado compartido entre el servidor HTTP, el CommandLane y el pipeline.
+
+    Los métodos devuelven diccionarios; si llevan "error", es una de las
+    claves de ERRORES_HTTP. `observar` es el consumidor "remoto" del pipeline.
+    """
+
+    def __init__(self, lane, al_perder=None, lease_s=LEASE_S, tasa=COMANDOS_S,
+                 rafaga=RAFAGA):
+        self.lane = lane
+        self.al_perder = al_perder  # callback(motivo) tras aplicar el estado seguro
+        self.lease_s = lease_s
+        self.tasa = tasa
+        self.rafaga = rafaga
+        self.hub = broadcast.BroadcastHub()
+        self.mando = None
+        self.latencias = deque(maxlen=LATENCIAS)
+        self.aceptados = self.limitados = self.rechazados = self.perdidas = 0
+        self._esperando = {}  # tipo -> comando remoto aún sin efecto visible
+        self._escritos = dict(lane.valores)  # último valor escrito por tipo
+        self._ultima = None  # última fila de valores vista
+        self._t_publicada = 0.0
+        self._n = 0
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        lane.oyentes.append(self._escrito)
+        threading.Thread(target=self._vigilar, daemon=True, name="remoto").start()
+
+    # --- mando ---
+    def _valido(self, token):
+        # Llamar con _lock tomado
+        m = self.mando
+        return m is not None and token and secrets.compare_digest(m.token, token)
+
+    def pedir(self, nombre):
+        with self._lock:
+            if self.mando is not None:
+                return {"error": "ocupado", "nombre": self.mando.nombre}
+            self.mando = Mando(nombre or "remoto", self.lease_s, self.tasa, self.rafaga)
+            m = self.mando
+        print(f"🎮 Mando remoto para {m.nombre}")
+        self.hub.publicar_evento("mando", {"nombre": m.nombre, "motivo": "tomado"})
+        return {"token": m.token, "nombre": m.nombre, "lease_s": self.lease_s}
+
+    def renovar(self, token):
+        with self._lock:
+            if not self._valido(token):
+                return {"error": "sin_mando"}
+            m = self.mando
+            # Con el stream caído solo vale reconectarlo: el latido no basta
+            if m.streams or not m.con_stream:
+                m.expira = time.monotonic() + self.lease_s
+            return {"expira_en": m.expira - time.monotonic()}
+
+    def soltar(self, token):
+        """Entrega voluntaria: las consignas se quedan como estén."""
+        with self._lock:
+            if not self._valido(token):
+                return {"error": "sin_mando"}
+            nombre = self.mando.nombre
+            self.mando = None
+        print(f"🎮 {nombre} suelta el mando remoto")
+        self.hub.publicar_evento("mando", {"nombre": None, "motivo": "liberado"})
+        return {}
+
+    def stream_abierto(self, token):
+        with self._lock:
+            if self._valido(token):
+                self.mando.streams += 1
+                self.mando.con_stream = True
+                self.mando.expira = time.monotonic() + self.lease_s
+
+    def stream_cerrado(self, token):
+        with self._lock:
+            if self._valido(token):
+                m = self.mando
+                m.streams -= 1
+                if not m.streams:
+                    m.expira = min(m.expira, time.monotonic() + RECONEXION_S)
+
+    def _perder(self, motivo):
+        """Mando perdido: calefactor a 0 y mando libre."""
+        with self._lock:
+            if self.mando is None:
+                return
+            nombre = self.mando.nombre
+            self.mando = None
+        # Fuera del lock: el oyente _escrito lo vuelve a tomar
+        self.lane.prioritario("HEAT", 0)
+        print(f"🟧 Mando remoto de {nombre} perdido ({motivo}): calefactor apagado")
+        self.hub.publicar_evento("mando", {"nombre": None, "motivo": motivo})
+        if self.al_perder:
+            self.al_perder(motivo)
+
+    # --- comandos ---
+    def comando(self, token, tipo, valor, cid=None):
+        tipo = str(tipo).upper()
+        try:
+            valor = int(max(0, min(255, float(valor))))
+        except (TypeError, ValueError):
+            valor = None
+        if tipo not in EFECTO or valor is None:
+            self.rechazados += 1
+            return {"error": "no_valido"}
+        with self._lock:
+            if not self._valido(token):
+                self.rechazados += 1
+                return {"error": "sin_mando"}
+            m = self.mando
+            if not m.cubo.tomar():
+                self.limitados += 1
+                return {"error": "limite", "reintentar_s": 1.0 / self.tasa}
+            if m.streams or not m.con_stream:
+                m.expira = time.monotonic() + self.lease_s
+            self._n += 1
+            cid = cid if cid is not None else self._n
+            anterior = self._esperando.get(tipo)
+            self._esperando[tipo] = {"id": cid, "tipo": tipo, "valor": valor,
+                                     "recibido": core.reloj(), "escrito": None, "base": None}
+            self.aceptados += 1
+        if anterior is not None and anterior["escrito"] is None:
+            # Sustituido antes de llegar al equipo: el CommandLane lo fusiona
+            self._terminar(anterior, motivo="fusionado")
+        self.lane.consigna(tipo, valor, ORIGEN)
+        return {"id": cid, "valor": valor}
+
+    def _escrito(self, t, tipo, valor, origen):
+        """Oyente del CommandLane (hilo del que escribe)."""
+        self.hub.publicar_evento("comando", {"t": t, "tipo": tipo, "valor": valor,
+                                             "origen": origen})
+        previo = self._escritos.get(tipo)
+        self._escritos[tipo] = valor
+        with self._lock:
+            reg = self._esperando.get(tipo)
+            if reg is None or reg["escrito"] is not None and origen == ORIGEN:
+                return
+            if origen != ORIGEN:
+                # Otro origen (mando local, PID, enclavamiento) pisa al remoto
+                del self._esperando[tipo]
+                motivo = "anulado"
+            else:
+                reg["escrito"] = t
+                if self._ultima is not None:
+                    reg["base"] = float(self._ultima[EFECTO[tipo][0]])
+                motivo = "sin_cambio" if valor == previo else None
+                if motivo:
+                    del self._esperando[tipo]
+        if motivo:
+            self._terminar(reg, motivo=motivo)
+
+    def observar(self, bloque):
+        """Consumidor "remoto" del pipeline: difunde y busca el efecto de los comandos."""
+        if not len(bloque):
+            return
+        t, valores = bloque.t, bloque.valores
+        terminados = []
+        with self._lock:
+            for tipo, reg in list(self._esperando.items()):
+                if reg["escrito"] is None:
+                    continue
+                col, umbral = EFECTO[tipo]
+                despues = t >= reg["escrito"]
+                if reg["base"] is None:
+                    # Sin muestra previa: la referencia es la primera tras escribir
+                    if not despues.any():
+                        continue
+                    reg["base"] = float(valores[np.argmax(despues), col])
+                cambio = despues & bloque.nuevos[:, col] & (
+                    np.abs(valores[:, col] - reg["base"]) >= umbral)
+                if cambio.any():
+                    terminados.append((reg, float(t[np.argmax(cambio)]), None))
+                elif t[-1] - reg["escrito"] > ESPERA_EFECTO:
+                    terminados.append((reg, None, "sin_efecto"))
+                else:
+                    continue
+                del self._esperando[tipo]
+            self._ultima = valores[-1]
+        for reg, t_efecto, motivo in terminados:
+            self._terminar(reg, t_efecto, motivo)
+        if t[-1] - self._t_publicada >= pipeline.INTERVALO_DIFUSION:
+            self._t_publicada = float(t[-1])
+            self.hub.publicar(self._t_publicada, *valores[-1].tolist())
+
+    def _terminar(self, reg, t_efecto=None, motivo=None):
+        lat = {"id": reg["id"], "tipo": reg["tipo"], "valor": reg["valor"], "motivo": motivo}
+        if reg["escrito"] is not None:
+            lat["cola_ms"] = (reg["escrito"] - reg["recibido"]) * 1e3
+        if t_efecto is not None:
+            lat["equipo_ms"] = (t_efecto - reg["escrito"]) * 1e3
+            lat["total_ms"] = (t_efecto - reg["recibido"]) * 1e3
+            self.latencias.append(lat["total_ms"])
+        elif motivo in ("sin_efecto", "perdido"):
+            self.perdidas += 1
+        self.hub.publicar_evento("latencia", lat)
+
+    def _vigilar(self):
+        while not self._parar.wait(0.5):
+            with self._lock:
+                caducado = self.mando is not None and time.monotonic() > self.mando.expira
+                sin_escribir = [
+                    r for r in self._esperando.values()
+                    if r["escrito"] is None and core.reloj() - r["recibido"] > ESPERA_EFECTO
+                ]
+                for r in sin_escribir:
+                    del self._esperando[r["tipo"]]
+            for r in sin_escribir:
+                self._terminar(r, motivo="perdido")
+            if caducado:
+                m = self.mando
+                motivo = "conexión perdida" if m and m.con_stream and not m.streams else "sin latidos"
+                self._perder(motivo)
+
+    def estado(self):
+        with self._lock:
+            m = self.mando
+            mando = None if m is None else {
+                "nombre": m.nombre, "desde": m.desde,
+                "expira_en": round(m.expira - time.monotonic(), 1),
+            }
+        lat = np.array(self.latencias) if self.latencias else None
+        return {
+            "mando": mando,
+            "visores": self.hub.estadisticas()["clientes"],
+            "valores": dict(self.lane.valores),
+            "aceptados": self.aceptados,
+            "limitados": self.limitados,
+            "rechazados": self.rechazados,
+            "sin_efecto": self.perdidas,
+            "latencia_p50_ms": None if lat is None else float(np.percentile(lat, 50)),
+            "latencia_p95_ms": None if lat is None else float(np.percentile(lat, 95)),
+        }
+
+    def cerrar(self):
+        """Al cerrar el programa: si había mando remoto, se aplica el estado seguro."""
+        self._parar.set()
+        self._perder("servidor detenido")
+        self.lane.oyentes.remove(self._escrito)
+
+
+# ---------------------------------------------------------
+# SERVIDOR HTTP
+# ---------------------------------------------------------
+PANEL_HTML = """<!DOCTYPE html>
+<html lang="es"><head><meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>IT 03.2 - Práctica remota</title>
+<style>
+body{font-family:"Segoe UI",sans-serif;background:#ecf1fd;margin:0;padding:16px}
+.card{background:#fff;border-radius:16px;padding:16px;margin-bottom:12px}
+.vals{display:grid;grid-template-columns:repeat(auto-fit,minmax(140px,1fr));gap:8px}
+.v{font-size:1.6em;font-weight:600}.n{color:#666;font-size:.9em}
+input[type=range]{width:100%}button{padding:6px 16px;border-radius:8px}
+#log{font-family:monospace;font-size:.85em;max-height:160px;overflow:auto}
+</style></head><body>
+<div class="card"><h2>IT 03.2 &mdash; Pr&aacute;ctica remota</h2>
+<div class="vals" id="vals"></div><div class="n" id="conexion">Conectando...</div></div>
+<div class="card">
+<div><input id="nombre" placeholder="Tu nombre"> <button id="tomar">Tomar el mando</button>
+<button id="soltar" disabled>Soltar</button> <span class="n" id="mando">-</span></div>
+<p>Ventilador <b id="p_FAN">0</b>%<input type="range" id="FAN" min="0" max="100" value="0" disabled></p>
+<p>Calefactor <b id="p_HEAT">0</b>%<input type="range" id="HEAT" min="0" max="100" value="0" disabled></p>
+<div class="n">&Uacute;ltimo comando: <b id="lat">-</b></div></div>
+<div class="card"><div id="log"></div></div>
+<script>
+const canales=[["te","TE (°C)"],["ts","TS (°C)"],["tc","TC (°C)"],["vel","Vel (m/s)"],["pot","Pot (W)"]];
+const $=id=>document.getElementById(id);
+for(const [k,nom] of canales)$("vals").insertAdjacentHTML("beforeend",
+  `<div><div class="n">${nom}</div><div class="v" id="v_${k}">-</div></div>`);
+let token=null,latido=null,es=null,n=0;const enviados={},ultimo={},espera={};
+function log(m){$("log").insertAdjacentHTML("afterbegin",`<div>${new Date().toLocaleTimeString()} ${m}</div>`);}
+async function post(ruta,cuerpo){const r=await fetch(ruta,{method:"POST",
+  headers:{"Content-Type":"application/json"},body:JSON.stringify(cuerpo)});
+  return [r.status,await r.json().catch(()=>({}))];}
+function mandos(activo){for(const k of ["FAN","HEAT"])$(k).disabled=!activo;
+  $("soltar").disabled=!activo;$("tomar").disabled=activo;}
+function abrir(){
+  if(es)es.close();
+  es=new EventSource("stream"+(token?"?token="+encodeURIComponent(token):""));
+  es.onopen=()=>$("conexion").textContent=token?"En directo (con el mando)":"En directo (solo visor)";
+  es.onerror=()=>$("conexion").textContent="Reconectando...";
+  es.onmessage=e=>{const m=JSON.parse(e.data);
+    for(const [k] of canales)$("v_"+k).textContent=m[k].toFixed(2);};
+  es.addEventListener("mando",e=>{const m=JSON.parse(e.data);
+    $("mando").textContent=m.nombre?"Mando: "+m.nombre:"Mando libre";
+    if(token&&!m.nombre&&m.motivo!="liberado")perdido("Mando perdido ("+m.motivo+")");});
+  es.addEventListener("comando",e=>{const m=JSON.parse(e.data);
+    if(document.activeElement!==$(m.tipo)){$(m.tipo).value=Math.round(m.valor/2.55);
+      $("p_"+m.tipo).textContent=$(m.tipo).value;}
+    if(m.origen!="remoto")log(`${m.tipo} ${Math.round(m.valor/2.55)}% (${m.origen})`);});
+  es.addEventListener("latencia",e=>{const m=JSON.parse(e.data);const t0=enviados[m.id];
+    if(t0===undefined)return;delete enviados[m.id];
+    if(m.motivo){if(m.motivo!="fusionado")$("lat").textContent=`${m.tipo} ${m.motivo}`;return;}
+    const nav=performance.now()-t0;
+    $("lat").textContent=`${m.tipo}: efecto a los ${nav.toFixed(0)} ms (servidor ${m.cola_ms.toFixed(0)} ms `+
+      `+ equipo ${m.equipo_ms.toFixed(0)} ms)`;});
+}
+function perdido(m){token=null;clearInterval(latido);mandos(false);log(m);abrir();}
+$("tomar").onclick=async()=>{const [s,d]=await post("lease",{nombre:$("nombre").value});
+  if(s!=200){log("Mando ocupado por "+d.nombre);return;}
+  token=d.token;mandos(true);abrir();log("Mando tomado");
+  latido=setInterval(async()=>{const [s]=await post("lease/renew",{token});
+    if(s!=200&&token)perdido("Mando caducado");},d.lease_s*300);};
+$("soltar").onclick=async()=>{await post("lease/release",{token});perdido("Mando liberado");};
+async function mandar(tipo){
+  const id=++n;ultimo[tipo]=performance.now();enviados[id]=ultimo[tipo];
+  const [s,d]=await post("command",{token,tipo,valor:Math.round($(tipo).value*2.55),id});
+  if(s==429){delete enviados[id];setTimeout(()=>mandar(tipo),d.reintentar_s*1000);}
+  else if(s==403)perdido("Sin mando");}
+for(const k of ["FAN","HEAT"])$(k).oninput=()=>{$("p_"+k).textContent=$(k).value;
+  // Como mucho un comando cada 250 ms por mando; el último siempre sale
+  clearTimeout(espera[k]);const falta=250-(performance.now()-(ultimo[k]||0));
+  espera[k]=setTimeout(()=>mandar(k),Math.max(0,falta));};
+abrir();
+</script></body></html>
+"""
+
+
+def crear_servidor(sesion, port=REMOTE_PORT, host="0.0.0.0"):
+    """Servidor HTTP de la práctica remota (un hilo por cliente conectado)."""
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path == "/stream":
+                self._stream(parse_qs(url.query).get("token", [None])[0])
+            elif url.path == "/status":
+                self._json(200, sesion.estado())
+            elif url.path in ("/", "/index.html"):
+                self._enviar(200, "text/html; charset=utf-8", PANEL_HTML.encode("utf-8"))
+            else:
+                self._enviar(404, "text/plain", b"not found")
+
+        def do_POST(self):
+            try:
+                n = int(self.headers.get("Content-Length", 0))
+                cuerpo = json.loads(self.rfile.read(n) or b"{}")
+            except ValueError:
+                self._json(400, {"error": "no_valido"})
+                return
+            ruta = urlparse(self.path).path
+            token = cuerpo.get("token")
+            if ruta == "/lease":
+                r = sesion.pedir(str(cuerpo.get("nombre") or "")[:40])
+            elif ruta == "/lease/renew":
+                r = sesion.renovar(token)
+            elif ruta == "/lease/release":
+                r = sesion.soltar(token)
+            elif ruta == "/command":
+                r = sesion.comando(token, cuerpo.get("tipo"), cuerpo.get("valor"), cuerpo.get("id"))
+            else:
+                self._enviar(404, "text/plain", b"not found")
+                return
+            self._json(ERRORES_HTTP.get(r.get("error"), 200), r)
+
+        def _json(self, status, datos):
+            self._enviar(status, "application/json", json.dumps(datos).encode("utf-8"))
+
+        def _enviar(self, status, tipo, data):
+            self.send_response(status)
+            self.send_header("Content-Type", tipo)
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _stream(self, token):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            self.close_connection = True
+            sub = sesion.hub.suscribir()
+            sesion.stream_abierto(token)
+            try:
+                m = sesion.estado()["mando"]
+                inicial = json.dumps({"nombre": m and m["nombre"], "motivo": "estado"})
+                self.wfile.write(f"retry: 1000\n\nevent: mando\ndata: {inicial}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                while not self.server.parando:
+                    tramas = sub.sacar_todo(broadcast.KEEPALIVE)
+                    self.wfile.write(b"".join(tramas) if tramas else b": ping\n\n")
+                    self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError, OSError):
+                pass
+            finally:
+                sesion.hub.desuscribir(sub)
+                sesion.stream_cerrado(token)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+
+    server = Server((host, port), Handler)
+    server.parando = False
+    return server
+
+
+def iniciar_servidor(sesion, port=REMOTE_PORT, host="0.0.0.0"):
+    server = crear_servidor(sesion, port, host)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"🎮 Práctica remota en http://{host}:{server.server_address[1]}/")
+    return server
+
+
+def detener_servidor(server, sesion):
+    sesion.cerrar()
+    broadcast.detener_servidor(server)
+
+
+# ---------------------------------------------------------
+# PRUEBA LOCAL (equipo simulado)
+# ---------------------------------------------------------
+def _equipo_simulado(sesion, device, parar, periodo):
+    """Hace de lector + pipeline: una muestra del equipo simulado cada `periodo`."""
+    while not parar.is_set():
+        valores = core.parsear_linea(device.readline())
+        if valores:
+            sesion.observar(pipeline.Bloque([core.reloj()], [valores]))
+        time.sleep(periodo)
+
+
+def _post(port, ruta, cuerpo):
+    with socket.create_connection(("127.0.0.1", port)) as s:
+        data = json.dumps(cuerpo).encode("utf-8")
+        s.sendall(f"POST {ruta} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+                  f"Content-Length: {len(data)}\r\nConnection: close\r\n\r\n".encode() + data)
+        resp = b""
+        while chunk := s.recv(65536):
+            resp += chunk
+    cabecera, _, cuerpo = resp.partition(b"\r\n\r\n")
+    return int(cabecera.split()[1]), json.loads(cuerpo or b"{}")
+
+
+def _stream(port, token, eventos, parar):
+    """Cliente SSE mínimo: guarda los eventos con nombre; se corta al activar `parar`."""
+    with socket.create_connection(("127.0.0.1", port)) as s:
+        s.sendall(f"GET /stream?token={token} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+        s.settimeout(0.2)
+        resto = b""
+        while not parar.is_set():
+            try:
+                data = s.recv(65536)
+            except socket.timeout:
+                continue
+            if not data:
+                return
+            resto += data
+            *tramas, resto = resto.split(b"\n\n")
+            for trama in tramas:
+                lineas = dict(l.split(": ", 1) for l in trama.decode().split("\n") if ": " in l)
+                if "event" in lineas:
+                    eventos.append((lineas["event"], json.loads(lineas["data"])))
+
+
+def prueba(periodo=0.1):
+    """Mando, visor, limitación, latencia y caída del mando contra un equipo simulado."""
+    from it032_soak import SimulatedDevice
+
+    device = SimulatedDevice(periodo)
+    lane = core.CommandLane(device)
+    sesion = RemoteSession(lane)
+    server = iniciar_servidor(sesion, 0, "127.0.0.1")
+    port = server.server_address[1]
+    parar_equipo = threading.Event()
+    threading.Thread(target=_equipo_simulado, args=(sesion, device, parar_equipo, periodo),
+                     daemon=True).start()
+    fallos = []
+
+    def comprobar(cond, texto):
+        print(("  ✅ " if cond else "  ❌ ") + texto)
+        if not cond:
+            fallos.append(texto)
+
+    try:
+        s, d = _post(port, "/lease", {"nombre": "alumno1"})
+        comprobar(s == 200, "alumno1 toma el mando")
+        token = d["token"]
+        s, d = _post(port, "/lease", {"nombre": "alumno2"})
+        comprobar(s == 409 and d["nombre"] == "alumno1", "alumno2 solo puede mirar (409)")
+        s, _ = _post(port, "/command", {"token": "x", "tipo": "HEAT", "valor": 200})
+        comprobar(s == 403, "comando sin mando rechazado (403)")
+
+        eventos, parar_stream = [], threading.Event()
+        threading.Thread(target=_stream, args=(port, token, eventos, parar_stream),
+                         daemon=True).start()
+        time.sleep(0.3)
+        for i, (tipo, valor) in enumerate([("HEAT", 150), ("FAN", 200), ("HEAT", 60)]):
+            _post(port, "/command", {"token": token, "tipo": tipo, "valor": valor, "id": i})
+            time.sleep(0.6 if tipo == "HEAT" else 4.0)
+        lat = [d for e, d in eventos if e == "latencia"]
+        for d in lat:
+            if "total_ms" in d:
+                print(f"     {d['tipo']} {d['valor']}: cola {d['cola_ms']:.1f} ms + "
+                      f"equipo {d['equipo_ms']:.0f} ms = {d['total_ms']:.0f} ms")
+        comprobar(sum("total_ms" in d for d in lat) == 3, "latencia medida en los 3 comandos")
+
+        codigos = [_post(port, "/command", {"token": token, "tipo": "FAN", "valor": 100 + i})[0]
+                   for i in range(12)]
+        comprobar(codigos.count(429) >= 6, f"ráfaga limitada ({codigos.count(429)}/12 con 429)")
+        time.sleep(0.5)
+        ultima = 100 + max(i for i, c in enumerate(codigos) if c == 200)
+        comprobar(device.fan == ultima, f"la última consigna aceptada llega al equipo (FAN={ultima})")
+
+        heat = device.heat
+        parar_stream.set()
+        t0 = time.monotonic()
+        while sesion.mando is not None and time.monotonic() - t0 < LEASE_S + 2:
+            time.sleep(0.1)
+        dt = time.monotonic() - t0
+        comprobar(sesion.mando is None and device.heat == 0,
+                  f"stream cortado: calefactor {heat} → {device.heat} en {dt:.1f} s, mando libre")
+        s, _ = _post(port, "/lease", {"nombre": "alumno2"})
+        comprobar(s == 200, "alumno2 puede tomar el mando")
+        print("  ", json.dumps(sesion.estado(), ensure_ascii=False))
+    finally:
+        parar_equipo.set()
+        detener_servidor(server, sesion)
+        lane.stop()
+    return not fallos
+
+
+def demo(port, periodo=0.5):
+    from it032_soak import SimulatedDevice
+
+    device = SimulatedDevice(periodo)
+    lane = core.CommandLane(device)
+    sesion = RemoteSession(lane)
+    server = iniciar_servidor(sesion, port)
+    parar = threading.Event()
+    try:
+        _equipo_simulado(sesion, device, parar, periodo)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        detener_servidor(server, sesion)
+        lane.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Práctica remota IT 03.2")
+    parser.add_argument("--demo", action="store_true", help="servidor con un equipo simulado")
+    parser.add_argument("--prueba", action="store_true", help="comprobación automática local")
+    parser.add_argument("--port", type=int, default=REMOTE_PORT or 8081)
+    args = parser.parse_args()
+    if args.prueba:
+        raise SystemExit(0 if prueba() else 1)
+    demo(args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+# it032_report.py - informe de la práctica (HTML/PDF) con gráficas y resultados
+# -------------------------------------------------------
+# - Parte de una sesión archivada (.it32s): registro continuo, puntos
+#   guardados, eventos y calibración (offsets) guardados en el pie
+# - Medias de régimen por escalón y resultados de convección (it032_analysis)
+# - Las gráficas se dibujan fuera de pantalla en procesos aparte: la GUI no
+#   se congela y los informes de toda una clase se reparten entre los núcleos
+# - HTML autocontenido (imágenes en base64) y PDF con QTextDocument
+# - Uso: python it032_report.py sesiones/*.it32s [--out informes] [--lang es]
+
+import base64
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+
+import it032_analysis as analysis
+
+REPORTS_DIR = os.environ.get("IT032_REPORTS", "informes")
+FORMATOS = ("html", "pdf")
+ANCHO_GRAFICA, ALTO_GRAFICA = 1000, 360
+PUNTOS_GRAFICA = 1500  # columnas de la envolvente mín/máx de cada curva
+COLORES = {
+    "te": "#E74C3C",
+    "ts": "#3498DB",
+    "tc": "#27AE60",
+    "vel": "#F39C12",
+    "pot": "#8E44AD",
+}
+
+
+def cargar_textos(lang="es", path="translations.json"):
+    with open(path, "r", encoding="utf-8") as f:
+        t = json.load(f)[lang]
+    return {**t["report"], "legend_labels": t["legend_labels"]}
+
+
+# ---------------------------------------------------------
+# GRÁFICAS (en el proceso de trabajo)
+# ---------------------------------------------------------
+_app = None
+
+
+def _iniciar_proceso():
+    """Inicializador de cada proceso: Qt sin pantalla."""
+    global _app
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt6.QtWidgets import QApplication
+
+    _app = QApplication.instance() or QApplication([])
+
+
+def _envolvente(x, y, n=PUNTOS_GRAFICA):
+    """Reduce una curva a n columnas (mín y máx de cada una) sin perder picos."""
+    if len(x) <= 2 * n:
+        return x, y
+    k = len(x) // n
+    xs = x[: n * k].reshape(n, k)[:, 0]
+    ys = y[: n * k].reshape(n, k)
+    return np.repeat(xs, 2), np.column_stack((ys.min(axis=1), ys.max(axis=1))).ravel()
+
+
+def _grafica(series, titulo, eje_x, eje_y, marcas=(), puntos=False):
+    """Dibuja las series [(x, y, color, nombre)] y devuelve un QImage."""
+    import pyqtgraph as pg
+    from pyqtgraph.exporters import ImageExporter
+
+    w = pg.PlotWidget()
+    w.resize(ANCHO_GRAFICA, ALTO_GRAFICA)
+    w.setBackground("#FFFFFF")
+    w.showGrid(x=True, y=True, alpha=0.3)
+    w.setTitle(titulo, color="#000000")
+    w.setLabel("bottom", eje_x, color="#000000")
+    w.setLabel("left", eje_y, color="#000000")
+    w.addLegend(offset=(10, 10))
+    for x, y, color, nombre in series:
+        if puntos:
+            w.plot(x, y, pen=None, symbol="o", symbolBrush=color, symbolSize=8, name=nombre)
+        else:
+            w.plot(*_envolvente(x, y), pen=pg.mkPen(color, width=1.5), name=nombre)
+    for m in marcas:
+        w.addItem(pg.InfiniteLine(m, angle=90, pen=pg.mkPen("#999999", width=1)))
+    # Sin mostrar el widget (en pantalla virtual) la escena no toma el tamaño pedido
+    w.show()
+    _app.processEvents()
+    exp = ImageExporter(w.plotItem)
+    exp.parameters()["width"] = ANCHO_GRAFICA
+    imagen = exp.export(toBytes=True)
+    w.close()
+    w.deleteLater()
+    return imagen
+
+
+def _png(imagen):
+    from PyQt6.QtCore import QBuffer, QByteArray, QIODevice
+
+    datos = QByteArray()
+    buf = QBuffer(datos)
+    buf.open(QIODevice.OpenModeFlag.WriteOnly)
+    imagen.save(buf, "PNG")
+    return bytes(datos)
+
+
+# ---------------------------------------------------------
+# CONTENIDO
+# ---------------------------------------------------------
+def _f(v, fmt="{:.2f}"):
+    return "—" if v is None or v != v else fmt.format(v)
+
+
+def _tabla(cabeceras, filas):
+    html = ['<table border="1" cellspacing="0" cellpadding="3"><tr>']
+    html += [f"<th>{c}</th>" for c in cabeceras]
+    html.append("</tr>")
+    for fila in filas:
+        html.append("<tr>" + "".join(f"<td>{c}</td>" for c in fila) + "</tr>")
+    html.append("</table>")
+    return "".join(html)
+
+
+def _html(tx, meta, t, escalones, equipo, imagenes):
+    """Cuerpo del informe; `imagenes` da el src de cada gráfica."""
+    dispositivo = meta.get("device", {})
+    inicio = datetime.fromtimestamp(t[0]).strftime("%d/%m/%Y %H:%M:%S") if len(t) else "—"
+    partes = [
+        "<html><head><meta charset='utf-8'>",
+        f"<title>{tx['title']}</title>",
+        "<style>body{font-family:Segoe UI,Arial,sans-serif;font-size:10pt}"
+        "table{border-collapse:collapse}th{background:#EEEEEE}</style></head><body>",
+        f"<h1>{tx['title']}</h1>",
+        _tabla(
+            [tx["device"], tx["session"], tx["start"], tx["duration"], tx["samples"]],
+            [[
+                f"{dispositivo.get('model', '')} {dispositivo.get('serial_number', '')}",
+                meta.get("session_id", "—"),
+                inicio,
+                _f((t[-1] - t[0]) / 60 if len(t) else None, "{:.1f} min"),
+                len(t),
+            ]],
+        ),
+        f"<h2>{tx['calibration']}</h2>",
+        _tabla(
+            [tx["offsets"]] + tx["legend_labels"],
+            [[""] + [_f(o, "{:.3f}") for o in meta.get("offsets", [0] * 5)]],
+        ),
+        "<p>" + tx["geometry"].format(**equipo) + "</p>",
+    ]
+    if meta.get("filters"):
+        partes.append(f"<p>{tx['filters']}: {json.dumps(meta['filters'])}</p>")
+    partes.append(f"<h2>{tx['plots']}</h2>")
+    for nombre in imagenes:
+        partes.append(f'<p><img src="{imagenes[nombre]}" width="640"></p>')
+
+    partes.append(f"<h2>{tx['steps_title']}</h2><p>{tx['steps_note']}</p>")
+    partes.append(_tabla(tx["steps_headers"], [
+        [
+            e["escalon"], _f(e["t0"] - t[0], "{:.0f}"), _f(e["duracion_s"], "{:.0f}"),
+            e["HEAT"], e["FAN"], _f(e["te"]), _f(e["ts"]), _f(e["tc"]), _f(e["vel"]),
+            _f(e["pot"], "{:.1f}"), _f(e["dt_superficie"], "{:.1f}"), _f(e["h"], "{:.1f}"),
+            _f(e["re"], "{:.0f}"), _f(e["nu"], "{:.1f}"), _f(e["balance"], "{:.2f}"),
+            ", ".join(tx["flags"].get(a, a) for a in e["avisos"]),
+        ]
+        for e in escalones
+    ]))
+
+    guardados = meta.get("saved")
+    if guardados:
+        partes.append(f"<h2>{tx['saved_title']}</h2>")
+        partes.append(_tabla(
+            ["#", tx["time"]] + tx["legend_labels"],
+            [
+                [i + 1, datetime.fromtimestamp(g[0]).strftime("%H:%M:%S")]
+                + [_f(v) for v in g[1:]]
+                for i, g in enumerate(guardados)
+            ],
+        ))
+    partes.append(f"<p><small>{tx['generated']} {datetime.now():%d/%m/%Y %H:%M}</small></p>")
+    partes.append("</body></html>")
+    return "\n".join(partes)
+
+
+def _graficas(tx, t, columnas, escalones):
+    minutos = (t - t[0]) / 60.0
+    marcas = [(e["t0"] - t[0]) / 60.0 for e in escalones[1:]]
+    etiquetas = dict(zip(analysis.CANALES, tx["legend_labels"]))
+    ejes = tx["axes"]
+    graficas = {
+        "temperaturas": _grafica(
+            [(minutos, columnas[c], COLORES[c], etiquetas[c]) for c in ("te", "ts", "tc")],
+            tx["plot_temperatures"], ejes["time"], ejes["temperature"], marcas,
+        ),
+        "velocidad": _grafica(
+            [(minutos, columnas["vel"], COLORES["vel"], etiquetas["vel"])],
+            tx["plot_velocity"], ejes["time"], ejes["velocity"], marcas,
+        ),
+        "potencia": _grafica(
+            [(minutos, columnas["pot"], COLORES["pot"], etiquetas["pot"])],
+            tx["plot_power"], ejes["time"], ejes["power"], marcas,
+        ),
+    }
+    validos = [e for e in escalones if e["h"] == e["h"]]
+    if validos:
+        graficas["conveccion"] = _grafica(
+            [(np.array([e["vel"] for e in validos]), np.array([e["h"] for e in validos]),
+              COLORES["tc"], "h")],
+            tx["plot_h"], ejes["velocity"], ejes["h"], puntos=True,
+        )
+    return graficas
+
+
+def generar_informe(path, destino=REPORTS_DIR, formatos=FORMATOS, textos=None, equipo=None):
+    """Genera el informe de una sesión. Pensada para ejecutarse en un proceso aparte.
+
+    Devuelve un dict con las rutas creadas, o con "error" si la sesión falla
+    (en un lote de clase, un fichero roto no detiene a los demás).
+    """
+    t_inicio = time.perf_counter()
+    try:
+        if _app is None:
+            _iniciar_proceso()
+        tx = textos or cargar_textos()
+        equipo = equipo or analysis.cargar_equipo()
+        t, columnas, meta = analysis.cargar_sesion(path)
+        if not len(t):
+            raise ValueError("sesión vacía")
+        escalones = analysis.resumen(t, columnas, meta.get("events", []), equipo)
+        imagenes = _graficas(tx, t, columnas, escalones)
+
+        os.makedirs(destino, exist_ok=True)
+        base = os.path.join(destino, os.path.splitext(os.path.basename(path))[0])
+        res = {"sesion": path, "escalones": len(escalones)}
+        if "html" in formatos:
+            src = {
+                n: "data:image/png;base64," + base64.b64encode(_png(img)).decode()
+                for n, img in imagenes.items()
+            }
+            with open(base + ".html", "w", encoding="utf-8") as f:
+                f.write(_html(tx, meta, t, escalones, equipo, src))
+            res["html"] = base + ".html"
+        if "pdf" in formatos:
+            res["pdf"] = _pdf(base + ".pdf", _html(
+                tx, meta, t, escalones, equipo, {n: f"{n}.png" for n in imagenes}
+            ), imagenes)
+        res["segundos"] = time.perf_counter() - t_inicio
+        return res
+    except Exception as e:
+        return {"sesion": path, "error": str(e), "segundos": time.perf_counter() - t_inicio}
+
+
+def _pdf(path, html, imagenes):
+    from PyQt6.QtCore import QSizeF, QUrl
+    from PyQt6.QtGui import QPageSize, QPdfWriter, QTextDocument
+
+    writer = QPdfWriter(path)
+    writer.setPageSize(QPageSize(QPageSize.PageSizeId.A4))
+    writer.setResolution(110)
+    doc = QTextDocument()
+    for nombre, imagen in imagenes.items():
+        doc.addResource(QTextDocument.ResourceType.ImageResource.value, QUrl(f"{nombre}.png"), imagen)
+    doc.setHtml(html)
+    doc.setPageSize(QSizeF(writer.width(), writer.height()))
+    doc.print(writer)
+    return path
+
+
+# ---------------------------------------------------------
+# GENERACIÓN EN PARALELO
+# ---------------------------------------------------------
+class GeneradorInformes:
+    """Pool de procesos para informes; se crea al primer uso y se reutiliza."""
+
+    def __init__(self, procesos=None):
+        self.procesos = procesos or os.cpu_count() or 1
+        self._pool = None
+
+    def _ejecutor(self):
+        if self._pool is None:
+            # spawn: el proceso hijo no hereda el estado de Qt de la GUI
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.procesos,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_iniciar_proceso,
+            )
+        return self._pool
+
+    def generar(self, paths, destino=REPORTS_DIR, formatos=FORMATOS, lang="es",
+                al_terminar=None):
+        """Lanza un informe por sesión. Sin `al_terminar`, espera y devuelve la lista;
+        con él, vuelve enseguida y llama al_terminar(resultados) desde otro hilo."""
+        textos = cargar_textos(lang)
+        equipo = analysis.cargar_equipo()
+        futuros = {
+            self._ejecutor().submit(generar_informe, p, destino, formatos, textos, equipo): p
+            for p in paths
+        }
+
+        def recoger():
+            resultados = []
+            for f in as_completed(futuros):
+                try:
+                    resultados.append(f.result())
+                except Exception as e:  # proceso caído o pool cerrado
+                    resultados.append({"sesion": futuros[f], "error": str(e) or type(e).__name__})
+            return resultados
+
+        if al_terminar is None:
+            return recoger()
+        threading.Thread(target=lambda: al_terminar(recoger()), daemon=True).start()
+        return None
+
+    def cerrar(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+def mensaje(resultados, tx, destino=REPORTS_DIR):
+    """Texto para el aviso de la GUI: ficheros creados o el primer error."""
+    errores = [r for r in resultados if "error" in r]
+    if errores and len(errores) == len(resultados):
+        return False, tx["failed"].format(error=errores[0]["error"])
+    ficheros = [
+        os.path.basename(r[fmt]) for r in resultados if "error" not in r
+        for fmt in FORMATOS if fmt in r
+    ]
+    texto = tx["done"].format(carpeta=os.path.abspath(destino), ficheros="\n".join(ficheros))
+    for r in errores:
+        texto += "\n❌ " + tx["failed"].format(error=f"{os.path.basename(r['sesion'])}: {r['error']}")
+    return True, texto
+
+
+def main():
+    import argparse
+    import glob
+
+    p = argparse.ArgumentParser(description="Informes de prácticas IT 03.2 en paralelo")
+    p.add_argument("sesiones", nargs="+", help="ficheros .it32s (admite comodines)")
+    p.add_argument("--out", default=REPORTS_DIR)
+    p.add_argument("--lang", default="es", choices=("es", "en"))
+    p.add_argument("--formats", default=",".join(FORMATOS))
+    p.add_argument("--jobs", type=int, default=None, help="procesos (por defecto, núcleos)")
+    args = p.parse_args()
+
+    paths = sorted({f for patron in args.sesiones for f in glob.glob(patron)})
+    gen = GeneradorInformes(args.jobs)
+    t = time.perf_counter()
+    resultados = gen.generar(paths, args.out, tuple(args.formats.split(",")), args.lang)
+    gen.cerrar()
+    dt = time.perf_counter() - t
+    errores = [r for r in resultados if "error" in r]
+    for r in errores:
+        print(f"❌ {r['sesion']}: {r['error']}")
+    print(f"✅ {len(resultados) - len(errores)}/{len(paths)} informes en {dt:.1f} s "
+          f"({gen.procesos} procesos) → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+# it032_reprocess.py - reprocesado en lote de sesiones archivadas (.it32s)
+# -------------------------------------------------------
+# - Vuelve a aplicar la calibración (calibration.json) a sesiones ya grabadas:
+#   deshace las constantes del firmware (p. ej. vel = ADC · 0.00489,
+#   TC = termopar - 1.3) y aplica las nuevas, canal a canal y vectorizado
+# - Si el equipo de la sesión tiene curvas en calibration.json ("devices"),
+#   esos canales pasan por su LUT (it032_calibration); las curvas con que se
+#   grabó la sesión, si las hubo, se deshacen antes con su inversa
+# - Opcionalmente añade columnas derivadas muestra a muestra (h, Re) con la
+#   geometría de equipo.json
+# - Un proceso por núcleo; cada fichero se lee y escribe bloque a bloque, así
+#   que la memoria no depende de la duración de la sesión
+# - Caché por contenido (.reprocess_cache.json en la carpeta de salida):
+#   SHA-256 del original + huella de la receta; los ficheros al día se saltan
+#   sin releerlos si no han cambiado tamaño ni fecha
+# - Informe de rendimiento en muestras/s
+#
+# Uso:  python it032_reprocess.py sesiones/ --out sesiones_v2 --vel-scale 0.00495
+#       python it032_reprocess.py "sesiones/*.it32s" --derive --jobs 4
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import it032_analysis as analysis
+import it032_calibration as calibration
+from it032_calibration import CALIBRATION_PATH, cargar_calibracion
+from it032_session_file import EXTENSION, SessionFile, SessionWriter
+
+OUT_DIR = "sesiones_reprocesadas"
+CACHE_FILE = ".reprocess_cache.json"
+RECETA_VERSION = 2  # subir si cambia el cálculo: invalida toda la caché
+HASH_BLOQUE = 1 << 20
+CANALES = analysis.CANALES
+
+def crear_receta(calibracion, derivar=False, equipo=None):
+    """Todo lo que determina el resultado; su huella decide si hay que rehacer un fichero."""
+    receta = {"version": RECETA_VERSION, "calibration": calibracion, "derive": bool(derivar)}
+    if derivar:
+        receta["equipo"] = equipo or analysis.cargar_equipo()
+    return receta
+
+
+def huella_receta(receta):
+    return hashlib.sha256(json.dumps(receta, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+
+def sha256_fichero(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            trozo = f.read(HASH_BLOQUE)
+            if not trozo:
+                return h.hexdigest()
+            h.update(trozo)
+
+
+# ---------------------------------------------------------
+# CÁLCULO POR BLOQUE
+# ---------------------------------------------------------
+def _lineal(cfg, canal):
+    c = cfg.get(canal, {})
+    return float(c.get("scale", 1.0)), float(c.get("offset", 0.0))
+
+
+def coeficientes(calibracion, offsets):
+    """Por canal, (a, b) tales que valor_nuevo = a · valor_grabado + b.
+
+    Lo grabado es F(raw) - o (F = constantes del firmware, o = offset de la
+    calibración en la GUI, en unidades de F). Lo nuevo es G(raw) - o', con o'
+    el mismo punto de reposo pasado por G; si no se calibró, o = o' = 0.
+    """
+    coef = {}
+    for i, canal in enumerate(CANALES):
+        fa, fb = _lineal(calibracion["firmware"], canal)
+        ga, gb = _lineal(calibracion["channels"], canal)
+        o = float(offsets[i]) if offsets else 0.0
+        a = ga / fa
+        # G(F⁻¹(x)) = a·x + (gb - a·fb)
+        b = gb - a * fb
+        o_nuevo = a * o + b if o else 0.0
+        coef[canal] = (a, a * o + b - o_nuevo)
+    return coef
+
+
+def procesar_bloque(bloque, coef, equipo=None, curvas=(None, None), offsets=None):
+    """Aplica la calibración (y los derivados) a un bloque de columnas.
+
+    `curvas` = (con las que se grabó, nuevas). Un canal con curva parte de la
+    lectura del firmware: la inversa de la curva antigua o, si no la hubo, lo
+    grabado más su offset. Con curva nueva pasa por su LUT; sin ella recibe
+    los coeficientes lineales (los canales con curva se grabaron sin offset).
+    """
+    previas, nuevas = curvas
+    out = dict(bloque)
+    for i, canal in enumerate(CANALES):
+        x = bloque[canal]
+        a, b = coef[canal]
+        if previas and canal in previas:
+            lectura = previas.invertir(canal, x)
+        elif nuevas and canal in nuevas:
+            lectura = x.astype(np.float64) + (float(offsets[i]) if offsets else 0.0)
+        elif a != 1.0 or b != 0.0:
+            out[canal] = (x.astype(np.float64) * a + b).astype(x.dtype)
+            continue
+        else:
+            continue
+        nuevo = nuevas.canal(canal, lectura) if nuevas and canal in nuevas else lectura * a + b
+        out[canal] = nuevo.astype(x.dtype)
+    if equipo is not None:
+        d = analysis.derivar({c: out[c] for c in CANALES}, equipo)
+        out["h"] = d["h"].astype(np.float32)
+        out["re"] = d["re"].astype(np.float32)
+    return out
+
+
+# ---------------------------------------------------------
+# UN FICHERO (se ejecuta en el proceso de trabajo)
+# ---------------------------------------------------------
+def reprocesar_fichero(origen, destino, receta):
+    """Reescribe `origen` en `destino` bloque a bloque; devuelve un resumen."""
+    t0 = time.perf_counter()
+    equipo = receta.get("equipo") if receta.get("derive") else None
+    filas = 0
+    with SessionFile(origen) as f:
+        meta = dict(f.metadata)
+        offsets = meta.get("offsets")
+        coef = coeficientes(receta["calibration"], offsets)
+        serie = meta.get("device", {}).get("serial_number")
+        curvas = (
+            calibration.Curvas(meta.get("curves"), receta["calibration"]["firmware"]),
+            calibration.curvas_equipo(receta["calibration"], serie),
+        )
+        columnas = [(c["name"], c["dtype"], c["unit"]) for c in meta["columns"]
+                    if c["name"] not in ("h", "re")]
+        if equipo is not None:
+            columnas += [("h", "<f4", "W/m²K"), ("re", "<f4", "")]
+        meta["calibration"] = receta["calibration"]
+        meta["curves"] = curvas[1].modelos
+        if offsets and curvas[1]:
+            meta["offsets"] = [float(o) for o in curvas[1].sin_offsets(offsets)]
+        meta["reprocessed"] = {"from": os.path.basename(origen), "at": time.time(),
+                               "recipe": huella_receta(receta)}
+        os.makedirs(os.path.dirname(os.path.abspath(destino)), exist_ok=True)
+        with SessionWriter(destino, meta, columnas, f.metadata.get("chunk_rows", 4096)) as w:
+            for bloque in f.iter_bloques():
+                w.agregar_bloque(procesar_bloque(bloque, coef, equipo, curvas, offsets))
+                filas += len(bloque["t"])
+    return {"origen": origen, "destino": destino, "filas": filas,
+            "segundos": time.perf_counter() - t0}
+
+
+# ---------------------------------------------------------
+# CACHÉ
+# ---------------------------------------------------------
+def cargar_cache(out_dir):
+    try:
+        with open(os.path.join(out_dir, CACHE_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def guardar_cache(out_dir, cache):
+    path = os.path.join(out_dir, CACHE_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cache, f, indent=1)
+    os.replace(tmp, path)
+
+
+def _firma(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def al_dia(cache, origen, destino, huella):
+    """True si `destino` ya es el resultado de este `origen` con esta receta."""
+    entrada = cache.get(os.path.basename(origen))
+    if not entrada or entrada.get("recipe") != huella or not os.path.exists(destino):
+        return False
+    if entrada.get("stat") == _firma(origen):
+        return True
+    # Tocado pero quizá con el mismo contenido (copiado, restaurado...)
+    sha = sha256_fichero(origen)
+    if sha != entrada.get("sha256"):
+        return False
+    entrada["stat"] = _firma(origen)
+    return True
+
+
+# ---------------------------------------------------------
+# LOTE
+# ---------------------------------------------------------
+def buscar_sesiones(entradas):
+    paths = []
+    for e in entradas:
+        if os.path.isdir(e):
+            paths += glob.glob(os.path.join(e, f"*{EXTENSION}"))
+        else:
+            paths += glob.glob(e)
+    return sorted(set(paths))
+
+
+def reprocesar(paths, out_dir, receta, procesos=None, forzar=False, al_terminar=None):
+    """Reprocesa en paralelo lo que no esté al día. Devuelve estadísticas del lote."""
+    os.makedirs(out_dir, exist_ok=True)
+    huella = huella_receta(receta)
+    cache = {} if forzar else cargar_cache(out_dir)
+    pendientes, saltados = [], 0
+    for origen in paths:
+        destino = os.path.join(out_dir, os.path.basename(origen))
+        if not forzar and al_dia(cache, origen, destino, huella):
+            saltados += 1
+        else:
+            pendientes.append((origen, destino))
+
+    t0 = time.perf_counter()
+    filas, errores = 0, []
+    if pendientes:
+        procesos = max(1, min(procesos or os.cpu_count() or 1, len(pendientes)))
+        with ProcessPoolExecutor(procesos) as pool:
+            # El hash del original se calcula aquí mientras los procesos trabajan
+            futuros = {pool.submit(reprocesar_fichero, o, d, receta): o for o, d in pendientes}
+            hashes = {o: (sha256_fichero(o), _firma(o)) for o, _ in pendientes}
+            for fut in as_completed(futuros):
+                origen = futuros[fut]
+                try:
+                    r = fut.result()
+                except Exception as e:
+                    errores.append((origen, str(e)))
+                    print(f"❌ {os.path.basename(origen)}: {e}")
+                    continue
+                filas += r["filas"]
+                sha, firma = hashes[origen]
+                cache[os.path.basename(origen)] = {"sha256": sha, "stat": firma, "recipe": huella}
+                if al_terminar:
+                    al_terminar(r)
+        guardar_cache(out_dir, cache)
+    dt = time.perf_counter() - t0
+    return {
+        "ficheros": len(paths),
+        "procesados": len(pendientes) - len(errores),
+        "saltados": saltados,
+        "errores": errores,
+        "filas": filas,
+        "segundos": dt,
+        "muestras_s": filas / dt if dt > 0 else 0.0,
+    }
+
+
+def main():
+    p = argparse.ArgumentParser(description="Reprocesado en lote de sesiones .it32s")
+    p.add_argument("sesiones", nargs="+", help="carpetas, ficheros o patrones")
+    p.add_argument("--out", default=OUT_DIR)
+    p.add_argument("--calibration", default=CALIBRATION_PATH)
+    p.add_argument("--vel-scale", type=float, help="nueva escala de velocidad (m/s por cuenta ADC)")
+    p.add_argument("--tc-offset", type=float, help="nueva corrección del termopar (°C)")
+    p.add_argument("--derive", action="store_true", help="añadir columnas h y Re por muestra")
+    p.add_argument("--jobs", type=int, default=None)
+    p.add_argument("--force", action="store_true", help="ignorar la caché")
+    args = p.parse_args()
+
+    calibracion = cargar_calibracion(args.calibration)
+    if args.vel_scale is not None:
+        calibracion["channels"].setdefault("vel", {})["scale"] = args.vel_scale
+    if args.tc_offset is not None:
+        calibracion["channels"].setdefault("tc", {})["offset"] = args.tc_offset
+    receta = crear_receta(calibracion, args.derive)
+    paths = buscar_sesiones(args.sesiones)
+    if not paths:
+        print("No se encontraron sesiones.")
+        return
+
+    def progreso(r):
+        print(f"  ✅ {os.path.basename(r['origen'])}: {r['filas']} muestras en "
+              f"{r['segundos']:.2f} s ({r['filas'] / max(r['segundos'], 1e-9):,.0f} muestras/s)")
+
+    res = reprocesar(paths, args.out, receta, args.jobs, args.force, progreso)
+    print(f"📦 {res['procesados']} reprocesadas, {res['saltados']} al día, "
+          f"{len(res['errores'])} con error, en {res['segundos']:.2f} s")
+    if res["filas"]:
+        print(f"⚡ {res['filas']:,} muestras a {res['muestras_s']:,.0f} muestras/s")
+
+
+if __name__ == "__main__":
+    main()
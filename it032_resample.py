@@ -0,0 +1,303 @@
+# it032_resample.py - remuestreo a rejilla uniforme y alineación de sesiones
+# -------------------------------------------------------
+# - Las muestras llegan a intervalos irregulares (bucle del lector más el
+#   tiempo de conversión de los sensores) y cada práctica empieza a una hora
+#   distinta: aquí se llevan a una rejilla de tiempo uniforme común
+# - Rejilla en hora real (anclada a múltiplos del paso, así dos exportaciones
+#   casan entre sí) o relativa al inicio de sesión o a un cambio de consigna
+# - Modos: "linear" (interpolación), "hold" (último valor conocido, como el
+#   de las consignas) y "mean" (media de las muestras de cada intervalo,
+#   centrado en el instante de la rejilla)
+# - Todo con searchsorted/bincount sobre los arrays completos y todos los
+#   canales a la vez; los NaN no contaminan la media y un hueco del registro
+#   mayor que `max_hueco` no se rellena inventando datos
+# - Lo usan el visor (cursor y exportación de sesiones superpuestas) y el
+#   análisis (it032_analysis.comparar)
+#
+# Uso:  python it032_resample.py sesiones/*.it32s --step 1 --mode mean --align event --out alineadas.xlsx
+#       python it032_resample.py --bench
+
+import argparse
+import math
+import os
+import time
+
+import numpy as np
+
+MODOS = ("linear", "hold", "mean")
+REFERENCIAS = ("wall", "start", "event")
+
+
+def rejilla(t0, t1, paso, anclada=True):
+    """Instantes uniformes en [t0, t1]; anclada: múltiplos enteros del paso."""
+    if paso <= 0:
+        raise ValueError("el paso debe ser positivo")
+    if not t1 >= t0:
+        return np.empty(0)
+    if anclada:
+        return np.arange(math.ceil(t0 / paso - 1e-9), math.floor(t1 / paso + 1e-9) + 1) * paso
+    return t0 + np.arange(int((t1 - t0) / paso + 1e-9) + 1) * paso
+
+
+def origen(t_inicio, eventos, referencia="start", tipo_evento="HEAT"):
+    """Instante (epoch) que pasa a ser el cero del eje para una sesión.
+
+    "event" toma el primer encendido del actuador `tipo_evento`; si la sesión
+    no lo tiene, cae al inicio. "wall" no desplaza nada.
+    """
+    if referencia == "start":
+        return t_inicio or 0.0
+    if referencia == "event":
+        encendidos = [e["t"] for e in eventos if e["kind"] == tipo_evento and e["value"] > 0]
+        return min(encendidos) if encendidos else (t_inicio or 0.0)
+    return 0.0  # hora real
+
+
+def _interpolar(t, y, g, retener, max_hueco):
+    n = len(t)
+    out = np.full((len(g), y.shape[1]), np.nan)
+    if n == 0 or not len(g):
+        return out
+    dentro = (g >= t[0]) & (g <= t[-1])
+    # i: primera muestra posterior al instante -> el tramo es [i - 1, i]
+    i = np.searchsorted(t, g, side="right")
+    if retener or n == 1:
+        j = np.maximum(i - 1, 0)
+        out[dentro] = y[j[dentro]]
+        if max_hueco is not None:
+            siguiente = t[np.minimum(i, n - 1)]
+            out[dentro & (siguiente - t[j] > max_hueco)] = np.nan
+        return out
+    i = np.clip(i, 1, n - 1)
+    ta, tb = t[i - 1], t[i]
+    with np.errstate(all="ignore"):
+        w = np.where(tb > ta, (g - ta) / (tb - ta), 0.0)
+    ya = y[i - 1]
+    out = ya + w[:, None] * (y[i] - ya)
+    fuera = ~dentro
+    if max_hueco is not None:
+        fuera |= tb - ta > max_hueco
+    out[fuera] = np.nan
+    return out
+
+
+def _media_intervalos(t, y, g, paso):
+    m, k = len(g), y.shape[1]
+    if not m:
+        return np.empty((0, k)), np.empty((0, k), dtype=np.int64)
+    bordes = np.append(g - paso / 2, g[-1] + paso / 2)
+    idx = np.searchsorted(bordes, t, side="right") - 1
+    ok = (idx >= 0) & (idx < m)
+    idx, y = idx[ok], y[ok]
+    # Una cubeta por (instante, canal): un solo bincount para todos los canales
+    cubeta = (idx[:, None] * k + np.arange(k)).ravel()
+    valores = y.ravel()
+    finito = np.isfinite(valores)
+    suma = np.bincount(cubeta[finito], weights=valores[finito], minlength=m * k).reshape(m, k)
+    cuenta = np.bincount(cubeta[finito], minlength=m * k).reshape(m, k)
+    with np.errstate(all="ignore"):
+        return np.where(cuenta > 0, suma / cuenta, np.nan), cuenta
+
+
+def remuestrear(t, columnas, instantes, modo="linear", max_hueco=None, paso=None):
+    """Valores de cada canal en `instantes` (dict canal -> array).
+
+    `t` debe ser creciente. En modo "mean" cada instante es el centro de un
+    intervalo de anchura `paso` (por defecto, la separación de la rejilla).
+    """
+    if modo not in MODOS:
+        raise ValueError(f"modo de remuestreo desconocido: {modo}")
+    t = np.asarray(t, dtype=float)
+    g = np.asarray(instantes, dtype=float)
+    canales = list(columnas)
+    y = np.empty((len(t), len(canales)))
+    for j, c in enumerate(canales):
+        y[:, j] = columnas[c]
+    if modo == "mean":
+        if paso is None:
+            if len(g) < 2:
+                raise ValueError("el modo 'mean' necesita el paso con un solo instante")
+            paso = float(g[1] - g[0])
+        out, _ = _media_intervalos(t, y, g, paso)
+    else:
+        out = _interpolar(t, y, g, modo == "hold", max_hueco)
+    return {c: out[:, j] for j, c in enumerate(canales)}
+
+
+def alinear(sesiones, paso, modo="linear", referencia="start", tipo_evento="HEAT",
+            max_hueco=None):
+    """Lleva varias sesiones a una misma rejilla.
+
+    `sesiones` es una lista de (t, columnas, eventos). Devuelve (rejilla,
+    [dict canal -> array]) con la rejilla en segundos desde el origen de cada
+    sesión (en hora real, epoch). Fuera del tramo de cada sesión queda NaN.
+    """
+    origenes = [
+        origen(float(t[0]) if len(t) else None, eventos, referencia, tipo_evento)
+        for t, _, eventos in sesiones
+    ]
+    tramos = [(t[0] - o, t[-1] - o) for (t, _, _), o in zip(sesiones, origenes) if len(t)]
+    if not tramos:
+        return np.empty(0), [{c: np.empty(0) for c in cols} for _, cols, _ in sesiones]
+    g = rejilla(min(a for a, _ in tramos), max(b for _, b in tramos), paso)
+    series = [
+        remuestrear(t, columnas, g + o, modo, max_hueco, paso)
+        for (t, columnas, _), o in zip(sesiones, origenes)
+    ]
+    return g, series
+
+
+# ---------------------------------------------------------
+# EXPORTACIÓN
+# ---------------------------------------------------------
+SONDEO_HORARIO_S = 6 * 3600.0  # dos cambios de horario nunca están tan cerca
+
+
+def _desfase(ts):
+    from datetime import datetime, timezone
+
+    return datetime.fromtimestamp(ts, timezone.utc).astimezone().utcoffset().total_seconds()
+
+
+def cambios_horarios(t0, t1):
+    """Instantes (epoch, al segundo) en que cambia el desfase local en [t0, t1]
+    y los desfases de cada tramo: (cambios, desfases) con len(desfases) = len(cambios) + 1.
+
+    Se sondea cada SONDEO_HORARIO_S y cada cambio se acota por bisección:
+    vale para zonas con medias horas y cambios a cualquier minuto.
+    """
+    sondas = np.append(np.arange(math.floor(t0), t1, SONDEO_HORARIO_S), math.ceil(t1))
+    desfases = [_desfase(sondas[0])]
+    cambios = []
+    for a, b in zip(sondas[:-1].tolist(), sondas[1:].tolist()):
+        d_b = _desfase(b)
+        if d_b == desfases[-1]:
+            continue
+        a, b = int(a), int(b)
+        while b - a > 1:
+            m = (a + b) // 2
+            if _desfase(m) == desfases[-1]:
+                a = m
+            else:
+                b = m
+        cambios.append(b)
+        desfases.append(d_b)
+    return np.array(cambios, dtype=float), np.array(desfases)
+
+
+def hora_local(g):
+    """Epoch -> datetime64 en hora local sin zona, como datetime.fromtimestamp.
+
+    Cada instante lleva el desfase de su tramo entre cambios de horario, así
+    una exportación de verano hecha en invierno sigue cuadrando con
+    fecha_hora del almacén.
+    """
+    g = np.asarray(g, dtype=float)
+    if not len(g):
+        return np.empty(0, dtype="datetime64[us]")
+    cambios, desfases = cambios_horarios(float(g.min()), float(g.max()))
+    local = g + desfases[np.searchsorted(cambios, g, side="right")]
+    return (local * 1e6).round().astype("int64").astype("datetime64[us]")
+
+
+def exportar(path, g, series, nombres, canales=None, hora_real=False):
+    """Excel con una hoja por canal (una columna por sesión) o CSV en ancho.
+
+    Sin sesiones o sin canales queda solo el eje de tiempo.
+    """
+    import pandas as pd
+
+    canales = list(canales or (series[0] if series else ()))
+    # Hora local, como fecha_hora del almacén y el resto de exportaciones
+    eje = hora_local(g) if hora_real else g
+    nombre_eje = "hora" if hora_real else "t_s"
+    if path.lower().endswith(".csv"):
+        df = pd.DataFrame({nombre_eje: eje})
+        for nombre, s in zip(nombres, series):
+            for c in canales:
+                df[f"{nombre}:{c}"] = s[c]
+        df.to_csv(path, index=False)
+        return path
+    with pd.ExcelWriter(path) as writer:
+        if not canales:
+            pd.DataFrame({nombre_eje: eje}).to_excel(writer, sheet_name=nombre_eje, index=False)
+        for c in canales:
+            df = pd.DataFrame({nombre_eje: eje})
+            for nombre, s in zip(nombres, series):
+                df[nombre] = s[c]
+            df.to_excel(writer, sheet_name=c, index=False)
+    return path
+
+
+# ---------------------------------------------------------
+# PRUEBA DE RENDIMIENTO
+# ---------------------------------------------------------
+def bench(n=1_000_000, paso=1.0):
+    """Compara con np.interp canal a canal y con un bucle por intervalo."""
+    rng = np.random.default_rng(0)
+    # Periodo medio de 0,5 s con fluctuaciones como las del lector
+    t = 1.7e9 + np.cumsum(rng.uniform(0.3, 0.7, n))
+    columnas = {c: rng.normal(20, 1, n) for c in ("te", "ts", "tc", "vel", "pot")}
+    g = rejilla(t[0], t[-1], paso)
+    print(f"📐 {n:,} muestras irregulares × {len(columnas)} canales → {len(g):,} instantes")
+    for modo in MODOS:
+        t0 = time.perf_counter()
+        out = remuestrear(t, columnas, g, modo)
+        dt = time.perf_counter() - t0
+        print(f"   {modo:6s}: {dt * 1e3:7.1f} ms ({dt / n * 1e9:5.1f} ns/muestra)")
+    t0 = time.perf_counter()
+    ref = {c: np.interp(g, t, y) for c, y in columnas.items()}
+    print(f"   np.interp por canal: {(time.perf_counter() - t0) * 1e3:7.1f} ms")
+    lin = remuestrear(t, columnas, g, "linear")
+    assert all(np.allclose(lin[c], ref[c]) for c in columnas)
+    # Referencia ingenua de la media: un searchsorted por intervalo
+    m = min(len(g), 20_000)
+    t0 = time.perf_counter()
+    bordes = np.append(g[:m] - paso / 2, g[m - 1] + paso / 2)
+    a = np.searchsorted(t, bordes[:-1])
+    b = np.searchsorted(t, bordes[1:])
+    lenta = np.array([columnas["tc"][i:j].mean() if j > i else np.nan for i, j in zip(a, b)])
+    dt = (time.perf_counter() - t0) * len(g) / m
+    print(f"   bucle por intervalo (extrapolado): {dt * 1e3:7.1f} ms")
+    assert np.allclose(remuestrear(t, columnas, g, "mean")["tc"][:m], lenta, equal_nan=True)
+    print("✅ Resultados idénticos a las referencias")
+    return out
+
+
+def main():
+    import glob
+
+    import it032_analysis as analysis
+
+    p = argparse.ArgumentParser(description="Remuestreo y alineación de sesiones .it32s")
+    p.add_argument("sesiones", nargs="*", help="ficheros .it32s (admite comodines)")
+    p.add_argument("--step", type=float, default=1.0, help="paso de la rejilla en segundos")
+    p.add_argument("--mode", default="linear", choices=MODOS)
+    p.add_argument("--align", default="start", choices=REFERENCIAS)
+    p.add_argument("--event", default="HEAT", choices=("HEAT", "FAN"))
+    p.add_argument("--max-gap", type=float, default=None, help="no rellenar huecos mayores (s)")
+    p.add_argument("--out", default="alineadas.xlsx", help=".xlsx o .csv")
+    p.add_argument("--bench", action="store_true")
+    args = p.parse_args()
+
+    if args.bench:
+        bench()
+        return
+    paths = sorted({f for patron in args.sesiones for f in glob.glob(patron)})
+    if not paths:
+        p.error("no se encontraron sesiones")
+    sesiones = []
+    for path in paths:
+        t, columnas, meta = analysis.cargar_sesion(path)
+        sesiones.append((t, columnas, meta.get("events", [])))
+    t0 = time.perf_counter()
+    g, series = alinear(sesiones, args.step, args.mode, args.align, args.event, args.max_gap)
+    dt = time.perf_counter() - t0
+    nombres = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    exportar(args.out, g, series, nombres, hora_real=args.align == "wall")
+    print(f"✅ {len(paths)} sesiones → {len(g):,} instantes cada {args.step:g} s "
+          f"({args.mode}, {dt * 1e3:.0f} ms) → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+# it032_retention.py - retención por niveles del registro continuo
+# -------------------------------------------------------
+# - Las sesiones recientes conservan todas sus muestras; las más antiguas se
+#   compactan en intervalos con mínimo/media/máximo por canal, cada vez más
+#   gruesos con la edad (niveles en retention.json)
+# - Los puntos guardados por el alumno, los eventos y los resúmenes por
+#   práctica no se tocan: las consultas del profesor siguen igual
+# - Las lecturas del almacén (iter_muestras, contar, agregados...) mezclan
+#   muestras originales e intervalos, así que el resto del programa no
+#   necesita saber qué está compactado
+# - Hilo en segundo plano de baja prioridad: una sesión cada vez, con pausas,
+#   cediendo el paso si el hilo escritor tiene trabajo; lo que falta se sigue
+#   en el próximo arranque. Con subida al servidor configurada no se compacta
+#   nada que no se haya enviado
+# - SQLite reutiliza las páginas liberadas: el fichero deja de crecer en
+#   cuanto lo que se compacta compensa lo que se graba
+#
+# Uso:  python it032_retention.py --once          (una pasada completa ahora)
+#       python it032_retention.py --bench 12      (12 meses simulados en una base temporal)
+#       python it032_retention.py --prueba        (compactar y después subir: no se pierde nada)
+
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+import it032_store as store
+
+RETENTION_PATH = "retention.json"
+DIA = 86400.0
+
+DEFAULT_CONFIG = {
+    "enabled": True,
+    # Sesiones terminadas hace más de `after_days` días -> intervalos de `resolution_s`
+    "tiers": [
+        {"after_days": 30, "resolution_s": 10},
+        {"after_days": 180, "resolution_s": 60},
+    ],
+    "pause_s": 1.0,  # entre sesiones compactadas
+    "interval_s": 3600,  # entre pasadas
+    "start_delay_s": 120,  # no competir con el arranque del programa
+}
+
+
+def cargar_config(path=RETENTION_PATH):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            cfg = json.load(f)
+    except FileNotFoundError:
+        return dict(DEFAULT_CONFIG)
+    except Exception as e:
+        print(f"⚠️ No se pudo cargar {path} ({e}); se usa la retención por defecto.")
+        return dict(DEFAULT_CONFIG)
+    config = {k: cfg.get(k, v) for k, v in DEFAULT_CONFIG.items()}
+    for nivel in config["tiers"]:
+        if nivel["resolution_s"] <= 0 or nivel["after_days"] < 0:
+            print(f"⚠️ Nivel de retención no válido en {path}: {nivel}; se usa la retención por defecto.")
+            return dict(DEFAULT_CONFIG)
+    return config
+
+
+def _bajar_prioridad():
+    """Sube el nice del hilo actual (Linux/macOS); en Windows se queda igual."""
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+    except (AttributeError, OSError):
+        pass
+
+
+class RetentionWorker:
+    """Compacta sesiones antiguas en segundo plano, una cada vez."""
+
+    def __init__(self, st, config=None, respetar_subida=False):
+        self.store = st
+        self.config = config or cargar_config()
+        self.respetar_subida = respetar_subida
+        self._stop = threading.Event()
+        self._thread = None
+        self.metricas = {"sesiones": 0, "filas_antes": 0, "filas_despues": 0, "segundos": 0.0}
+
+    def start(self):
+        if not self.config["enabled"] or not self.config["tiers"]:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True, name="retencion")
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _loop(self):
+        _bajar_prioridad()
+        if self._stop.wait(self.config["start_delay_s"]):
+            return
+        while not self._stop.is_set():
+            try:
+                self.pasada()
+            except Exception as e:
+                print(f"⚠️ Retención: {e}")
+            self._stop.wait(self.config["interval_s"])
+
+    def _ocupado(self):
+        # El registro en curso tiene preferencia sobre la compactación
+        return self.store._cola.qsize() > store.BATCH_SIZE
+
+    def pasada(self, ahora=None, pausa=None):
+        """Compacta todo lo pendiente; devuelve cuántas sesiones ha tratado."""
+        ahora = time.time() if ahora is None else ahora
+        pausa = self.config["pause_s"] if pausa is None else pausa
+        hasta_id = self.store.cursor_subida() if self.respetar_subida else None
+        hechas = 0
+        # Del nivel más grueso al más fino: una sesión muy antigua pasa
+        # directamente al suyo sin detenerse en los intermedios
+        for nivel in sorted(self.config["tiers"], key=lambda n: -n["after_days"]):
+            limite = ahora - nivel["after_days"] * DIA
+            while not self._stop.is_set():
+                sesiones = self.store.sesiones_a_compactar(
+                    limite, nivel["resolution_s"], hasta_id, limite=20
+                )
+                if not sesiones:
+                    break
+                for session_id in sesiones:
+                    while self._ocupado() and not self._stop.wait(pausa or 0.1):
+                        pass
+                    if self._stop.is_set():
+                        return hechas
+                    t0 = time.perf_counter()
+                    antes, despues = self.store.compactar_sesion(session_id, nivel["resolution_s"])
+                    self.metricas["sesiones"] += 1
+                    self.metricas["filas_antes"] += antes
+                    self.metricas["filas_despues"] += despues
+                    self.metricas["segundos"] += time.perf_counter() - t0
+                    hechas += 1
+                    if pausa:
+                        self._stop.wait(pausa)
+        return hechas
+
+
+# ---------------------------------------------------------
+# PRUEBA: MESES DE USO SIMULADOS
+# ---------------------------------------------------------
+def _grabar_sesion(st, machine_id, t0, muestras, periodo, rng):
+    """Una práctica sintética: calefactor a 40 W y escalón de ventilador a mitad."""
+    sid = st.iniciar_sesion(machine_id, t0)
+    t = t0 + np.arange(muestras) * periodo
+    r = t - t0
+    fan = int(rng.integers(50, 255))
+    vel = np.where(r >= r[-1] / 2, fan / 255 * 3, 0.3) + rng.normal(0, 0.02, muestras)
+    pot = np.where(r >= 10, 40.0, 0.0)
+    h = 8 + 15 * np.abs(vel) ** 0.8
+    te = 21 + rng.normal(0, 0.05, muestras)
+    tc = 22 + pot / (0.01 * h) * (1 - np.exp(-np.maximum(r - 10, 0) / 60))
+    st.agregar_bloque(machine_id, sid, t, np.column_stack([te, te + 1.5, tc, vel, pot]))
+    st.agregar_evento(machine_id, sid, t0 + 10, "HEAT", 170, "consigna")
+    st.agregar_evento(machine_id, sid, t0 + r[-1] / 2, "FAN", fan, "consigna")
+    st.cerrar_sesion(sid, t[-1])
+    return sid
+
+
+def bench(meses, sesiones_mes=10, minutos=60, periodo=0.5):
+    with tempfile.TemporaryDirectory() as tmp:
+        st = store.PracticeStore(os.path.join(tmp, "practicas.db"))
+        machine_id = st.maquina()
+        worker = RetentionWorker(st, dict(DEFAULT_CONFIG))
+        rng = np.random.default_rng(0)
+        muestras = int(minutos * 60 / periodo)
+        inicio = time.time() - meses * 30 * DIA
+        primera = None
+        print(f"📦 {sesiones_mes} prácticas/mes de {minutos} min a {1 / periodo:g} muestras/s; "
+              f"niveles {[(n['after_days'], n['resolution_s']) for n in worker.config['tiers']]}")
+        for mes in range(meses):
+            for j in range(sesiones_mes):
+                t0 = inicio + (mes + j / sesiones_mes) * 30 * DIA
+                sid = _grabar_sesion(st, machine_id, t0, muestras, periodo, rng)
+                primera = primera or sid
+            ahora = inicio + (mes + 1) * 30 * DIA
+            t = time.perf_counter()
+            n = worker.pasada(ahora, pausa=0)
+            dt = time.perf_counter() - t
+            esp = st.espacio()
+            print(f"   mes {mes + 1:2d}: {esp['usados'] / 1e6:6.1f} MB usados "
+                  f"({esp['fichero'] / 1e6:6.1f} MB fichero), {esp['practices']:8d} muestras + "
+                  f"{esp['practices_agg']:6d} intervalos; {n} sesiones compactadas en {dt:.2f} s")
+        m = worker.metricas
+        if m["sesiones"]:
+            print(f"⚡ {m['filas_antes']:,} filas → {m['filas_despues']:,} en {m['segundos']:.1f} s "
+                  f"({m['filas_antes'] / m['segundos']:,.0f} filas/s)")
+        # La misma API sobre la sesión más antigua, ya compactada
+        t = time.perf_counter()
+        filas = list(st.iter_muestras(machine_id, session_id=primera))
+        t_iter = time.perf_counter() - t
+        t = time.perf_counter()
+        tc, n, mn, media, mx = st.agregados(machine_id, 3600)
+        t_agg = time.perf_counter() - t
+        print(f"   sesión {primera}: {len(filas)} filas por iter_muestras en {t_iter * 1e3:.1f} ms; "
+              f"resumen {st.escalones_sesion(primera)[-1]['h']:.1f} W/m²K de h")
+        print(f"   tendencia horaria de todo el periodo: {len(tc)} intervalos en {t_agg * 1e3:.0f} ms, "
+              f"TC máx {np.nanmax(mx[:, 2]):.1f} °C")
+        st.cerrar()
+
+
+def prueba():
+    """Compactar una sesión ya subida no debe dejar filas nuevas por debajo del cursor."""
+    with tempfile.TemporaryDirectory() as tmp:
+        st = store.PracticeStore(os.path.join(tmp, "practicas.db"))
+        machine_id = st.maquina()
+        rng = np.random.default_rng(0)
+        # Una sesión de hace 40 días, ya enviada entera al servidor
+        _grabar_sesion(st, machine_id, time.time() - 40 * DIA, 1000, 0.5, rng)
+        st.flush()
+        cursor = max(f[0] for f in st.pendientes_subida(10_000))
+        st.avanzar_cursor_subida(cursor)
+        worker = RetentionWorker(st, dict(DEFAULT_CONFIG), respetar_subida=True)
+        n = worker.pasada(pausa=0)
+        # Práctica nueva después de las vacaciones
+        _grabar_sesion(st, machine_id, time.time(), 20, 0.5, rng)
+        st.flush()
+        pendientes = [f[0] for f in st.pendientes_subida(10_000)]
+        st.cerrar()
+    ok = n == 1 and len(pendientes) == 20 and min(pendientes) > cursor
+    print(f"{'✅' if ok else '❌'} {n} sesión compactada; {len(pendientes)}/20 filas nuevas "
+          f"pendientes de subir (ids > {cursor}: {bool(pendientes) and min(pendientes) > cursor})")
+    return ok
+
+
+def main():
+    p = argparse.ArgumentParser(description="Retención por niveles del almacén de prácticas")
+    p.add_argument("--db", default=store.DB_PATH)
+    p.add_argument("--config", default=RETENTION_PATH)
+    p.add_argument("--once", action="store_true", help="compactar ahora todo lo pendiente")
+    p.add_argument("--bench", type=int, metavar="MESES", help="simular MESES de uso")
+    p.add_argument("--prueba", action="store_true", help="comprobar compactación + subida")
+    args = p.parse_args()
+
+    if args.prueba:
+        raise SystemExit(0 if prueba() else 1)
+
+    if args.bench:
+        bench(args.bench)
+        return
+    st = store.PracticeStore(args.db)
+    try:
+        esp = st.espacio()
+        print(f"📦 {esp['usados'] / 1e6:.1f} MB usados, {esp['practices']:,} muestras, "
+              f"{esp['practices_agg']:,} intervalos")
+        if args.once:
+            worker = RetentionWorker(st, cargar_config(args.config))
+            n = worker.pasada(pausa=0)
+            esp = st.espacio()
+            print(f"✅ {n} sesiones compactadas: {esp['usados'] / 1e6:.1f} MB usados, "
+                  f"{esp['practices']:,} muestras, {esp['practices_agg']:,} intervalos")
+    finally:
+        st.cerrar()
+
+
+if __name__ == "__main__":
+    main()
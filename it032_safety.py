@@ -0,0 +1,310 @@
+# it032_safety.py - enclavamientos de seguridad evaluados en cada muestra
+# -------------------------------------------------------
+# - Reglas de umbral, de velocidad de cambio y de vigilancia (watchdog)
+#   cargadas de safety_rules.json y precompiladas al arrancar
+# - Se evalúan en el propio hilo de lectura con coste acotado por muestra
+# - Al dispararse envían HEAT000 por la vía prioritaria del CommandLane,
+#   saltándose las consignas en cola, y enclavan el calefactor hasta rearmar
+# - Se registra la latencia de reacción de cada disparo
+
+import json
+import operator
+import threading
+import time
+from collections import deque
+
+from it032_core import reloj
+
+RULES_PATH = "safety_rules.json"
+WATCHDOG_PERIOD = 0.25  # segundos entre comprobaciones del watchdog
+RATE_MAX_SAMPLES = 256  # tope de muestras guardadas por regla de pendiente
+
+CANALES = {"te": 0, "ts": 1, "tc": 2, "vel": 3, "pot": 4}
+OPERADORES = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+}
+
+DEFAULT_RULES = [
+    {"name": "tc_sobretemperatura", "type": "threshold", "channel": "tc",
+     "op": ">", "value": 150.0, "action": "HEAT000"},
+    {"name": "sin_datos", "type": "watchdog", "timeout_s": 3.0,
+     "when": {"HEAT": [">", 0]}, "action": "HEAT000"},
+]
+
+
+def _parse_accion(accion):
+    """'HEAT000' -> ('HEAT', 0)"""
+    tipo = accion.rstrip("0123456789").upper()
+    return tipo, int(accion[len(tipo):] or 0)
+
+
+# ---------------------------------------------------------
+# REGLAS PRECOMPILADAS
+# ---------------------------------------------------------
+class Regla:
+    """Base común: condición sobre los actuadores, retardo y acción."""
+
+    def __init__(self, cfg):
+        self.nombre = cfg["name"]
+        self.tipo_accion, self.valor_accion = _parse_accion(cfg.get("action", "HEAT000"))
+        self.hold_s = float(cfg.get("hold_s", 0.0))
+        self.cuando = [
+            (tipo.upper(), OPERADORES[op], valor)
+            for tipo, (op, valor) in cfg.get("when", {}).items()
+        ]
+        self._desde = None  # instante en que empezó a cumplirse la condición
+        self.disparada = False
+
+    def habilitada(self, actuadores):
+        for tipo, op, valor in self.cuando:
+            if not op(actuadores.get(tipo, 0), valor):
+                return False
+        return True
+
+    def confirmar(self, t, cumple):
+        """Aplica el retardo hold_s y devuelve True solo en el flanco de disparo."""
+        if not cumple:
+            self._desde = None
+            self.disparada = False
+            return False
+        if self._desde is None:
+            self._desde = t
+        if self.disparada or t - self._desde < self.hold_s:
+            return False
+        self.disparada = True
+        return True
+
+    def reiniciar(self):
+        """Olvida el estado del flanco: si la condición sigue, vuelve a dispararse."""
+        self._desde = None
+        self.disparada = False
+
+
+class ReglaUmbral(Regla):
+    def __init__(self, cfg):
+        super().__init__(cfg)
+        self.idx = CANALES[cfg["channel"]]
+        self.op = OPERADORES[cfg["op"]]
+        self.limite = float(cfg["value"])
+
+    def comprobar(self, t, valores, actuadores):
+        cumple = self.habilitada(actuadores) and self.op(valores[self.idx], self.limite)
+        return self.confirmar(t, cumple), valores[self.idx]
+
+
+class ReglaPendiente(Regla):
+    """Velocidad de cambio (unidades/s) respecto a la muestra más antigua de la ventana."""
+
+    def __init__(self, cfg):
+        super().__init__(cfg)
+        self.idx = CANALES[cfg["channel"]]
+        self.op = OPERADORES[cfg["op"]]
+        self.limite = float(cfg["value"])
+        self.ventana = float(cfg.get("window_s", 2.0))
+        self.hist = deque(maxlen=RATE_MAX_SAMPLES)
+
+    def comprobar(self, t, valores, actuadores):
+        v = valores[self.idx]
+        hist = self.hist
+        hist.append((t, v))
+        while t - hist[0][0] > self.ventana:
+            hist.popleft()
+        t0, v0 = hist[0]
+        pendiente = (v - v0) / (t - t0) if t > t0 else 0.0
+        cumple = self.habilitada(actuadores) and self.op(pendiente, self.limite)
+        return self.confirmar(t, cumple), pendiente
+
+
+class ReglaWatchdog(Regla):
+    """Se dispara si pasan más de timeout_s sin recibir muestras."""
+
+    def __init__(self, cfg):
+        super().__init__(cfg)
+        self.timeout = float(cfg.get("timeout_s", 3.0))
+
+    def comprobar_silencio(self, ahora, ultima, actuadores):
+        silencio = ahora - ultima
+        cumple = self.habilitada(actuadores) and silencio > self.timeout
+        return self.confirmar(ahora, cumple), silencio
+
+
+TIPOS_REGLA = {
+    "threshold": ReglaUmbral,
+    "rate": ReglaPendiente,
+    "watchdog": ReglaWatchdog,
+}
+
+
+def compilar_regla(cfg):
+    return TIPOS_REGLA[cfg["type"]](cfg)
+
+
+def cargar_reglas(path=RULES_PATH):
+    """Lee y precompila las reglas; si no hay fichero usa las reglas por defecto."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            cfg = json.load(f)["rules"]
+    except FileNotFoundError:
+        cfg = DEFAULT_RULES
+    except Exception as e:
+        print(f"⚠️ No se pudo cargar {path} ({e}); se usan las reglas por defecto.")
+        cfg = DEFAULT_RULES
+    return [compilar_regla(c) for c in cfg]
+
+
+# ---------------------------------------------------------
+# MOTOR DE ENCLAVAMIENTOS
+# ---------------------------------------------------------
+class SafetyEngine:
+    """Evalúa las reglas en cada muestra y actúa por la vía prioritaria."""
+
+    def __init__(self, lane, reglas=None, al_disparar=None):
+        self.lane = lane
+        reglas = reglas if reglas is not None else cargar_reglas()
+        self.reglas_muestra = [r for r in reglas if not isinstance(r, ReglaWatchdog)]
+        self.reglas_watchdog = [r for r in reglas if isinstance(r, ReglaWatchdog)]
+        self.al_disparar = al_disparar
+        self.disparos = []
+        self._ultima = None
+        self._armado = threading.Event()
+        self._fin = threading.Event()
+        self._lock = threading.Lock()
+        if self.reglas_watchdog:
+            threading.Thread(target=self._vigilar, daemon=True).start()
+
+    def armar(self):
+        self._ultima = reloj()
+        for r in self.reglas_watchdog:
+            r.confirmar(self._ultima, False)
+        self._armado.set()
+
+    def desarmar(self):
+        self._armado.clear()
+
+    def detener(self):
+        """Desarma y termina el hilo del watchdog (al cambiar de equipo o cerrar)."""
+        self._armado.clear()
+        self._fin.set()
+
+    def evaluar(self, t, valores):
+        """Evalúa todas las reglas de muestra. Llamar desde el hilo de adquisición."""
+        t_deteccion = time.perf_counter()
+        self._ultima = t
+        actuadores = self.lane.valores
+        for regla in self.reglas_muestra:
+            disparo, medida = regla.comprobar(t, valores, actuadores)
+            if disparo:
+                self._disparar(regla, t, medida, t_deteccion)
+
+    def _vigilar(self):
+        while not self._fin.wait(WATCHDOG_PERIOD):
+            if not self._armado.is_set() or self._ultima is None:
+                continue
+            ahora = reloj()
+            for regla in self.reglas_watchdog:
+                disparo, silencio = regla.comprobar_silencio(
+                    ahora, self._ultima, self.lane.valores
+                )
+                if disparo:
+                    self._disparar(regla, ahora, silencio, time.perf_counter())
+
+    def _disparar(self, regla, t_muestra, medida, t_deteccion):
+        with self._lock:
+            self.lane.prioritario(regla.tipo_accion, regla.valor_accion, enclavar=True)
+            latencia = time.perf_counter() - t_deteccion
+            edad = reloj() - t_muestra
+        disparo = {
+            "regla": regla.nombre,
+            "t": t_muestra,
+            "medida": medida,
+            "accion": f"{regla.tipo_accion}{regla.valor_accion:03d}",
+            "latencia_s": latencia,
+            "desde_muestra_s": edad,
+        }
+        self.disparos.append(disparo)
+        print(
+            f"🛑 Enclavamiento '{regla.nombre}' (medida={medida:.2f}) → "
+            f"{disparo['accion']} en {latencia * 1e3:.2f} ms "
+            f"({edad * 1e3:.1f} ms desde la muestra)"
+        )
+        if self.al_disparar:
+            self.al_disparar(disparo)
+
+    def rearmar(self):
+        """Libera los enclavamientos tras el reconocimiento del operador.
+
+        Las reglas empiezan de cero: si la condición aún se cumple (TC todavía
+        por encima del límite), la siguiente muestra vuelve a dispararla.
+        """
+        with self._lock:
+            for regla in self.reglas_muestra + self.reglas_watchdog:
+                regla.reiniciar()
+            for tipo in {r.tipo_accion for r in self.reglas_muestra + self.reglas_watchdog}:
+                self.lane.rearmar(tipo)
+
+
+# ---------------------------------------------------------
+# PRUEBA
+# ---------------------------------------------------------
+class _ViaPrueba:
+    """Lo mínimo del CommandLane: valores, vía prioritaria con bloqueo y rearme."""
+
+    def __init__(self):
+        self.valores = {"HEAT": 0, "FAN": 0}
+        self.bloqueos = {}
+        self.escritos = []
+
+    def consigna(self, tipo, valor):
+        self.valores[tipo] = self.bloqueos.get(tipo, valor)
+
+    def prioritario(self, tipo, valor, enclavar=False):
+        if enclavar:
+            self.bloqueos[tipo] = valor
+        self.valores[tipo] = valor
+        self.escritos.append((tipo, valor))
+
+    def rearmar(self, tipo):
+        self.bloqueos.pop(tipo, None)
+
+
+def main():
+    """Comprueba disparo, enclavamiento y rearme: python it032_safety.py"""
+    fallos = []
+
+    def comprobar(ok, texto):
+        print(f"{'✅' if ok else '❌'} {texto}")
+        if not ok:
+            fallos.append(texto)
+
+    via = _ViaPrueba()
+    motor = SafetyEngine(via, [compilar_regla(DEFAULT_RULES[0])])
+    caliente = [21.0, 22.0, 160.0, 1.0, 40.0]
+    via.consigna("HEAT", 200)
+    t0 = reloj()
+    motor.evaluar(t0, caliente)
+    comprobar(via.valores["HEAT"] == 0 and len(motor.disparos) == 1, "TC > 150 °C apaga el calefactor")
+    via.consigna("HEAT", 200)
+    comprobar(via.valores["HEAT"] == 0, "enclavado: la consigna no lo vuelve a encender")
+    # Rearme con TC todavía por encima del límite
+    motor.rearmar()
+    via.consigna("HEAT", 200)
+    motor.evaluar(t0 + 0.1, caliente)
+    comprobar(via.valores["HEAT"] == 0 and len(motor.disparos) == 2,
+              "rearme con la condición activa: la siguiente muestra vuelve a disparar")
+    # Rearme ya en condiciones normales
+    frio = [21.0, 22.0, 80.0, 1.0, 40.0]
+    motor.evaluar(t0 + 0.2, frio)
+    motor.rearmar()
+    via.consigna("HEAT", 200)
+    motor.evaluar(t0 + 0.3, frio)
+    comprobar(via.valores["HEAT"] == 200 and len(motor.disparos) == 2,
+              "rearme con TC normal: el calefactor vuelve a obedecer")
+    motor.detener()
+    raise SystemExit(1 if fallos else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+# it032_session_file.py - formato nativo de sesión (.it32s): columnas por canal
+# -------------------------------------------------------
+# Estructura del fichero:
+#   [cabecera 16 B]  MAGIC + versión
+#   [bloques]        por cada bloque, una columna tras otra, comprimidas con zlib
+#   [índice]         una fila de tamaño fijo por bloque: nº filas, rango de
+#                    tiempo y, por columna, offset/longitudes/mín/máx
+#   [pie JSON]       metadatos: equipo, columnas, offsets, consignas, eventos...
+#   [cola 40 B]      posiciones del índice y del pie + MAGIC_END
+#
+# El lector hace mmap del fichero y solo lee la cola, el índice y el pie al
+# abrir; cada rango de tiempo descomprime únicamente los bloques que lo tocan.
+
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+
+MAGIC = b"IT32SES\0"
+MAGIC_END = b"IT32END\0"
+VERSION = 1
+EXTENSION = ".it32s"
+SESSIONS_DIR = os.environ.get("IT032_SESSIONS", "sesiones")
+CHUNK_ROWS = 4096  # filas por bloque
+ZLIB_LEVEL = 6
+
+_HEADER = struct.Struct("<8sHxxxxxx")  # magic, versión
+_TRAILER = struct.Struct("<QQQQ8s")  # índice off/len, pie off/len, magic
+
+# Columnas por defecto: tiempo en float64, canales en float32
+COLUMNAS = [
+    ("t", "<f8", "s"),
+    ("te", "<f4", "°C"),
+    ("ts", "<f4", "°C"),
+    ("tc", "<f4", "°C"),
+    ("vel", "<f4", "m/s"),
+    ("pot", "<f4", "W"),
+]
+
+
+def _dtype_indice(nombres):
+    """Fila del índice: nº de filas + (offset, long. comprimida, mín, máx) por columna.
+
+    Los campos t_min / t_max de la columna de tiempo dan el rango del bloque.
+    """
+    campos = [("n", "<u4")]
+    for nombre in nombres:
+        campos += [
+            (f"{nombre}_off", "<u8"),
+            (f"{nombre}_clen", "<u4"),
+            (f"{nombre}_min", "<f8"),
+            (f"{nombre}_max", "<f8"),
+        ]
+    return np.dtype(campos)
+
+
+def _shuffle(arr):
+    """Reordena los bytes por planos (todos los bytes 0, luego los 1...): comprime mejor."""
+    return np.ascontiguousarray(arr).view(np.uint8).reshape(-1, arr.itemsize).T.tobytes()
+
+
+def _unshuffle(data, dtype, n):
+    planos = np.frombuffer(data, dtype=np.uint8).reshape(dtype.itemsize, n)
+    return np.ascontiguousarray(planos.T).view(dtype).reshape(n)
+
+
+# ---------------------------------------------------------
+# ESCRITURA
+# ---------------------------------------------------------
+class SessionWriter:
+    """Escribe una sesión en streaming: las filas se agrupan en bloques de CHUNK_ROWS."""
+
+    def __init__(self, path, metadata=None, columnas=COLUMNAS, chunk_rows=CHUNK_ROWS):
+        self.path = path
+        self.columnas = [(n, np.dtype(d), u) for n, d, u in columnas]
+        self.nombres = [c[0] for c in self.columnas]
+        self.metadata = dict(metadata or {})
+        self.chunk_rows = chunk_rows
+        self._piezas = {n: [] for n in self.nombres}  # arrays pendientes por columna
+        self._filas = []  # filas sueltas de agregar()
+        self._pendientes = 0
+        self._indice = []
+        self._tmp = path + ".tmp"
+        self._f = open(self._tmp, "wb")
+        self._f.write(_HEADER.pack(MAGIC, VERSION))
+
+    def agregar(self, t, valores):
+        """Añade una fila (t, [te, ts, tc, vel, pot])."""
+        self._filas.append((t, *valores))
+        self._pendientes += 1
+        if self._pendientes >= self.chunk_rows:
+            self._volcar()
+
+    def agregar_bloque(self, columnas):
+        """Añade muchas filas de golpe: dict nombre -> array de igual longitud."""
+        self._pasar_filas()
+        n = len(columnas["t"])
+        inicio = 0
+        while inicio < n:
+            hueco = self.chunk_rows - self._pendientes
+            fin = min(n, inicio + hueco)
+            for nombre in self.nombres:
+                self._piezas[nombre].append(np.asarray(columnas[nombre][inicio:fin]))
+            self._pendientes += fin - inicio
+            inicio = fin
+            if self._pendientes >= self.chunk_rows:
+                self._volcar()
+
+    def _pasar_filas(self):
+        if self._filas:
+            cols = zip(*self._filas)
+            for nombre, (_, dtype, _u), col in zip(self.nombres, self.columnas, cols):
+                self._piezas[nombre].append(np.asarray(col, dtype=dtype))
+            self._filas = []
+
+    def _volcar(self):
+        if not self._pendientes:
+            return
+        self._pasar_filas()
+        fila = {"n": self._pendientes}
+        for nombre, dtype, _ in self.columnas:
+            arr = np.concatenate(self._piezas[nombre]).astype(dtype, copy=False)
+            comp = zlib.compress(_shuffle(arr), ZLIB_LEVEL)
+            fila[f"{nombre}_off"] = self._f.tell()
+            fila[f"{nombre}_clen"] = len(comp)
+            fila[f"{nombre}_min"] = float(np.nanmin(arr)) if np.isfinite(arr).any() else np.nan
+            fila[f"{nombre}_max"] = float(np.nanmax(arr)) if np.isfinite(arr).any() else np.nan
+            self._f.write(comp)
+            self._piezas[nombre] = []
+        self._indice.append(fila)
+        self._pendientes = 0
+
+    def cerrar(self):
+        """Escribe índice, pie y cola, y publica el fichero de forma atómica."""
+        self._volcar()
+        dtype = _dtype_indice(self.nombres)
+        indice = np.zeros(len(self._indice), dtype=dtype)
+        for i, fila in enumerate(self._indice):
+            for campo, valor in fila.items():
+                indice[i][campo] = valor
+        off_indice = self._f.tell()
+        self._f.write(indice.tobytes())
+        meta = dict(self.metadata)
+        meta.update({
+            "version": VERSION,
+            "columns": [
+                {"name": n, "dtype": d.str, "unit": u} for n, d, u in self.columnas
+            ],
+            "chunk_rows": self.chunk_rows,
+            "rows": int(indice["n"].sum()) if len(indice) else 0,
+            "shuffle": True,
+            "written_at": time.time(),
+        })
+        pie = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+        off_pie = self._f.tell()
+        self._f.write(pie)
+        self._f.write(_TRAILER.pack(off_indice, indice.nbytes, off_pie, len(pie), MAGIC_END))
+        self._f.close()
+        os.replace(self._tmp, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        if exc_type is None:
+            self.cerrar()
+        else:
+            self._f.close()
+            os.remove(self._tmp)
+
+
+# ---------------------------------------------------------
+# LECTURA (mmap)
+# ---------------------------------------------------------
+class SessionFile:
+    """Sesión abierta con mmap; abrir cuesta lo mismo sea cual sea su duración."""
+
+    def __init__(self, path):
+        self.path = path
+        self._f = open(path, "rb")
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} no es un fichero de sesión IT 03.2")
+        if version > VERSION:
+            raise ValueError(f"{path}: versión de formato {version} no soportada")
+        off_i, len_i, off_p, len_p, fin = _TRAILER.unpack_from(
+            self._mm, len(self._mm) - _TRAILER.size
+        )
+        if fin != MAGIC_END:
+            raise ValueError(f"{path} está incompleto (falta la cola)")
+        self.metadata = json.loads(self._mm[off_p:off_p + len_p].decode("utf-8"))
+        self.columnas = {c["name"]: np.dtype(c["dtype"]) for c in self.metadata["columns"]}
+        self.nombres = list(self.columnas)
+        # El índice se interpreta directamente sobre el mmap, sin copiarlo
+        dtype = _dtype_indice(self.nombres)
+        self.indice = np.frombuffer(
+            self._mm, dtype=dtype, count=len_i // dtype.itemsize, offset=off_i
+        )
+
+    @property
+    def filas(self):
+        return self.metadata["rows"]
+
+    @property
+    def t_inicio(self):
+        return float(self.indice["t_min"][0]) if len(self.indice) else None
+
+    @property
+    def t_fin(self):
+        return float(self.indice["t_max"][-1]) if len(self.indice) else None
+
+    def bloques_en(self, t0=None, t1=None):
+        """Índices de los bloques cuyo rango de tiempo se solapa con [t0, t1]."""
+        ini = 0 if t0 is None else int(np.searchsorted(self.indice["t_max"], t0, "left"))
+        fin = len(self.indice) if t1 is None else int(
+            np.searchsorted(self.indice["t_min"], t1, "right")
+        )
+        return range(ini, fin)
+
+    def leer_bloque(self, i, nombres=None):
+        fila = self.indice[i]
+        n = int(fila["n"])
+        out = {}
+        for nombre in nombres or self.nombres:
+            off = int(fila[f"{nombre}_off"])
+            data = zlib.decompress(self._mm[off:off + int(fila[f"{nombre}_clen"])])
+            out[nombre] = _unshuffle(data, self.columnas[nombre], n)
+        return out
+
+    def rango(self, t0=None, t1=None, nombres=None):
+        """Columnas recortadas a [t0, t1]; solo se descomprimen los bloques necesarios."""
+        nombres = list(nombres or self.nombres)
+        if "t" not in nombres:
+            nombres = ["t"] + nombres
+        partes = {n: [] for n in nombres}
+        for i in self.bloques_en(t0, t1):
+            bloque = self.leer_bloque(i, nombres)
+            t = bloque["t"]
+            a = 0 if t0 is None else int(np.searchsorted(t, t0, "left"))
+            b = len(t) if t1 is None else int(np.searchsorted(t, t1, "right"))
+            for n in nombres:
+                partes[n].append(bloque[n][a:b])
+        return {
+            n: np.concatenate(p) if p else np.empty(0, dtype=self.columnas[n])
+            for n, p in partes.items()
+        }
+
+    def iter_bloques(self, nombres=None):
+        """Recorre la sesión bloque a bloque con memoria acotada."""
+        for i in range(len(self.indice)):
+            yield self.leer_bloque(i, nombres)
+
+    def min_max(self, nombre, t0=None, t1=None):
+        """Mín/máx aproximado a resolución de bloque, sin descomprimir nada."""
+        bloques = self.bloques_en(t0, t1)
+        sel = self.indice[bloques.start:bloques.stop]
+        if not len(sel):
+            return None, None
+        return float(np.nanmin(sel[f"{nombre}_min"])), float(np.nanmax(sel[f"{nombre}_max"]))
+
+    def cerrar(self):
+        self.indice = None
+        self._mm.close()
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.cerrar()
+
+
+# ---------------------------------------------------------
+# EXPORTACIÓN DESDE EL ALMACÉN SQLITE
+# ---------------------------------------------------------
+def ruta_sesion(serial_number, session_id, t_inicio, carpeta=SESSIONS_DIR):
+    """sesiones/DKT032_20251009_150223_s12.it32s"""
+    os.makedirs(carpeta, exist_ok=True)
+    marca = time.strftime("%Y%m%d_%H%M%S", time.localtime(t_inicio))
+    return os.path.join(carpeta, f"{serial_number}_{marca}_s{session_id}{EXTENSION}")
+
+
+def exportar_sesion(practice_store, machine_id, session_id, path, metadata=None):
+    """Vuelca el registro continuo de una sesión del almacén a un fichero .it32s."""
+    meta = dict(metadata or {})
+    meta.setdefault("machine_id", machine_id)
+    meta.setdefault("session_id", session_id)
+    meta.setdefault(
+        "events",
+        [
+            {"t": t, "kind": kind, "value": value, "source": source}
+            for t, kind, value, source in practice_store.eventos(machine_id, session_id)
+        ],
+    )
+    # Los puntos guardados a mano van en el pie: son pocos y los usa el informe
+    meta.setdefault(
+        "saved",
+        [list(fila) for fila in practice_store.iter_muestras(
+            machine_id, session_id=session_id, guardadas=True
+        )],
+    )
+    with SessionWriter(path, meta) as w:
+        for timestamp, *valores in practice_store.iter_muestras(
+            machine_id, session_id=session_id, guardadas=False
+        ):
+            w.agregar(timestamp, valores)
+    return path
@@ -0,0 +1,309 @@
+# it032_soak.py - prueba de resistencia acelerada de la aplicación completa
+# -------------------------------------------------------
+# - Arranca la MainWindow real con la plataforma Qt "offscreen" y un equipo
+#   simulado (modelo térmico sencillo) o reproducido desde un fichero .it32s
+# - El equipo entrega muestras a `--speed` veces el ritmo real: con los valores
+#   por defecto, un día de práctica (2 muestras/s) se simula en ~15 minutos
+# - Durante la prueba cambia consignas, guarda puntos y exporta a Excel como
+#   haría un alumno, y cada hora simulada anota RSS, latencia del bucle de
+#   eventos, coste por muestra en la GUI y muestras pendientes
+# - Termina con código 1 si algo crece más allá de los límites configurados
+#
+# Uso:  python it032_soak.py --hours 24 --speed 100 --report soak.json
+#
+# El tiempo de las marcas guardadas es el real (comprimido): una hora
+# simulada dura 3600 / speed segundos de reloj.
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ.pop("IT032_SERVER", None)  # sin subida al servidor durante la prueba
+os.environ.pop("IT032_UPDATE_URL", None)
+os.environ.pop("IT032_BROADCAST_PORT", None)
+os.environ.pop("IT032_REMOTE_PORT", None)
+
+WORK_DIR = tempfile.mkdtemp(prefix="it032_soak_")
+os.environ["IT032_DB"] = os.path.join(WORK_DIR, "practicas.db")
+os.environ["IT032_SESSIONS"] = os.path.join(WORK_DIR, "sesiones")
+
+from PyQt6.QtCore import QTimer
+from PyQt6.QtWidgets import QApplication, QFileDialog, QMessageBox
+
+import it032_core as core
+import it032_metrics as metrics
+import it032_safety as safety
+
+PERIODO_REAL = 0.5  # segundos entre muestras del equipo real
+LOOP_PROBE_MS = 50  # periodo del temporizador que mide la latencia del bucle
+PROGRAMA_HEAT = [0, 100, 200, 150, 60]  # consignas que se van alternando
+PROGRAMA_FAN = [120, 200, 80]
+
+
+# ---------------------------------------------------------
+# EQUIPO SIMULADO
+# ---------------------------------------------------------
+class SimulatedDevice:
+    """Puerto serie falso: responde a FAN/HEAT con una respuesta de primer orden."""
+
+    is_open = True
+
+    def __init__(self, periodo=PERIODO_REAL, replay=None):
+        self.periodo = periodo
+        self.n = 0
+        self.heat = 0
+        self.fan = 0
+        self.te, self.ts, self.tc, self.vel = 21.0, 21.5, 22.0, 0.0
+        self._replay = self._filas_replay(replay) if replay else None
+
+    @property
+    def t_simulado(self):
+        return self.n * self.periodo
+
+    def _filas_replay(self, path):
+        from it032_session_file import SessionFile
+
+        with SessionFile(path) as f:
+            bloques = [f.leer_bloque(i) for i in range(len(f.indice))]
+        while True:
+            for b in bloques:
+                for i in range(len(b["t"])):
+                    yield [float(b[c][i]) for c in ("te", "ts", "tc", "vel", "pot")]
+
+    def _modelo(self):
+        dt = self.periodo
+        vel_obj = self.fan / 255 * 3.0
+        tc_obj = 22.0 + self.heat / 255 * 100.0 / (1.0 + 0.3 * self.vel)
+        self.vel += (vel_obj - self.vel) * dt / 5.0
+        self.tc += (tc_obj - self.tc) * dt / 120.0
+        self.ts += (21.0 + (self.tc - 22.0) * 0.3 - self.ts) * dt / 60.0
+        ruido = random.gauss
+        return [
+            self.te + ruido(0, 0.05),
+            self.ts + ruido(0, 0.05),
+            self.tc + ruido(0, 0.1),
+            max(0.0, self.vel + ruido(0, 0.02)),
+            self.heat / 255 * 100.0,
+        ]
+
+    def readline(self):
+        self.n += 1
+        te, ts, tc, vel, pot = next(self._replay) if self._replay else self._modelo()
+        # El equipo envía TS y TE intercambiados (leer_linea los vuelve a cambiar)
+        return f"{ts:.2f}\t{te:.2f}\t{tc:.2f}\t{vel:.2f}\t{pot:.2f}\n".encode()
+
+    def write(self, data):
+        tipo, valor = data[:-4].decode(), int(data[-4:-1])
+        if tipo == "HEAT":
+            self.heat = valor
+        elif tipo == "FAN":
+            self.fan = valor
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+def acelerar_reglas(reglas, speed):
+    """Escala los tiempos de las reglas de seguridad al ritmo de la simulación.
+
+    El watchdog se deja en tiempo real: mide paradas reales del hilo lector.
+    """
+    for regla in reglas:
+        if isinstance(regla, safety.ReglaPendiente):
+            regla.limite *= speed
+            regla.ventana /= speed
+        if not isinstance(regla, safety.ReglaWatchdog):
+            regla.hold_s /= speed
+    return reglas
+
+
+# ---------------------------------------------------------
+# PRUEBA
+# ---------------------------------------------------------
+class SoakTest:
+    def __init__(self, args):
+        self.args = args
+        self.checkpoints = []
+        self.fallos = []
+        self._proxima = {"save": 0.0, "export": 0.0, "consigna": 0.0, "checkpoint": 3600.0}
+        self._paso = 0
+        self._t_sonda = None
+        self._t_inicio = None
+
+    def preparar(self):
+        import it032_gui as gui
+
+        a = self.args
+        # Diálogos modales fuera: la prueba no tiene a nadie que pulse "Aceptar"
+        QMessageBox.information = staticmethod(lambda *x, **k: None)
+        QMessageBox.warning = staticmethod(lambda *x, **k: print("⚠️", *x[1:]))
+        QMessageBox.critical = staticmethod(lambda *x, **k: print("❌", *x[1:]))
+        self.excel = os.path.join(WORK_DIR, "export.xlsx")
+        QFileDialog.getSaveFileName = staticmethod(lambda *x, **k: (self.excel, ""))
+
+        self.device = SimulatedDevice(PERIODO_REAL, a.replay)
+        core.detectar_puerto = lambda: "SIM"
+        core.serial.Serial = lambda *x, **k: self.device
+        core.READ_DELAY = PERIODO_REAL / a.speed
+        cargar = safety.cargar_reglas
+        safety.cargar_reglas = lambda *x, **k: acelerar_reglas(cargar(*x, **k), a.speed)
+
+        metrics.METRICS_FILE = os.path.join(WORK_DIR, "metricas.json")
+        metrics.activar()
+        self.w = gui.MainWindow()
+        self.w.show()  # con "offscreen" también se pinta: el repintado entra en la medida
+        self.w.conectar()
+        self.w.iniciar_lectura()
+
+        self.timer = QTimer()
+        self.timer.setInterval(LOOP_PROBE_MS)
+        self.timer.timeout.connect(self.tick)
+        self._t_sonda = self._t_inicio = time.perf_counter()
+        self.timer.start()
+
+    def tick(self):
+        ahora = time.perf_counter()
+        metrics.registrar("bucle_eventos", max(0.0, ahora - self._t_sonda - LOOP_PROBE_MS / 1e3))
+        self._t_sonda = ahora
+
+        t = self.device.t_simulado
+        a = self.args
+        if t >= self._proxima["consigna"]:
+            self._proxima["consigna"] += a.step_min * 60
+            self.w.slider_heat.setValue(PROGRAMA_HEAT[self._paso % len(PROGRAMA_HEAT)])
+            self.w.dial_fan.setValue(PROGRAMA_FAN[self._paso % len(PROGRAMA_FAN)])
+            self._paso += 1
+        if t >= self._proxima["save"]:
+            self._proxima["save"] += a.save_min * 60
+            self._medir("guardar_dato", self.w.guardar_dato)
+        if t >= self._proxima["export"] and t > 0:
+            self._proxima["export"] += a.export_h * 3600
+            self._medir("export_excel", self.w.export_excel)
+        if t >= self._proxima["checkpoint"]:
+            self._proxima["checkpoint"] += 3600
+            self.checkpoint(t)
+        if t >= a.hours * 3600:
+            self.terminar()
+        self._t_sonda = time.perf_counter()  # el trabajo de la sonda no cuenta como latencia
+
+    @staticmethod
+    def _medir(etapa, funcion):
+        t0 = time.perf_counter()
+        funcion()
+        metrics.registrar(etapa, time.perf_counter() - t0)
+
+    def checkpoint(self, t):
+        inst = metrics.instantanea()
+        e = inst["etapas"]
+
+        def p(etapa, q):
+            return e.get(etapa, {}).get(q, 0.0)
+
+        fila = {
+            "hora_sim": round(t / 3600, 2),
+            "real_s": round(time.perf_counter() - self._t_inicio, 1),
+            "muestras": self.device.n,
+            "puntos_grafica": sum(len(s) for s in self.w.series.values()),
+            "rss_mb": round(inst["rss_mb"] or 0.0, 1),
+            "bucle_p99_ms": round(p("bucle_eventos", "p99_ms"), 2),
+            "bucle_max_ms": round(p("bucle_eventos", "max_ms"), 2),
+            "gui_p50_ms": round(p("actualizar_datos", "p50_ms") + p("plot.setData", "p50_ms"), 3),
+            "gui_p99_ms": round(p("actualizar_datos", "p99_ms") + p("plot.setData", "p99_ms"), 3),
+            "lector_p99_ms": round(p("filtros+seguridad", "p99_ms"), 3),
+            "pendientes": inst["colas"].get("grafica", 0),
+            "escritura_db": inst["colas"].get("escritura_db", 0),
+            "disparos": len(self.w.safety.disparos),
+        }
+        self.checkpoints.append(fila)
+        print(
+            f"h{fila['hora_sim']:5.1f} | {fila['real_s']:7.1f} s | RSS {fila['rss_mb']:7.1f} MB | "
+            f"bucle p99 {fila['bucle_p99_ms']:7.2f} ms | GUI p50 {fila['gui_p50_ms']:7.3f} "
+            f"p99 {fila['gui_p99_ms']:7.3f} ms | pendientes {fila['pendientes']:6d} | "
+            f"puntos {fila['puntos_grafica']}"
+        )
+        # Cada hora se mide por separado
+        metrics.reiniciar()
+
+    def terminar(self):
+        self.timer.stop()
+        w = self.w
+        w.slider_heat.setValue(0)
+        w.dial_fan.setValue(0)
+        w.detener_lectura()
+        w.n_guardados = 0  # ya exportado: sin diálogo de confirmación al cerrar
+        t0 = time.perf_counter()
+        w.close()
+        self.cierre_s = time.perf_counter() - t0
+        print(f"Cierre (incluye archivar la sesión): {self.cierre_s:.2f} s")
+        QApplication.instance().quit()
+
+    def evaluar(self):
+        a = self.args
+        if len(self.checkpoints) < 2:
+            self.fallos.append("la prueba es demasiado corta (hacen falta al menos 2 horas simuladas)")
+            return
+        base, ultimo = self.checkpoints[0], self.checkpoints[-1]
+        crecimiento = ultimo["rss_mb"] - base["rss_mb"]
+        if crecimiento > a.max_rss_growth_mb:
+            self.fallos.append(f"RSS creció {crecimiento:.1f} MB (> {a.max_rss_growth_mb})")
+        peor = max(c["bucle_p99_ms"] for c in self.checkpoints)
+        if peor > a.max_loop_p99_ms:
+            self.fallos.append(f"latencia p99 del bucle {peor:.1f} ms (> {a.max_loop_p99_ms})")
+        if base["gui_p50_ms"] > 0:
+            ratio = ultimo["gui_p50_ms"] / base["gui_p50_ms"]
+            if ratio > a.max_cost_ratio:
+                self.fallos.append(
+                    f"coste por muestra en la GUI x{ratio:.1f} respecto a la 1ª hora (> x{a.max_cost_ratio})"
+                )
+        atasco = max(c["pendientes"] for c in self.checkpoints)
+        if atasco > a.max_backlog:
+            self.fallos.append(f"{atasco} muestras pendientes de la GUI (> {a.max_backlog})")
+
+    def informe(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"args": vars(self.args), "checkpoints": self.checkpoints, "fallos": self.fallos},
+                f, ensure_ascii=False, indent=2,
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de resistencia acelerada IT 03.2")
+    parser.add_argument("--hours", type=float, default=24.0, help="horas simuladas")
+    parser.add_argument("--speed", type=float, default=100.0, help="veces más rápido que el real")
+    parser.add_argument("--replay", help="fichero .it32s a reproducir en vez del modelo")
+    parser.add_argument("--save-min", type=float, default=5.0, help="guardar un punto cada N min")
+    parser.add_argument("--export-h", type=float, default=2.0, help="exportar a Excel cada N h")
+    parser.add_argument("--step-min", type=float, default=30.0, help="cambio de consigna cada N min")
+    parser.add_argument("--max-rss-growth-mb", type=float, default=150.0)
+    parser.add_argument("--max-loop-p99-ms", type=float, default=100.0)
+    parser.add_argument("--max-cost-ratio", type=float, default=3.0)
+    parser.add_argument("--max-backlog", type=int, default=200)
+    parser.add_argument("--report", help="guardar las mediciones en este JSON")
+    args = parser.parse_args()
+
+    app = QApplication(sys.argv)
+    prueba = SoakTest(args)
+    prueba.preparar()
+    print(f"Prueba de resistencia: {args.hours} h a x{args.speed:g} en {WORK_DIR}")
+    app.exec()
+
+    prueba.evaluar()
+    if args.report:
+        prueba.informe(args.report)
+    if prueba.fallos:
+        print("❌ FALLO:\n  - " + "\n  - ".join(prueba.fallos))
+        sys.exit(1)
+    print("✅ Dentro de los límites")
+
+
+if __name__ == "__main__":
+    main()
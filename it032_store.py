@@ -0,0 +1,931 @@
+# it032_store.py - almacén local SQLite de prácticas (espejo del esquema del servidor)
+# -------------------------------------------------------
+# - Tablas machines / practices equivalentes a las de la API Laravel
+# - Marcas de tiempo numéricas (segundos epoch) indexadas por máquina y tiempo
+# - Modo WAL: la GUI puede leer mientras el hilo escritor inserta
+# - Inserciones agrupadas en lotes desde un hilo escritor dedicado
+# - Resumen por práctica y por escalón (medias de régimen, h, avisos) que se
+#   calcula al cerrar cada sesión: las consultas del profesor no recorren
+#   las muestras
+# - Retención por niveles: las sesiones antiguas se compactan en intervalos
+#   con mínimo/media/máximo (practices_agg, ver it032_retention) y las
+#   lecturas por rango devuelven la media de esos intervalos donde ya no
+#   quedan muestras originales
+
+import os
+import sqlite3
+import threading
+import queue
+import time
+import uuid
+from datetime import datetime
+
+import numpy as np
+
+import it032_analysis as analysis
+
+DB_PATH = os.environ.get("IT032_DB", "practicas.db")
+MACHINE_SERIAL = "DKT032"
+MACHINE_MODEL = "IT03.2"
+BATCH_SIZE = 50  # filas por transacción
+FLUSH_INTERVAL = 1.0  # segundos máximos antes de confirmar un lote incompleto
+READ_CHUNK = 500  # filas por página en las lecturas por rango
+
+CANALES = ("te", "ts", "tp", "vel", "pot")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS machines (
+    id INTEGER PRIMARY KEY,
+    serial_number TEXT NOT NULL UNIQUE,
+    model TEXT
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    machine_id INTEGER NOT NULL REFERENCES machines(id),
+    started_at REAL NOT NULL,
+    ended_at REAL
+);
+CREATE TABLE IF NOT EXISTS practices (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    machine_id INTEGER NOT NULL REFERENCES machines(id),
+    session_id INTEGER REFERENCES sessions(id),
+    timestamp REAL NOT NULL,
+    te REAL,
+    ts REAL,
+    tp REAL,
+    vel REAL,
+    pot REAL,
+    saved INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_practices_machine_time
+    ON practices(machine_id, timestamp);
+CREATE INDEX IF NOT EXISTS idx_practices_session
+    ON practices(session_id, saved, timestamp);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    machine_id INTEGER NOT NULL REFERENCES machines(id),
+    session_id INTEGER REFERENCES sessions(id),
+    timestamp REAL NOT NULL,
+    kind TEXT NOT NULL,
+    value REAL,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_events_session
+    ON events(session_id, timestamp);
+CREATE TABLE IF NOT EXISTS session_summary (
+    session_id INTEGER PRIMARY KEY REFERENCES sessions(id),
+    machine_id INTEGER NOT NULL REFERENCES machines(id),
+    started_at REAL NOT NULL,
+    ended_at REAL,
+    samples INTEGER NOT NULL,
+    steps INTEGER NOT NULL,
+    valid_steps INTEGER NOT NULL,
+    h_mean REAL,
+    h_max REAL,
+    re_max REAL,
+    nu_mean REAL,
+    balance_mean REAL,
+    tp_max REAL,
+    flags TEXT NOT NULL,
+    computed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_summary_machine_time
+    ON session_summary(machine_id, started_at);
+CREATE INDEX IF NOT EXISTS idx_summary_time ON session_summary(started_at);
+CREATE INDEX IF NOT EXISTS idx_summary_h ON session_summary(h_mean);
+CREATE TABLE IF NOT EXISTS step_summary (
+    session_id INTEGER NOT NULL REFERENCES sessions(id),
+    step INTEGER NOT NULL,
+    t0 REAL NOT NULL,
+    duration REAL NOT NULL,
+    heat REAL,
+    fan REAL,
+    samples INTEGER NOT NULL,
+    te REAL,
+    ts REAL,
+    tp REAL,
+    vel REAL,
+    pot REAL,
+    tp_slope REAL,
+    dt_surface REAL,
+    h REAL,
+    re REAL,
+    nu REAL,
+    q_air REAL,
+    balance REAL,
+    flags TEXT NOT NULL,
+    PRIMARY KEY (session_id, step)
+);
+CREATE TABLE IF NOT EXISTS imports (
+    sha256 TEXT PRIMARY KEY,
+    source TEXT NOT NULL,
+    machine_id INTEGER REFERENCES machines(id),
+    rows INTEGER NOT NULL,
+    sessions INTEGER NOT NULL,
+    imported_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS practices_agg (
+    machine_id INTEGER NOT NULL REFERENCES machines(id),
+    session_id INTEGER NOT NULL REFERENCES sessions(id),
+    resolution REAL NOT NULL,
+    timestamp REAL NOT NULL,
+    n INTEGER NOT NULL,
+    te_min REAL, te_mean REAL, te_max REAL,
+    ts_min REAL, ts_mean REAL, ts_max REAL,
+    tp_min REAL, tp_mean REAL, tp_max REAL,
+    vel_min REAL, vel_mean REAL, vel_max REAL,
+    pot_min REAL, pot_mean REAL, pot_max REAL,
+    PRIMARY KEY (session_id, timestamp)
+);
+CREATE INDEX IF NOT EXISTS idx_agg_machine_time ON practices_agg(machine_id, timestamp);
+CREATE TABLE IF NOT EXISTS retention (
+    session_id INTEGER PRIMARY KEY REFERENCES sessions(id),
+    resolution REAL NOT NULL,
+    raw_rows INTEGER NOT NULL,
+    compacted_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS upload_state (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    last_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS upload_batch (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    first_id INTEGER NOT NULL,
+    last_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS install (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    uuid TEXT NOT NULL
+);
+"""
+
+_INSERT_SAMPLE = (
+    "INSERT INTO practices "
+    "(machine_id, session_id, timestamp, te, ts, tp, vel, pot, saved, created_at) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+_INSERT_AGG = (
+    "INSERT INTO practices_agg VALUES (?, ?, ?, ?, ?, "
+    + ", ".join("?" * 3 * len(CANALES)) + ")"
+)
+# Media de cada intervalo compactado (timestamp = centro del intervalo); el
+# id negativo mantiene un orden total (timestamp, id) junto a las originales
+_SELECT_AGG = (
+    "SELECT -rowid, timestamp, te_mean, ts_mean, tp_mean, vel_mean, pot_mean "
+    "FROM practices_agg WHERE "
+)
+_INSERT_EVENT = (
+    "INSERT INTO events (machine_id, session_id, timestamp, kind, value, source) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+
+def conectar_db(path=DB_PATH):
+    """Abre una conexión SQLite configurada para WAL y lecturas concurrentes."""
+    conn = sqlite3.connect(path, timeout=10.0, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+
+def migrar_ids(conn):
+    """Pasa practices.id a AUTOINCREMENT en bases creadas antes de la retención.
+
+    Sin AUTOINCREMENT SQLite reutiliza los ids más altos borrados al compactar,
+    y las filas nuevas quedarían por debajo del cursor de subida sin enviarse
+    nunca. El contador arranca por encima del mayor id usado y del cursor.
+    """
+    sql, = conn.execute(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'practices'"
+    ).fetchone()
+    if "AUTOINCREMENT" not in sql.upper():
+        print("🔧 Migrando practices.id a AUTOINCREMENT...")
+        conn.execute("PRAGMA foreign_keys=OFF")
+        # Un solo script: si algo falla a medias la transacción se deshace entera
+        conn.executescript(
+            "BEGIN;"
+            "ALTER TABLE practices RENAME TO practices_old;"
+            "DROP INDEX IF EXISTS idx_practices_machine_time;"
+            "DROP INDEX IF EXISTS idx_practices_session;"
+            + SCHEMA
+            + "INSERT INTO practices SELECT * FROM practices_old;"
+            "DROP TABLE practices_old;"
+            "COMMIT;"
+        )
+        conn.execute("PRAGMA foreign_keys=ON")
+    ultimo = conn.execute(
+        "SELECT MAX(COALESCE((SELECT MAX(id) FROM practices), 0), "
+        "COALESCE((SELECT last_id FROM upload_state WHERE id = 1), 0))"
+    ).fetchone()[0]
+    fila = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'practices'").fetchone()
+    if fila is None:
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('practices', ?)", (ultimo,))
+    elif fila[0] < ultimo:
+        conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'practices'", (ultimo,))
+    conn.commit()
+
+
+def fecha_hora(timestamp):
+    """Convierte una marca de tiempo numérica a las cadenas Fecha / Hora de la tabla."""
+    dt = datetime.fromtimestamp(timestamp)
+    return dt.strftime("%d/%m/%Y"), dt.strftime("%H:%M:%S")
+
+
+def agregar_intervalos(t, n, minimo, media, maximo, resolucion):
+    """Agrupa filas ordenadas por t en intervalos de `resolucion` s alineados al epoch.
+
+    Cada fila pesa `n` muestras (1 si es original); minimo/media/maximo son
+    (filas, canales) y los NaN no cuentan. Devuelve t (centro del intervalo),
+    n, minimo, media y maximo por intervalo.
+    """
+    inicio = np.floor(np.asarray(t, dtype=float) / resolucion) * resolucion
+    if not len(inicio):
+        vacio = np.empty((0, np.shape(media)[1]))
+        return inicio, inicio.copy(), vacio, vacio.copy(), vacio.copy()
+    cortes = np.concatenate(([0], np.flatnonzero(np.diff(inicio)) + 1))
+    n = np.asarray(n, dtype=float)
+    validos = np.isfinite(media)
+    peso = np.where(validos, n[:, None], 0.0)
+    suma = np.add.reduceat(np.where(validos, media, 0.0) * peso, cortes)
+    cuenta = np.add.reduceat(peso, cortes)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        medias = np.where(cuenta > 0, suma / cuenta, np.nan)
+    return (
+        inicio[cortes] + resolucion / 2,
+        np.add.reduceat(n, cortes),
+        np.fmin.reduceat(minimo, cortes),
+        medias,
+        np.fmax.reduceat(maximo, cortes),
+    )
+
+
+def _leer_continuas(conn, filtros, params):
+    """Registro continuo (originales + intervalos ya compactados) ordenado por tiempo.
+
+    Devuelve ((t, n, mínimo, media, máximo), filas originales); una muestra
+    original es un intervalo con n = 1 y mínimo = media = máximo.
+    """
+    where = " AND ".join(filtros)
+    columnas = ", ".join(CANALES)
+    crudas = conn.execute(
+        f"SELECT timestamp, 1, {columnas}, {columnas}, {columnas} FROM practices "
+        f"WHERE {where} AND saved = 0",
+        params,
+    ).fetchall()
+    previas = conn.execute(
+        "SELECT timestamp, n, " + ", ".join(f"{c}_min" for c in CANALES) + ", "
+        + ", ".join(f"{c}_mean" for c in CANALES) + ", "
+        + ", ".join(f"{c}_max" for c in CANALES) + f" FROM practices_agg WHERE {where}",
+        params,
+    ).fetchall()
+    k = len(CANALES)
+    datos = np.array(crudas + previas, dtype=float).reshape(-1, 2 + 3 * k)
+    datos = datos[np.argsort(datos[:, 0], kind="stable")]
+    return (datos[:, 0], datos[:, 1], datos[:, 2:2 + k], datos[:, 2 + k:2 + 2 * k],
+            datos[:, 2 + 2 * k:]), len(crudas)
+
+
+class PracticeStore:
+    """Almacén de prácticas con un hilo escritor y lecturas por rango."""
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._conn = conectar_db(path)
+        self._conn.executescript(SCHEMA)
+        migrar_ids(self._conn)
+        self._lock = threading.Lock()
+
+        self._cola = queue.Queue()
+        self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer.start()
+
+    # =======================================================
+    # MÁQUINAS Y SESIONES
+    # =======================================================
+    def maquina(self, serial_number=MACHINE_SERIAL, model=MACHINE_MODEL):
+        """Devuelve el id de la máquina, creándola si aún no existe."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id FROM machines WHERE serial_number = ?", (serial_number,)
+            ).fetchone()
+            if row:
+                return row[0]
+            cur = self._conn.execute(
+                "INSERT INTO machines (serial_number, model) VALUES (?, ?)",
+                (serial_number, model),
+            )
+            self._conn.commit()
+            return cur.lastrowid
+
+    def iniciar_sesion(self, machine_id, started_at=None):
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO sessions (machine_id, started_at) VALUES (?, ?)",
+                (machine_id, started_at or time.time()),
+            )
+            self._conn.commit()
+            return cur.lastrowid
+
+    def cerrar_sesion(self, session_id, ended_at=None):
+        self.flush()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE sessions SET ended_at = ? WHERE id = ?",
+                (ended_at or time.time(), session_id),
+            )
+            self._conn.commit()
+        try:
+            self.resumir_sesion(session_id)
+        except Exception as e:
+            print(f"⚠️ No se pudo resumir la sesión {session_id}: {e}")
+
+    # =======================================================
+    # ESCRITURA (no bloqueante)
+    # =======================================================
+    def agregar_muestra(self, machine_id, session_id, timestamp, valores, guardada=False):
+        """Encola una muestra [te, ts, tp, vel, pot]; la inserta el hilo escritor."""
+        te, ts, tp, vel, pot = valores
+        self._cola.put(
+            (_INSERT_SAMPLE,
+             (machine_id, session_id, timestamp, te, ts, tp, vel, pot,
+              1 if guardada else 0, time.time()))
+        )
+
+    def agregar_evento(self, machine_id, session_id, timestamp, tipo, valor, origen=""):
+        """Encola un evento (p. ej. comando FAN/HEAT) en la misma línea de tiempo que las muestras."""
+        self._cola.put(
+            (_INSERT_EVENT, (machine_id, session_id, timestamp, tipo, valor, origen))
+        )
+
+    def agregar_bloque(self, machine_id, session_id, t, valores, guardadas=False):
+        """Inserta muchas muestras de golpe (importaciones): t (n,), valores (n, 5).
+
+        Va directo a la base en una transacción, sin pasar por la cola del
+        hilo escritor. NaN se guarda como NULL.
+        """
+        ahora = time.time()
+        valores = np.asarray(valores, dtype=float)
+        filas = [
+            (machine_id, session_id, ti, *(None if v != v else v for v in fila),
+             1 if guardadas else 0, ahora)
+            for ti, fila in zip(np.asarray(t, dtype=float).tolist(), valores.tolist())
+        ]
+        self.flush()
+        with self._lock:
+            self._conn.executemany(_INSERT_SAMPLE, filas)
+            self._conn.commit()
+
+    def flush(self, timeout=5.0):
+        """Espera a que todo lo encolado hasta ahora esté confirmado en disco."""
+        if not self._writer.is_alive():
+            return
+        hecho = threading.Event()
+        self._cola.put(hecho)
+        hecho.wait(timeout)
+
+    def _writer_loop(self):
+        conn = conectar_db(self.path)
+        lote = {}  # sql -> filas
+        n_lote = 0
+        limite = time.monotonic() + FLUSH_INTERVAL
+        while True:
+            try:
+                item = self._cola.get(timeout=max(0.0, limite - time.monotonic()))
+            except queue.Empty:
+                item = ()  # plazo vencido
+
+            if isinstance(item, tuple) and item:
+                lote.setdefault(item[0], []).append(item[1])
+                n_lote += 1
+                if n_lote < BATCH_SIZE:
+                    continue
+
+            # Lote completo, plazo vencido, barrera de flush o parada
+            if lote:
+                try:
+                    for sql, filas in lote.items():
+                        conn.executemany(sql, filas)
+                    conn.commit()
+                except sqlite3.Error as e:
+                    print(f"⚠️ Error guardando {n_lote} filas: {e}")
+                lote = {}
+                n_lote = 0
+            limite = time.monotonic() + FLUSH_INTERVAL
+
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is None:
+                break
+        conn.close()
+
+    # =======================================================
+    # LECTURA POR RANGOS
+    # =======================================================
+    def iter_muestras(
+        self, machine_id, t0=None, t1=None, session_id=None, guardadas=None, lote=READ_CHUNK
+    ):
+        """Recorre las muestras en orden temporal paginando por (timestamp, id).
+
+        Devuelve tuplas (timestamp, te, ts, tp, vel, pot) sin cargar todo en memoria.
+        """
+        conn = conectar_db(self.path)
+        try:
+            filtros = ["machine_id = ?"]
+            params = [machine_id]
+            if session_id is not None:
+                filtros.append("session_id = ?")
+                params.append(session_id)
+            if guardadas is not None:
+                filtros.append("saved = ?")
+                params.append(1 if guardadas else 0)
+            if t0 is not None:
+                filtros.append("timestamp >= ?")
+                params.append(t0)
+            if t1 is not None:
+                filtros.append("timestamp <= ?")
+                params.append(t1)
+            # Cada parte de la consulta con sus parámetros; el cursor va al final de cada una
+            partes = [(
+                "SELECT id, timestamp, te, ts, tp, vel, pot FROM practices WHERE "
+                + " AND ".join(filtros)
+                + " AND (timestamp > ? OR (timestamp = ? AND id > ?))",
+                params,
+            )]
+            if not guardadas:
+                # Tramos compactados: mismas columnas, con la media de cada intervalo
+                agg = [(f, v) for f, v in zip(filtros, params) if not f.startswith("saved")]
+                partes.append((
+                    _SELECT_AGG + " AND ".join(f for f, _ in agg)
+                    + " AND (timestamp > ? OR (timestamp = ? AND -rowid > ?))",
+                    [v for _, v in agg],
+                ))
+            sql = " UNION ALL ".join(p for p, _ in partes) + " ORDER BY timestamp, id LIMIT ?"
+            cursor = (float("-inf"), float("-inf"), -(2 ** 62))
+            while True:
+                args = [v for _, ps in partes for v in (*ps, *cursor)]
+                filas = conn.execute(sql, (*args, lote)).fetchall()
+                for fila in filas:
+                    yield fila[1:]
+                if len(filas) < lote:
+                    break
+                cursor = (filas[-1][1], filas[-1][1], filas[-1][0])
+        finally:
+            conn.close()
+
+    def eventos(self, machine_id, session_id=None, tipo=None, t0=None, t1=None):
+        """Eventos en orden temporal: tuplas (timestamp, kind, value, source)."""
+        sql = "SELECT timestamp, kind, value, source FROM events WHERE machine_id = ?"
+        params = [machine_id]
+        for cond, valor in (
+            ("session_id = ?", session_id),
+            ("kind = ?", tipo),
+            ("timestamp >= ?", t0),
+            ("timestamp <= ?", t1),
+        ):
+            if valor is not None:
+                sql += " AND " + cond
+                params.append(valor)
+        conn = conectar_db(self.path)
+        try:
+            return conn.execute(sql + " ORDER BY timestamp, id", params).fetchall()
+        finally:
+            conn.close()
+
+    def ventana_evento(self, machine_id, session_id, t_evento, antes_s=10.0, despues_s=60.0):
+        """Muestras continuas alrededor de un evento (rango indexado por sesión y tiempo)."""
+        return list(
+            self.iter_muestras(
+                machine_id,
+                t0=t_evento - antes_s,
+                t1=t_evento + despues_s,
+                session_id=session_id,
+                guardadas=False,
+            )
+        )
+
+    def respuestas_escalon(self, machine_id, session_id, tipo=None, antes_s=10.0, despues_s=60.0):
+        """Para cada evento de la sesión devuelve (evento, muestras alrededor).
+
+        La ventana posterior se recorta al siguiente evento del mismo tipo para
+        que cada tramo contenga una sola respuesta a escalón.
+        """
+        self.flush()
+        evs = self.eventos(machine_id, session_id, tipo)
+        for i, ev in enumerate(evs):
+            fin = despues_s
+            for sig in evs[i + 1:]:
+                if sig[1] == ev[1]:
+                    fin = min(despues_s, sig[0] - ev[0])
+                    break
+            yield ev, self.ventana_evento(machine_id, session_id, ev[0], antes_s, fin)
+
+    def segundos_con_datos(self, machine_id, t0, t1):
+        """Segundos enteros de [t0, t1] que ya tienen alguna muestra de la máquina."""
+        with self._lock:
+            filas = self._conn.execute(
+                "SELECT DISTINCT CAST(timestamp AS INTEGER) FROM practices "
+                "WHERE machine_id = ? AND timestamp >= ? AND timestamp < ?",
+                (machine_id, float(np.floor(t0)), float(np.floor(t1)) + 1.0),
+            ).fetchall()
+            # Los tramos compactados cuentan entero su intervalo
+            intervalos = self._conn.execute(
+                "SELECT timestamp - resolution / 2, resolution FROM practices_agg "
+                "WHERE machine_id = ? AND timestamp + resolution / 2 >= ? AND timestamp - resolution / 2 < ?",
+                (machine_id, float(np.floor(t0)), float(np.floor(t1)) + 1.0),
+            ).fetchall()
+        segundos = np.array([f[0] for f in filas], dtype=np.int64)
+        for inicio, resolucion in intervalos:
+            segundos = np.concatenate(
+                (segundos, np.arange(int(inicio), int(np.ceil(inicio + resolucion)), dtype=np.int64))
+            )
+        return np.unique(segundos) if intervalos else segundos
+
+    def registros_guardados(self, machine_id, session_id):
+        """Puntos guardados con el formato de la tabla: [fecha, hora, te, ts, tc, vel, pot]."""
+        for timestamp, *valores in self.iter_muestras(
+            machine_id, session_id=session_id, guardadas=True
+        ):
+            yield [*fecha_hora(timestamp), *valores]
+
+    # =======================================================
+    # RESÚMENES POR PRÁCTICA
+    # =======================================================
+    # Se calculan una vez por sesión (al cerrarla, o en actualizar_resumenes
+    # para las que quedaron sin resumir) y las consultas solo leen estas tablas.
+    ORDENES = ("started_at", "h_mean", "h_max", "re_max", "nu_mean", "balance_mean",
+               "tp_max", "valid_steps", "samples")
+
+    def resumir_sesion(self, session_id, equipo=None):
+        """Calcula y guarda el resumen de una sesión; devuelve el dict de la fila."""
+        self.flush()
+        with self._lock:
+            sesion = self._conn.execute(
+                "SELECT machine_id, started_at, ended_at FROM sessions WHERE id = ?",
+                (session_id,),
+            ).fetchone()
+            filas = self._conn.execute(
+                "SELECT timestamp, te, ts, tp, vel, pot FROM practices "
+                "WHERE session_id = ? AND saved = 0 ORDER BY timestamp, id",
+                (session_id,),
+            ).fetchall()
+            if not filas:
+                # Sesión ya compactada: se resume con las medias de los intervalos
+                filas = self._conn.execute(
+                    "SELECT timestamp, te_mean, ts_mean, tp_mean, vel_mean, pot_mean "
+                    "FROM practices_agg WHERE session_id = ? ORDER BY timestamp",
+                    (session_id,),
+                ).fetchall()
+            eventos = self._conn.execute(
+                "SELECT timestamp, kind, value, source FROM events "
+                "WHERE session_id = ? ORDER BY timestamp, id",
+                (session_id,),
+            ).fetchall()
+        if sesion is None:
+            raise ValueError(f"la sesión {session_id} no existe")
+        machine_id, started_at, ended_at = sesion
+        datos = np.array(filas, dtype=float).reshape(-1, 6)
+        t = datos[:, 0]
+        columnas = dict(zip(analysis.CANALES, datos[:, 1:].T))
+        escalones = analysis.resumen(
+            t, columnas,
+            [{"t": e[0], "kind": e[1], "value": e[2], "source": e[3]} for e in eventos],
+            equipo or analysis.cargar_equipo(),
+        )
+
+        def media(valores):
+            valores = [v for v in valores if v == v]
+            return sum(valores) / len(valores) if valores else None
+
+        validos = [e for e in escalones if not e["avisos"] and e["h"] == e["h"]]
+        finitos = [e["h"] for e in escalones if e["h"] == e["h"]]
+        resumen = {
+            "session_id": session_id,
+            "machine_id": machine_id,
+            "started_at": started_at,
+            "ended_at": ended_at,
+            "samples": len(t),
+            "steps": len(escalones),
+            "valid_steps": len(validos),
+            "h_mean": media([e["h"] for e in validos]),
+            "h_max": max(finitos) if finitos else None,
+            "re_max": max((e["re"] for e in validos), default=None),
+            "nu_mean": media([e["nu"] for e in validos]),
+            "balance_mean": media([e["balance"] for e in validos]),
+            "tp_max": float(np.nanmax(columnas["tc"])) if len(t) else None,
+            # El tramo inicial con el calefactor apagado no tiene h: no cuenta como aviso
+            "flags": ",".join(sorted({a for e in escalones if e["HEAT"] for a in e["avisos"]})),
+            "computed_at": time.time(),
+        }
+        pasos = [
+            (session_id, e["escalon"], e["t0"], e["duracion_s"], e["HEAT"], e["FAN"], e["n"],
+             e["te"], e["ts"], e["tc"], e["vel"], e["pot"], e["pendiente_tc"],
+             e["dt_superficie"], e["h"], e["re"], e["nu"], e["q_aire"], e["balance"],
+             ",".join(e["avisos"]))
+            for e in escalones
+        ]
+        # NaN -> NULL para que las comparaciones en SQL no den resultados raros
+        pasos = [tuple(None if v != v else v for v in p) for p in pasos]
+        with self._lock:
+            self._conn.execute("DELETE FROM step_summary WHERE session_id = ?", (session_id,))
+            self._conn.executemany(
+                f"INSERT INTO step_summary VALUES ({', '.join('?' * 20)})", pasos
+            )
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO session_summary ({', '.join(resumen)}) "
+                f"VALUES ({', '.join('?' * len(resumen))})",
+                tuple(resumen.values()),
+            )
+            self._conn.commit()
+        return resumen
+
+    def actualizar_resumenes(self):
+        """Resume las sesiones que no tienen resumen o que han cambiado desde entonces."""
+        with self._lock:
+            pendientes = [r[0] for r in self._conn.execute(
+                "SELECT s.id FROM sessions s LEFT JOIN session_summary r ON r.session_id = s.id "
+                "WHERE r.session_id IS NULL OR r.computed_at < s.ended_at"
+            )]
+        equipo = analysis.cargar_equipo()
+        for session_id in pendientes:
+            try:
+                self.resumir_sesion(session_id, equipo)
+            except Exception as e:
+                print(f"⚠️ No se pudo resumir la sesión {session_id}: {e}")
+        return len(pendientes)
+
+    def buscar_practicas(self, serial_number=None, desde=None, hasta=None, h_min=None,
+                         h_max=None, sin_avisos=False, orden="started_at", descendente=True,
+                         limite=50):
+        """Prácticas resumidas que cumplen los filtros, ordenadas por un resultado.
+
+        Devuelve dicts con las columnas de session_summary más serial_number.
+        """
+        if orden not in self.ORDENES:
+            raise ValueError(f"orden no válido: {orden} (use {', '.join(self.ORDENES)})")
+        sql = (
+            "SELECT r.*, m.serial_number FROM session_summary r "
+            "JOIN machines m ON m.id = r.machine_id WHERE 1 = 1"
+        )
+        params = []
+        for cond, valor in (
+            ("m.serial_number = ?", serial_number),
+            ("r.started_at >= ?", desde),
+            ("r.started_at < ?", hasta),
+            ("r.h_mean >= ?", h_min),
+            ("r.h_mean <= ?", h_max),
+        ):
+            if valor is not None:
+                sql += " AND " + cond
+                params.append(valor)
+        if sin_avisos:
+            sql += " AND r.flags = ''"
+        # Los NULL (sin resultado) siempre al final, en cualquier sentido
+        sql += f" ORDER BY r.{orden} IS NULL, r.{orden} {'DESC' if descendente else 'ASC'}"
+        sql += " LIMIT ?"
+        params.append(limite)
+        with self._lock:
+            cur = self._conn.execute(sql, params)
+            nombres = [d[0] for d in cur.description]
+            return [dict(zip(nombres, fila)) for fila in cur.fetchall()]
+
+    def escalones_sesion(self, session_id):
+        """Resumen por escalón de una sesión (dicts con las columnas de step_summary)."""
+        with self._lock:
+            cur = self._conn.execute(
+                "SELECT * FROM step_summary WHERE session_id = ? ORDER BY step", (session_id,)
+            )
+            nombres = [d[0] for d in cur.description]
+            return [dict(zip(nombres, fila)) for fila in cur.fetchall()]
+
+    # =======================================================
+    # RETENCIÓN POR NIVELES (it032_retention decide qué y cuándo)
+    # =======================================================
+    def sesiones_a_compactar(self, terminadas_antes, resolucion, hasta_id=None, limite=100):
+        """Sesiones cerradas antes de `terminadas_antes` que aún tienen más detalle que `resolucion`.
+
+        Con `hasta_id` solo las que ya no tienen filas por encima de ese id
+        (p. ej. el cursor de subida: no se compacta lo que falta por enviar).
+        """
+        sql = (
+            "SELECT s.id FROM sessions s LEFT JOIN retention r ON r.session_id = s.id "
+            "WHERE s.ended_at IS NOT NULL AND s.ended_at < ? AND COALESCE(r.resolution, 0) < ?"
+        )
+        params = [terminadas_antes, resolucion]
+        if hasta_id is not None:
+            sql += " AND NOT EXISTS (SELECT 1 FROM practices p WHERE p.session_id = s.id AND p.id > ?)"
+            params.append(hasta_id)
+        sql += " ORDER BY s.ended_at LIMIT ?"
+        params.append(limite)
+        with self._lock:
+            return [r[0] for r in self._conn.execute(sql, params)]
+
+    def compactar_sesion(self, session_id, resolucion):
+        """Sustituye el registro continuo de la sesión por intervalos de `resolucion` s.
+
+        Parte de las muestras originales o de un nivel más fino ya compactado.
+        Los puntos guardados por el alumno (saved = 1) no se tocan. Devuelve
+        (filas antes, filas después). Trabaja con su propia conexión para no
+        retener el lock de la GUI.
+        """
+        if not self._tiene_resumen(session_id):
+            self.resumir_sesion(session_id)  # después ya no habrá muestras originales
+        conn = conectar_db(self.path)
+        try:
+            machine_id, = conn.execute(
+                "SELECT machine_id FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            datos, n_crudas = _leer_continuas(conn, ["session_id = ?"], [session_id])
+            t, n, minimo, media, maximo = agregar_intervalos(*datos, resolucion)
+            filas = [
+                (machine_id, session_id, resolucion, ti, ni,
+                 *(None if v != v else v for c in range(len(CANALES))
+                   for v in (mn[c], me[c], mx[c])))
+                for ti, ni, mn, me, mx in zip(
+                    t.tolist(), n.astype(int).tolist(), minimo.tolist(), media.tolist(),
+                    maximo.tolist(),
+                )
+            ]
+            previo = conn.execute(
+                "SELECT raw_rows FROM retention WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            with conn:
+                conn.execute("DELETE FROM practices WHERE session_id = ? AND saved = 0", (session_id,))
+                conn.execute("DELETE FROM practices_agg WHERE session_id = ?", (session_id,))
+                conn.executemany(_INSERT_AGG, filas)
+                conn.execute(
+                    "INSERT OR REPLACE INTO retention VALUES (?, ?, ?, ?)",
+                    (session_id, resolucion, previo[0] if previo else n_crudas, time.time()),
+                )
+            return len(datos[0]), len(filas)
+        finally:
+            conn.close()
+
+    def _tiene_resumen(self, session_id):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM session_summary WHERE session_id = ?", (session_id,)
+            ).fetchone() is not None
+
+    def agregados(self, machine_id, resolucion, t0=None, t1=None, session_id=None):
+        """Mínimo/media/máximo por intervalos de `resolucion` s, esté o no compactado el tramo.
+
+        Devuelve arrays (t centro, n, mínimo, media, máximo), los tres últimos
+        (intervalos, 5). Las muestras originales y los niveles más finos se
+        agregan al vuelo, así que sirve igual para sesiones recientes y antiguas.
+        """
+        filtros, params = ["machine_id = ?"], [machine_id]
+        for cond, valor in (("session_id = ?", session_id), ("timestamp >= ?", t0),
+                            ("timestamp <= ?", t1)):
+            if valor is not None:
+                filtros.append(cond)
+                params.append(valor)
+        self.flush()
+        conn = conectar_db(self.path)
+        try:
+            datos, _ = _leer_continuas(conn, filtros, params)
+        finally:
+            conn.close()
+        return agregar_intervalos(*datos, resolucion)
+
+    def espacio(self):
+        """Bytes ocupados de verdad en la base (sin contar páginas libres) y filas por tabla."""
+        with self._lock:
+            pagina = self._conn.execute("PRAGMA page_size").fetchone()[0]
+            total = self._conn.execute("PRAGMA page_count").fetchone()[0]
+            libres = self._conn.execute("PRAGMA freelist_count").fetchone()[0]
+            filas = {
+                tabla: self._conn.execute(f"SELECT COUNT(*) FROM {tabla}").fetchone()[0]
+                for tabla in ("practices", "practices_agg")
+            }
+        return {"usados": (total - libres) * pagina, "fichero": total * pagina, **filas}
+
+    # =======================================================
+    # IMPORTACIONES
+    # =======================================================
+    def hashes_importados(self):
+        """SHA-256 de los ficheros ya importados (para no repetirlos)."""
+        with self._lock:
+            return {f[0] for f in self._conn.execute("SELECT sha256 FROM imports")}
+
+    def registrar_importacion(self, sha256, origen, machine_id, filas, sesiones):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO imports VALUES (?, ?, ?, ?, ?, ?)",
+                (sha256, origen, machine_id, filas, sesiones, time.time()),
+            )
+            self._conn.commit()
+
+    # =======================================================
+    # COLA DE SUBIDA AL SERVIDOR
+    # =======================================================
+    # La propia tabla practices hace de cola duradera: todo id mayor que
+    # upload_state.last_id está pendiente de enviar.
+    def id_instalacion(self):
+        """Identificador único de esta base de datos, creado al primer uso.
+
+        Los ids de practices solo son únicos dentro de una base: si se borra
+        practicas.db o se cambia IT032_DB vuelven a empezar, así que las
+        claves de idempotencia de la subida llevan también este identificador.
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO install (id, uuid) VALUES (1, ?)", (uuid.uuid4().hex,)
+            )
+            self._conn.commit()
+            return self._conn.execute("SELECT uuid FROM install WHERE id = 1").fetchone()[0]
+
+    def cursor_subida(self):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_id FROM upload_state WHERE id = 1"
+            ).fetchone()
+        return row[0] if row else 0
+
+    def avanzar_cursor_subida(self, last_id):
+        """Confirma hasta `last_id`; el lote en vuelo que cubre queda cerrado."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO upload_state (id, last_id) VALUES (1, ?) "
+                "ON CONFLICT(id) DO UPDATE SET last_id = MAX(last_id, excluded.last_id)",
+                (last_id,),
+            )
+            self._conn.execute("DELETE FROM upload_batch WHERE last_id <= ?", (last_id,))
+            self._conn.commit()
+
+    # Lote en vuelo: rango de ids enviado y aún sin confirmar. Si se pierde la
+    # respuesta, el reintento lleva exactamente las mismas filas (y la misma
+    # clave de idempotencia) aunque entretanto hayan llegado más.
+    def lote_en_vuelo(self):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT first_id, last_id FROM upload_batch WHERE id = 1"
+            ).fetchone()
+
+    def fijar_lote_en_vuelo(self, first_id, last_id):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO upload_batch (id, first_id, last_id) VALUES (1, ?, ?)",
+                (first_id, last_id),
+            )
+            self._conn.commit()
+
+    def soltar_lote_en_vuelo(self):
+        """Olvida el lote en vuelo (solo si el servidor lo ha rechazado sin guardarlo)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM upload_batch")
+            self._conn.commit()
+
+    def pendientes_subida(self, limite, desde_id=None, hasta_id=None):
+        """Filas aún no enviadas, en orden de id, junto al número de serie de la máquina."""
+        if desde_id is None:
+            desde_id = self.cursor_subida()
+        sql = (
+            "SELECT p.id, m.serial_number, m.model, p.timestamp, "
+            "p.te, p.ts, p.tp, p.vel, p.pot, p.saved, p.created_at "
+            "FROM practices p JOIN machines m ON m.id = p.machine_id WHERE p.id > ?"
+        )
+        params = [desde_id]
+        if hasta_id is not None:
+            sql += " AND p.id <= ?"
+            params.append(hasta_id)
+        with self._lock:
+            return self._conn.execute(sql + " ORDER BY p.id LIMIT ?", params + [limite]).fetchall()
+
+    def contar_pendientes(self):
+        desde_id = self.cursor_subida()
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM practices WHERE id > ?", (desde_id,)
+            ).fetchone()[0]
+
+    def contar(self, machine_id, session_id=None, guardadas=None):
+        """Filas que devolvería iter_muestras con los mismos filtros."""
+        sql = "SELECT COUNT(*) FROM practices WHERE machine_id = ?"
+        sql_agg = "SELECT COUNT(*) FROM practices_agg WHERE machine_id = ?"
+        params = [machine_id]
+        if session_id is not None:
+            sql += " AND session_id = ?"
+            sql_agg += " AND session_id = ?"
+            params.append(session_id)
+        params_agg = list(params)
+        if guardadas is not None:
+            sql += " AND saved = ?"
+            params.append(1 if guardadas else 0)
+        self.flush()
+        with self._lock:
+            n = self._conn.execute(sql, params).fetchone()[0]
+            if not guardadas:
+                n += self._conn.execute(sql_agg, params_agg).fetchone()[0]
+            return n
+
+    # =======================================================
+    # CIERRE
+    # =======================================================
+    def cerrar(self):
+        if self._writer.is_alive():
+            self._cola.put(None)
+            self._writer.join(timeout=5.0)
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,637 @@
+# it032_update.py - actualización remota por diferencias (manifiesto de versión)
+# -------------------------------------------------------
+# - El servidor publica manifest.json con la versión y el SHA-256 de cada
+#   fichero; por cada versión anterior puede haber un delta binario
+# - Solo se descargan los ficheros que cambian y, si hay delta desde el
+#   fichero instalado, solo el delta (troceado por contenido: lo que se
+#   desplaza dentro del exe de PyInstaller se sigue reutilizando)
+# - Descarga en un hilo de fondo con reanudación (Range) y verificación por
+#   hash; el arranque nunca espera a la red
+# - Lo descargado queda preparado en actualizacion/ y se aplica al
+#   arrancar la siguiente vez, con diario para terminar si se corta a medias
+# - Un manifiesto con rutas fuera de la instalación (absolutas, con "..")
+#   se rechaza entero antes de descargar o mover nada
+# - Servidor de prueba local y publicador incluidos: python it032_update.py
+
+import hashlib
+import http.client
+import json
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import zlib
+from urllib.parse import urlsplit
+
+import numpy as np
+
+APP_VERSION = "1.0.0"  # versión del código fuente si no hay version.json
+UPDATE_URL = os.environ.get("IT032_UPDATE_URL", "")  # p. ej. "https://servidor/updates"
+MANIFEST_PATH = "/manifest.json"
+VERSION_FILE = "version.json"
+STAGING_DIR = "actualizacion"
+HTTP_TIMEOUT = 15.0
+CHECK_DELAY = 30.0  # segundos tras el arranque antes de la primera comprobación
+CHECK_INTERVAL = 6 * 3600.0
+BACKOFF_MIN = 30.0
+BACKOFF_MAX = 3600.0
+BLOQUE_RED = 64 * 1024
+
+# Troceado por contenido (gear hash sobre una ventana deslizante)
+VENTANA = 32
+CORTE_BITS = 13  # trozo medio ~8 KB
+TROZO_MIN = 2 * 1024
+TROZO_MAX = 64 * 1024
+_BLOQUE_TROCEO = 1 << 22
+_GEAR = np.random.default_rng(0x1732).integers(0, 2 ** 63, 256, dtype=np.uint64)
+DELTA_MAGIC = b"IT32D1\n"
+DELTA_MAX_RATIO = 0.8  # un delta más grande que esto no compensa
+
+
+def directorio_app():
+    """Carpeta de la instalación: junto al exe (PyInstaller) o junto al código."""
+    if getattr(sys, "frozen", False):
+        return os.path.dirname(sys.executable)
+    return os.path.dirname(os.path.abspath(__file__))
+
+
+def sha256_fichero(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for bloque in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def _escribir_json(path, datos):
+    """Escritura atómica: o queda el fichero anterior o el nuevo completo."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(datos, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _leer_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def ruta_segura(base_dir, rel):
+    """Ruta de `rel` dentro de `base_dir`; ValueError si apunta fuera de ella."""
+    if not isinstance(rel, str) or not rel or "\0" in rel:
+        raise ValueError(f"ruta no válida en el manifiesto: {rel!r}")
+    partes = re.split(r"[\\/]", rel)
+    if os.path.isabs(rel) or os.path.splitdrive(rel)[0] or rel[0] in "\\/" or ".." in partes:
+        raise ValueError(f"ruta fuera de la instalación: {rel!r}")
+    base = os.path.realpath(base_dir)
+    path = os.path.realpath(os.path.join(base, rel))
+    if not path.startswith(base + os.sep):
+        raise ValueError(f"ruta fuera de la instalación: {rel!r}")
+    return path
+
+
+def validar_manifiesto(manifiesto, base_dir, staging):
+    """Comprueba versión, rutas y hashes antes de usarlos para nombrar ficheros."""
+    ruta_segura(staging, manifiesto["version"])
+    for rel, info in manifiesto["files"].items():
+        ruta_segura(base_dir, rel)
+        for sha in [info["sha256"], *info.get("deltas", {}), *(
+                d["sha256"] for d in info.get("deltas", {}).values())]:
+            if not re.fullmatch(r"[0-9a-f]{64}", sha):
+                raise ValueError(f"hash no válido en el manifiesto para {rel!r}")
+
+
+def version_instalada(base_dir=None):
+    info = _leer_json(os.path.join(base_dir or directorio_app(), VERSION_FILE))
+    return info["version"] if info else APP_VERSION
+
+
+# ---------------------------------------------------------
+# DELTAS BINARIOS
+# ---------------------------------------------------------
+def trocear(datos):
+    """Divide en trozos por contenido; devuelve los finales de cada trozo.
+
+    Un corte cae donde la suma gear de los últimos VENTANA bytes tiene a cero
+    los bits de la máscara, así que un cambio solo mueve los cortes cercanos.
+    La suma deslizante se saca por bloques con cumsum (aritmética mod 2^64).
+    """
+    b = np.frombuffer(datos, dtype=np.uint8)
+    n = len(b)
+    mascara = np.uint64((1 << CORTE_BITS) - 1)
+    candidatos = []
+    for ini in range(VENTANA - 1, n, _BLOQUE_TROCEO):
+        fin = min(n, ini + _BLOQUE_TROCEO)
+        acum = np.cumsum(_GEAR[b[ini - VENTANA + 1:fin]], dtype=np.uint64)
+        suma = acum[VENTANA - 1:].copy()
+        suma[1:] -= acum[:-VENTANA]
+        candidatos.append(np.flatnonzero(((suma >> np.uint64(40)) & mascara) == 0) + ini + 1)
+    cortes = []
+    ultimo = 0
+    for p in (np.concatenate(candidatos).tolist() if candidatos else []):
+        while p - ultimo > TROZO_MAX:
+            ultimo += TROZO_MAX
+            cortes.append(ultimo)
+        if p - ultimo >= TROZO_MIN:
+            cortes.append(p)
+            ultimo = p
+    while n - ultimo > TROZO_MAX:
+        ultimo += TROZO_MAX
+        cortes.append(ultimo)
+    if n > ultimo:
+        cortes.append(n)
+    return cortes
+
+
+def _trozos(datos):
+    ini = 0
+    for fin in trocear(datos):
+        yield ini, fin - ini
+        ini = fin
+
+
+def crear_delta(viejo, nuevo):
+    """Delta de `viejo` a `nuevo` (bytes): copias del viejo + datos literales."""
+    indice = {}
+    for off, n in _trozos(viejo):
+        indice.setdefault(hashlib.blake2b(viejo[off:off + n], digest_size=16).digest(), (off, n))
+    ops = []
+    literales = bytearray()
+    for off, n in _trozos(nuevo):
+        trozo = nuevo[off:off + n]
+        copia = indice.get(hashlib.blake2b(trozo, digest_size=16).digest())
+        if copia and viejo[copia[0]:copia[0] + n] == trozo:
+            if ops and ops[-1][0] == 0 and ops[-1][1] + ops[-1][2] == copia[0]:
+                ops[-1][2] += n  # copia contigua: se amplía la anterior
+            else:
+                ops.append([0, copia[0], n])
+        else:
+            literales += trozo
+            if ops and ops[-1][0] == 1:
+                ops[-1][1] += n
+            else:
+                ops.append([1, n])
+    cabecera = {
+        "base": hashlib.sha256(viejo).hexdigest(),
+        "destino": hashlib.sha256(nuevo).hexdigest(),
+        "tam": len(nuevo),
+        "ops": ops,
+    }
+    return DELTA_MAGIC + zlib.compress(
+        json.dumps(cabecera, separators=(",", ":")).encode() + b"\n" + bytes(literales), 6
+    )
+
+
+def aplicar_delta(base_path, delta, destino):
+    """Reconstruye `destino` a partir del fichero base; verifica ambos hashes."""
+    if not delta.startswith(DELTA_MAGIC):
+        raise ValueError("delta con formato desconocido")
+    crudo = zlib.decompress(delta[len(DELTA_MAGIC):])
+    fin_cabecera = crudo.index(b"\n")
+    cabecera = json.loads(crudo[:fin_cabecera])
+    literales = memoryview(crudo)[fin_cabecera + 1:]
+    if sha256_fichero(base_path) != cabecera["base"]:
+        raise ValueError(f"{base_path}: no es la versión base del delta")
+    h = hashlib.sha256()
+    pos = 0
+    with open(base_path, "rb") as base, open(destino, "wb") as out:
+        for op in cabecera["ops"]:
+            if op[0] == 0:
+                base.seek(op[1])
+                trozo = base.read(op[2])
+            else:
+                trozo = literales[pos:pos + op[1]]
+                pos += op[1]
+            h.update(trozo)
+            out.write(trozo)
+    if h.hexdigest() != cabecera["destino"]:
+        os.remove(destino)
+        raise ValueError(f"{destino}: hash incorrecto tras aplicar el delta")
+
+
+# ---------------------------------------------------------
+# PUBLICACIÓN (lado servidor)
+# ---------------------------------------------------------
+def _listar(directorio):
+    for raiz, _, ficheros in os.walk(directorio):
+        for nombre in ficheros:
+            path = os.path.join(raiz, nombre)
+            yield os.path.relpath(path, directorio).replace(os.sep, "/"), path
+
+
+def publicar(release_dir, repo_dir, version, anteriores=()):
+    """Prepara en repo_dir los ficheros, los deltas y manifest.json de una versión.
+
+    `anteriores` son carpetas con versiones ya instaladas en los equipos: de
+    cada una se calculan los deltas hacia esta.
+    """
+    manifiesto = {"version": version, "files": {}}
+    for rel, path in _listar(release_dir):
+        with open(path, "rb") as f:
+            nuevo = f.read()
+        sha = hashlib.sha256(nuevo).hexdigest()
+        url = f"files/{version}/{rel}"
+        os.makedirs(os.path.dirname(os.path.join(repo_dir, url)), exist_ok=True)
+        shutil.copyfile(path, os.path.join(repo_dir, url))
+        info = {"sha256": sha, "size": len(nuevo), "url": url, "deltas": {}}
+        for anterior in anteriores:
+            viejo_path = os.path.join(anterior, rel)
+            if not os.path.exists(viejo_path):
+                continue
+            with open(viejo_path, "rb") as f:
+                viejo = f.read()
+            sha_viejo = hashlib.sha256(viejo).hexdigest()
+            if sha_viejo == sha or sha_viejo in info["deltas"]:
+                continue
+            delta = crear_delta(viejo, nuevo)
+            if len(delta) > DELTA_MAX_RATIO * len(nuevo):
+                continue
+            url_delta = f"deltas/{sha_viejo[:16]}-{sha[:16]}.it32d"
+            os.makedirs(os.path.join(repo_dir, "deltas"), exist_ok=True)
+            with open(os.path.join(repo_dir, url_delta), "wb") as f:
+                f.write(delta)
+            info["deltas"][sha_viejo] = {
+                "url": url_delta,
+                "sha256": hashlib.sha256(delta).hexdigest(),
+                "size": len(delta),
+            }
+        manifiesto["files"][rel] = info
+    _escribir_json(os.path.join(repo_dir, "manifest.json"), manifiesto)
+    return manifiesto
+
+
+# ---------------------------------------------------------
+# DESCARGA EN SEGUNDO PLANO
+# ---------------------------------------------------------
+class Updater:
+    """Comprueba el manifiesto y deja preparada la actualización en actualizacion/."""
+
+    def __init__(self, url=UPDATE_URL, base_dir=None, staging=None,
+                 retardo=CHECK_DELAY, intervalo=CHECK_INTERVAL):
+        partes = urlsplit(url)
+        self.https = partes.scheme == "https"
+        self.host = partes.hostname
+        self.port = partes.port
+        self.prefix = partes.path.rstrip("/")
+        self.base_dir = base_dir or directorio_app()
+        self.staging = staging or os.path.join(self.base_dir, STAGING_DIR)
+        self.retardo = retardo
+        self.intervalo = intervalo
+        self.estado = "inactivo"
+        self.preparada = None  # versión lista para aplicar al reiniciar
+        self.metricas = {
+            "bytes_descargados": 0,
+            "bytes_completos": 0,  # lo que habría costado bajar los ficheros enteros
+            "reanudaciones": 0,
+            "deltas": 0,
+            "errores": 0,
+        }
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _loop(self):
+        espera = BACKOFF_MIN
+        if self._stop.wait(self.retardo):
+            return
+        while not self._stop.is_set():
+            try:
+                self.comprobar()
+                espera = BACKOFF_MIN
+                self._stop.wait(self.intervalo)
+            except Exception as e:
+                self.metricas["errores"] += 1
+                self.estado = f"error: {e}"
+                print(f"⚠️ Actualización fallida ({e}); reintento en {espera:.0f} s")
+                # Lo ya descargado se conserva en .part y se reanuda en el reintento
+                self._stop.wait(espera * random.uniform(0.8, 1.2))
+                espera = min(BACKOFF_MAX, espera * 2)
+
+    def _conexion(self):
+        cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=HTTP_TIMEOUT)
+
+    def _manifiesto(self):
+        conn = self._conexion()
+        try:
+            conn.request("GET", self.prefix + MANIFEST_PATH)
+            resp = conn.getresponse()
+            data = resp.read()
+        finally:
+            conn.close()
+        if resp.status != 200:
+            raise RuntimeError(f"manifiesto: HTTP {resp.status}")
+        return json.loads(data)
+
+    def _descargar(self, url, sha, size):
+        """Descarga a actualizacion/descargas/<sha> reanudando lo que ya hubiera."""
+        carpeta = os.path.join(self.staging, "descargas")
+        os.makedirs(carpeta, exist_ok=True)
+        final = os.path.join(carpeta, sha)
+        if os.path.exists(final):
+            return final
+        parcial = final + ".part"
+        hecho = os.path.getsize(parcial) if os.path.exists(parcial) else 0
+        cabeceras = {}
+        if 0 < hecho < size:
+            cabeceras["Range"] = f"bytes={hecho}-"
+            self.metricas["reanudaciones"] += 1
+        conn = self._conexion()
+        try:
+            conn.request("GET", f"{self.prefix}/{url}", headers=cabeceras)
+            resp = conn.getresponse()
+            if resp.status == 200:
+                modo = "wb"  # el servidor no admite Range: se empieza de cero
+            elif resp.status == 206:
+                modo = "ab"
+            else:
+                raise RuntimeError(f"{url}: HTTP {resp.status}")
+            with open(parcial, modo) as f:
+                while not self._stop.is_set():
+                    bloque = resp.read(BLOQUE_RED)
+                    if not bloque:
+                        break
+                    f.write(bloque)
+                    self.metricas["bytes_descargados"] += len(bloque)
+        finally:
+            conn.close()
+        if self._stop.is_set() or os.path.getsize(parcial) < size:
+            # Se conserva el .part: la siguiente pasada pide solo lo que falta
+            raise RuntimeError(f"{url}: descarga incompleta")
+        if sha256_fichero(parcial) != sha:
+            os.remove(parcial)
+            raise RuntimeError(f"{url}: hash incorrecto, se descartará la descarga")
+        os.replace(parcial, final)
+        return final
+
+    def comprobar(self):
+        """Una pasada completa; devuelve la versión preparada o None si está al día."""
+        self.estado = "comprobando"
+        manifiesto = self._manifiesto()
+        validar_manifiesto(manifiesto, self.base_dir, self.staging)
+        version = manifiesto["version"]
+        if version == version_instalada(self.base_dir):
+            self.estado = "al día"
+            return None
+        listo = _leer_json(os.path.join(self.staging, "listo.json"))
+        if listo and listo["version"] == version:
+            self.preparada = version
+            return version
+
+        self.estado = f"descargando {version}"
+        carpeta = os.path.join(self.staging, version)
+        ficheros = {}
+        self.metricas["bytes_completos"] = 0
+        for rel, info in manifiesto["files"].items():
+            local = os.path.join(self.base_dir, rel)
+            sha_local = sha256_fichero(local) if os.path.exists(local) else None
+            if sha_local == info["sha256"]:
+                continue
+            destino = os.path.join(carpeta, rel)
+            ficheros[rel] = info["sha256"]
+            self.metricas["bytes_completos"] += info["size"]
+            if os.path.exists(destino) and sha256_fichero(destino) == info["sha256"]:
+                continue  # preparado en una pasada anterior
+            os.makedirs(os.path.dirname(destino), exist_ok=True)
+            delta = info.get("deltas", {}).get(sha_local)
+            if delta:
+                path = self._descargar(delta["url"], delta["sha256"], delta["size"])
+                with open(path, "rb") as f:
+                    aplicar_delta(local, f.read(), destino + ".tmp")
+                self.metricas["deltas"] += 1
+            else:
+                path = self._descargar(info["url"], info["sha256"], info["size"])
+                shutil.copyfile(path, destino + ".tmp")
+            os.replace(destino + ".tmp", destino)
+
+        _escribir_json(os.path.join(self.staging, "listo.json"),
+                       {"version": version, "files": ficheros})
+        shutil.rmtree(os.path.join(self.staging, "descargas"), ignore_errors=True)
+        self.preparada = version
+        self.estado = f"versión {version} lista"
+        print(f"🔄 Versión {version} descargada; se aplicará en el próximo arranque")
+        return version
+
+
+# ---------------------------------------------------------
+# APLICACIÓN AL ARRANCAR
+# ---------------------------------------------------------
+def aplicar_pendiente(base_dir=None, staging=None):
+    """Instala la actualización preparada, si la hay. Devuelve la versión o None.
+
+    listo.json se renombra a aplicando.json antes de tocar nada: si el proceso
+    se corta a medias, el siguiente arranque termina de mover lo que falte.
+    """
+    base_dir = base_dir or directorio_app()
+    staging = staging or os.path.join(base_dir, STAGING_DIR)
+    diario = os.path.join(staging, "aplicando.json")
+    listo = os.path.join(staging, "listo.json")
+    if not os.path.exists(diario):
+        if not os.path.exists(listo):
+            _borrar_restos(base_dir)
+            return None
+        os.replace(listo, diario)
+    plan = _leer_json(diario)
+    try:
+        carpeta = ruta_segura(staging, plan["version"])
+        for rel in plan["files"]:
+            ruta_segura(base_dir, rel)
+            ruta_segura(carpeta, rel)
+    except ValueError as e:
+        print(f"⚠️ Actualización descartada sin aplicar: {e}")
+        os.remove(diario)
+        return None
+    for rel in plan["files"]:
+        origen = os.path.join(carpeta, rel)
+        if not os.path.exists(origen):
+            continue  # ya movido antes del corte
+        destino = os.path.join(base_dir, rel)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        if os.path.exists(destino):
+            # En Windows el exe en marcha se puede renombrar pero no sobrescribir
+            os.replace(destino, destino + ".old")
+        os.replace(origen, destino)
+    anterior = _leer_json(os.path.join(base_dir, VERSION_FILE)) or {}
+    _escribir_json(os.path.join(base_dir, VERSION_FILE), {
+        "version": plan["version"],
+        "files": sorted(set(anterior.get("files", [])) | set(plan["files"])),
+    })
+    shutil.rmtree(carpeta, ignore_errors=True)
+    os.remove(diario)
+    _borrar_restos(base_dir)
+    print(f"✅ Actualizado a la versión {plan['version']}")
+    return plan["version"]
+
+
+def _borrar_restos(base_dir):
+    """Quita los .old de la actualización anterior (el exe viejo ya no está en uso)."""
+    for rel in (_leer_json(os.path.join(base_dir, VERSION_FILE)) or {}).get("files", []):
+        try:
+            os.remove(ruta_segura(base_dir, rel) + ".old")
+        except (OSError, ValueError):
+            pass
+
+
+def relanzar():
+    """Arranca de nuevo la aplicación (ya con los ficheros nuevos) y sale."""
+    if getattr(sys, "frozen", False):
+        subprocess.Popen([sys.executable, *sys.argv[1:]])
+    else:
+        subprocess.Popen([sys.executable, *sys.argv])
+    sys.exit(0)
+
+
+# ---------------------------------------------------------
+# SERVIDOR DE PRUEBA LOCAL
+# ---------------------------------------------------------
+def servidor_prueba(directorio, port=0, cortar_tras=None):
+    """Sirve `directorio` por HTTP con soporte de Range.
+
+    Si `cortar_tras` tiene un valor, la primera descarga de cada fichero más
+    grande se corta tras ese número de bytes (para probar la reanudación).
+    Devuelve (server, peticiones).
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    peticiones = []
+    cortados = set()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            path = os.path.join(directorio, self.path.lstrip("/"))
+            peticiones.append((self.path, self.headers.get("Range")))
+            if not os.path.isfile(path):
+                self.send_response(404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            with open(path, "rb") as f:
+                data = f.read()
+            ini = 0
+            rango = self.headers.get("Range")
+            if rango and rango.startswith("bytes="):
+                ini = int(rango[6:].split("-")[0])
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {ini}-{len(data) - 1}/{len(data)}")
+            else:
+                self.send_response(200)
+            cuerpo = data[ini:]
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            if cortar_tras is not None and len(cuerpo) > cortar_tras and self.path not in cortados:
+                cortados.add(self.path)
+                self.wfile.write(cuerpo[:cortar_tras])
+                self.close_connection = True
+                return
+            self.wfile.write(cuerpo)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, peticiones
+
+
+def main():
+    """Prueba de extremo a extremo contra el servidor local: python it032_update.py
+
+    Uso como publicador: python it032_update.py publicar release/ repo/ 1.1.0 [anterior/ ...]
+    """
+    import tempfile
+
+    if len(sys.argv) > 4 and sys.argv[1] == "publicar":
+        m = publicar(sys.argv[2], sys.argv[3], sys.argv[4], sys.argv[5:])
+        print(f"✅ Publicada la versión {m['version']} ({len(m['files'])} ficheros)")
+        return
+
+    rng = np.random.default_rng(7)
+    with tempfile.TemporaryDirectory() as tmp:
+        v1, v2, repo, inst = (os.path.join(tmp, d) for d in ("v1", "v2", "repo", "inst"))
+        for d in (v1, v2, repo):
+            os.makedirs(os.path.join(d, "datos"), exist_ok=True)
+        # "exe" de 8 MB poco compresible; la v2 inserta y cambia unos bloques
+        exe = rng.integers(0, 256, 8 << 20, dtype=np.uint8).tobytes()
+        exe2 = exe[:1_000_000] + rng.integers(0, 256, 5000, dtype=np.uint8).tobytes() + exe[1_000_000:]
+        exe2 = exe2[:5_000_000] + b"\x00" * 20000 + exe2[5_020_000:]
+        for d, contenido, texto in ((v1, exe, "es"), (v2, exe2, "es, en")):
+            with open(os.path.join(d, "it032_gui.exe"), "wb") as f:
+                f.write(contenido)
+            with open(os.path.join(d, "datos", "translations.json"), "w") as f:
+                f.write(json.dumps({"idiomas": texto}))
+            with open(os.path.join(d, "style.qss"), "w") as f:
+                f.write("QWidget { color: black; }")
+        shutil.copytree(v1, inst)
+
+        t = time.perf_counter()
+        manifiesto = publicar(v2, repo, "1.1.0", [v1])
+        print(f"📦 Publicada 1.1.0 en {time.perf_counter() - t:.2f} s")
+        server, peticiones = servidor_prueba(repo, cortar_tras=16_000)
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+
+        up = Updater(url, base_dir=inst, retardo=0)
+        for _ in range(3):  # la primera pasada se corta a propósito
+            try:
+                up.comprobar()
+                break
+            except Exception as e:
+                print(f"   pasada interrumpida ({e}); se reanuda")
+        version = aplicar_pendiente(inst)
+        server.shutdown()
+
+        iguales = all(
+            sha256_fichero(os.path.join(inst, rel)) == info["sha256"]
+            for rel, info in manifiesto["files"].items()
+        )
+        m = up.metricas
+        print(f"{'✅' if iguales and version == '1.1.0' else '❌'} Instalada {version_instalada(inst)}: "
+              f"{m['bytes_descargados'] / 1024:.0f} KB descargados de "
+              f"{m['bytes_completos'] / 1024:.0f} KB ({m['deltas']} deltas, "
+              f"{m['reanudaciones']} reanudaciones)")
+        print(f"   peticiones: {peticiones}")
+
+        # Manifiesto manipulado: rutas fuera de la instalación
+        fuera = os.path.join(tmp, "fuera.txt")
+        for rel in ("../fuera.txt", fuera, "datos/../../fuera.txt"):
+            malo = {"version": "6.6.6", "files": {rel: dict(manifiesto["files"]["style.qss"])}}
+            _escribir_json(os.path.join(repo, "manifest.json"), malo)
+            server, _ = servidor_prueba(repo)
+            up = Updater(f"http://127.0.0.1:{server.server_address[1]}", base_dir=inst, retardo=0)
+            try:
+                up.comprobar()
+                rechazado = False
+            except ValueError:
+                rechazado = True
+            server.shutdown()
+            # El mismo plan ya preparado (p. ej. listo.json de una versión antigua)
+            staging = os.path.join(inst, STAGING_DIR)
+            os.makedirs(staging, exist_ok=True)
+            _escribir_json(os.path.join(staging, "listo.json"), {"version": "6.6.6", "files": [rel]})
+            aplicado = aplicar_pendiente(inst)
+            ok = rechazado and aplicado is None and not os.path.exists(fuera)
+            print(f"{'✅' if ok else '❌'} Ruta {rel!r} rechazada "
+                  f"(descarga: {rechazado}, aplicación: {aplicado is None})")
+
+
+if __name__ == "__main__":
+    main()
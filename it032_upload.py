@@ -0,0 +1,387 @@
+# it032_upload.py - subida por lotes de las prácticas al servidor (/api/practices)
+# -------------------------------------------------------
+# - Lee las filas no enviadas del almacén local (cola duradera en SQLite)
+# - Las envía en lotes JSON comprimidos con gzip
+# - Reutiliza conexiones keep-alive de un pequeño pool
+# - Clave de idempotencia determinista por lote (reintentos seguros): id de la
+#   instalación (uuid guardado en la base) + primer y último id del lote
+# - El rango del lote en vuelo se guarda junto al cursor: hasta que el servidor
+#   lo confirma se reenvía idéntico, aunque hayan llegado filas nuevas
+# - Reintentos con espera exponencial y métricas de rendimiento
+# - Se ejecuta en un hilo de fondo: la GUI nunca espera a la red
+
+import gzip
+import json
+import os
+import queue
+import random
+import threading
+import time
+import http.client
+from datetime import datetime
+from urllib.parse import urlsplit
+
+SERVER_URL = os.environ.get("IT032_SERVER", "")  # p. ej. "https://servidor/api"
+API_PATH = "/api/practices"
+API_TOKEN = os.environ.get("IT032_TOKEN", "")
+BATCH_ROWS = 500  # filas por petición
+POLL_INTERVAL = 2.0  # segundos entre consultas cuando la cola está vacía
+HTTP_TIMEOUT = 10.0
+BACKOFF_MIN = 1.0
+BACKOFF_MAX = 60.0
+POOL_SIZE = 2
+
+
+# ---------------------------------------------------------
+# POOL DE CONEXIONES KEEP-ALIVE
+# ---------------------------------------------------------
+class ConnectionPool:
+    """Mantiene abiertas unas pocas conexiones HTTP/1.1 al mismo servidor."""
+
+    def __init__(self, url, size=POOL_SIZE, timeout=HTTP_TIMEOUT):
+        partes = urlsplit(url)
+        self.https = partes.scheme == "https"
+        self.host = partes.hostname
+        self.port = partes.port
+        self.prefix = partes.path.rstrip("/")
+        self.timeout = timeout
+        self._libres = queue.LifoQueue(maxsize=size)
+
+    def _nueva(self):
+        cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return cls(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method, path, body=None, headers=None):
+        """Envía una petición y devuelve (status, cuerpo). Reintenta una vez si la
+        conexión reutilizada había sido cerrada por el servidor."""
+        for intento in range(2):
+            try:
+                conn = self._libres.get_nowait()
+                reutilizada = True
+            except queue.Empty:
+                conn = self._nueva()
+                reutilizada = False
+            try:
+                conn.request(method, self.prefix + path, body=body, headers=headers or {})
+                resp = conn.getresponse()
+                data = resp.read()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                if reutilizada and intento == 0:
+                    continue
+                raise
+            if resp.will_close:
+                conn.close()
+            else:
+                try:
+                    self._libres.put_nowait(conn)
+                except queue.Full:
+                    conn.close()
+            return resp.status, data
+
+    def close(self):
+        while True:
+            try:
+                self._libres.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+# ---------------------------------------------------------
+# FORMATO DEL LOTE
+# ---------------------------------------------------------
+def fila_servidor(fila):
+    """Convierte una fila de pendientes_subida al registro de la API Laravel."""
+    _id, _serial, _model, timestamp, te, ts, tp, vel, pot, saved, created_at = fila
+    dt = datetime.fromtimestamp(timestamp)
+    return {
+        "date": dt.strftime("%Y-%m-%d"),
+        "time": dt.strftime("%H:%M:%S.%f")[:-3],
+        "timestamp": timestamp,
+        "te": te,
+        "ts": ts,
+        "tp": tp,
+        "vel": vel,
+        "pot": pot,
+        "saved": bool(saved),
+        "created_at": datetime.fromtimestamp(created_at).isoformat(timespec="milliseconds"),
+    }
+
+
+def construir_lote(filas, instalacion):
+    """Agrupa las filas por máquina y devuelve (cuerpo gzip, clave idempotencia, bytes sin comprimir).
+
+    `instalacion` es el id único de la base local: los ids de fila solos se
+    repiten si la base se vuelve a crear.
+    """
+    maquinas = {}
+    for fila in filas:
+        serial, model = fila[1], fila[2]
+        maq = maquinas.setdefault(
+            serial, {"serial_number": serial, "model": model, "practices": []}
+        )
+        maq["practices"].append(fila_servidor(fila))
+    clave = f"{filas[0][1]}-{instalacion}-{filas[0][0]}-{filas[-1][0]}"
+    raw = json.dumps(
+        {"idempotency_key": clave, "machines": list(maquinas.values())},
+        separators=(",", ":"),
+    ).encode("utf-8")
+    return gzip.compress(raw, compresslevel=6), clave, len(raw)
+
+
+# ---------------------------------------------------------
+# HILO DE SUBIDA
+# ---------------------------------------------------------
+class Uploader:
+    """Vacía la cola de practices hacia el servidor en segundo plano."""
+
+    def __init__(
+        self, store, url=SERVER_URL, token=API_TOKEN, batch_rows=BATCH_ROWS,
+        backoff_min=BACKOFF_MIN,
+    ):
+        self.store = store
+        self.backoff_min = backoff_min
+        self.pool = ConnectionPool(url)
+        self.token = token
+        self.batch_rows = batch_rows
+        self.instalacion = store.id_instalacion()
+        self._stop = threading.Event()
+        self._thread = None
+        self.metricas = {
+            "filas_enviadas": 0,
+            "lotes_enviados": 0,
+            "filas_duplicadas": 0,
+            "lotes_duplicados": 0,
+            "bytes_json": 0,
+            "bytes_gzip": 0,
+            "errores": 0,
+            "reintentos_consecutivos": 0,
+            "ultima_latencia_s": 0.0,
+            "filas_por_s": 0.0,
+            "ultimo_error": "",
+        }
+        self._t_inicio = None
+
+    def start(self):
+        self._stop.clear()
+        self._t_inicio = time.monotonic()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        self.pool.close()
+
+    def pendientes(self):
+        return self.store.contar_pendientes()
+
+    def _cabeceras(self, clave):
+        cab = {
+            "Content-Type": "application/json",
+            "Content-Encoding": "gzip",
+            "Accept": "application/json",
+            "Connection": "keep-alive",
+            "Idempotency-Key": clave,
+        }
+        if self.token:
+            cab["Authorization"] = f"Bearer {self.token}"
+        return cab
+
+    def enviar_pendientes(self):
+        """Envía un lote. Devuelve el número de filas confirmadas (0 si no había)."""
+        en_vuelo = self.store.lote_en_vuelo()
+        if en_vuelo:
+            # Reintento de un lote sin confirmar: mismas filas, misma clave
+            filas = self.store.pendientes_subida(
+                en_vuelo[1] - en_vuelo[0] + 1, desde_id=en_vuelo[0] - 1, hasta_id=en_vuelo[1]
+            )
+            if not filas:
+                self.store.soltar_lote_en_vuelo()
+                return 0
+        else:
+            filas = self.store.pendientes_subida(self.batch_rows)
+            if not filas:
+                return 0
+            self.store.fijar_lote_en_vuelo(filas[0][0], filas[-1][0])
+        cuerpo, clave, n_raw = construir_lote(filas, self.instalacion)
+        t0 = time.monotonic()
+        status, data = self.pool.request("POST", API_PATH, cuerpo, self._cabeceras(clave))
+        latencia = time.monotonic() - t0
+
+        if status == 413 and self.batch_rows > 1:
+            # Lote demasiado grande para el servidor: no lo ha guardado, así
+            # que se puede rehacer más pequeño
+            self.store.soltar_lote_en_vuelo()
+            self.batch_rows = max(1, self.batch_rows // 2)
+            raise RuntimeError(f"HTTP 413, lote reducido a {self.batch_rows} filas")
+        if status == 409:
+            # El servidor ya había procesado esa clave (p. ej. se perdió la
+            # respuesta): se avanza, pero no cuenta como enviado ahora
+            self.store.avanzar_cursor_subida(filas[-1][0])
+            self.metricas["filas_duplicadas"] += len(filas)
+            self.metricas["lotes_duplicados"] += 1
+            print(f"ℹ️ Lote {clave} ya estaba en el servidor (HTTP 409); {len(filas)} filas omitidas")
+            return len(filas)
+        if not 200 <= status < 300:
+            raise RuntimeError(f"HTTP {status}: {data[:200]!r}")
+
+        self.store.avanzar_cursor_subida(filas[-1][0])
+        m = self.metricas
+        m["filas_enviadas"] += len(filas)
+        m["lotes_enviados"] += 1
+        m["bytes_json"] += n_raw
+        m["bytes_gzip"] += len(cuerpo)
+        m["ultima_latencia_s"] = latencia
+        m["filas_por_s"] = m["filas_enviadas"] / max(1e-9, time.monotonic() - self._t_inicio)
+        return len(filas)
+
+    def _loop(self):
+        espera = self.backoff_min
+        while not self._stop.is_set():
+            try:
+                enviadas = self.enviar_pendientes()
+                espera = self.backoff_min
+                self.metricas["reintentos_consecutivos"] = 0
+                if enviadas < self.batch_rows:
+                    self._stop.wait(POLL_INTERVAL)
+            except Exception as e:
+                self.metricas["errores"] += 1
+                self.metricas["reintentos_consecutivos"] += 1
+                self.metricas["ultimo_error"] = str(e)
+                print(f"⚠️ Subida fallida ({e}); reintento en {espera:.0f} s")
+                # Espera exponencial con algo de aleatoriedad para no saturar al volver la red
+                self._stop.wait(espera * random.uniform(0.8, 1.2))
+                espera = min(BACKOFF_MAX, espera * 2)
+
+
+# ---------------------------------------------------------
+# SERVIDOR DE PRUEBA LOCAL
+# ---------------------------------------------------------
+def servidor_prueba(port=0, fallos=0, perdidas=0):
+    """Arranca un servidor HTTP local que imita /api/practices.
+
+    Devuelve (server, recibidas). Las primeras `fallos` peticiones responden 503;
+    de las siguientes, `perdidas` se guardan pero se corta la conexión sin
+    responder (como un corte de red justo después del commit en el servidor).
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    recibidas = {}
+    estado = {"fallos": fallos, "perdidas": perdidas}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            cuerpo = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if estado["fallos"] > 0:
+                estado["fallos"] -= 1
+                self._responder(503, b'{"error":"unavailable"}')
+                return
+            clave = self.headers.get("Idempotency-Key")
+            if clave in recibidas:
+                self._responder(409, b'{"status":"duplicate"}')
+                return
+            if self.headers.get("Content-Encoding") == "gzip":
+                cuerpo = gzip.decompress(cuerpo)
+            recibidas[clave] = json.loads(cuerpo)
+            if estado["perdidas"] > 0:
+                estado["perdidas"] -= 1
+                self.close_connection = True
+                return
+            self._responder(201, b'{"status":"ok"}')
+
+        def _responder(self, status, data):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, recibidas
+
+
+def main():
+    """Prueba de extremo a extremo contra el servidor local: python it032_upload.py"""
+    import tempfile
+    import it032_store as store
+
+    server, recibidas = servidor_prueba(fallos=2)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    # Dos bases distintas con los mismos ids de fila (como tras borrar
+    # practicas.db): el servidor no debe tomar la segunda por un duplicado
+    n = 5000
+    for _ in range(2):
+        with tempfile.TemporaryDirectory() as tmp:
+            st = store.PracticeStore(os.path.join(tmp, "practicas.db"))
+            machine_id = st.maquina()
+            session_id = st.iniciar_sesion(machine_id)
+            t0 = time.time()
+            for i in range(n):
+                st.agregar_muestra(machine_id, session_id, t0 + i * 0.5, [20, 21, 35, 1.5, 40])
+            st.flush()
+
+            up = Uploader(st, url, backoff_min=0.05)
+            up.start()
+            limite = time.monotonic() + 30
+            while up.pendientes() and time.monotonic() < limite:
+                time.sleep(0.05)
+            up.stop()
+            st.cerrar()
+
+    total = sum(
+        len(m["practices"]) for lote in recibidas.values() for m in lote["machines"]
+    )
+    m = up.metricas
+    print(f"{'✅' if total == 2 * n else '❌'} Recibidas {total}/{2 * n} filas de dos bases; "
+          f"la última en {m['lotes_enviados']} lotes "
+          f"({m['errores']} errores reintentados, {m['lotes_duplicados']} duplicados)")
+    print(f"   {m['filas_por_s']:.0f} filas/s, compresión "
+          f"{m['bytes_json'] / max(1, m['bytes_gzip']):.1f}x")
+    server.shutdown()
+
+    # Respuesta perdida con un lote a medias mientras siguen llegando filas:
+    # el reintento debe llevar exactamente el mismo lote (misma clave)
+    server, recibidas = servidor_prueba(perdidas=2)
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    n = 3000
+    with tempfile.TemporaryDirectory() as tmp:
+        st = store.PracticeStore(os.path.join(tmp, "practicas.db"))
+        machine_id = st.maquina()
+        session_id = st.iniciar_sesion(machine_id)
+        t0 = time.time()
+        st.agregar_muestra(machine_id, session_id, t0, [20, 21, 35, 1.5, 40])
+        st.flush()
+        up = Uploader(st, url, backoff_min=0.2)
+        up.start()
+        for i in range(1, n):
+            st.agregar_muestra(machine_id, session_id, t0 + i * 0.5, [20, 21, 35, 1.5, 40])
+            if i % 50 == 0:
+                st.flush()
+                time.sleep(0.02)
+        st.flush()
+        limite = time.monotonic() + 30
+        while up.pendientes() and time.monotonic() < limite:
+            time.sleep(0.05)
+        up.stop()
+        st.cerrar()
+    marcas = [
+        p["timestamp"] for lote in recibidas.values() for m in lote["machines"] for p in m["practices"]
+    ]
+    ok = len(marcas) == len(set(marcas)) == n
+    m = up.metricas
+    print(f"{'✅' if ok else '❌'} Respuestas perdidas: {len(set(marcas))}/{n} filas, "
+          f"{len(marcas) - len(set(marcas))} repetidas en el servidor "
+          f"({m['errores']} errores reintentados, {m['lotes_duplicados']} duplicados)")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,454 @@
+# it032_viewer.py - visor de sesiones grabadas con superposición de varias prácticas
+# -------------------------------------------------------
+# - Abre uno o varios ficheros .it32s y los superpone en los mismos ejes
+# - Alineación por hora real, por inicio de sesión o por un cambio de consigna
+# - Zoom y desplazamiento interactivos: los datos se sirven diezmados (mín/máx
+#   por píxel) desde una caché de teselas con expulsión LRU por memoria, de modo
+#   que comparar diez sesiones largas no las carga enteras
+# - Exportación de las sesiones abiertas remuestreadas en una rejilla común,
+#   con la alineación elegida (it032_resample); el cursor usa el mismo modo
+
+import math
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pyqtgraph as pg
+from PyQt6.QtCore import Qt, QTimer, pyqtSignal
+from PyQt6.QtWidgets import (
+    QWidget,
+    QVBoxLayout,
+    QHBoxLayout,
+    QPushButton,
+    QComboBox,
+    QDoubleSpinBox,
+    QListWidget,
+    QListWidgetItem,
+    QLabel,
+    QFileDialog,
+    QMessageBox,
+)
+
+import it032_session_file as session_file
+import it032_report as report
+import it032_resample as resample
+
+TILE_BUCKETS = 1024  # cubetas (píxeles) por tesela
+CACHE_BYTES = 64 * 1024 * 1024  # memoria máxima de la caché de teselas
+MAX_OPEN_FILES = 16  # ficheros mmap abiertos a la vez
+
+COLORES = [
+    "#E74C3C", "#3498DB", "#27AE60", "#F39C12", "#8E44AD",
+    "#16A085", "#D35400", "#2C3E50", "#C0392B", "#7F8C8D",
+]
+ALINEACIONES = ("wall", "start", "event")
+
+
+# ---------------------------------------------------------
+# CACHÉS
+# ---------------------------------------------------------
+class LRUCache:
+    """Diccionario LRU acotado por memoria (se expulsa lo menos usado)."""
+
+    def __init__(self, max_bytes=CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._datos = OrderedDict()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def get(self, clave):
+        valor = self._datos.get(clave)
+        if valor is None:
+            self.fallos += 1
+            return None
+        self._datos.move_to_end(clave)
+        self.aciertos += 1
+        return valor[0]
+
+    def put(self, clave, valor, nbytes):
+        if clave in self._datos:
+            self.bytes -= self._datos.pop(clave)[1]
+        self._datos[clave] = (valor, nbytes)
+        self.bytes += nbytes
+        while self.bytes > self.max_bytes and len(self._datos) > 1:
+            _, (_, b) = self._datos.popitem(last=False)
+            self.bytes -= b
+
+    def clear(self):
+        self._datos.clear()
+        self.bytes = 0
+
+
+class SessionPool:
+    """Mantiene abiertos como mucho MAX_OPEN_FILES ficheros de sesión (LRU)."""
+
+    def __init__(self, max_open=MAX_OPEN_FILES):
+        self.max_open = max_open
+        self._abiertos = OrderedDict()
+
+    def abrir(self, path):
+        f = self._abiertos.get(path)
+        if f is not None:
+            self._abiertos.move_to_end(path)
+            return f
+        f = session_file.SessionFile(path)
+        self._abiertos[path] = f
+        while len(self._abiertos) > self.max_open:
+            _, viejo = self._abiertos.popitem(last=False)
+            viejo.cerrar()
+        return f
+
+    def cerrar(self):
+        for f in self._abiertos.values():
+            f.cerrar()
+        self._abiertos.clear()
+
+
+class Decimator:
+    """Sirve envolventes mín/máx de un canal a la resolución pedida.
+
+    El eje de tiempo se divide en niveles de potencia de dos segundos por
+    cubeta y cada nivel en teselas de TILE_BUCKETS cubetas; cada tesela se
+    calcula una vez y queda en la caché LRU.
+    """
+
+    def __init__(self, pool=None, cache=None):
+        self.pool = pool or SessionPool()
+        self.cache = cache or LRUCache()
+
+    @staticmethod
+    def nivel(t0, t1, pixeles):
+        ancho = max((t1 - t0) / max(1, pixeles), 1e-3)
+        return 2.0 ** math.ceil(math.log2(ancho))
+
+    def envolvente(self, path, canal, t0, t1, pixeles):
+        """Devuelve (t, ymin, ymax) con como mucho ~2 cubetas por píxel en [t0, t1]."""
+        w = self.nivel(t0, t1, pixeles)
+        span = w * TILE_BUCKETS
+        k0, k1 = int(math.floor(t0 / span)), int(math.floor(t1 / span))
+        partes = [self._tesela(path, canal, w, k) for k in range(k0, k1 + 1)]
+        partes = [p for p in partes if len(p[0])]
+        if not partes:
+            vacio = np.empty(0)
+            return vacio, vacio, vacio
+        t, lo, hi = (np.concatenate(c) for c in zip(*partes))
+        sel = (t >= t0 - w) & (t <= t1 + w)
+        return t[sel], lo[sel], hi[sel]
+
+    def _tesela(self, path, canal, w, k):
+        clave = (path, canal, w, k)
+        tesela = self.cache.get(clave)
+        if tesela is not None:
+            return tesela
+        f = self.pool.abrir(path)
+        ta, tb = k * w * TILE_BUCKETS, (k + 1) * w * TILE_BUCKETS
+        bloques = f.bloques_en(ta, tb)
+        idx = f.indice[bloques.start:bloques.stop]
+        filas = int(idx["n"].sum()) if len(idx) else 0
+        duracion = float(idx["t_max"][-1] - idx["t_min"][0]) if len(idx) else 0.0
+
+        if filas and duracion / max(1, len(idx)) <= w:
+            # Cada bloque cabe en una cubeta: basta el mín/máx del índice
+            t = (idx["t_min"] + idx["t_max"]) / 2
+            b = np.floor((t - ta) / w).astype(np.int64)
+            lo, hi = idx[f"{canal}_min"].astype(float), idx[f"{canal}_max"].astype(float)
+        else:
+            datos = f.rango(ta, tb, [canal])
+            t, y = datos["t"], datos[canal].astype(float)
+            b = np.floor((t - ta) / w).astype(np.int64)
+            lo = hi = y
+
+        if not len(b):
+            tesela = (np.empty(0), np.empty(0), np.empty(0))
+        else:
+            # Mín/máx por cubeta: t está ordenado, así que cada cubeta es un
+            # tramo contiguo y basta un reduceat por extremo
+            b = np.clip(b, 0, TILE_BUCKETS - 1)
+            usados, inicio = np.unique(b, return_index=True)
+            tesela = (
+                ta + (usados + 0.5) * w,
+                np.minimum.reduceat(lo, inicio),
+                np.maximum.reduceat(hi, inicio),
+            )
+        self.cache.put(clave, tesela, sum(a.nbytes for a in tesela))
+        return tesela
+
+
+# ---------------------------------------------------------
+# ALINEACIÓN
+# ---------------------------------------------------------
+def desplazamiento(f, modo, tipo_evento="HEAT"):
+    """Tiempo (epoch) que pasa a ser el cero del eje para esta sesión."""
+    return resample.origen(f.t_inicio, f.metadata.get("events", []), modo, tipo_evento)
+
+
+# ---------------------------------------------------------
+# VENTANA
+# ---------------------------------------------------------
+class HistoryViewer(QWidget):
+    """Visor de sesiones archivadas con superposición, zoom y cursor."""
+
+    # Resultados de los informes de clase (llegan desde el hilo que los recoge)
+    informes_listos = pyqtSignal(list)
+
+    def __init__(self, translations, current_lang, carpeta=session_file.SESSIONS_DIR):
+        super().__init__()
+        t = translations[current_lang]
+        th = t["history"]
+        self.th = th
+        self.carpeta = carpeta
+        self.setWindowTitle(th["title"])
+        self.resize(1200, 700)
+
+        self.decimator = Decimator()
+        self.sesiones = []  # dicts con path, offset y los elementos de la gráfica
+
+        # --- Controles ---
+        self.btn_abrir = QPushButton(th["open"])
+        self.btn_abrir.clicked.connect(self.abrir_sesiones)
+        self.btn_quitar = QPushButton(th["clear"])
+        self.btn_quitar.clicked.connect(self.quitar_sesiones)
+        # Informes de todas las sesiones abiertas, en paralelo entre núcleos
+        self.tr_report = t["report"]
+        self.lang = current_lang
+        self.generador = report.GeneradorInformes()
+        self.btn_informes = QPushButton(t["report"]["class_button"])
+        self.btn_informes.clicked.connect(self.generar_informes)
+        self.informes_listos.connect(self.on_informes_listos)
+
+        self.cmb_canal = QComboBox()
+        for clave, etiqueta in zip(("te", "ts", "tc", "vel", "pot"), t["legend_labels"]):
+            self.cmb_canal.addItem(etiqueta, clave)
+        self.cmb_canal.currentIndexChanged.connect(self.redibujar_todo)
+
+        self.cmb_alinear = QComboBox()
+        for modo in ALINEACIONES:
+            self.cmb_alinear.addItem(th["align"][modo], modo)
+        self.cmb_alinear.currentIndexChanged.connect(self.realinear)
+
+        self.cmb_evento = QComboBox()
+        self.cmb_evento.addItems(["HEAT", "FAN"])
+        self.cmb_evento.currentIndexChanged.connect(self.realinear)
+
+        # Remuestreo para exportar y para leer el cursor
+        self.cmb_modo = QComboBox()
+        for modo in resample.MODOS:
+            self.cmb_modo.addItem(th["modes"][modo], modo)
+        self.cmb_modo.currentIndexChanged.connect(self.actualizar_cursor)
+        self.spin_paso = QDoubleSpinBox()
+        self.spin_paso.setRange(0.1, 600.0)
+        self.spin_paso.setDecimals(1)
+        self.spin_paso.setValue(1.0)
+        self.spin_paso.setSuffix(" s")
+        self.spin_paso.valueChanged.connect(self.actualizar_cursor)
+        self.btn_exportar = QPushButton(th["export"])
+        self.btn_exportar.clicked.connect(self.exportar_alineadas)
+
+        self.lista = QListWidget()
+        self.lista.setFixedWidth(320)
+        self.lista.itemChanged.connect(self.cambiar_visibilidad)
+
+        self.lbl_cursor = QLabel("")
+        self.lbl_cursor.setWordWrap(True)
+
+        # --- Gráfica ---
+        self.etiqueta_x = t["graph_labels"]["x"]
+        self.plot = pg.PlotWidget(axisItems={"bottom": pg.DateAxisItem(orientation="bottom")})
+        self.plot.setBackground("#FFFFFF")
+        self.plot.showGrid(x=True, y=True, alpha=0.3)
+        self.plot.setLabel("bottom", self.etiqueta_x, color="#000000")
+        self.cursor = pg.InfiniteLine(angle=90, movable=True, pen=pg.mkPen("#555", width=1))
+        self.plot.addItem(self.cursor)
+        self.cursor.sigPositionChanged.connect(self.actualizar_cursor)
+
+        # Redibujo diferido: agrupa los eventos de zoom/arrastre en uno cada 40 ms
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(40)
+        self._timer.timeout.connect(self.redibujar_todo)
+        self.plot.getViewBox().sigRangeChanged.connect(lambda *a: self._timer.start())
+
+        # --- Layout ---
+        h_ctrl = QHBoxLayout()
+        h_ctrl.addWidget(self.btn_abrir)
+        h_ctrl.addWidget(self.btn_quitar)
+        h_ctrl.addWidget(self.btn_informes)
+        h_ctrl.addWidget(QLabel(th["channel"]))
+        h_ctrl.addWidget(self.cmb_canal)
+        h_ctrl.addWidget(QLabel(th["align_label"]))
+        h_ctrl.addWidget(self.cmb_alinear)
+        h_ctrl.addWidget(self.cmb_evento)
+        h_ctrl.addWidget(QLabel(th["step"]))
+        h_ctrl.addWidget(self.spin_paso)
+        h_ctrl.addWidget(self.cmb_modo)
+        h_ctrl.addWidget(self.btn_exportar)
+        h_ctrl.addStretch()
+
+        v_izq = QVBoxLayout()
+        v_izq.addWidget(self.lista)
+        v_izq.addWidget(self.lbl_cursor)
+
+        h_main = QHBoxLayout()
+        h_main.addLayout(v_izq)
+        h_main.addWidget(self.plot, stretch=1)
+
+        layout = QVBoxLayout(self)
+        layout.addLayout(h_ctrl)
+        layout.addLayout(h_main)
+
+    # =======================================================
+    # SESIONES
+    # =======================================================
+    def abrir_sesiones(self):
+        paths, _ = QFileDialog.getOpenFileNames(
+            self, self.th["open"], self.carpeta,
+            f"IT 03.2 (*{session_file.EXTENSION})",
+        )
+        for path in paths:
+            self.agregar_sesion(path)
+        self.realinear()
+
+    def agregar_sesion(self, path):
+        try:
+            f = self.decimator.pool.abrir(path)
+        except Exception as e:
+            QMessageBox.warning(self, "Error", f"{os.path.basename(path)}: {e}")
+            return
+        color = COLORES[len(self.sesiones) % len(COLORES)]
+        pen = pg.mkPen(color, width=1.5)
+        curva = self.plot.plot(pen=pen)
+        # Relleno entre mín y máx para que los picos diezmados sigan visibles
+        curva_max = self.plot.plot(pen=pg.mkPen(color, width=0.5))
+        relleno = pg.FillBetweenItem(curva, curva_max, brush=pg.mkBrush(color + "40"))
+        self.plot.addItem(relleno)
+        self.sesiones.append({
+            "path": path, "offset": 0.0, "curva": curva, "curva_max": curva_max,
+            "relleno": relleno,
+        })
+        item = QListWidgetItem(f"{os.path.basename(path)}  ({f.filas} muestras)")
+        item.setForeground(pg.mkColor(color))
+        item.setFlags(item.flags() | Qt.ItemFlag.ItemIsUserCheckable)
+        item.setCheckState(Qt.CheckState.Checked)
+        self.lista.addItem(item)
+
+    def quitar_sesiones(self):
+        for s in self.sesiones:
+            for clave in ("curva", "curva_max", "relleno"):
+                self.plot.removeItem(s[clave])
+        self.sesiones = []
+        self.lista.clear()
+        self.decimator.cache.clear()
+
+    def generar_informes(self):
+        if not self.sesiones:
+            QMessageBox.warning(self, "Error", self.tr_report["no_data"])
+            return
+        self.btn_informes.setEnabled(False)
+        self.btn_informes.setText(self.tr_report["running"])
+        self.generador.generar(
+            [s["path"] for s in self.sesiones], lang=self.lang,
+            al_terminar=self.informes_listos.emit,
+        )
+
+    def on_informes_listos(self, resultados):
+        self.btn_informes.setEnabled(True)
+        self.btn_informes.setText(self.tr_report["class_button"])
+        ok, texto = report.mensaje(resultados, self.tr_report)
+        if ok:
+            QMessageBox.information(self, self.tr_report["class_button"], texto)
+        else:
+            QMessageBox.warning(self, "Error", texto)
+
+    def exportar_alineadas(self):
+        """Todas las sesiones abiertas, todos los canales, en la rejilla común."""
+        if not self.sesiones:
+            QMessageBox.warning(self, "Error", self.tr_report["no_data"])
+            return
+        path, _ = QFileDialog.getSaveFileName(
+            self, self.th["export"], "alineadas.xlsx", "Excel (*.xlsx);;CSV (*.csv)"
+        )
+        if not path:
+            return
+        try:
+            modo = self.cmb_alinear.currentData()
+            sesiones, nombres = [], []
+            for s in self.sesiones:
+                f = self.decimator.pool.abrir(s["path"])
+                datos = f.rango()
+                t = np.asarray(datos.pop("t"), dtype=float)
+                sesiones.append((t, datos, f.metadata.get("events", [])))
+                nombres.append(os.path.splitext(os.path.basename(s["path"]))[0])
+            g, series = resample.alinear(
+                sesiones, self.spin_paso.value(), self.cmb_modo.currentData(),
+                modo, self.cmb_evento.currentText(),
+            )
+            resample.exportar(path, g, series, nombres, hora_real=modo == "wall")
+            QMessageBox.information(self, self.th["export"], path)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", str(e))
+
+    def cambiar_visibilidad(self, item):
+        s = self.sesiones[self.lista.row(item)]
+        visible = item.checkState() == Qt.CheckState.Checked
+        for clave in ("curva", "curva_max", "relleno"):
+            s[clave].setVisible(visible)
+
+    def realinear(self):
+        modo = self.cmb_alinear.currentData()
+        tipo = self.cmb_evento.currentText()
+        self.cmb_evento.setEnabled(modo == "event")
+        for s in self.sesiones:
+            f = self.decimator.pool.abrir(s["path"])
+            s["offset"] = desplazamiento(f, modo, tipo)
+        # En modo hora real el eje muestra fechas; en los demás, segundos relativos
+        eje = pg.DateAxisItem(orientation="bottom") if modo == "wall" else pg.AxisItem("bottom")
+        self.plot.setAxisItems({"bottom": eje})
+        self.plot.setLabel("bottom", self.etiqueta_x, color="#000000")
+        if self.sesiones:
+            ini = min(self.decimator.pool.abrir(s["path"]).t_inicio - s["offset"] for s in self.sesiones)
+            fin = max(self.decimator.pool.abrir(s["path"]).t_fin - s["offset"] for s in self.sesiones)
+            self.plot.setXRange(ini, fin, padding=0.02)
+            self.cursor.setValue(ini)
+        self.redibujar_todo()
+
+    # =======================================================
+    # DIBUJO
+    # =======================================================
+    def redibujar_todo(self):
+        if not self.sesiones:
+            return
+        canal = self.cmb_canal.currentData()
+        (x0, x1), _ = self.plot.getViewBox().viewRange()
+        pixeles = max(100, self.plot.width())
+        for s in self.sesiones:
+            off = s["offset"]
+            t, lo, hi = self.decimator.envolvente(s["path"], canal, x0 + off, x1 + off, pixeles)
+            s["curva"].setData(t - off, lo)
+            s["curva_max"].setData(t - off, hi)
+        self.actualizar_cursor()
+
+    def actualizar_cursor(self):
+        if not self.sesiones:
+            return
+        canal = self.cmb_canal.currentData()
+        x = self.cursor.value()
+        modo = self.cmb_modo.currentData()
+        paso = self.spin_paso.value()
+        lineas = []
+        for i, s in enumerate(self.sesiones):
+            f = self.decimator.pool.abrir(s["path"])
+            t = x + s["offset"]
+            margen = max(5.0, paso)
+            datos = f.rango(t - margen, t + margen, [canal])
+            valor = resample.remuestrear(
+                datos.pop("t"), datos, [t], modo, max_hueco=margen, paso=paso
+            )[canal][0]
+            lineas.append(f"{i + 1}: {valor:.2f}" if np.isfinite(valor) else f"{i + 1}: -")
+        self.lbl_cursor.setText("\n".join(lineas))
+
+    def closeEvent(self, event):
+        self.quitar_sesiones()
+        self.decimator.pool.cerrar()
+        self.generador.cerrar()
+        event.accept()
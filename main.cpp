@@ -62,6 +62,27 @@ const uint8_t MIN_POT_VALUE = 10;
 const uint8_t NUM_READINGS = 10;
 char buf[8];
 
+// --- Modo PC con frecuencia negociada (comando RATE###) ---
+// RATE000 = modo clásico (línea de 5 campos, conversiones bloqueantes).
+// RATE001..RATE020 = canales rápidos (velocidad, potencia) a esa frecuencia en Hz;
+// las temperaturas se convierten en segundo plano y solo se envían cuando hay
+// una lectura nueva. Límite de 20 Hz por el ancho de banda a 9600 baudios.
+// El equipo responde "# RATE n" con la frecuencia que ha aplicado de verdad.
+const uint8_t RATE_MAX_HZ = 20;
+const unsigned long DS18B20_CONV_MS = 750; // conversión a 12 bits
+const unsigned long TC_PERIOD_MS = 250;    // el MAX6675 necesita ~220 ms por conversión
+uint8_t fastRateHz = 0;
+uint8_t pcRateHz = 0; // la negociada con el PC; se recupera al volver al modo PC
+unsigned long lastFastMs = 0;
+unsigned long lastTcMs = 0;
+unsigned long dsRequestedMs = 0;
+bool dsPending = false;
+bool newDs = false;
+bool newTc = false;
+float entryTemp = NAN;
+float exitTemp = NAN;
+float tcTemp = NAN;
+
 int myCustomCommand_DS18B20(unsigned char numInputBytes, unsigned char *input, unsigned char *numResponseByte, unsigned char *response);
 
 int myCustomCommand_Termopar(unsigned char numInputBytes, unsigned char *input, unsigned char *numResponseBytes, unsigned char *response);
@@ -74,6 +95,12 @@ void handleStopped();
 void handleManual();
 void handlePC();
 float readAverage(uint8_t pin, uint8_t samples);
+float readAverageFast(uint8_t pin, uint8_t samples);
+void setRate(int hz);
+void applyRate(uint8_t hz);
+void startDsConversion();
+void serviceSlowChannels();
+void sendMixedReadings();
 
 void setup()
 {
@@ -409,23 +436,127 @@ void processSerialCommand() {
     heat = parseField3(cmd, i + 4);
   }
 
+  // --- RATE --- (frecuencia de los canales rápidos, negociada por el PC)
+  i = cmd.indexOf("RATE");
+  if (i >= 0) {
+    int rate = parseField3(cmd, i + 4);
+    if (rate >= 0) setRate(rate);
+  }
+
   if (fan  >= 0)  analogWrite(PIN_FAN_PWM,  fan);
   if (heat >= 0)  analogWrite(PIN_HEAT_PWM, heat);
 }
 
+// Comando RATE del PC: se acota a 0..RATE_MAX_HZ y se confirma lo aplicado
+void setRate(int hz)
+{
+  pcRateHz = (uint8_t)constrain(hz, 0, (int)RATE_MAX_HZ);
+  applyRate(pcRateHz);
+
+  // Confirmación para el PC (las líneas que empiezan por '#' no son lecturas)
+  Serial.print("# RATE ");
+  Serial.println(fastRateHz);
+}
+
+// Cambia el modo de lectura sin avisar al PC
+void applyRate(uint8_t hz)
+{
+  fastRateHz = hz;
+  bool mixed = fastRateHz > 0;
+  // En modo mixto requestTemperatures() vuelve en el acto y se consulta más tarde
+  sensorEntry.setWaitForConversion(!mixed);
+  sensorExit.setWaitForConversion(!mixed);
+  dsPending = false;
+  newDs = newTc = false;
+  lastFastMs = lastTcMs = millis();
+  if (mixed)
+    startDsConversion();
+}
+
+void startDsConversion()
+{
+  sensorEntry.requestTemperatures();
+  sensorExit.requestTemperatures();
+  dsRequestedMs = millis();
+  dsPending = true;
+}
+
+void serviceSlowChannels()
+{
+  unsigned long now = millis();
+  if (dsPending && now - dsRequestedMs >= DS18B20_CONV_MS)
+  {
+    entryTemp = sensorEntry.getTempCByIndex(0);
+    exitTemp = sensorExit.getTempCByIndex(0);
+    newDs = true;
+    startDsConversion();
+  }
+  if (now - lastTcMs >= TC_PERIOD_MS)
+  {
+    lastTcMs = now;
+    tcTemp = thermocouple.readCelsius() - 1.3;
+    newTc = true;
+  }
+}
+
+// Línea mixta: millis, TE, TS, TC, velocidad, potencia.
+// Los campos de temperatura van vacíos si no hay lectura nueva desde la anterior.
+void sendMixedReadings()
+{
+  float powAvg = (readAverageFast(PIN_POT_CALENTADOR, NUM_READINGS) - 156) * 0.30517578125;
+  float flowAvg = readAverageFast(PIN_VEL_AIRE, NUM_READINGS) * 0.00489;
+
+  Serial.print(millis());
+  Serial.print('\t');
+  if (newDs)
+    Serial.print(entryTemp);
+  Serial.print('\t');
+  if (newDs)
+    Serial.print(exitTemp);
+  Serial.print('\t');
+  if (newTc)
+    Serial.print(tcTemp);
+  Serial.print('\t');
+  Serial.print(flowAvg);
+  Serial.print('\t');
+  Serial.print(powAvg);
+  Serial.print('\n');
+  newDs = newTc = false;
+}
+
 
 void handlePC()
 {
   lcd.clear();
   lcd.setCursor(5, 1);
   lcd.print("CONTROL PC");
+  // Si el PC sigue conectado, espera el mismo formato de línea que negoció
+  applyRate(pcRateHz);
   while (currentMode == MODE_PC)
   {
-    sendReadings();         // Enviar lecturas al PC
     processSerialCommand(); // Procesar comandos del PC
-    updateMode();           // Verificar si el modo cambia
-    delay(150);             // Esperar un poco antes de la siguiente iteración
+    if (fastRateHz == 0)
+    {
+      sendReadings();       // Modo clásico: enviar lecturas al PC
+      updateMode();         // Verificar si el modo cambia
+      delay(150);           // Esperar un poco antes de la siguiente iteración
+      continue;
+    }
+    // Modo mixto: nada bloquea; las temperaturas se recogen cuando están listas
+    serviceSlowChannels();
+    unsigned long periodMs = 1000UL / fastRateHz;
+    if (millis() - lastFastMs >= periodMs)
+    {
+      lastFastMs += periodMs;
+      if (millis() - lastFastMs >= periodMs)
+        lastFastMs = millis(); // se perdió algún ciclo: no intentar recuperarlos
+      sendMixedReadings();
+    }
+    updateMode();
   }
+  // Fuera del modo PC las lecturas vuelven a ser bloqueantes (modo manual);
+  // sin "# RATE 0": el PC no lo ha pedido y lo tomaría por una respuesta
+  applyRate(0);
 }
 
 float readAverage(uint8_t pin, uint8_t samples)
@@ -439,6 +570,17 @@ float readAverage(uint8_t pin, uint8_t samples)
   return sum / (float)samples;
 }
 
+// Igual que readAverage pero sin pausas (~0,1 ms por conversión del ADC)
+float readAverageFast(uint8_t pin, uint8_t samples)
+{
+  long sum = 0;
+  for (uint8_t i = 0; i < samples; i++)
+  {
+    sum += analogRead(pin);
+  }
+  return sum / (float)samples;
+}
+
 // DS18B20: devuelve 2 floats (TE, TS)
 int myCustomCommand_DS18B20(unsigned char numInputBytes, unsigned char *input, unsigned char *numResponseBytes, unsigned char *response)
 {